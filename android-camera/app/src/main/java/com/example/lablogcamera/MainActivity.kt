@@ -145,6 +145,12 @@ private const val WS_CLIENT_MAX_TEXT_BYTES: Long =
 private const val MAX_MP4_BYTES_PER_SEGMENT: Long =
     ((WS_CLIENT_MAX_TEXT_BYTES) * 3) / 4 // 反推 base64 后不超过队列
 private const val MIN_FRAMES_BEFORE_SPLIT = 10
+// reconfigure_capture 允许的分段时长范围（秒）
+private const val MIN_SEGMENT_DURATION_SECONDS = 5.0
+private const val MAX_SEGMENT_DURATION_SECONDS = 600.0
+// reconfigure_capture 允许的码率下限（bps）与帧率上限
+private const val MIN_RECONFIGURE_BITRATE_BPS = 100_000
+private const val MAX_RECONFIGURE_FPS = 60
 
 //region 通信协议相关数据类
 /**
@@ -160,6 +166,12 @@ data class ServerCommand(val command: String, val payload: CommandPayload? = nul
  * - aspectRatio: 目标宽高比（width:height，例如 4:3）
  * - bitrate: 目标码率（MB，例如 4 表示 4MB = 4,000,000 bps）
  * - fps: 期望帧率，0 或 null 表示不限（由设备尽可能多发）
+ * - segmentDuration: 分段时长（秒），缺省 60
+ *
+ * reconfigure_capture 命令（录制中调整参数，不重启采集）的负载格式，各字段均可选：
+ * - segmentDuration: 新的分段时长（秒）
+ * - bitrate: 新的目标码率（MB，可为小数，例如 0.5）
+ * - fps: 新的期望帧率，0 表示不限
  */
 data class CommandPayload(
     val format: String,
@@ -212,9 +224,10 @@ data class ClientCapabilities(
 /**
  * 使用MediaMuxer封装MP4分段
  * 负责将H264编码数据封装成MP4文件，并在达到分段时长且是关键帧时触发分段完成
+ * segmentDurationSeconds 可在录制过程中由服务器的 reconfigure_capture 命令修改，从当前分段起生效
  */
 class MP4SegmentMuxer(
-    private val segmentDurationSeconds: Double,
+    @Volatile var segmentDurationSeconds: Double,
     private val onSegmentComplete: (ByteArray, String) -> Unit,
     private val onSegmentFinished: (() -> Unit)? = null,  // 分段完成后的回调，用于启动新分段
     private val maxSegmentBytes: Long? = null             // 按大小触发分段（保护 WebSocket 队列）
@@ -746,6 +759,26 @@ class H264Encoder(
         private set
     private var encoderColorFormat: Int = MediaCodecInfo.CodecCapabilities.COLOR_FormatYUV420SemiPlanar
 
+    /**
+     * 录制中调整码率与帧率（不重启编码器）：
+     * - 码率通过 MediaCodec 动态参数立即生效
+     * - 帧率由上层 Analyzer 丢帧控制，这里只更新下一个分段封装时使用的帧率
+     */
+    fun reconfigure(bitrate: Int?, targetFps: Int?) {
+        if (bitrate != null) {
+            try {
+                mediaCodec?.setParameters(Bundle().apply {
+                    putInt(MediaCodec.PARAMETER_KEY_VIDEO_BITRATE, bitrate)
+                })
+            } catch (e: IllegalStateException) {
+                Log.w(TAG, "Bitrate update skipped (codec not running)", e)
+            }
+        }
+        if (targetFps != null) {
+            encoderFps = if (targetFps > 0) targetFps else 10
+        }
+    }
+
     fun start(width: Int, height: Int, bitrate: Int, targetFps: Int) {
         encoderWidth = width
         encoderHeight = height
@@ -1302,6 +1335,8 @@ class WebSocketViewModel(application: Application) : AndroidViewModel(applicatio
     private val client = OkHttpClient()
     private var webSocket: WebSocket? = null
     private var h264Encoder: H264Encoder? = null
+    // 当前分段封装器（reconfigure_capture 修改其分段时长）
+    @Volatile private var segmentMuxer: MP4SegmentMuxer? = null
     private var encoderStarted: Boolean = false
     private var encoderBitrate: Int = 2_000_000
     // 录制时锁定的裁剪区域，避免会话期间尺寸变化导致编码器问题
@@ -1315,7 +1350,7 @@ class WebSocketViewModel(application: Application) : AndroidViewModel(applicatio
         private set
     var requestedHeight: Int = 0
         private set
-    private var requestedFps: Int = 0
+    @Volatile private var requestedFps: Int = 0
     private var lastFrameSentTimeNs: Long = 0L
     private var droppedFrames: Int = 0
     private val cameraManager: CameraManager? =
@@ -1599,6 +1634,45 @@ class WebSocketViewModel(application: Application) : AndroidViewModel(applicatio
                     }
                 }
                 "stop_capture" -> stopStreaming()
+                "reconfigure_capture" -> {
+                    val payload = obj.optJSONObject("payload")
+                    val muxer = segmentMuxer
+                    if (payload != null && muxer != null) {
+                        val applied = mutableListOf<String>()
+                        if (payload.has("segmentDuration")) {
+                            val segmentDuration = payload.optDouble("segmentDuration", muxer.segmentDurationSeconds)
+                                .coerceIn(MIN_SEGMENT_DURATION_SECONDS, MAX_SEGMENT_DURATION_SECONDS)
+                            muxer.segmentDurationSeconds = segmentDuration
+                            applied.add("segmentDuration=$segmentDuration")
+                        }
+                        // 服务器饱和时下发的码率/帧率（背压），恢复时下发原参数
+                        var bitrateBps: Int? = null
+                        var fps: Int? = null
+                        if (payload.has("bitrate")) {
+                            bitrateBps = (payload.optDouble("bitrate", encoderBitrate / 1_000_000.0) * 1_000_000)
+                                .toInt().coerceAtLeast(MIN_RECONFIGURE_BITRATE_BPS)
+                            encoderBitrate = bitrateBps
+                            applied.add("bitrate=$bitrateBps")
+                        }
+                        if (payload.has("fps")) {
+                            fps = payload.optInt("fps", requestedFps).coerceIn(0, MAX_RECONFIGURE_FPS)
+                            requestedFps = fps
+                            lastFrameSentTimeNs = 0L
+                            applied.add("fps=$fps")
+                        }
+                        if (bitrateBps != null || fps != null) {
+                            h264Encoder?.reconfigure(bitrateBps, fps)
+                        }
+                        if (applied.isNotEmpty()) {
+                            Log.d(TAG, "Capture reconfigured: ${applied.joinToString(", ")}")
+                            sendStatus(ClientStatus("capture_reconfigured", applied.joinToString(", ")))
+                        } else {
+                            Log.w(TAG, "reconfigure_capture ignored (no supported fields)")
+                        }
+                    } else {
+                        Log.w(TAG, "reconfigure_capture ignored (not streaming or payload missing)")
+                    }
+                }
             }
         } catch (e: Exception) {
             Log.e(TAG, "Failed to parse command", e)
@@ -1653,6 +1727,7 @@ class WebSocketViewModel(application: Application) : AndroidViewModel(applicatio
                     },
                     maxSegmentBytes = MAX_MP4_BYTES_PER_SEGMENT
                 )
+                segmentMuxer = mp4Muxer
                 
                 // 创建H264Encoder，传入MP4Muxer
                 h264Encoder = H264Encoder(
@@ -1844,6 +1919,7 @@ class WebSocketViewModel(application: Application) : AndroidViewModel(applicatio
             }
             h264Encoder?.stop()
             h264Encoder = null
+            segmentMuxer = null
             encoderStarted = false
             lockedCropRect = null  // 清除锁定的裁剪区域
             lastCropOrientationPortrait = null
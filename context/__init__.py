@@ -1,12 +1,15 @@
 """动态上下文模块：人物外貌缓存、事件上下文、提示词构建"""
 
 from context.appearance_cache import AppearanceCache, AppearanceRecord
+from context.appearance_store import AppearanceStore
 from context.event_context import EventContext
-from context.prompt_builder import PromptBuilder
+from context.prompt_builder import PromptBuilder, PromptLayout
 
 __all__ = [
     'AppearanceCache',
     'AppearanceRecord',
+    'AppearanceStore',
     'EventContext',
     'PromptBuilder',
+    'PromptLayout',
 ]
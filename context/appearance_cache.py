@@ -1,11 +1,53 @@
 """人物外貌缓存管理器：使用并查集维护合并关系"""
 
 import json
+import os
 import re
-from dataclasses import dataclass, field
+from dataclasses import dataclass, field, replace
 from datetime import datetime
+from functools import lru_cache
 from pathlib import Path
-from typing import Dict, List, Optional, Tuple
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Set, Tuple
+
+
+_DATE_SUFFIX_RE = re.compile(r'_(\d{4}-\d{2}-\d{2})$')
+_PERSON_NUMBER_RE = re.compile(r'p(\d+)')
+_FIRST_NUMBER_RE = re.compile(r'\d+')
+
+
+class PersonKey(NamedTuple):
+    """解析后的人物编号：p12_2025-12-24 -> (short_id='p12', number=12, date='2025-12-24')"""
+    short_id: str
+    number: int
+    date: Optional[str]
+
+
+@lru_cache(maxsize=65536)
+def parse_person_key(person_id: str) -> PersonKey:
+    """
+    解析人物编号（结果缓存，每个编号只解析一次）
+    
+    Args:
+        person_id: 简写（p1）或带日期后缀的全称（p1_2025-12-24）
+    
+    Returns:
+        PersonKey
+    """
+    date_match = _DATE_SUFFIX_RE.search(person_id)
+    if date_match:
+        short_id = person_id[:date_match.start()]
+        date = date_match.group(1)
+    else:
+        short_id = person_id
+        date = None
+    
+    match = _PERSON_NUMBER_RE.search(short_id)
+    if match:
+        number = int(match.group(1))
+    else:
+        match = _FIRST_NUMBER_RE.search(short_id)
+        number = int(match.group()) if match else 0
+    return PersonKey(short_id, number, date)
 
 
 @dataclass
@@ -15,21 +57,47 @@ class AppearanceRecord:
     appearance: str             # 详细外貌描述（常见+稀有特征）
     user_id: Optional[str] = None  # 关联的用户ID（来自二维码）
     created_at: str = field(default_factory=lambda: datetime.now().isoformat())
+    last_seen: Optional[str] = None  # 最近一次在事件中出现的时间（视频时间，ISO 格式）
+    key: PersonKey = field(init=False, repr=False, compare=False)  # 解析后的编号
+    
+    def __post_init__(self):
+        self.key = parse_person_key(self.person_id)
 
 
 class UnionFind:
-    """并查集实现，用于管理人物编号的合并关系"""
+    """
+    并查集实现，用于管理人物编号的合并关系
+    
+    内部按秩合并（树结构的根不一定是大编号），每个集合另外记录语义上的主编号
+    （合并目标，即大编号）；对外的 find / get_roots 均返回主编号。
+    """
     
     def __init__(self):
-        self.parent: Dict[str, str] = {}
+        self.parent: Dict[str, str] = {}         # 节点 -> 树结构上的父节点
+        self.rank: Dict[str, int] = {}           # 结构根 -> 秩
+        self.label: Dict[str, str] = {}          # 结构根 -> 主编号
+        self.members: Dict[str, Set[str]] = {}   # 主编号 -> 集合内全部节点（含主编号），在 union 时维护
+    
+    def _find_root(self, x: str) -> str:
+        """查找结构根（迭代 + 路径压缩，避免长合并链触发递归上限）"""
+        parent = self.parent
+        if x not in parent:
+            parent[x] = x
+            self.rank[x] = 0
+            self.label[x] = x
+            self.members[x] = {x}
+            return x
+        
+        root = x
+        while parent[root] != root:
+            root = parent[root]
+        while parent[x] != root:
+            parent[x], x = root, parent[x]
+        return root
     
     def find(self, x: str) -> str:
-        """查找根节点（带路径压缩）"""
-        if x not in self.parent:
-            self.parent[x] = x
-        if self.parent[x] != x:
-            self.parent[x] = self.find(self.parent[x])
-        return self.parent[x]
+        """查找主编号"""
+        return self.label[self._find_root(x)]
     
     def union(self, small: str, large: str) -> None:
         """
@@ -39,40 +107,69 @@ class UnionFind:
             small: 被合并的小编号（merge_from）
             large: 目标大编号（target_person_id）
         """
-        root_small = self.find(small)
-        root_large = self.find(large)
-        if root_small != root_large:
-            # 始终将小的指向大的
-            self.parent[root_small] = root_large
+        root_small = self._find_root(small)
+        root_large = self._find_root(large)
+        if root_small == root_large:
+            return
+        
+        # 主编号始终取大编号所在集合的主编号
+        main_small = self.label.pop(root_small)
+        main_large = self.label.pop(root_large)
+        
+        # 按秩合并
+        if self.rank[root_small] > self.rank[root_large]:
+            root_small, root_large = root_large, root_small
+        self.parent[root_small] = root_large
+        if self.rank[root_small] == self.rank[root_large]:
+            self.rank[root_large] += 1
+        del self.rank[root_small]
+        
+        self.label[root_large] = main_large
+        self.members[main_large] |= self.members.pop(main_small)
     
     def get_all_aliases(self, person_id: str) -> List[str]:
         """获取某个主编号的所有别名（被合并到它的编号）"""
-        root = self.find(person_id)
-        aliases = []
-        for node, parent in self.parent.items():
-            if self.find(node) == root and node != root:
-                aliases.append(node)
-        return sorted(aliases, key=lambda x: self._extract_number(x))
+        main_id = self.find(person_id)
+        aliases = [node for node in self.members[main_id] if node != main_id]
+        return sorted(aliases, key=lambda x: parse_person_key(x).number)
     
     def get_roots(self) -> List[str]:
-        """获取所有主编号（根节点）"""
-        roots = set()
-        for node in self.parent:
-            roots.add(self.find(node))
-        return sorted(list(roots), key=lambda x: self._extract_number(x))
+        """获取所有主编号"""
+        return sorted(self.members, key=lambda x: parse_person_key(x).number)
     
-    def _extract_number(self, person_id: str) -> int:
-        """从 person_id (如 p1, p23) 提取数字"""
-        match = re.search(r'\d+', person_id)
-        return int(match.group()) if match else 0
+    def copy(self) -> 'UnionFind':
+        """复制并查集"""
+        clone = UnionFind()
+        clone.parent = dict(self.parent)
+        clone.rank = dict(self.rank)
+        clone.label = dict(self.label)
+        clone.members = {main_id: set(nodes) for main_id, nodes in self.members.items()}
+        return clone
     
     def to_dict(self) -> Dict[str, str]:
-        """序列化为字典"""
-        return dict(self.parent)
+        """序列化为字典（节点 -> 主编号，与旧文件格式兼容）"""
+        return {node: self.find(node) for node in self.parent}
     
     def load_from_dict(self, data: Dict[str, str]) -> None:
-        """从字典加载"""
-        self.parent = dict(data)
+        """从字典加载（节点 -> 父节点，父节点链的终点为主编号）"""
+        self.parent = {}
+        self.rank = {}
+        self.label = {}
+        self.members = {}
+        
+        for node in data:
+            # 沿旧文件中的父节点链找到主编号
+            main_id = node
+            steps = 0
+            while data.get(main_id, main_id) != main_id and steps <= len(data):
+                main_id = data[main_id]
+                steps += 1
+            
+            self._find_root(main_id)
+            if node != main_id:
+                self.parent[node] = main_id
+                self.rank[main_id] = max(self.rank[main_id], 1)
+                self.members[main_id].add(node)
 
 
 class AppearanceCache:
@@ -82,11 +179,22 @@ class AppearanceCache:
         self.records: Dict[str, AppearanceRecord] = {}  # key (f"{person_id}_{date}") -> record
         self.union_find = UnionFind()
         self.nominal_date: Optional[str] = None  # YYYY-MM-DD
+        # 版本号：add/update/merge/load/clear 时递增，用于提示词渲染结果的缓存失效
+        self.version = 0
+        self._max_person_number = 0  # 现存最大编号数字（0 表示无记录）
+        self._prompt_cache: Optional[Tuple[int, List[Dict], List[Dict]]] = None
+        # 变更监听：每次 add/update/merge/seen/clear 后以操作字典回调（用于追加写操作日志）
+        self.op_listener: Optional[Callable[[Dict[str, Any]], None]] = None
+    
+    def _emit(self, op: Dict[str, Any]) -> None:
+        """通知变更监听器"""
+        if self.op_listener is not None:
+            self.op_listener(op)
     
     def _get_full_id(self, person_id: str) -> str:
         """获取完整的内部键值 (person_id_date)"""
         # 如果已经包含了日期后缀（格式 YYYY-MM-DD），则直接返回
-        if re.search(r'_\d{4}-\d{2}-\d{2}$', person_id):
+        if parse_person_key(person_id).date:
             return person_id
         
         # 否则追加当前名义日期
@@ -96,7 +204,7 @@ class AppearanceCache:
 
     def _strip_date(self, full_id: str) -> str:
         """剥离日期后缀，返回原始 person_id (如 p1)"""
-        return re.sub(r'_\d{4}-\d{2}-\d{2}$', '', full_id)
+        return parse_person_key(full_id).short_id
 
     def add(self, person_id: str, appearance: str, user_id: Optional[str] = None) -> None:
         """
@@ -114,17 +222,31 @@ class AppearanceCache:
         
         # 检查是否满足新增编号必须 > 现存最大的规则（仅针对简写部分）
         max_id = self.get_max_person_id_number()
-        new_id_num = self._extract_number(person_id)
+        new_id_num = parse_person_key(person_id).number
         if max_id is not None and new_id_num <= max_id:
             raise ValueError(f"新增编号 {person_id} 必须大于现存最大编号 p{max_id}")
         
-        self.records[full_id] = AppearanceRecord(
+        record = self._insert_record(AppearanceRecord(
             person_id=full_id,
             appearance=appearance,
             user_id=user_id
-        )
+        ))
+        self._emit({
+            "op": "add",
+            "person_id": full_id,
+            "appearance": appearance,
+            "user_id": user_id,
+            "created_at": record.created_at
+        })
+    
+    def _insert_record(self, record: AppearanceRecord) -> AppearanceRecord:
+        """插入记录并维护最大编号、并查集节点与版本号（不做编号校验）"""
+        self.records[record.person_id] = record
+        self._max_person_number = max(self._max_person_number, record.key.number)
         # 初始化并查集节点
-        self.union_find.find(full_id)
+        self.union_find.find(record.person_id)
+        self.version += 1
+        return record
     
     def update(self, person_id: str, appearance: Optional[str] = None, 
                user_id: Optional[str] = None) -> None:
@@ -149,6 +271,8 @@ class AppearanceCache:
             record.appearance = appearance
         if user_id is not None:
             record.user_id = user_id
+        self.version += 1
+        self._emit({"op": "update", "person_id": root_id, "appearance": appearance, "user_id": user_id})
     
     def merge(self, merge_from: str, target_person_id: str) -> None:
         """
@@ -161,8 +285,8 @@ class AppearanceCache:
         full_from = self._get_full_id(merge_from)
         full_target = self._get_full_id(target_person_id)
 
-        from_num = self._extract_number(merge_from)
-        to_num = self._extract_number(target_person_id)
+        from_num = parse_person_key(merge_from).number
+        to_num = parse_person_key(target_person_id).number
         
         if from_num >= to_num:
             raise ValueError(
@@ -179,16 +303,87 @@ class AppearanceCache:
             to_record = self.records[from_root]
             if from_record.user_id and not to_record.user_id:
                 to_record.user_id = from_record.user_id
+        self.version += 1
+        self._emit({"op": "merge", "merge_from": full_from, "target": full_target})
+    
+    def mark_seen(self, person_ids: List[str], seen_at: str) -> None:
+        """
+        记录人物最近一次出现的时间（用于提示词预算裁剪时的排序）
+        
+        Args:
+            person_ids: 事件中的人物编号列表（可为别名）
+            seen_at: 出现时间（ISO 格式，通常为事件结束时间）
+        """
+        for person_id in person_ids:
+            try:
+                full_id = self._get_full_id(person_id)
+            except ValueError:
+                continue
+            if full_id not in self.union_find.parent:
+                continue
+            record = self.records.get(self.union_find.find(full_id))
+            if record and (record.last_seen is None or seen_at > record.last_seen):
+                record.last_seen = seen_at
+                self._emit({"op": "seen", "person_id": record.person_id, "seen_at": seen_at})
+    
+    def apply_op(self, op: Dict[str, Any]) -> None:
+        """
+        重放一条操作日志（不触发变更监听）
+        
+        Args:
+            op: 由 op_listener 产生的操作字典
+        """
+        listener, self.op_listener = self.op_listener, None
+        try:
+            kind = op.get("op")
+            if kind == "add":
+                if op["person_id"] not in self.records:
+                    self._insert_record(AppearanceRecord(
+                        person_id=op["person_id"],
+                        appearance=op.get("appearance") or "",
+                        user_id=op.get("user_id"),
+                        created_at=op.get("created_at") or datetime.now().isoformat()
+                    ))
+            elif kind == "update":
+                self.update(op["person_id"], op.get("appearance"), op.get("user_id"))
+            elif kind == "merge":
+                self.merge(op["merge_from"], op["target"])
+            elif kind == "seen":
+                self.mark_seen([op["person_id"]], op["seen_at"])
+            elif kind == "clear":
+                self.clear()
+            elif kind == "meta":
+                if op.get("nominal_date") and not self.nominal_date:
+                    self.nominal_date = op["nominal_date"]
+        finally:
+            self.op_listener = listener
     
     def get_for_prompt(self) -> Tuple[List[Dict], List[Dict]]:
         """
         获取用于提示词的外貌表数据（剥离日期后缀）
         
+        返回按版本缓存数据的副本，调用方修改不会影响缓存。
+        
         Returns:
             (主记录列表, 别名列表)
-            - 主记录：[{person_id, appearance, user_id}, ...]
+            - 主记录：[{person_id, appearance, user_id, last_seen}, ...]
             - 别名：[{alias, main_person_id}, ...]
         """
+        if self._prompt_cache is None or self._prompt_cache[0] != self.version:
+            self._prompt_cache = (self.version, *self._build_prompt_data())
+        _, main_records, all_aliases = self._prompt_cache
+        
+        records = []
+        for item in main_records:
+            record = {key: value for key, value in item.items() if key != "_root"}
+            # last_seen 不影响版本号，每次取最新值
+            record["last_seen"] = self.records[item["_root"]].last_seen
+            records.append(record)
+        
+        return records, [dict(alias) for alias in all_aliases]
+    
+    def _build_prompt_data(self) -> Tuple[List[Dict], List[Dict]]:
+        """构建外貌表数据（按版本缓存，只经 get_for_prompt 返回副本）"""
         roots = self.union_find.get_roots()
         main_records = []
         all_aliases = []
@@ -199,7 +394,9 @@ class AppearanceCache:
                 main_records.append({
                     "person_id": self._strip_date(record.person_id),
                     "appearance": record.appearance,
-                    "user_id": record.user_id
+                    "user_id": record.user_id,
+                    "last_seen": record.last_seen,
+                    "_root": root
                 })
                 
                 # 收集别名
@@ -218,20 +415,12 @@ class AppearanceCache:
         return f"p{max_num}" if max_num is not None else None
     
     def get_max_person_id_number(self) -> Optional[int]:
-        """返回当前最大编号数字"""
-        if not self.records:
-            return None
-        max_num = 0
-        for full_id in self.records:
-            num = self._extract_number(full_id)
-            if num > max_num:
-                max_num = num
-        return max_num if max_num > 0 else None
+        """返回当前最大编号数字（在 add/load 时维护，O(1)）"""
+        return self._max_person_number if self._max_person_number > 0 else None
     
     def _extract_number(self, person_id: str) -> int:
         """从 person_id (如 p1, p1_2025-12-24) 提取数字"""
-        match = re.search(r'p(\d+)', person_id)
-        return int(match.group(1)) if match else 0
+        return parse_person_key(person_id).number
     
     def get_record(self, person_id: str) -> Optional[AppearanceRecord]:
         """获取人物记录（自动解析合并关系）"""
@@ -239,33 +428,70 @@ class AppearanceCache:
         root_id = self.union_find.find(full_id)
         return self.records.get(root_id)
     
-    def dump_to_file(self, path: str) -> None:
+    def copy(self) -> 'AppearanceCache':
         """
-        保存缓存到 JSONL 文件
+        复制缓存（不含变更监听），用作只读快照
         
-        Args:
-            path: 文件路径
+        Returns:
+            与当前版本号相同的独立副本
         """
-        file_path = Path(path)
-        file_path.parent.mkdir(parents=True, exist_ok=True)
-        
-        data = {
+        clone = AppearanceCache()
+        clone.nominal_date = self.nominal_date
+        clone.records = {pid: replace(r) for pid, r in self.records.items()}
+        clone.union_find = self.union_find.copy()
+        clone._max_person_number = self._max_person_number
+        clone.version = self.version
+        return clone
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """序列化为字典（appearances.json 格式）"""
+        return {
             "nominal_date": self.nominal_date,
             "records": {
                 pid: {
                     "person_id": r.person_id,
                     "appearance": r.appearance,
                     "user_id": r.user_id,
-                    "created_at": r.created_at
+                    "created_at": r.created_at,
+                    "last_seen": r.last_seen
                 }
                 for pid, r in self.records.items()
             },
             "union_find": self.union_find.to_dict(),
             "dump_time": datetime.now().isoformat()
         }
+    
+    def load_from_dict(self, data: Dict[str, Any]) -> None:
+        """从字典加载（appearances.json 格式）"""
+        self.nominal_date = data.get("nominal_date")
+        self.records.clear()
+        for pid, r in data.get("records", {}).items():
+            self.records[pid] = AppearanceRecord(
+                person_id=r["person_id"],
+                appearance=r["appearance"],
+                user_id=r.get("user_id"),
+                created_at=r.get("created_at", datetime.now().isoformat()),
+                last_seen=r.get("last_seen")
+            )
         
-        with open(file_path, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+        self.union_find.load_from_dict(data.get("union_find", {}))
+        self._max_person_number = max(
+            (r.key.number for r in self.records.values()), default=0
+        )
+        self.version += 1
+    
+    def dump_to_file(self, path: str, extra: Optional[Dict[str, Any]] = None) -> None:
+        """
+        保存缓存到 JSON 文件（先写临时文件再原子替换，写入中途崩溃不会损坏原文件）
+        
+        Args:
+            path: 文件路径
+            extra: 额外写入的顶层字段（如操作日志序号）
+        """
+        data = self.to_dict()
+        if extra:
+            data.update(extra)
+        write_json_atomic(Path(path), data)
     
     def load_from_file(self, path: str) -> bool:
         """
@@ -277,44 +503,13 @@ class AppearanceCache:
         Returns:
             是否成功加载
         """
-        file_path = Path(path)
-        if not file_path.exists():
+        data = read_json_file(Path(path))
+        if data is None:
             return False
         
         try:
-            # 检查文件是否为空
-            file_size = file_path.stat().st_size
-            if file_size == 0:
-                print(f"[Context]: 外貌缓存为空")
-                return False
-            
-            with open(file_path, 'r', encoding='utf-8') as f:
-                content = f.read().strip()
-                if not content:
-                    print(f"[Context]: 外貌缓存为空")
-                    return False
-                
-                data = json.loads(content)
-            
-            self.nominal_date = data.get("nominal_date")
-            self.records.clear()
-            for pid, r in data.get("records", {}).items():
-                self.records[pid] = AppearanceRecord(
-                    person_id=r["person_id"],
-                    appearance=r["appearance"],
-                    user_id=r.get("user_id"),
-                    created_at=r.get("created_at", datetime.now().isoformat())
-                )
-            
-            self.union_find.load_from_dict(data.get("union_find", {}))
+            self.load_from_dict(data)
             return True
-        except json.JSONDecodeError as e:
-            # JSON 解析错误，可能是文件为空或格式错误
-            if "Expecting value" in str(e) or "line 1 column 1" in str(e):
-                print(f"[Context]: 外貌缓存为空")
-            else:
-                print(f"[Context]: 加载外貌缓存失败（JSON 格式错误）: {e}")
-            return False
         except Exception as e:
             print(f"[Context]: 加载外貌缓存失败: {e}")
             return False
@@ -325,11 +520,43 @@ class AppearanceCache:
     
     def get_root_count(self) -> int:
         """获取主编号数量（去重后）"""
-        return len(self.union_find.get_roots())
+        return len(self.union_find.members)
     
     def clear(self) -> None:
         """清空缓存"""
         self.records.clear()
         self.union_find = UnionFind()
+        self._max_person_number = 0
+        self.version += 1
+        self._emit({"op": "clear"})
+
 
+def write_json_atomic(file_path: Path, data: Dict[str, Any]) -> None:
+    """写入 JSON：同目录临时文件 + fsync + os.replace"""
+    file_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = file_path.with_name(f".{file_path.name}.tmp")
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, file_path)
 
+
+def read_json_file(file_path: Path) -> Optional[Dict[str, Any]]:
+    """读取外貌缓存 JSON 文件，文件不存在、为空或格式错误时返回 None"""
+    if not file_path.exists():
+        return None
+    
+    try:
+        with open(file_path, 'r', encoding='utf-8') as f:
+            content = f.read().strip()
+        if not content:
+            print(f"[Context]: 外貌缓存为空")
+            return None
+        return json.loads(content)
+    except json.JSONDecodeError as e:
+        print(f"[Context]: 加载外貌缓存失败（JSON 格式错误）: {e}")
+        return None
+    except Exception as e:
+        print(f"[Context]: 加载外貌缓存失败: {e}")
+        return None
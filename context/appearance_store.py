@@ -0,0 +1,179 @@
+"""人物外貌缓存持久化：追加写操作日志 + 周期性压缩快照
+
+- 操作日志 appearances.oplog.jsonl：每次 add/update/merge/seen/clear 追加一行 {"seq": N, "op": ...}；
+  新建（或压缩后截断）的操作日志第一行为 meta 操作，记录 nominal_date，首次压缩前崩溃也能恢复名义日期
+- 快照 appearances.json：压缩后的全量状态，带 oplog_seq 水位线，经临时文件 + os.replace 原子写入
+- 加载：读取快照后只重放 seq > oplog_seq 的操作；快照写入后再截断操作日志，
+  两步之间崩溃也不会重复应用
+
+快照格式与旧版 appearances.json 兼容（仅多出 oplog_seq 字段）。
+"""
+
+import json
+import os
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from context.appearance_cache import AppearanceCache, parse_person_key, read_json_file
+
+
+# 默认压缩阈值：累计多少条操作后写一次快照
+DEFAULT_COMPACT_OPS = 200
+
+
+def get_compact_ops() -> int:
+    """读取压缩阈值（环境变量 APPEARANCE_COMPACT_OPS）"""
+    try:
+        return max(int(os.getenv('APPEARANCE_COMPACT_OPS', str(DEFAULT_COMPACT_OPS))), 1)
+    except ValueError:
+        return DEFAULT_COMPACT_OPS
+
+
+def oplog_path_for(snapshot_path: Path) -> Path:
+    """快照对应的操作日志路径（appearances.json -> appearances.oplog.jsonl）"""
+    return snapshot_path.with_name(f"{snapshot_path.stem}.oplog.jsonl")
+
+
+class AppearanceStore:
+    """人物外貌缓存存储（快照 + 操作日志）"""
+
+    def __init__(
+        self,
+        snapshot_path: Path,
+        oplog_path: Optional[Path] = None,
+        compact_ops: Optional[int] = None
+    ):
+        """
+        初始化存储
+
+        Args:
+            snapshot_path: 快照文件路径（appearances.json）
+            oplog_path: 操作日志路径，默认与快照同目录的 <stem>.oplog.jsonl
+            compact_ops: 累计多少条操作后压缩，None 则读取 APPEARANCE_COMPACT_OPS
+        """
+        self.snapshot_path = Path(snapshot_path)
+        self.oplog_path = Path(oplog_path) if oplog_path else oplog_path_for(self.snapshot_path)
+        self.compact_ops = compact_ops if compact_ops is not None else get_compact_ops()
+        self.seq = 0                    # 最后一条操作的序号
+        self.ops_since_snapshot = 0     # 上次快照后累计的操作数
+        self._cache: Optional[AppearanceCache] = None
+        self._oplog_file = None
+
+    def load(self, cache: AppearanceCache) -> bool:
+        """
+        加载快照并重放操作日志，然后开始记录 cache 的后续变更
+
+        Args:
+            cache: 外貌缓存（会被覆盖为持久化状态）
+
+        Returns:
+            是否加载到任何持久化数据
+        """
+        loaded = False
+        data = read_json_file(self.snapshot_path)
+        if data is not None:
+            cache.load_from_dict(data)
+            self.seq = int(data.get("oplog_seq", 0))
+            loaded = True
+
+        replayed = 0
+        for entry in self._read_oplog():
+            if entry.get("op") == "meta":
+                cache.apply_op(entry)
+                continue
+            if entry.get("seq", 0) <= self.seq:
+                continue
+            try:
+                cache.apply_op(entry)
+            except Exception as e:
+                print(f"[Warning]: 重放外貌操作失败 (seq={entry.get('seq')}): {e}")
+            self.seq = entry["seq"]
+            replayed += 1
+
+        if replayed:
+            print(f"[Context]: 重放外貌操作日志 {replayed} 条")
+            loaded = True
+        self.ops_since_snapshot = replayed
+        if not cache.nominal_date:
+            # 旧版操作日志没有 meta 行：从带日期后缀的人物编号恢复
+            cache.nominal_date = next(
+                (key.date for key in map(parse_person_key, cache.records) if key.date), None
+            )
+
+        self.attach(cache)
+        return loaded
+
+    def attach(self, cache: AppearanceCache) -> None:
+        """开始记录 cache 的变更"""
+        self._cache = cache
+        cache.op_listener = self._append
+
+    def _read_oplog(self):
+        """逐行读取操作日志（跳过崩溃时写了一半的行）"""
+        if not self.oplog_path.exists():
+            return
+        with open(self.oplog_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if isinstance(entry, dict) and "seq" in entry:
+                    yield entry
+
+    def _append(self, op: Dict[str, Any]) -> None:
+        """追加一条操作"""
+        self.seq += 1
+        entry = {"seq": self.seq, **op}
+        if self._oplog_file is None:
+            self.oplog_path.parent.mkdir(parents=True, exist_ok=True)
+            is_new = not self.oplog_path.exists() or self.oplog_path.stat().st_size == 0
+            self._oplog_file = open(self.oplog_path, 'a', encoding='utf-8')
+            if self._ends_with_partial_line():
+                # 上次崩溃留下的半行单独成行，避免与新操作拼接
+                self._oplog_file.write("\n")
+            if is_new and self._cache is not None and self._cache.nominal_date:
+                meta = {"seq": self.seq - 1, "op": "meta", "nominal_date": self._cache.nominal_date}
+                self._oplog_file.write(json.dumps(meta, ensure_ascii=False) + "\n")
+        self._oplog_file.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        self._oplog_file.flush()
+        self.ops_since_snapshot += 1
+
+    def _ends_with_partial_line(self) -> bool:
+        """操作日志是否以未写完的行结尾"""
+        if not self.oplog_path.exists() or self.oplog_path.stat().st_size == 0:
+            return False
+        with open(self.oplog_path, 'rb') as f:
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) != b"\n"
+
+    def maybe_compact(self) -> bool:
+        """累计操作数达到阈值时写快照"""
+        if self.ops_since_snapshot >= self.compact_ops:
+            self.compact()
+            return True
+        return False
+
+    def compact(self) -> None:
+        """写入快照（原子替换）并截断操作日志"""
+        if self._cache is None:
+            return
+        self._cache.dump_to_file(str(self.snapshot_path), extra={"oplog_seq": self.seq})
+
+        if self._oplog_file is not None:
+            self._oplog_file.close()
+            self._oplog_file = None
+        if self.oplog_path.exists():
+            self.oplog_path.write_text('', encoding='utf-8')
+        self.ops_since_snapshot = 0
+
+    def close(self) -> None:
+        """写最终快照并停止记录"""
+        if self._cache is not None:
+            if self.ops_since_snapshot or not self.snapshot_path.exists():
+                self.compact()
+            self._cache.op_listener = None
+            self._cache = None
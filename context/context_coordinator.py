@@ -0,0 +1,223 @@
+"""跨进程共享的上下文协调器：多进程接收服务器的各个工作进程共用同一份外貌缓存与事件编号
+
+DateContextService 只在进程内共享。多进程接收（streaming_server/sharded.py）时各工作进程各自持有
+会话，但同一名义日期的会话仍必须共用外貌缓存与事件编号。协调器运行在独立的管理进程中
+（multiprocessing.managers），按名义日期持有 DateContextService；工作进程通过
+RemoteContextService 调用 snapshot() / commit()，接口与 DateContextService 一致：
+
+- snapshot()：外貌缓存版本未变时不回传副本，工作进程复用上一次收到的副本（避免每个分段都序列化整表）
+- commit()：只回传快照的版本号、日期与最大事件编号，编号重排在协调器内完成
+
+外貌缓存快照与操作日志只由协调器写入；事件日志仍由各工作进程写入同一个 event_logs.jsonl，
+协调器读取最近事件时按偏移增量读取，能看到所有进程追加的事件。
+"""
+
+import threading
+from dataclasses import replace
+from datetime import datetime
+from multiprocessing.managers import BaseManager
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from context.appearance_cache import AppearanceCache
+from context.context_service import (
+    CommitResult,
+    ContextSnapshot,
+    DateContextService,
+    acquire_context_service,
+    release_context_service,
+)
+from context.event_context import EventContext
+from storage.models import EventLog
+
+
+class ContextCoordinator:
+    """协调器进程内的上下文服务表（按名义日期）"""
+
+    def __init__(self):
+        self._services: Dict[str, DateContextService] = {}
+        self._lock = threading.Lock()
+
+    def _service(self, nominal_date: str) -> DateContextService:
+        with self._lock:
+            service = self._services.get(nominal_date)
+        if service is None:
+            raise KeyError(f"名义日期 {nominal_date} 的上下文服务未获取")
+        return service
+
+    def acquire(self, nominal_date: str, snapshot_path: str) -> None:
+        """获取名义日期对应的上下文服务（引用计数加一）"""
+        with self._lock:
+            self._services[nominal_date] = acquire_context_service(nominal_date, Path(snapshot_path))
+
+    def release(self, nominal_date: str) -> None:
+        """引用计数减一，最后一个会话释放时写快照并关闭"""
+        with self._lock:
+            service = self._services.get(nominal_date)
+            if service is None:
+                return
+            if service._refcount <= 1:
+                self._services.pop(nominal_date, None)
+        release_context_service(service)
+
+    def snapshot(
+        self,
+        nominal_date: str,
+        date: Optional[datetime],
+        max_recent_events: int,
+        known_version: Optional[int] = None
+    ) -> ContextSnapshot:
+        """
+        获取上下文快照
+
+        Args:
+            nominal_date: 名义日期
+            date: 视频日期，None 表示今天
+            max_recent_events: 最近事件数
+            known_version: 调用方已持有的外貌缓存副本版本号
+
+        Returns:
+            ContextSnapshot；版本号等于 known_version 时 appearance_cache 为 None
+        """
+        snapshot = self._service(nominal_date).snapshot(date, max_recent_events)
+        if known_version is not None and snapshot.version == known_version:
+            snapshot = replace(snapshot, appearance_cache=None)
+        return snapshot
+
+    def commit(
+        self,
+        nominal_date: str,
+        version: int,
+        date_key: str,
+        max_event_id: int,
+        appearance_updates: List[Any],
+        events: List[EventLog]
+    ) -> CommitResult:
+        """提交一个分段的外貌更新与事件（参数为快照的版本号、日期与最大事件编号）"""
+        snapshot = ContextSnapshot(
+            version=version,
+            date_key=date_key,
+            appearance_cache=None,
+            recent_events=[],
+            max_event_id=max_event_id
+        )
+        return self._service(nominal_date).commit(snapshot, appearance_updates, events)
+
+    def maybe_compact(self, nominal_date: str) -> bool:
+        return self._service(nominal_date).maybe_compact()
+
+    def compact(self, nominal_date: str) -> None:
+        self._service(nominal_date).compact()
+
+    def close_all(self) -> None:
+        """关闭所有上下文服务（服务器退出时调用，工作进程异常退出未释放的引用也一并关闭）"""
+        with self._lock:
+            services, self._services = list(self._services.values()), {}
+        for service in services:
+            service._refcount = 1
+            release_context_service(service)
+
+
+_coordinator: Optional[ContextCoordinator] = None
+
+
+def _get_coordinator() -> ContextCoordinator:
+    """管理进程内的协调器单例"""
+    global _coordinator
+    if _coordinator is None:
+        _coordinator = ContextCoordinator()
+    return _coordinator
+
+
+class CoordinatorManager(BaseManager):
+    """协调器所在的管理进程"""
+
+
+CoordinatorManager.register('coordinator', callable=_get_coordinator)
+
+
+def start_coordinator(authkey: bytes) -> Tuple[CoordinatorManager, Any]:
+    """
+    启动协调器管理进程
+
+    Args:
+        authkey: 工作进程连接时使用的认证密钥
+
+    Returns:
+        (manager, address)，退出时先调用 coordinator().close_all() 再 manager.shutdown()
+    """
+    manager = CoordinatorManager(address=('127.0.0.1', 0), authkey=authkey)
+    manager.start()
+    return manager, manager.address
+
+
+def connect_coordinator(address: Any, authkey: bytes) -> Any:
+    """在工作进程中连接协调器，返回协调器代理（代理按线程各自建立连接，可在线程池中调用）"""
+    manager = CoordinatorManager(address=address, authkey=authkey)
+    manager.connect()
+    return manager.coordinator()
+
+
+class RemoteContextService:
+    """工作进程中的上下文服务代理（接口与 DateContextService 一致）"""
+
+    def __init__(self, coordinator: Any, nominal_date: str, snapshot_path: Path):
+        """
+        Args:
+            coordinator: connect_coordinator() 返回的协调器代理
+            nominal_date: 名义日期 YYYY-MM-DD
+            snapshot_path: 外貌缓存快照路径（由协调器读写）
+        """
+        self.nominal_date = nominal_date
+        self._coordinator = coordinator
+        self._coordinator.acquire(nominal_date, str(snapshot_path))
+        self._cache_lock = threading.Lock()
+        self._cache: Optional[AppearanceCache] = None
+        # 旧版处理器需要事件上下文对象；最近事件由协调器统一读取
+        self.event_context = EventContext()
+        self.snapshot()
+
+    @property
+    def appearance_cache(self) -> AppearanceCache:
+        """最近一次快照的外貌缓存副本（只读）"""
+        return self._cache
+
+    def snapshot(self, date: Optional[datetime] = None, max_recent_events: int = 20) -> ContextSnapshot:
+        """获取上下文快照（外貌缓存未变时复用本地副本）"""
+        with self._cache_lock:
+            known = self._cache.version if self._cache is not None else None
+        snapshot = self._coordinator.snapshot(self.nominal_date, date, max_recent_events, known)
+        with self._cache_lock:
+            if snapshot.appearance_cache is None:
+                return replace(snapshot, appearance_cache=self._cache)
+            self._cache = snapshot.appearance_cache
+        return snapshot
+
+    def commit(
+        self,
+        snapshot: ContextSnapshot,
+        appearance_updates: List[Any],
+        events: List[EventLog]
+    ) -> CommitResult:
+        """提交一个分段的外貌更新与事件（编号重排在协调器内完成，返回改写后的副本）"""
+        return self._coordinator.commit(
+            self.nominal_date,
+            snapshot.version,
+            snapshot.date_key,
+            snapshot.max_event_id,
+            appearance_updates,
+            events
+        )
+
+    def maybe_compact(self) -> bool:
+        return self._coordinator.maybe_compact(self.nominal_date)
+
+    def compact(self) -> None:
+        self._coordinator.compact(self.nominal_date)
+
+    def release(self) -> None:
+        """释放协调器中的引用并关闭本地事件上下文"""
+        try:
+            self._coordinator.release(self.nominal_date)
+        finally:
+            self.event_context.close()
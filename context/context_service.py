@@ -0,0 +1,344 @@
+"""按名义日期共享的上下文服务：多路摄像头会话共用同一份外貌缓存与事件编号
+
+同一进程内、同一名义日期的所有会话通过 acquire_context_service() 获得同一个 DateContextService：
+- snapshot()：在锁内取版本号并复制外貌缓存（按版本复用副本），供提示词构建使用，VLM 调用无需持锁
+- commit()：在锁内应用外貌更新；若快照之后其他会话已提交（版本号变化），对新增人物编号与
+  事件编号做乐观重排（rebase），避免编号冲突，再统一落盘到操作日志
+
+这样多路会话可以并行调用 VLM，只在提交时短暂串行。
+多进程接收时由协调器进程持有各日期的服务，工作进程经 context_coordinator.RemoteContextService 访问。
+"""
+
+import re
+import threading
+from collections import deque
+from dataclasses import dataclass, field
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Deque, Dict, List, Optional
+
+from context.appearance_cache import AppearanceCache, parse_person_key
+from context.appearance_store import AppearanceStore
+from context.event_context import EventContext
+from storage.models import EventLog
+
+
+_EVENT_NUMBER_RE = re.compile(r'evt_(\d+)')
+
+# 每个日期保留的已提交事件数（用于补齐尚未落盘的最近事件）
+RECENT_COMMITTED_EVENTS = 50
+
+
+def _event_number(event_id: str) -> int:
+    match = _EVENT_NUMBER_RE.search(event_id or '')
+    return int(match.group(1)) if match else 0
+
+
+def _date_key(date: Optional[datetime]) -> str:
+    return (date or datetime.now()).strftime('%Y-%m-%d')
+
+
+@dataclass
+class ContextSnapshot:
+    """提示词构建用的上下文快照"""
+    version: int                         # 外貌缓存版本号（提交时用于检测并发修改）
+    date_key: str                        # 视频日期 YYYY-MM-DD
+    appearance_cache: AppearanceCache    # 只读副本
+    recent_events: List[Dict[str, Any]]  # 最近事件（按时间倒序）
+    max_event_id: int                    # 当前最大事件编号数字
+
+
+@dataclass
+class CommitResult:
+    """提交结果"""
+    events: List[EventLog]
+    appearance_updates: List[Any]
+    person_id_map: Dict[str, str] = field(default_factory=dict)  # 重排的人物编号 旧 -> 新
+    event_id_map: Dict[str, str] = field(default_factory=dict)   # 重排的事件编号 旧 -> 新
+    rebased: bool = False
+
+
+def apply_appearance_updates(cache: AppearanceCache, updates: List[Any]) -> None:
+    """
+    将模型输出的外貌更新应用到缓存（与各处理器的 _apply_appearance_updates 语义一致）
+
+    Args:
+        cache: 外貌缓存
+        updates: AppearanceUpdate 列表（op, target_person_id, merge_from, appearance, user_id）
+    """
+    for update in updates:
+        try:
+            if update.op == 'add':
+                cache.add(
+                    person_id=update.target_person_id,
+                    appearance=update.appearance or '',
+                    user_id=update.user_id
+                )
+            elif update.op == 'update':
+                cache.update(
+                    person_id=update.target_person_id,
+                    appearance=update.appearance,
+                    user_id=update.user_id
+                )
+            elif update.op == 'merge':
+                if update.merge_from:
+                    cache.merge(
+                        merge_from=update.merge_from,
+                        target_person_id=update.target_person_id
+                    )
+                    if update.appearance:
+                        cache.update(
+                            person_id=update.target_person_id,
+                            appearance=update.appearance
+                        )
+        except Exception as e:
+            print(f"警告：应用外貌更新失败 ({update.op} {update.target_person_id}): {e}")
+
+
+class DateContextService:
+    """某个名义日期的共享上下文（进程内，线程安全）"""
+
+    def __init__(self, nominal_date: str, snapshot_path: Path):
+        """
+        初始化上下文服务
+
+        Args:
+            nominal_date: 名义日期 YYYY-MM-DD
+            snapshot_path: 外貌缓存快照路径（appearances.json）
+        """
+        self.nominal_date = nominal_date
+        self.lock = threading.RLock()
+
+        self.appearance_cache = AppearanceCache()
+        self.appearance_cache.nominal_date = nominal_date
+        self.store = AppearanceStore(snapshot_path)
+        if self.store.load(self.appearance_cache):
+            print(f"[Context]: 加载外貌缓存成功，共 {self.appearance_cache.get_record_count()} 条记录")
+
+        self.event_context = EventContext()
+
+        self._snapshot_cache: Optional[AppearanceCache] = None
+        self._max_event_number: Dict[str, int] = {}
+        self._recent_committed: Dict[str, Deque[Dict[str, Any]]] = {}
+        self._refcount = 0
+
+    def snapshot(self, date: Optional[datetime] = None, max_recent_events: int = 20) -> ContextSnapshot:
+        """
+        获取上下文快照
+
+        Args:
+            date: 视频日期（从 segment_id 解析），None 表示今天
+            max_recent_events: 最近事件数
+
+        Returns:
+            ContextSnapshot
+        """
+        date_key = _date_key(date)
+        with self.lock:
+            version = self.appearance_cache.version
+            if self._snapshot_cache is None or self._snapshot_cache.version != version:
+                self._snapshot_cache = self.appearance_cache.copy()
+            cache_copy = self._snapshot_cache
+            committed = list(self._recent_committed.get(date_key, ()))
+            committed_max = self._max_event_number.get(date_key, 0)
+
+        # 读文件不持锁；已提交但可能尚未写入文件的事件由内存补齐
+        if date is None:
+            file_events = self.event_context.get_recent_events(max_recent_events)
+            file_max = self.event_context.get_max_event_id_number()
+        else:
+            file_events = self.event_context.get_recent_events(max_recent_events, date=date)
+            file_max = self.event_context.get_max_event_id_number(date=date)
+
+        seen_ids = {e.get('event_id') for e in file_events}
+        merged = file_events + [e for e in committed if e.get('event_id') not in seen_ids]
+        merged.sort(key=lambda e: e.get('start_time') or '', reverse=True)
+
+        return ContextSnapshot(
+            version=version,
+            date_key=date_key,
+            appearance_cache=cache_copy,
+            recent_events=merged[:max_recent_events],
+            max_event_id=max(file_max, committed_max)
+        )
+
+    def commit(
+        self,
+        snapshot: ContextSnapshot,
+        appearance_updates: List[Any],
+        events: List[EventLog]
+    ) -> CommitResult:
+        """
+        提交一个分段的外貌更新与事件
+
+        快照之后若有其他会话提交，则把本次新增的、与现有编号冲突的人物编号和事件编号
+        顺延到当前最大值之后，并同步改写更新、事件中的引用。
+
+        Args:
+            snapshot: 处理该分段时使用的快照
+            appearance_updates: 模型输出的外貌更新
+            events: 模型输出的事件
+
+        Returns:
+            CommitResult（事件与更新已按需改写）
+        """
+        with self.lock:
+            cache = self.appearance_cache
+            result = CommitResult(events=events, appearance_updates=appearance_updates)
+
+            if cache.version != snapshot.version:
+                result.person_id_map = self._rebase_person_ids(appearance_updates)
+            current_event_max = self._max_event_number.get(snapshot.date_key, 0)
+            if current_event_max > snapshot.max_event_id:
+                result.event_id_map = self._rebase_event_ids(events, current_event_max)
+            result.rebased = bool(result.person_id_map or result.event_id_map)
+
+            if result.person_id_map:
+                self._remap_updates(appearance_updates, result.person_id_map)
+            if result.person_id_map or result.event_id_map:
+                self._remap_events(events, result.person_id_map, result.event_id_map)
+
+            apply_appearance_updates(cache, appearance_updates)
+
+            recent = self._recent_committed.setdefault(
+                snapshot.date_key, deque(maxlen=RECENT_COMMITTED_EVENTS)
+            )
+            for event in events:
+                person_ids = event.structured.get('person_ids', [])
+                cache.mark_seen(person_ids, event.end_time.isoformat())
+                number = _event_number(event.event_id)
+                if number > self._max_event_number.get(snapshot.date_key, 0):
+                    self._max_event_number[snapshot.date_key] = number
+                recent.append({
+                    'event_id': event.event_id,
+                    'start_time': event.start_time.strftime('%Y-%m-%dT%H:%M:%S'),
+                    'end_time': event.end_time.strftime('%Y-%m-%dT%H:%M:%S'),
+                    'event_type': event.event_type or '',
+                    'person_ids': person_ids,
+                    'equipment': event.structured.get('equipment', ''),
+                    'description': event.raw_text
+                })
+            # 未写出事件时也记录快照中的最大编号，便于后续提交判断
+            if snapshot.max_event_id > self._max_event_number.get(snapshot.date_key, 0):
+                self._max_event_number[snapshot.date_key] = snapshot.max_event_id
+
+        if result.rebased:
+            print(
+                f"[Context]: 并发提交重排编号: 人物 {result.person_id_map or '-'}, "
+                f"事件 {result.event_id_map or '-'}"
+            )
+        return result
+
+    def _rebase_person_ids(self, updates: List[Any]) -> Dict[str, str]:
+        """为与现有编号冲突的新增人物分配新编号"""
+        cache = self.appearance_cache
+        next_number = (cache.get_max_person_id_number() or 0) + 1
+        id_map: Dict[str, str] = {}
+        for update in updates:
+            if update.op != 'add':
+                continue
+            key = parse_person_key(update.target_person_id)
+            if key.short_id in id_map:
+                continue
+            if key.number < next_number:
+                new_id = f"p{next_number}"
+                id_map[key.short_id] = new_id
+                next_number += 1
+            else:
+                next_number = key.number + 1
+        return id_map
+
+    def _rebase_event_ids(self, events: List[EventLog], current_max: int) -> Dict[str, str]:
+        """将本批事件按原编号顺序整体顺延到其他会话已提交的编号之后"""
+        next_number = current_max + 1
+        id_map: Dict[str, str] = {}
+        for event in sorted(events, key=lambda e: _event_number(e.event_id)):
+            if event.event_id in id_map:
+                continue
+            new_id = f"evt_{next_number:05d}"
+            if new_id != event.event_id:
+                id_map[event.event_id] = new_id
+            next_number += 1
+        return id_map
+
+    @staticmethod
+    def _remap_person_id(person_id: str, id_map: Dict[str, str]) -> str:
+        """按简写编号查找新编号（p3 与 p3_2025-12-24 映射到同一个新编号，保留日期后缀）"""
+        short_id = parse_person_key(person_id).short_id
+        if short_id not in id_map:
+            return person_id
+        return id_map[short_id] + person_id[len(short_id):]
+
+    def _remap_updates(self, updates: List[Any], id_map: Dict[str, str]) -> None:
+        for update in updates:
+            update.target_person_id = self._remap_person_id(update.target_person_id, id_map)
+            if update.merge_from:
+                update.merge_from = self._remap_person_id(update.merge_from, id_map)
+
+    def _remap_events(
+        self,
+        events: List[EventLog],
+        person_map: Dict[str, str],
+        event_map: Dict[str, str]
+    ) -> None:
+        for event in events:
+            event.event_id = event_map.get(event.event_id, event.event_id)
+            person_ids = event.structured.get('person_ids')
+            if person_map and person_ids:
+                event.structured['person_ids'] = [self._remap_person_id(pid, person_map) for pid in person_ids]
+
+    def maybe_compact(self) -> bool:
+        """累计操作数达到阈值时写外貌缓存快照"""
+        with self.lock:
+            return self.store.maybe_compact()
+
+    def compact(self) -> None:
+        """立即写外貌缓存快照"""
+        with self.lock:
+            self.store.compact()
+
+    def close(self) -> None:
+        """写最终快照并释放资源"""
+        with self.lock:
+            self.store.close()
+            self.event_context.close()
+
+
+_services: Dict[str, DateContextService] = {}
+_registry_lock = threading.Lock()
+
+
+def acquire_context_service(nominal_date: str, snapshot_path: Path) -> DateContextService:
+    """
+    获取（必要时创建）名义日期对应的共享上下文服务，引用计数加一
+
+    Args:
+        nominal_date: 名义日期 YYYY-MM-DD
+        snapshot_path: 外貌缓存快照路径
+
+    Returns:
+        DateContextService
+    """
+    with _registry_lock:
+        service = _services.get(nominal_date)
+        if service is None:
+            for other in _services.values():
+                if other.store.snapshot_path == Path(snapshot_path):
+                    print(
+                        f"[Warning]: 名义日期 {other.nominal_date} 的会话仍在使用 {snapshot_path}，"
+                        f"日期 {nominal_date} 的外貌缓存将写入同一文件"
+                    )
+            service = DateContextService(nominal_date, Path(snapshot_path))
+            _services[nominal_date] = service
+        service._refcount += 1
+        return service
+
+
+def release_context_service(service: DateContextService) -> None:
+    """引用计数减一，最后一个会话释放时写快照并关闭"""
+    with _registry_lock:
+        service._refcount -= 1
+        if service._refcount > 0:
+            return
+        _services.pop(service.nominal_date, None)
+    service.close()
@@ -1,22 +1,42 @@
-"""当天事件缓存查询：从 JSONL 文件获取最新事件用于模型上下文"""
+"""当天事件缓存查询：从 JSONL 文件获取最新事件用于模型上下文
 
+文件只追加写入，因此按日期维护一份内存索引（简化后的事件、最大事件编号、已出现的 segment_id），
+每次查询前只读取上次位置之后新追加的完整行；文件被截断（如清空测试数据）或替换时重建索引。
+"""
+
+import heapq
 import json
+import os
 import re
-from datetime import datetime, timedelta
+import threading
+from dataclasses import dataclass, field
+from datetime import datetime
 from pathlib import Path
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Set, Tuple
+
+
+_EVENT_NUMBER_RE = re.compile(r'(\d+)$')
+
+
+@dataclass
+class _DayIndex:
+    """某一天的事件索引"""
+    events: List[Dict[str, Any]] = field(default_factory=list)  # 简化后的事件（文件顺序）
+    max_number: int = 0
 
 
 class EventContext:
-    """事件上下文管理器：从 JSONL 文件查询当天最新事件"""
+    """事件上下文管理器：从 JSONL 文件查询当天最新事件（增量读取，线程安全）"""
     
     def __init__(self, event_log_file: Optional[str] = None):
         """
         初始化事件上下文
         
         Args:
-            event_log_file: 事件日志文件路径，如果为 None 则使用默认路径 logs_debug/event_logs.jsonl
+            event_log_file: 事件日志文件路径，如果为 None 则读取环境变量 EVENT_LOG_FILE，
+                未设置时使用默认路径 logs_debug/event_logs.jsonl
         """
+        event_log_file = event_log_file or os.getenv('EVENT_LOG_FILE')
         if event_log_file is None:
             # 默认使用项目根目录下的 logs_debug/event_logs.jsonl
             # event_context.py 在 context/ 目录下，所以 parent.parent 是项目根目录
@@ -24,6 +44,84 @@ class EventContext:
             self.event_log_file = project_root / "logs_debug" / "event_logs.jsonl"
         else:
             self.event_log_file = Path(event_log_file)
+        
+        self._lock = threading.Lock()
+        self._file_id: Optional[Tuple[int, int]] = None
+        self._offset = 0
+        self._days: Dict[str, _DayIndex] = {}
+        self._segment_ids: Set[str] = set()
+    
+    def _reset_index(self) -> None:
+        self._offset = 0
+        self._days = {}
+        self._segment_ids = set()
+    
+    def _refresh(self) -> None:
+        """读取文件新追加的完整行并更新索引（调用方持有 self._lock）"""
+        try:
+            stat = self.event_log_file.stat()
+        except FileNotFoundError:
+            self._file_id = None
+            self._reset_index()
+            return
+        
+        file_id = (stat.st_dev, stat.st_ino)
+        if file_id != self._file_id or stat.st_size < self._offset:
+            self._file_id = file_id
+            self._reset_index()
+        if stat.st_size == self._offset:
+            return
+        
+        with open(self.event_log_file, 'rb') as f:
+            f.seek(self._offset)
+            data = f.read()
+        # 只处理完整的行，末尾未写完的行留到下次
+        end = data.rfind(b'\n')
+        if end < 0:
+            return
+        for line in data[:end].split(b'\n'):
+            self._index_line(line)
+        self._offset += end + 1
+    
+    def _index_line(self, line: bytes) -> None:
+        line = line.strip()
+        if not line:
+            return
+        try:
+            event = json.loads(line.decode('utf-8'))
+        except (json.JSONDecodeError, UnicodeDecodeError):
+            # 跳过无效的 JSON 行
+            return
+        if not isinstance(event, dict):
+            return
+        
+        segment_id = event.get('segment_id')
+        if segment_id:
+            self._segment_ids.add(segment_id)
+        
+        # 解析 ISO 格式时间
+        start_time_str = event.get('start_time', '')
+        if not isinstance(start_time_str, str) or 'T' not in start_time_str:
+            return
+        try:
+            event_start = datetime.fromisoformat(start_time_str.replace('Z', '+00:00'))
+        except ValueError:
+            return
+        
+        day = self._days.setdefault(event_start.strftime('%Y-%m-%d'), _DayIndex())
+        day.events.append(self._simplify_event(event))
+        # 从 event_id 中提取数字（格式如 evt_00042）
+        match = _EVENT_NUMBER_RE.search(event.get('event_id', '') or '')
+        if match:
+            day.max_number = max(day.max_number, int(match.group(1)))
+    
+    def _day_index(self, date: Optional[datetime]) -> Optional[_DayIndex]:
+        """刷新索引并返回指定日期（默认今天）的索引"""
+        if date is None:
+            date = datetime.now()
+        with self._lock:
+            self._refresh()
+            return self._days.get(date.strftime('%Y-%m-%d'))
     
     def get_recent_events(self, n: int = 20, date: Optional[datetime] = None) -> List[Dict[str, Any]]:
         """
@@ -34,7 +132,7 @@ class EventContext:
             date: 指定日期，默认为今天
         
         Returns:
-            事件列表，每个事件包含简化字段：
+            事件列表（按开始时间降序），每个事件包含简化字段：
             - event_id: 事件ID
             - start_time: 开始时间 (ISO格式)
             - end_time: 结束时间 (ISO格式)
@@ -43,63 +141,13 @@ class EventContext:
             - equipment: 设备名称
             - description: 事件描述
         """
-        if date is None:
-            date = datetime.now()
-        
-        # 构建当天的时间范围
-        day_start = date.replace(hour=0, minute=0, second=0, microsecond=0)
-        day_end = day_start + timedelta(days=1)
-        
-        # 查询当天的事件
-        raw_events = self._query_today_events(day_start, day_end, n)
-        
-        # 转换为简化格式
-        return [self._simplify_event(event) for event in raw_events]
-    
-    def _query_today_events(self, day_start: datetime, day_end: datetime, 
-                            limit: int) -> List[Dict[str, Any]]:
-        """从 JSONL 文件查询当天事件的原始数据"""
-        if not self.event_log_file.exists():
-            return []
-        
-        events = []
         try:
-            # 读取 JSONL 文件的所有行
-            with open(self.event_log_file, 'r', encoding='utf-8') as f:
-                for line in f:
-                    line = line.strip()
-                    if not line:
-                        continue
-                    
-                    try:
-                        event = json.loads(line)
-                        # 解析时间
-                        start_time_str = event.get('start_time', '')
-                        if not start_time_str:
-                            continue
-                        
-                        # 解析 ISO 格式时间
-                        try:
-                            if 'T' in start_time_str:
-                                event_start = datetime.fromisoformat(start_time_str.replace('Z', '+00:00'))
-                            else:
-                                continue
-                        except (ValueError, AttributeError):
-                            continue
-                        
-                        # 过滤当天的数据
-                        if day_start <= event_start < day_end:
-                            events.append(event)
-                    except json.JSONDecodeError:
-                        # 跳过无效的 JSON 行
-                        continue
-            
-            # 按时间降序排序（最新的在前）
-            events.sort(key=lambda x: x.get('start_time', ''), reverse=True)
-            
-            # 返回最新的 n 条
-            return events[:limit]
-            
+            day = self._day_index(date)
+            if day is None:
+                return []
+            with self._lock:
+                latest = heapq.nlargest(n, day.events, key=lambda e: e.get('start_time') or '')
+            return [dict(event) for event in latest]
         except Exception as e:
             print(f"从 JSONL 文件查询当天事件失败: {e}")
             return []
@@ -164,54 +212,27 @@ class EventContext:
         Returns:
             最大事件编号数字，如果没有事件则返回 0
         """
-        if date is None:
-            date = datetime.now()
-        
-        day_start = date.replace(hour=0, minute=0, second=0, microsecond=0)
-        day_end = day_start + timedelta(days=1)
-        
-        if not self.event_log_file.exists():
-            return 0
-        
-        max_num = 0
         try:
-            with open(self.event_log_file, 'r', encoding='utf-8') as f:
-                for line in f:
-                    line = line.strip()
-                    if not line:
-                        continue
-                    
-                    try:
-                        event = json.loads(line)
-                        # 检查是否是当天的数据
-                        start_time_str = event.get('start_time', '')
-                        if not start_time_str:
-                            continue
-                        
-                        try:
-                            if 'T' in start_time_str:
-                                event_start = datetime.fromisoformat(start_time_str.replace('Z', '+00:00'))
-                            else:
-                                continue
-                        except (ValueError, AttributeError):
-                            continue
-                        
-                        if day_start <= event_start < day_end:
-                            event_id = event.get('event_id', '')
-                            # 从 event_id 中提取数字（格式如 evt_00042）
-                            match = re.search(r'(\d+)$', event_id)
-                            if match:
-                                num = int(match.group(1))
-                                if num > max_num:
-                                    max_num = num
-                    except (json.JSONDecodeError, ValueError):
-                        continue
-            
-            return max_num
+            day = self._day_index(date)
+            return day.max_number if day else 0
         except Exception as e:
             print(f"从 JSONL 文件获取最大事件编号失败: {e}")
             return 0
     
+    def has_segment(self, segment_id: str) -> bool:
+        """
+        文件中是否已有该分段的事件（用于重放时判断分段是否已提交）
+        
+        Args:
+            segment_id: 分段ID
+        
+        Returns:
+            是否已有事件
+        """
+        with self._lock:
+            self._refresh()
+            return segment_id in self._segment_ids
+    
     def format_for_prompt(self, events: List[Dict[str, Any]]) -> str:
         """
         将事件列表格式化为提示词中的文本
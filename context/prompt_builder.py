@@ -1,71 +1,53 @@
-"""动态提示词构建器：基于上下文构建视频理解提示"""
+"""动态提示词构建器：基于上下文构建视频理解提示
 
-import json
+提示词按“稳定在前、易变在后”的顺序布局，便于命中模型服务端的前缀缓存：
+1. 静态前缀：系统指令 + 任务要求 + 输出格式（不随分段变化，构建一次后复用）
+2. 人物外貌表（仅在外貌缓存变化时改变）
+3. 易变尾部：二维码识别结果、最近事件记录、编号起始值
+
+外貌表与最近事件按 token 预算（PROMPT_MAX_INPUT_TOKENS）裁剪，保证文本输入不超过上限。
+"""
+
+from dataclasses import dataclass, field
 from datetime import datetime
 from typing import List, Dict, Any, Optional, Tuple
 
 from storage.models import VideoSegment
 from context.appearance_cache import AppearanceCache
+from context.token_budget import (
+    APPEARANCE_BUDGET_SHARE,
+    EVENT_DESCRIPTION_MAX_CHARS,
+    EVENTS_KEEP_FULL,
+    BudgetSplit,
+    estimate_tokens,
+    get_max_input_tokens,
+    truncate_text,
+)
 
 
-class PromptBuilder:
-    """动态提示词构建器"""
-    
-    def __init__(self, max_recent_events: int = 20):
-        """
-        初始化提示词构建器
-        
-        Args:
-            max_recent_events: 最大最近事件数
-        """
-        self.max_recent_events = max_recent_events
-    
-    def build_dynamic_prompt(
-        self,
-        segment: VideoSegment,
-        qr_results: List[Dict[str, Any]],
-        recent_events: List[Dict[str, Any]],
-        appearance_cache: AppearanceCache,
-        max_event_id: int,
-        max_person_id: Optional[int]
-    ) -> str:
-        """
-        构建动态提示词
-        
-        Args:
-            segment: 视频分段
-            qr_results: 二维码识别结果
-            recent_events: 最近事件列表
-            appearance_cache: 人物外貌缓存
-            max_event_id: 当前最大事件编号数字
-            max_person_id: 当前最大人物编号数字（可能为 None）
-        
-        Returns:
-            构建好的提示词文本
-        """
-        # 格式化各部分内容
-        qr_section = self._format_qr_results(qr_results)
-        events_section = self._format_recent_events(recent_events)
-        appearance_section = self._format_appearance_table(appearance_cache)
-        
-        # 计算新编号的起始值
-        next_event_id = max_event_id + 1
-        next_person_id = (max_person_id or 0) + 1
-        
-        prompt = f"""请分析这段实验室视频，结合已有的上下文信息，输出续写的事件日志、人物外貌记录更新以及紧急情况识别。
+SYSTEM_INSTRUCTION = """你是一个实验室视频分析助手，负责分析视频内容并生成结构化的事件日志。
 
-## 时间戳
-- 视频中的时间戳水印格式为 "yyyy-MM-dd Time: hh:mm:ss"
-- 如果时间戳水印缺少日期，使用2025-1-1作为日期
+你需要：
+1. 仔细观察视频中的人物动作和设备状态
+2. 根据时间戳水印确定事件的时间范围
+3. 将观察结果与已有的上下文（事件记录、人物外貌表）关联
+4. 输出续写的事件和外貌更新，格式必须为指定的 JSON 格式
+
+关键原则：
+- 准确识别时间戳，精确到秒
+- 优先重用已有的人物编号，避免创建重复记录
+- 外貌匹配时，稀有特征的权重高于常见特征
+- 不在事件描述中提及人物外貌信息（如上衣颜色、头发颜色等），这些信息保存在外貌表中
+- 只输出 JSON，不要输出其他内容"""
 
-## 二维码识别结果
-{qr_section}
 
-## 最近事件记录（参考描述风格，共 {len(recent_events)} 条）
-{events_section}
+# 任务要求与输出格式（静态部分，不包含任何随分段变化的内容）
+TASK_RULES = """请分析这段实验室视频，结合已有的上下文信息，输出续写的事件日志、人物外貌记录更新以及紧急情况识别。
+上下文信息（人物外貌表、二维码识别结果、最近事件记录、编号起始值）在用户消息中给出。
 
-## 人物外貌表（已全量给出）
-{appearance_section}
+## 时间戳
+- 视频中的时间戳水印格式为 "yyyy-MM-dd Time: hh:mm:ss"
+- 如果时间戳水印缺少日期，使用2025-1-1作为日期
 
 ## 任务要求
 
@@ -118,41 +100,41 @@ class PromptBuilder:
   - merge_from 必须小于 target_person_id
 
 ### 6. 编号分配规则
-- **新事件编号必须从 evt_{next_event_id:05d} 开始递增**
+- **新事件编号必须从“编号起始值”中给出的事件编号开始递增**
 - start_time 在先的事件先描述。如果两个事件的 start_time 相同，则随意。
-- **新人物编号必须从 p{next_person_id} 开始递增**
+- **新人物编号必须从“编号起始值”中给出的人物编号开始递增**
 
 ## 输出格式
 必须输出以下 JSON 格式：
 
 ```json
-{{
+{
   "events_to_append": [
-    {{
+    {
       "event_id": "evt_xxxxx",
       "start_time": "2025-12-24T10:00:00",
       "end_time": "2025-12-24T10:00:20",
       "event_type": "person",
       "person_ids": ["p3"],
       "description": "人物 p3 向本摄像头展示二维码。"
-    }}
+    }
   ],
   "appearance_updates": [
-    {{
+    {
       "op": "add",
       "target_person_id": "p7",
       "appearance": "短黑发，戴黑框眼镜，穿白色实验服...",
       "user_id": null
-    }}
+    }
   ],
   "emergency_events": [
-    {{
+    {
       "description": "画面左侧离心机位置出现明火，伴随黑烟。",
       "start_time": "2025-12-24T10:00:05",
       "end_time": "2025-12-24T10:00:15"
-    }}
+    }
   ]
-}}
+}
 ```
 
 ## 注意事项
@@ -161,9 +143,349 @@ class PromptBuilder:
 - 事件描述中不要包含具体的人物外貌特征和 user_id，这些信息只保存在外貌表中
 - equipment-only 和 none 事件的 person_ids 应为空数组 []
 - 如果没有外貌更新，appearance_updates 返回空数组
-- 如果没有紧急情况，emergency_events 返回空数组
-"""
-        return prompt
+- 如果没有紧急情况，emergency_events 返回空数组"""
+
+
+@dataclass(frozen=True)
+class PromptLayout:
+    """
+    分层提示词
+
+    - static_prefix: 系统指令 + 任务要求 + 输出格式（所有分段完全相同）
+    - appearance_section: 人物外貌表
+    - volatile_tail: 二维码识别结果、最近事件记录、编号起始值
+    - budget: 本次的 token 预算分配（BudgetSplit.to_dict()）
+    """
+    static_prefix: str
+    appearance_section: str
+    volatile_tail: str
+    budget: Dict[str, Any] = field(default_factory=dict, compare=False)
+
+    def to_text(self) -> str:
+        """拼接为单段文本（用于不区分消息角色的场景）"""
+        return "\n\n".join([self.static_prefix, self.appearance_section, self.volatile_tail])
+
+
+class PromptBuilder:
+    """动态提示词构建器"""
+    
+    def __init__(self, max_recent_events: int = 20, max_input_tokens: Optional[int] = None):
+        """
+        初始化提示词构建器
+        
+        Args:
+            max_recent_events: 最大最近事件数
+            max_input_tokens: 文本输入上限（估算 token），None 则读取 PROMPT_MAX_INPUT_TOKENS，0 表示不限制
+        """
+        self.max_recent_events = max_recent_events
+        self.max_input_tokens = get_max_input_tokens() if max_input_tokens is None else max_input_tokens
+        # 静态前缀只构建一次，保证每次调用逐字节一致
+        self._static_prefix: Optional[str] = None
+        # 外貌表渲染缓存：(缓存对象 id, 版本号) -> 全量段落、全量 token 数、每人一行的 token 数
+        self._appearance_render_key: Optional[Tuple[int, int]] = None
+        self._appearance_render: Optional[Tuple[str, int, Dict[str, int]]] = None
+    
+    def build_static_prefix(self) -> str:
+        """
+        构建静态前缀（系统指令 + 任务要求 + 输出格式）
+        
+        Returns:
+            静态前缀文本（首次构建后缓存）
+        """
+        if self._static_prefix is None:
+            self._static_prefix = f"{SYSTEM_INSTRUCTION}\n\n{TASK_RULES}"
+        return self._static_prefix
+    
+    def build_prompt_layout(
+        self,
+        segment: VideoSegment,
+        qr_results: List[Dict[str, Any]],
+        recent_events: List[Dict[str, Any]],
+        appearance_cache: AppearanceCache,
+        max_event_id: int,
+        max_person_id: Optional[int]
+    ) -> PromptLayout:
+        """
+        构建分层提示词
+        
+        Args:
+            segment: 视频分段
+            qr_results: 二维码识别结果
+            recent_events: 最近事件列表
+            appearance_cache: 人物外貌缓存
+            max_event_id: 当前最大事件编号数字
+            max_person_id: 当前最大人物编号数字（可能为 None）
+        
+        Returns:
+            PromptLayout
+        """
+        static_prefix = self.build_static_prefix()
+        
+        # 计算新编号的起始值
+        next_event_id = max_event_id + 1
+        next_person_id = (max_person_id or 0) + 1
+        
+        qr_section = f"## 二维码识别结果\n{self._format_qr_results(qr_results)}"
+        id_section = f"""## 编号起始值
+- 新事件编号从 evt_{next_event_id:05d} 开始递增
+- 新人物编号从 p{next_person_id} 开始递增"""
+        if segment.extra_video_paths:
+            # 多视频合并调用：各视频是同一机位按时间顺序相邻的片段
+            id_section = f"""## 视频说明
+- 本次共 {len(segment.extra_video_paths) + 1} 段视频，按时间顺序相邻，视为同一段连续录像分析
+- 跨视频持续的动作只记录为一个事件，时间以各视频的时间戳水印为准
+
+{id_section}"""
+        
+        budget = BudgetSplit(ceiling=self.max_input_tokens)
+        budget.static_tokens = estimate_tokens(static_prefix)
+        budget.fixed_tokens = estimate_tokens(qr_section) + estimate_tokens(id_section)
+        
+        main_records, aliases = appearance_cache.get_for_prompt()
+        rendered = self._render_appearance_cached(appearance_cache, main_records, aliases)
+        appearance_section, events_section = self._fit_to_budget(
+            main_records, aliases, rendered, qr_results, recent_events, budget
+        )
+        
+        volatile_tail = f"{qr_section}\n\n{events_section}\n\n{id_section}"
+        
+        if budget.ceiling and budget.total_tokens > budget.ceiling:
+            print(
+                f"[Warning]: 提示词必需部分已超出预算 "
+                f"({budget.total_tokens}/{budget.ceiling} tokens)"
+            )
+        elif budget.trimmed:
+            print(
+                f"[Context]: 提示词按预算裁剪 ({budget.total_tokens}/{budget.ceiling} tokens): "
+                f"外貌表 {budget.appearance_included} 条展开/{budget.appearance_omitted} 条仅编号, "
+                f"事件 {budget.events_included} 条（截断 {budget.events_truncated}，丢弃 {budget.events_dropped}）"
+            )
+        
+        return PromptLayout(
+            static_prefix=static_prefix,
+            appearance_section=appearance_section,
+            volatile_tail=volatile_tail,
+            budget=budget.to_dict()
+        )
+    
+    def _render_appearance_cached(
+        self,
+        appearance_cache: AppearanceCache,
+        main_records: List[Dict[str, Any]],
+        aliases: List[Dict[str, str]]
+    ) -> Tuple[str, int, Dict[str, int]]:
+        """
+        渲染全量外貌表并按外貌缓存版本号复用
+        
+        Returns:
+            (全量外貌表段落, 全量段落 token 数, 人物编号 -> 单行 token 数)
+        """
+        key = (id(appearance_cache), appearance_cache.version)
+        if self._appearance_render_key != key or self._appearance_render is None:
+            section = self._render_appearance_section(main_records, aliases, [])
+            line_tokens = {
+                r['person_id']: estimate_tokens(self._format_person_line(r)) + 1
+                for r in main_records
+            }
+            self._appearance_render = (section, estimate_tokens(section), line_tokens)
+            self._appearance_render_key = key
+        return self._appearance_render
+    
+    def _fit_to_budget(
+        self,
+        main_records: List[Dict[str, Any]],
+        aliases: List[Dict[str, str]],
+        rendered: Tuple[str, int, Dict[str, int]],
+        qr_results: List[Dict[str, Any]],
+        recent_events: List[Dict[str, Any]],
+        budget: BudgetSplit
+    ) -> Tuple[str, str]:
+        """
+        在预算内分配外貌表与最近事件
+        
+        先尝试全量；超出时外貌表至少可占剩余预算的 APPEARANCE_BUDGET_SHARE，
+        任一部分未用完的额度让给另一部分。
+        
+        Returns:
+            (外貌表段落, 最近事件段落)
+        """
+        full_appearance, full_appearance_tokens, line_tokens = rendered
+        full_events = self._render_events_section(recent_events, truncate_from=len(recent_events))
+        full_events_tokens = estimate_tokens(full_events)
+        
+        available = budget.ceiling - budget.static_tokens - budget.fixed_tokens
+        if not budget.ceiling or full_appearance_tokens + full_events_tokens <= available:
+            budget.appearance_tokens = full_appearance_tokens
+            budget.events_tokens = full_events_tokens
+            budget.appearance_included = len(main_records)
+            budget.events_included = len(recent_events)
+            return full_appearance, full_events
+        
+        available = max(available, 0)
+        appearance_budget = max(int(available * APPEARANCE_BUDGET_SHARE), available - full_events_tokens)
+        appearance_section = self._fit_appearance(
+            main_records, aliases, line_tokens, qr_results, recent_events, appearance_budget, budget
+        )
+        budget.appearance_tokens = estimate_tokens(appearance_section)
+        
+        events_section = self._fit_events(
+            recent_events, available - budget.appearance_tokens, budget
+        )
+        budget.events_tokens = estimate_tokens(events_section)
+        return appearance_section, events_section
+    
+    def _fit_appearance(
+        self,
+        main_records: List[Dict[str, Any]],
+        aliases: List[Dict[str, str]],
+        line_tokens: Dict[str, int],
+        qr_results: List[Dict[str, Any]],
+        recent_events: List[Dict[str, Any]],
+        token_budget: int,
+        budget: BudgetSplit
+    ) -> str:
+        """
+        按优先级选择展开描述的人物，其余人物只列出编号
+        
+        优先级：与本分段二维码关联 > 在最近事件中出现得更晚 > 最近一次出现时间更晚
+        > 已关联用户ID > 编号更大（更新）
+        """
+        alias_to_main = {a['alias']: a['main_person_id'] for a in aliases}
+        qr_user_ids = {qr.get('user_id') for qr in qr_results if qr.get('user_id')}
+        
+        # 最近事件按时间倒序排列，下标越小越新
+        mention_index: Dict[str, int] = {}
+        for idx, event in enumerate(recent_events):
+            for pid in event.get('person_ids', []) or []:
+                main_id = alias_to_main.get(pid, pid)
+                mention_index.setdefault(main_id, idx)
+        
+        def rank(record: Dict[str, Any]) -> Tuple:
+            pid = record['person_id']
+            return (
+                record.get('user_id') in qr_user_ids,
+                -mention_index.get(pid, len(recent_events)),
+                record.get('last_seen') or '',
+                bool(record.get('user_id')),
+                self._person_number(pid),
+            )
+        
+        ranked = sorted(main_records, key=rank, reverse=True)
+        
+        # 预留“仅编号”行的开销（按全部人物估算，保证上限）
+        reserve = estimate_tokens(self._render_appearance_section([], [], [r['person_id'] for r in ranked]))
+        remaining = token_budget - reserve
+        selected_ids = set()
+        for record in ranked:
+            cost = line_tokens[record['person_id']]
+            if cost > remaining:
+                continue
+            selected_ids.add(record['person_id'])
+            remaining -= cost
+        
+        # 渲染时保持编号顺序，使外貌表在人物集合不变时逐字节稳定
+        selected = [r for r in main_records if r['person_id'] in selected_ids]
+        omitted = [r['person_id'] for r in main_records if r['person_id'] not in selected_ids]
+        kept_aliases = [a for a in aliases if a['main_person_id'] in selected_ids]
+        
+        section = self._render_appearance_section(selected, kept_aliases, omitted)
+        if estimate_tokens(section) > token_budget and kept_aliases:
+            # 别名放不下时只保留主记录
+            kept_aliases = []
+            section = self._render_appearance_section(selected, kept_aliases, omitted)
+        
+        budget.appearance_included = len(selected)
+        budget.appearance_omitted = len(omitted)
+        return section
+    
+    def _fit_events(
+        self,
+        recent_events: List[Dict[str, Any]],
+        token_budget: int,
+        budget: BudgetSplit
+    ) -> str:
+        """
+        在预算内保留最近事件：先截断较早事件的描述，仍超出则从最早的事件开始丢弃
+        """
+        events = list(recent_events)
+        truncate_from = len(events)
+        section = self._render_events_section(events, truncate_from=truncate_from)
+        if estimate_tokens(section) > token_budget:
+            truncate_from = min(EVENTS_KEEP_FULL, len(events))
+            section = self._render_events_section(events, truncate_from=truncate_from)
+            while events and estimate_tokens(section) > token_budget:
+                # recent_events 按时间倒序，末尾是最早的事件
+                events.pop()
+                truncate_from = min(truncate_from, len(events))
+                section = self._render_events_section(events, truncate_from=truncate_from)
+        
+        budget.events_included = len(events)
+        budget.events_truncated = sum(
+            1 for e in events[truncate_from:]
+            if len(e.get('description', '') or '') > EVENT_DESCRIPTION_MAX_CHARS
+        )
+        budget.events_dropped = len(recent_events) - len(events)
+        return section
+    
+    def _render_events_section(self, events: List[Dict[str, Any]], truncate_from: int) -> str:
+        """渲染最近事件段落（下标 >= truncate_from 的事件描述会被截断）"""
+        header = f"## 最近事件记录（参考描述风格，共 {len(events)} 条）"
+        if truncate_from < len(events):
+            header += "\n（较早事件的描述已截断）"
+        return f"{header}\n{self._format_recent_events(events, truncate_from)}"
+    
+    def _render_appearance_section(
+        self,
+        main_records: List[Dict[str, Any]],
+        aliases: List[Dict[str, str]],
+        omitted_ids: List[str]
+    ) -> str:
+        """渲染外貌表段落"""
+        if not omitted_ids:
+            return (
+                "## 人物外貌表（已全量给出）\n"
+                f"{self._format_appearance_table(main_records, aliases)}"
+            )
+        
+        table = self._format_appearance_table(main_records, aliases) if main_records else "### 人物记录"
+        return (
+            "## 人物外貌表（部分给出）\n"
+            f"{table}\n"
+            f"- 未展开描述的已有人物: {', '.join(omitted_ids)}（如确认是同一人，沿用其编号）"
+        )
+    
+    def build_dynamic_prompt(
+        self,
+        segment: VideoSegment,
+        qr_results: List[Dict[str, Any]],
+        recent_events: List[Dict[str, Any]],
+        appearance_cache: AppearanceCache,
+        max_event_id: int,
+        max_person_id: Optional[int]
+    ) -> str:
+        """
+        构建动态提示词（单段文本，不含系统指令）
+        
+        Args:
+            segment: 视频分段
+            qr_results: 二维码识别结果
+            recent_events: 最近事件列表
+            appearance_cache: 人物外貌缓存
+            max_event_id: 当前最大事件编号数字
+            max_person_id: 当前最大人物编号数字（可能为 None）
+        
+        Returns:
+            构建好的提示词文本
+        """
+        layout = self.build_prompt_layout(
+            segment=segment,
+            qr_results=qr_results,
+            recent_events=recent_events,
+            appearance_cache=appearance_cache,
+            max_event_id=max_event_id,
+            max_person_id=max_person_id
+        )
+        return "\n\n".join([TASK_RULES, layout.appearance_section, layout.volatile_tail])
     
     def _format_qr_results(self, qr_results: List[Dict[str, Any]]) -> str:
         """格式化二维码识别结果"""
@@ -190,13 +512,17 @@ class PromptBuilder:
         
         return "\n".join(lines)
     
-    def _format_recent_events(self, events: List[Dict[str, Any]]) -> str:
-        """格式化最近事件记录"""
+    def _format_recent_events(self, events: List[Dict[str, Any]], truncate_from: Optional[int] = None) -> str:
+        """格式化最近事件记录（下标 >= truncate_from 的事件描述会被截断）"""
         if not events:
             return "（暂无事件记录）"
         
         lines = []
-        for event in events:
+        for idx, event in enumerate(events):
+            description = event.get('description', '') or ''
+            if truncate_from is not None and idx >= truncate_from:
+                description = truncate_text(description, EVENT_DESCRIPTION_MAX_CHARS)
+            
             person_ids = event.get('person_ids', [])
             person_str = ", ".join(person_ids) if person_ids else "-"
             equipment = event.get('equipment', '') or "-"
@@ -207,16 +533,18 @@ class PromptBuilder:
                 f"{event.get('event_type', '')} | "
                 f"人物: {person_str} | "
                 f"设备: {equipment} | "
-                f"{event.get('description', '')}"
+                f"{description}"
             )
             lines.append(line)
         
         return "\n".join(lines)
     
-    def _format_appearance_table(self, appearance_cache: AppearanceCache) -> str:
+    def _format_appearance_table(
+        self,
+        main_records: List[Dict[str, Any]],
+        aliases: List[Dict[str, str]]
+    ) -> str:
         """格式化人物外貌表"""
-        main_records, aliases = appearance_cache.get_for_prompt()
-        
         if not main_records:
             return "（暂无人物外貌记录）"
         
@@ -225,8 +553,7 @@ class PromptBuilder:
         # 主记录
         lines.append("### 人物记录")
         for record in main_records:
-            user_id_str = f", 用户ID: {record['user_id']}" if record.get('user_id') else ""
-            lines.append(f"- {record['person_id']}: {record['appearance']}{user_id_str}")
+            lines.append(self._format_person_line(record))
         
         # 别名
         if aliases:
@@ -236,6 +563,16 @@ class PromptBuilder:
         
         return "\n".join(lines)
     
+    def _format_person_line(self, record: Dict[str, Any]) -> str:
+        """格式化单条人物记录"""
+        user_id_str = f", 用户ID: {record['user_id']}" if record.get('user_id') else ""
+        return f"- {record['person_id']}: {record['appearance']}{user_id_str}"
+    
+    def _person_number(self, person_id: str) -> int:
+        """从 p12 形式的编号提取数字"""
+        digits = person_id[1:] if person_id.startswith('p') else ''
+        return int(digits) if digits.isdigit() else 0
+    
     def build_system_instruction(self) -> str:
         """
         构建系统指令
@@ -243,18 +580,4 @@ class PromptBuilder:
         Returns:
             系统指令文本
         """
-        return """你是一个实验室视频分析助手，负责分析视频内容并生成结构化的事件日志。
-
-你需要：
-1. 仔细观察视频中的人物动作和设备状态
-2. 根据时间戳水印确定事件的时间范围
-3. 将观察结果与已有的上下文（事件记录、人物外貌表）关联
-4. 输出续写的事件和外貌更新，格式必须为指定的 JSON 格式
-
-关键原则：
-- 准确识别时间戳，精确到秒
-- 优先重用已有的人物编号，避免创建重复记录
-- 外貌匹配时，稀有特征的权重高于常见特征
-- 不在事件描述中提及人物外貌信息（如上衣颜色、头发颜色等），这些信息保存在外貌表中
-- 只输出 JSON，不要输出其他内容"""
-
+        return SYSTEM_INSTRUCTION
@@ -0,0 +1,102 @@
+"""提示词 token 预算：估算各部分 token 数并记录每个分段的预算分配"""
+
+import math
+import os
+from dataclasses import dataclass, asdict
+from typing import Any, Dict
+
+
+# 默认文本输入上限（估算 token，不含视频帧 token）
+DEFAULT_MAX_INPUT_TOKENS = 12000
+
+# 外貌表与最近事件同时超预算时，外貌表优先占用的比例（未用完的部分让给事件）
+APPEARANCE_BUDGET_SHARE = 0.6
+
+# 最近事件中保留完整描述的条数（更早的事件描述会被截断）
+EVENTS_KEEP_FULL = 5
+
+# 截断后的事件描述最大字符数
+EVENT_DESCRIPTION_MAX_CHARS = 30
+
+
+def get_max_input_tokens() -> int:
+    """
+    读取提示词文本输入上限（环境变量 PROMPT_MAX_INPUT_TOKENS）
+
+    Returns:
+        上限 token 数；0 表示不限制
+    """
+    value = os.getenv('PROMPT_MAX_INPUT_TOKENS', str(DEFAULT_MAX_INPUT_TOKENS))
+    try:
+        return max(int(value), 0)
+    except ValueError:
+        return DEFAULT_MAX_INPUT_TOKENS
+
+
+def _is_cjk(ch: str) -> bool:
+    code = ord(ch)
+    return (
+        0x4E00 <= code <= 0x9FFF        # CJK 统一汉字
+        or 0x3400 <= code <= 0x4DBF     # 扩展 A
+        or 0x3000 <= code <= 0x303F     # CJK 标点
+        or 0xFF00 <= code <= 0xFFEF     # 全角字符
+    )
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    粗略估算文本 token 数（不依赖具体分词器）
+
+    中文字符及全角标点按 1 字 1 token 计，其余字符按 4 字符 1 token 计，结果向上取整，
+    对 Qwen / Gemini 的分词结果略偏保守。
+
+    Args:
+        text: 文本
+
+    Returns:
+        估算 token 数
+    """
+    if not text:
+        return 0
+    cjk = 0
+    for ch in text:
+        if _is_cjk(ch):
+            cjk += 1
+    other = len(text) - cjk
+    return cjk + math.ceil(other / 4)
+
+
+def truncate_text(text: str, max_chars: int) -> str:
+    """截断文本，超出部分以省略号代替"""
+    if len(text) <= max_chars:
+        return text
+    return text[:max_chars] + "…"
+
+
+@dataclass
+class BudgetSplit:
+    """单个分段的提示词预算分配（估算 token）"""
+    ceiling: int                    # 文本输入上限，0 表示不限制
+    static_tokens: int = 0          # 静态前缀
+    fixed_tokens: int = 0           # 二维码识别结果 + 编号起始值（必需部分）
+    appearance_tokens: int = 0      # 人物外貌表
+    events_tokens: int = 0          # 最近事件记录
+    appearance_included: int = 0    # 展开描述的人物数
+    appearance_omitted: int = 0     # 仅列出编号的人物数
+    events_included: int = 0        # 保留的事件数
+    events_truncated: int = 0       # 描述被截断的事件数
+    events_dropped: int = 0         # 被丢弃的最早事件数
+
+    @property
+    def total_tokens(self) -> int:
+        return self.static_tokens + self.fixed_tokens + self.appearance_tokens + self.events_tokens
+
+    @property
+    def trimmed(self) -> bool:
+        """是否因预算进行了裁剪"""
+        return bool(self.appearance_omitted or self.events_truncated or self.events_dropped)
+
+    def to_dict(self) -> Dict[str, Any]:
+        data = asdict(self)
+        data['total_tokens'] = self.total_tokens
+        return data
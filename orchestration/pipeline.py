@@ -1,6 +1,22 @@
-"""主处理流程（串行执行）"""
+"""主处理流程：分段 → 视频理解 → 写入日志，三个阶段流水线并行
 
-from typing import List, Optional
+分段器每切出一个分段就交给视频理解阶段，视频理解以有限并发处理（各阶段之间是有界队列，
+切分快于理解时分段器会阻塞等待，不会把整段视频一次性切完），写入阶段按分段顺序提交
+已完成的连续分段。整段视频的处理时间接近视频理解阶段本身的耗时。
+
+处理器使用动态上下文（event_context）时，分段之间有顺序依赖（最近事件、外貌表、事件编号），
+视频理解阶段退化为单并发，但切分与写入仍与之重叠。
+
+环境变量：
+- PIPELINE_VLM_PARALLELISM：视频理解阶段的并发数（默认 2）
+"""
+
+import os
+import queue
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
 
 from segmentation.segmenter import VideoSegmenter
 from video_processing.interface import VideoProcessor
@@ -9,7 +25,52 @@ from log_writer.writer import LogWriter
 from indexing.chunker import LogChunker
 from indexing.embedding_service import EmbeddingService
 from storage.seekdb_client import SeekDBClient
-from storage.models import EventLog
+from storage.models import EventLog, VideoSegment, VideoUnderstandingResult
+
+
+# 阶段之间传递的结束标记
+_END = object()
+
+
+def _env_number(name: str, default, cast):
+    try:
+        return cast(os.getenv(name, str(default)))
+    except ValueError:
+        return default
+
+
+@dataclass
+class StageMetrics:
+    """单个阶段的统计：处理耗时与输入队列深度"""
+    name: str
+    count: int = 0
+    busy_time: float = 0.0       # 各分段处理耗时之和（并发阶段可大于墙钟时间）
+    max_latency: float = 0.0
+    wait_time: float = 0.0       # 等待上游的累计时间
+    depth_samples: int = 0
+    depth_total: int = 0
+    max_depth: int = 0
+    
+    def record(self, latency: float) -> None:
+        self.count += 1
+        self.busy_time += latency
+        self.max_latency = max(self.max_latency, latency)
+    
+    def sample_depth(self, depth: int) -> None:
+        self.depth_samples += 1
+        self.depth_total += depth
+        self.max_depth = max(self.max_depth, depth)
+    
+    def summary(self) -> Dict[str, Any]:
+        return {
+            'count': self.count,
+            'avg_latency': round(self.busy_time / self.count, 2) if self.count else None,
+            'max_latency': round(self.max_latency, 2),
+            'busy_time': round(self.busy_time, 2),
+            'wait_time': round(self.wait_time, 2),
+            'avg_queue_depth': round(self.depth_total / self.depth_samples, 2) if self.depth_samples else 0,
+            'max_queue_depth': self.max_depth,
+        }
 
 
 class VideoLogPipeline:
@@ -22,7 +83,8 @@ class VideoLogPipeline:
                  embedding_service: Optional[EmbeddingService] = None,
                  db_client: Optional[SeekDBClient] = None,
                  enable_indexing: bool = False,
-                 nominal_date: Optional[str] = None):
+                 nominal_date: Optional[str] = None,
+                 vlm_parallelism: Optional[int] = None):
         """
         初始化处理流程
         
@@ -34,6 +96,7 @@ class VideoLogPipeline:
             db_client: 数据库客户端，如果为 None 则创建默认实例
             enable_indexing: 是否启用索引（分块和嵌入），默认 False（已废弃，索引完全由独立脚本处理，不再由视频处理触发）
             nominal_date: 名义日期 (YYYY-MM-DD)，用于外貌缓存的复合键
+            vlm_parallelism: 视频理解阶段的并发数，None 则读取 PIPELINE_VLM_PARALLELISM（默认 2）
         """
         self.db_client = db_client or SeekDBClient()
         
@@ -47,58 +110,171 @@ class VideoLogPipeline:
         self.chunker = chunker or LogChunker()
         self.embedding_service = embedding_service or EmbeddingService()
         self.enable_indexing = enable_indexing  # 保留参数以兼容旧代码，但实际不再使用
+        
+        if vlm_parallelism is None:
+            vlm_parallelism = _env_number('PIPELINE_VLM_PARALLELISM', 2, int)
+        if getattr(self.video_processor, '_use_dynamic_context', False):
+            # 动态上下文依赖上一个分段的结果，只能逐个理解
+            vlm_parallelism = 1
+        self.vlm_parallelism = max(1, vlm_parallelism)
+        # 最近一次 process_video 的各阶段统计
+        self.last_metrics: Dict[str, Any] = {}
     
     def process_video(self, video_path: str) -> List[EventLog]:
         """
-        处理视频：分段 → 理解并立即写入
+        处理视频：分段 → 理解 → 按分段顺序写入（三个阶段流水线并行）
         
         Args:
             video_path: 视频文件路径
         
         Returns:
-            所有生成的事件日志列表
+            所有生成的事件日志列表（按分段顺序）
         """
         print(f"开始处理视频: {video_path}")
-        
-        # 1. 视频分段
-        print("步骤 1/2: 视频分段...")
-        segmenter = VideoSegmenter()
-        segments = segmenter.segment(video_path)
-        print(f"  分段完成，共 {len(segments)} 个分段")
-        
-        # 2. 视频理解并立即写入
         from config.encryption_config import EncryptionConfig
         encryption_status = "（加密）" if EncryptionConfig.should_encrypt() else ""
-        print(f"步骤 2/2: 视频理解并写入日志{encryption_status}...")
-        all_events = []
-        total_written = 0
-        for i, segment in enumerate(segments, 1):
-            print(f"  处理分段 {i}/{len(segments)}: {segment.segment_id}")
+        print(f"流水线处理：分段 → 视频理解（并发 {self.vlm_parallelism}）→ 写入日志{encryption_status}")
+        
+        started_at = time.time()
+        metrics = {name: StageMetrics(name) for name in ('segment', 'vlm', 'write')}
+        # 有界队列：下游跟不上时上游阻塞，避免一次切出全部分段
+        segment_queue: queue.Queue = queue.Queue(maxsize=self.vlm_parallelism * 2)
+        result_queue: queue.Queue = queue.Queue()
+        stop = threading.Event()
+        vlm_metrics_lock = threading.Lock()
+        segmenter_error: List[BaseException] = []
+        
+        def put(q: queue.Queue, item) -> bool:
+            """放入有界队列；写入阶段已中止时返回 False"""
+            while not stop.is_set():
+                try:
+                    q.put(item, timeout=0.5)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+        
+        def segment_stage() -> None:
+            segmenter = VideoSegmenter()
+            index = 0
             try:
-                # 视频理解
-                result = self.video_processor.process_segment(segment)
-                print(f"    识别到 {len(result.events)} 个事件")
-                
-                # 立即写入日志（每理解一段就立刻写入）
-                for event in result.events:
-                    try:
-                        self.log_writer.write_event_log(event)
-                        total_written += 1
-                    except Exception as e:
-                        print(f"    写入事件失败 ({event.event_id}): {e}")
-                        continue
+                cut_start = time.time()
+                for segment in segmenter.iter_segments(video_path):
+                    metrics['segment'].record(time.time() - cut_start)
+                    metrics['vlm'].sample_depth(segment_queue.qsize())
+                    if not put(segment_queue, (index, segment)):
+                        return
+                    index += 1
+                    cut_start = time.time()
+            except BaseException as e:
+                segmenter_error.append(e)
+            finally:
+                for _ in range(self.vlm_parallelism):
+                    put(segment_queue, _END)
+        
+        def vlm_stage() -> None:
+            while True:
+                wait_start = time.time()
+                item = segment_queue.get()
+                if item is _END:
+                    result_queue.put(_END)
+                    return
+                index, segment = item
+                call_start = time.time()
+                try:
+                    result = self.video_processor.process_segment(segment)
+                    error = None
+                except Exception as e:
+                    result, error = None, e
+                with vlm_metrics_lock:
+                    metrics['vlm'].wait_time += call_start - wait_start
+                    metrics['vlm'].record(time.time() - call_start)
+                    metrics['write'].sample_depth(result_queue.qsize())
+                result_queue.put((index, segment, result, error))
+        
+        workers = [threading.Thread(target=segment_stage, name="pipeline-segment", daemon=True)]
+        workers += [
+            threading.Thread(target=vlm_stage, name=f"pipeline-vlm-{i}", daemon=True)
+            for i in range(self.vlm_parallelism)
+        ]
+        for worker in workers:
+            worker.start()
+        
+        all_events: List[EventLog] = []
+        total_written = 0
+        pending: Dict[int, tuple] = {}
+        next_index = 0
+        finished_workers = 0
+        try:
+            while finished_workers < self.vlm_parallelism:
+                wait_start = time.time()
+                item = result_queue.get()
+                metrics['write'].wait_time += time.time() - wait_start
+                if item is _END:
+                    finished_workers += 1
+                else:
+                    pending[item[0]] = item
                 
-                # 收集事件（用于返回值）
-                all_events.extend(result.events)
-                print(f"    已写入 {len(result.events)} 个事件到数据库")
-            except Exception as e:
-                print(f"    处理分段失败: {e}")
-                continue
+                # 按分段顺序提交已就绪的连续分段
+                while next_index in pending:
+                    _, segment, result, error = pending.pop(next_index)
+                    next_index += 1
+                    write_start = time.time()
+                    written = self._write_segment_result(segment, result, error)
+                    metrics['write'].record(time.time() - write_start)
+                    total_written += written
+                    if result is not None:
+                        all_events.extend(result.events)
+        finally:
+            stop.set()
+            for worker in workers:
+                worker.join(timeout=1.0)
         
-        print(f"  视频处理完成，共识别 {len(all_events)} 个事件，已写入 {total_written} 个事件")
+        if segmenter_error:
+            raise segmenter_error[0]
+        
+        elapsed = time.time() - started_at
+        self.last_metrics = {
+            'elapsed': round(elapsed, 2),
+            'vlm_parallelism': self.vlm_parallelism,
+            'segments': next_index,
+            'events_written': total_written,
+            'stages': {name: stage.summary() for name, stage in metrics.items()},
+        }
+        vlm_time = metrics['vlm'].busy_time / self.vlm_parallelism
+        print(f"  视频处理完成，共 {next_index} 个分段，识别 {len(all_events)} 个事件，已写入 {total_written} 个事件")
+        print(
+            f"  总耗时 {elapsed:.1f}s（视频理解阶段 {vlm_time:.1f}s，"
+            f"分段 {metrics['segment'].busy_time:.1f}s，写入 {metrics['write'].busy_time:.1f}s）"
+        )
+        for name, stage in metrics.items():
+            print(f"    [{name}] {stage.summary()}")
         print("视频处理完成！")
         return all_events
     
+    def _write_segment_result(
+        self,
+        segment: VideoSegment,
+        result: Optional[VideoUnderstandingResult],
+        error: Optional[Exception]
+    ) -> int:
+        """写入一个分段的理解结果，返回成功写入的事件数"""
+        print(f"  分段 {segment.segment_id}:")
+        if error is not None:
+            print(f"    处理分段失败: {error}")
+            return 0
+        print(f"    识别到 {len(result.events)} 个事件")
+        written = 0
+        for event in result.events:
+            try:
+                self.log_writer.write_event_log(event)
+                written += 1
+            except Exception as e:
+                print(f"    写入事件失败 ({event.event_id}): {e}")
+                continue
+        print(f"    已写入 {written} 个事件到数据库")
+        return written
+    
     def index_events(self, events: List[EventLog]) -> dict:
         """
         对事件进行分块和嵌入（公共方法，供实时处理流程调用）
@@ -0,0 +1,540 @@
+"""录制会话重放引擎：按名义日期分道并行处理、预取后续分段、断点续跑
+
+scripts/process_recording_session.py 原先逐个分段串行阻塞调用模型，且没有断点，中途崩溃只能从头再来。
+ReplayEngine 的做法：
+
+- 每个名义日期一条有序通道（lane）：同一日期的会话按目录名、分段按 segment_id 顺序处理
+  （事件编号与外貌缓存依赖处理顺序）；不同日期的通道并行，共用异步 HTTP 连接池
+- 预取：处理当前分段时，在线程池中提前准备后面 prefetch 个分段（上传前预处理、响应缓存的视频哈希）
+- 断点：每个分段提交（外貌更新写入操作日志、事件写入数据库与 event_logs.jsonl）后，把
+  last_segment_id、外貌操作日志序号与最大事件编号写入 logs_debug/replay_checkpoints/<日期>.json；
+  重跑时跳过断点及之前的分段。上下文提交后立即把提交结果（事件与写入进度）记入断点（committed），
+  之后写入失败或崩溃时，重跑只重做剩余的写入，不再调用模型、不再重复提交外貌更新
+- 失败：分段处理或事件写入失败时通道停止（事件编号与外貌缓存依赖顺序，不能越过失败分段继续），
+  断点保持在失败批次之前。提交前失败的分段记入 failed_segments，重跑时重新处理；提交后写入失败的
+  批次由 committed 续写
+- 合并调用（batch_size > 1）：同一会话中相邻的 batch_size 个分段合为一次调用（拼接或多视频，见
+  video_processing/batching.py），事件按水印时间归还到各自的 segment_id，断点记录到批次最后一个分段；
+  通道统计给出每分钟视频的 token 数，便于比较合并前后的成本
+
+单个日期只有一条通道时外貌缓存使用 logs_debug/appearances.json（与实时处理相同）；
+多个日期并行时每个日期使用 logs_debug/appearances_<YYYYMMDD>.json，避免互相覆盖。
+"""
+
+import asyncio
+import json
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from context.context_service import DateContextService, acquire_context_service, release_context_service
+from storage.models import EventLog, VideoSegment, from_commit_record, to_commit_record
+from utils.segment_time_parser import extract_date_from_segment_id, parse_segment_times
+from video_processing.batching import (
+    BATCH_MODE_CONCAT,
+    BATCH_MODE_MULTI,
+    SegmentPart,
+    attribute_items,
+    concat_segments,
+)
+from video_processing.preprocess import VideoPreprocessor, is_preprocess_enabled
+from video_processing.response_cache import file_sha256, is_response_cache_enabled
+
+
+DEBUG_LOG_DIR = Path("logs_debug")
+CHECKPOINT_DIR = DEBUG_LOG_DIR / "replay_checkpoints"
+
+
+def load_segments(session_dir: Path, target_duration: float) -> List[VideoSegment]:
+    """读取目录下的 mp4 分段及对应二维码结果"""
+    mp4_files = sorted(session_dir.glob("*.mp4"))
+    segments: List[VideoSegment] = []
+    for mp4_file in mp4_files:
+        segment_id = mp4_file.stem
+        qr_file = mp4_file.with_name(f"{segment_id}_qr.json")
+        qr_results = []
+        if qr_file.exists():
+            try:
+                qr_results = json.loads(qr_file.read_text(encoding="utf-8"))
+            except Exception as e:
+                print(f"[Warn] 读取二维码结果失败 {qr_file}: {e}")
+                qr_results = []
+        start_time, end_time = parse_segment_times(segment_id, target_duration)
+        segments.append(
+            VideoSegment(
+                segment_id=segment_id,
+                video_path=str(mp4_file),
+                start_time=start_time,
+                end_time=end_time,
+                qr_results=qr_results,
+            )
+        )
+    return segments
+
+
+def nominal_date_from_session(session_dir: Path) -> str:
+    """
+    从会话目录名提取名义日期
+
+    Args:
+        session_dir: 会话目录（格式 YYYYMMDD_HHMMSS）
+
+    Returns:
+        YYYY-MM-DD
+
+    Raises:
+        ValueError: 目录名日期部分无效
+    """
+    date_part = session_dir.name.split('_')[0]
+    if len(date_part) != 8 or not date_part.isdigit():
+        raise ValueError(f"目录名日期部分无效: {date_part}")
+    return f"{date_part[:4]}-{date_part[4:6]}-{date_part[6:]}"
+
+
+@dataclass
+class ReplayItem:
+    """通道中的一个分段"""
+    session_dir: Path
+    segment: VideoSegment
+
+    @property
+    def key(self) -> Tuple[str, str]:
+        """通道内的顺序键（会话目录名, segment_id）"""
+        return (self.session_dir.name, self.segment.segment_id)
+
+
+@dataclass
+class ReplayLane:
+    """一个名义日期的有序通道"""
+    nominal_date: str
+    items: List[ReplayItem] = field(default_factory=list)
+
+
+@dataclass
+class ReplayCheckpoint:
+    """通道断点"""
+    nominal_date: str
+    session: Optional[str] = None          # 最后提交分段所在的会话目录名
+    last_segment_id: Optional[str] = None
+    appearance_oplog_seq: int = 0          # 外貌缓存操作日志序号（上下文版本）
+    max_event_id: int = 0
+    processed: int = 0
+    failed_segments: List[str] = field(default_factory=list)
+    # 已提交但未写完的批次：{session, last_segment_id, segment_ids, events, events_written}
+    committed: Optional[Dict[str, Any]] = None
+    updated_at: Optional[str] = None
+
+    @staticmethod
+    def path_for(nominal_date: str, checkpoint_dir: Path = CHECKPOINT_DIR) -> Path:
+        return checkpoint_dir / f"{nominal_date}.json"
+
+    @classmethod
+    def load(cls, nominal_date: str, checkpoint_dir: Path = CHECKPOINT_DIR) -> Optional['ReplayCheckpoint']:
+        """读取断点，不存在或损坏时返回 None"""
+        path = cls.path_for(nominal_date, checkpoint_dir)
+        try:
+            data = json.loads(path.read_text(encoding='utf-8'))
+        except FileNotFoundError:
+            return None
+        except (OSError, json.JSONDecodeError) as e:
+            print(f"[Warning]: 断点文件损坏，忽略 ({path}): {e}")
+            return None
+        known = set(cls.__dataclass_fields__)
+        return cls(**{k: v for k, v in data.items() if k in known})
+
+    def covers(self, item: ReplayItem) -> bool:
+        """分段是否在断点及之前"""
+        return self.covers_key(item.key)
+
+    def covers_key(self, key: Tuple[str, str]) -> bool:
+        """顺序键（会话目录名, segment_id）是否在断点及之前"""
+        if self.last_segment_id is None:
+            return False
+        return key <= (self.session or '', self.last_segment_id)
+
+    def save(self, checkpoint_dir: Path = CHECKPOINT_DIR) -> None:
+        """原子写入断点"""
+        checkpoint_dir.mkdir(parents=True, exist_ok=True)
+        self.updated_at = datetime.now().isoformat()
+        path = self.path_for(self.nominal_date, checkpoint_dir)
+        temp_path = path.with_suffix('.tmp')
+        temp_path.write_text(json.dumps(self.__dict__, ensure_ascii=False, indent=2), encoding='utf-8')
+        os.replace(temp_path, path)
+
+
+@dataclass
+class LaneStats:
+    """通道统计"""
+    nominal_date: str
+    total: int = 0
+    processed: int = 0
+    resumed_skips: int = 0      # 断点或已提交而跳过的分段数
+    failed: int = 0
+    events_written: int = 0
+    appearance_updates: int = 0
+    vlm_time: float = 0.0
+    elapsed: float = 0.0
+    vlm_calls: int = 0
+    tokens: int = 0             # 输入 + 输出 token 数
+    video_seconds: float = 0.0  # 有 token 统计的调用覆盖的视频时长
+
+    def tokens_per_video_minute(self) -> Optional[float]:
+        if not self.tokens or self.video_seconds <= 0:
+            return None
+        return self.tokens / (self.video_seconds / 60.0)
+
+
+class ReplayEngine:
+    """录制会话重放引擎"""
+
+    def __init__(
+        self,
+        processor_factory: Callable[[DateContextService], Any],
+        log_writer: Any,
+        max_recent_events: int = 20,
+        prefetch: int = 2,
+        max_parallel_lanes: int = 4,
+        target_duration: float = 60.0,
+        resume: bool = True,
+        checkpoint_dir: Path = CHECKPOINT_DIR,
+        appearance_dump_interval: int = 5,
+        batch_size: int = 1,
+        batch_mode: str = BATCH_MODE_CONCAT
+    ):
+        """
+        Args:
+            processor_factory: 按通道上下文服务创建视频处理器（DynamicContextVideoEngine）
+            log_writer: 日志写入器（SimpleLogWriter），各通道共用，写入时加锁
+            max_recent_events: 提示词中的最近事件数
+            prefetch: 每条通道提前准备的分段数
+            max_parallel_lanes: 最多同时运行的通道数
+            target_duration: 分段目标时长，解析时间戳失败时使用（秒）
+            resume: 是否按断点续跑（False 时忽略并覆盖已有断点）
+            checkpoint_dir: 断点目录
+            appearance_dump_interval: 每处理多少次调用检查一次外貌缓存快照
+            batch_size: 每次调用合并的相邻分段数（1 为不合并）
+            batch_mode: 合并方式（concat 拼接 / multi 多视频内容项）
+        """
+        self.processor_factory = processor_factory
+        self.log_writer = log_writer
+        self.max_recent_events = max_recent_events
+        self.prefetch = max(prefetch, 0)
+        self.max_parallel_lanes = max(max_parallel_lanes, 1)
+        self.target_duration = target_duration
+        self.resume = resume
+        self.checkpoint_dir = Path(checkpoint_dir)
+        self.appearance_dump_interval = max(appearance_dump_interval, 1)
+        self.batch_size = max(batch_size, 1)
+        self.batch_mode = batch_mode
+
+        self.preprocessor = VideoPreprocessor() if is_preprocess_enabled() else None
+        self._write_lock = threading.Lock()
+
+    def plan(self, session_dirs: List[Path]) -> List[ReplayLane]:
+        """
+        按名义日期把会话分组为有序通道
+
+        Args:
+            session_dirs: 会话目录列表
+
+        Returns:
+            通道列表（按日期排序）
+
+        Raises:
+            ValueError: 会话目录名无法解析日期
+        """
+        lanes: Dict[str, ReplayLane] = {}
+        for session_dir in sorted(Path(d) for d in session_dirs):
+            nominal_date = nominal_date_from_session(session_dir)
+            lane = lanes.setdefault(nominal_date, ReplayLane(nominal_date))
+            for segment in load_segments(session_dir, self.target_duration):
+                lane.items.append(ReplayItem(session_dir, segment))
+        for lane in lanes.values():
+            lane.items.sort(key=lambda item: item.key)
+        return [lanes[date] for date in sorted(lanes)]
+
+    def load_checkpoint(self, nominal_date: str) -> Optional[ReplayCheckpoint]:
+        if not self.resume:
+            return None
+        return ReplayCheckpoint.load(nominal_date, self.checkpoint_dir)
+
+    async def run(self, lanes: List[ReplayLane]) -> List[LaneStats]:
+        """
+        并行运行所有通道
+
+        Args:
+            lanes: plan() 的结果
+
+        Returns:
+            各通道统计
+        """
+        semaphore = asyncio.Semaphore(self.max_parallel_lanes)
+        separate_snapshots = len(lanes) > 1
+
+        async def run_lane(lane: ReplayLane) -> LaneStats:
+            async with semaphore:
+                return await self._run_lane(lane, separate_snapshots)
+
+        return list(await asyncio.gather(*(run_lane(lane) for lane in lanes)))
+
+    def _snapshot_path(self, nominal_date: str, separate: bool) -> Path:
+        if not separate:
+            return DEBUG_LOG_DIR / "appearances.json"
+        return DEBUG_LOG_DIR / f"appearances_{nominal_date.replace('-', '')}.json"
+
+    def _group(self, pending: List[ReplayItem]) -> List[List[ReplayItem]]:
+        """把待处理分段按 batch_size 分批（批次不跨会话）"""
+        batches: List[List[ReplayItem]] = []
+        for item in pending:
+            if (
+                batches and len(batches[-1]) < self.batch_size
+                and batches[-1][-1].session_dir == item.session_dir
+            ):
+                batches[-1].append(item)
+            else:
+                batches.append([item])
+        return batches
+
+    @staticmethod
+    def _batch_video_path(batch: List[ReplayItem]) -> Path:
+        """拼接视频路径（不在会话目录顶层，避免被当作分段）"""
+        return batch[0].session_dir / "coalesced" / f"{batch[0].segment.segment_id}_x{len(batch)}.mp4"
+
+    def _prepare(self, batch: List[ReplayItem]) -> List[str]:
+        """
+        准备上传用的视频（阻塞，在线程池中预取）
+
+        Returns:
+            上传路径列表（拼接或单个分段时只有一个，多视频合并时每个分段一个）
+        """
+        paths = [item.segment.video_path for item in batch]
+        if len(batch) > 1 and self.batch_mode != BATCH_MODE_MULTI:
+            paths = [str(concat_segments(paths, self._batch_video_path(batch)))]
+        if self.preprocessor:
+            paths = [self.preprocessor.prepare(path).path for path in paths]
+        if is_response_cache_enabled():
+            # 提前计算视频哈希，查询响应缓存时直接复用
+            for path in paths:
+                file_sha256(path)
+        return paths
+
+    def _write_committed(self, checkpoint: ReplayCheckpoint) -> int:
+        """
+        写入断点中已提交批次的剩余事件（阻塞），每写完一条更新写入进度并保存断点
+
+        Returns:
+            本次写入的事件数
+
+        Raises:
+            RuntimeError: 事件写入失败（写入进度保留，重跑时从失败的事件继续）
+        """
+        committed = checkpoint.committed
+        events = committed['events']
+        written = 0
+        with self._write_lock:
+            while committed['events_written'] < len(events):
+                event = from_commit_record(EventLog, events[committed['events_written']])
+                try:
+                    self.log_writer.write_event_log(event)
+                except Exception as e:
+                    raise RuntimeError(f"写入事件失败 ({event.event_id}): {e}") from e
+                committed['events_written'] += 1
+                written += 1
+                checkpoint.save(self.checkpoint_dir)
+        return written
+
+    async def _finish_committed(
+        self,
+        service: DateContextService,
+        checkpoint: ReplayCheckpoint,
+        stats: LaneStats
+    ) -> None:
+        """写完已提交批次的事件后把断点推进到该批次"""
+        stats.events_written += await asyncio.to_thread(self._write_committed, checkpoint)
+        committed = checkpoint.committed
+        checkpoint.failed_segments = [
+            segment_id for segment_id in checkpoint.failed_segments if segment_id not in committed['segment_ids']
+        ]
+        if not checkpoint.covers_key((committed['session'], committed['last_segment_id'])):
+            checkpoint.session = committed['session']
+            checkpoint.last_segment_id = committed['last_segment_id']
+        checkpoint.appearance_oplog_seq = service.store.seq
+        checkpoint.max_event_id = service.event_context.get_max_event_id_number(
+            date=extract_date_from_segment_id(committed['last_segment_id'])
+        )
+        checkpoint.committed = None
+        await asyncio.to_thread(checkpoint.save, self.checkpoint_dir)
+
+    async def _run_lane(self, lane: ReplayLane, separate_snapshots: bool) -> LaneStats:
+        stats = LaneStats(lane.nominal_date, total=len(lane.items))
+        lane_start = time.time()
+        service = acquire_context_service(
+            lane.nominal_date, self._snapshot_path(lane.nominal_date, separate_snapshots)
+        )
+        try:
+            processor = self.processor_factory(service)
+            checkpoint = self.load_checkpoint(lane.nominal_date) or ReplayCheckpoint(lane.nominal_date)
+            if service.store.seq < checkpoint.appearance_oplog_seq:
+                print(
+                    f"[Warning]: {lane.nominal_date}: 外貌缓存操作日志序号 {service.store.seq} 落后于断点 "
+                    f"{checkpoint.appearance_oplog_seq}，已提交的外貌更新可能丢失"
+                )
+
+            # 上次提交后未写完的批次：只重做剩余写入
+            blocked = False
+            if checkpoint.committed is not None:
+                committed = checkpoint.committed
+                print(
+                    f"[Replay] {lane.nominal_date}: 续写已提交批次 {committed['segment_ids'][0]} 的事件"
+                    f"（已写 {committed['events_written']}/{len(committed['events'])}）"
+                )
+                try:
+                    await self._finish_committed(service, checkpoint, stats)
+                except Exception as e:
+                    blocked = True
+                    print(f"[Replay] {lane.nominal_date}: 续写失败，通道停止: {e}")
+
+            # 断点及之前、或事件已写入的分段不再处理（上次失败的分段除外）
+            failed = set(checkpoint.failed_segments)
+            pending: List[ReplayItem] = []
+            for item in lane.items:
+                if item.segment.segment_id in failed:
+                    pending.append(item)
+                elif self.resume and (
+                    checkpoint.covers(item) or service.event_context.has_segment(item.segment.segment_id)
+                ):
+                    stats.resumed_skips += 1
+                else:
+                    pending.append(item)
+            if stats.resumed_skips:
+                print(
+                    f"[Replay] {lane.nominal_date}: 从断点继续，跳过 {stats.resumed_skips} 个已提交分段"
+                    f"（last_segment_id={checkpoint.last_segment_id}）"
+                )
+            if failed:
+                print(f"[Replay] {lane.nominal_date}: 重新处理上次失败的 {len(failed)} 个分段")
+            print(f"[Replay] {lane.nominal_date}: 待处理 {len(pending)}/{len(lane.items)} 个分段")
+
+            batches = [] if blocked else self._group(pending)
+            prepared: Dict[int, asyncio.Future] = {}
+
+            def schedule(index: int) -> None:
+                if index < len(batches) and index not in prepared:
+                    prepared[index] = asyncio.ensure_future(asyncio.to_thread(self._prepare, batches[index]))
+
+            for index, batch in enumerate(batches):
+                for ahead in range(index, index + self.prefetch + 1):
+                    schedule(ahead)
+                try:
+                    upload_paths = await prepared.pop(index)
+                except Exception as e:
+                    # 拼接失败时同样退回原视频（多个分段时作为多视频内容项）
+                    print(f"[Warning]: 预处理失败，上传原视频 ({batch[0].segment.segment_id}): {e}")
+                    upload_paths = [item.segment.video_path for item in batch]
+
+                batch_ids = [item.segment.segment_id for item in batch]
+                try:
+                    await self._process_batch(service, processor, checkpoint, batch, upload_paths, stats)
+                    checkpoint.processed += len(batch)
+                except Exception as e:
+                    # 断点保持在失败批次之前，通道停止
+                    stats.failed += len(batch)
+                    if checkpoint.committed is not None:
+                        retry_info = "已提交，重跑时只重做剩余写入"
+                    else:
+                        retry_info = "重跑时从失败分段继续"
+                        checkpoint.failed_segments.extend(
+                            segment_id for segment_id in batch_ids if segment_id not in checkpoint.failed_segments
+                        )
+                        await asyncio.to_thread(checkpoint.save, self.checkpoint_dir)
+                    print(f"[Replay] {lane.nominal_date}: 处理分段失败 {batch_ids[0]}"
+                          f"{f' 等 {len(batch)} 段' if len(batch) > 1 else ''}: {e}")
+                    print(f"[Replay] {lane.nominal_date}: 通道停止（断点 last_segment_id={checkpoint.last_segment_id}），"
+                          f"{retry_info}")
+                    break
+                finally:
+                    if len(batch) > 1:
+                        self._batch_video_path(batch).unlink(missing_ok=True)
+
+                if (index + 1) % self.appearance_dump_interval == 0:
+                    await asyncio.to_thread(service.maybe_compact)
+
+            for future in prepared.values():
+                future.cancel()
+            await asyncio.to_thread(service.compact)
+        finally:
+            release_context_service(service)
+        stats.elapsed = time.time() - lane_start
+        return stats
+
+    async def _process_batch(
+        self,
+        service: DateContextService,
+        processor: Any,
+        checkpoint: ReplayCheckpoint,
+        batch: List[ReplayItem],
+        upload_paths: List[str],
+        stats: LaneStats
+    ) -> None:
+        """处理并提交一批相邻分段（一次模型调用），提交结果记入断点后写入事件并推进断点"""
+        first, last = batch[0].segment, batch[-1].segment
+        segment = VideoSegment(
+            segment_id=first.segment_id,
+            video_path=upload_paths[0],
+            start_time=first.start_time,
+            end_time=last.end_time,
+            qr_results=[qr for item in batch for qr in item.segment.qr_results],
+            extra_video_paths=upload_paths[1:]
+        )
+        segment_date = extract_date_from_segment_id(segment.segment_id)
+
+        snapshot = await asyncio.to_thread(service.snapshot, segment_date, self.max_recent_events)
+        vlm_start = time.time()
+        result = await processor.process_segment_with_context_async(
+            segment,
+            snapshot.appearance_cache,
+            snapshot.recent_events,
+            snapshot.max_event_id
+        )
+        stats.vlm_time += time.time() - vlm_start
+        stats.vlm_calls += 1
+        tokens = int(result.metrics.get('input_tokens') or 0) + int(result.metrics.get('output_tokens') or 0)
+        if tokens:
+            stats.tokens += tokens
+            stats.video_seconds += segment.end_time - segment.start_time
+
+        commit = await asyncio.to_thread(
+            service.commit, snapshot, result.appearance_updates, result.events
+        )
+        batch_info = ""
+        if len(batch) > 1:
+            # 按水印时间把事件归还到各自的分段
+            parts = [
+                SegmentPart(item.segment.segment_id, item.segment.video_path,
+                            item.segment.start_time, item.segment.end_time)
+                for item in batch
+            ]
+            attribute_items(commit.events, parts)
+            batch_info = f"（合并 {len(batch)} 段）"
+
+        # 记录提交结果：之后写入失败或崩溃时，重跑只重做剩余写入
+        checkpoint.committed = {
+            'session': batch[-1].session_dir.name,
+            'last_segment_id': last.segment_id,
+            'segment_ids': [item.segment.segment_id for item in batch],
+            'events': [to_commit_record(event) for event in commit.events],
+            'events_written': 0,
+        }
+        await asyncio.to_thread(checkpoint.save, self.checkpoint_dir)
+        await self._finish_committed(service, checkpoint, stats)
+
+        stats.processed += len(batch)
+        stats.appearance_updates += len(commit.appearance_updates)
+        print(
+            f"[Replay] {batch[0].session_dir.name}/{segment.segment_id}{batch_info}: 事件数={len(commit.events)}, "
+            f"外貌更新={len(commit.appearance_updates)}, 已处理={stats.processed}/{stats.total}"
+        )
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""人物外貌缓存微基准
+
+模拟一天内出现大量人物编号的情况，测量 AppearanceCache 的新增、合并、查询最大编号、
+外貌表生成以及提示词构建的耗时。
+
+用法：
+    python scripts/bench_appearance_cache.py [--persons 10000] [--merges 5000]
+"""
+
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+
+# 添加项目根目录到路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from context.appearance_cache import AppearanceCache
+from context.prompt_builder import PromptBuilder
+from storage.models import VideoSegment
+
+
+def timed(label: str, func, repeat: int = 1):
+    """执行 func repeat 次并打印总耗时与单次耗时"""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = func()
+    elapsed = time.perf_counter() - start
+    print(f"  {label:<32} 总计 {elapsed * 1000:9.2f} ms  单次 {elapsed / repeat * 1e6:10.2f} us")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="人物外貌缓存微基准")
+    parser.add_argument('--persons', type=int, default=10000, help='人物数量（默认 10000）')
+    parser.add_argument('--merges', type=int, default=5000, help='合并次数（默认 5000）')
+    parser.add_argument('--seed', type=int, default=42, help='随机种子')
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    cache = AppearanceCache()
+    cache.nominal_date = '2025-12-24'
+
+    print(f"人物数={args.persons}, 合并数={args.merges}")
+
+    def add_all():
+        for i in range(1, args.persons + 1):
+            cache.add(f"p{i}", f"白色实验服，黑色短发，编号 {i} 的稀有特征", user_id=f"u{i}" if i % 10 == 0 else None)
+    timed("add", add_all)
+
+    # 一半合并构成长链（p1->p2->p3...），检验路径压缩不会触发递归上限
+    chain = min(args.merges // 2, args.persons - 1)
+
+    def merge_all():
+        for i in range(1, chain + 1):
+            cache.merge(f"p{i}", f"p{i + 1}")
+        for _ in range(args.merges - chain):
+            a, b = sorted(random.sample(range(chain + 2, args.persons + 1), 2))
+            cache.merge(f"p{a}", f"p{b}")
+    timed("merge", merge_all)
+
+    timed("get_max_person_id_number", cache.get_max_person_id_number, repeat=10000)
+    timed("get_record (alias)", lambda: cache.get_record("p1"), repeat=10000)
+    timed("get_for_prompt (首次)", lambda: (setattr(cache, 'version', cache.version + 1), cache.get_for_prompt()))
+    timed("get_for_prompt (缓存命中)", cache.get_for_prompt, repeat=100)
+
+    builder = PromptBuilder(max_recent_events=20)
+    segment = VideoSegment(segment_id='bench', video_path='bench.mp4', start_time=0, end_time=60)
+    max_person_id = cache.get_max_person_id_number()
+    timed(
+        "build_prompt_layout",
+        lambda: builder.build_prompt_layout(segment, [], [], cache, 0, max_person_id),
+        repeat=20
+    )
+
+    print(f"  主编号数={cache.get_root_count()}, 记录数={cache.get_record_count()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""WebSocket 接收服务器压测：比较单进程与多进程接收（--workers）的聚合吞吐与单客户端延迟
+
+为每个进程数启动一个服务器子进程（临时工作目录，REALTIME_PROCESSING_ENABLED=false 只测接收：
+JSON 解析、base64 解码与写盘；SEGMENT_ACK=true 使服务器保存分段后回复 segment_ack），N 个模拟客户端
+按 mp4_segment 协议连续发送分段，每个分段收到确认后再发送下一个。统计：
+
+- 聚合吞吐：所有客户端发送的分段字节数 / 第一个分段开始到最后一个确认的时间（MB/s）
+- 分段延迟：开始发送到收到 segment_ack 的时间（p50 / p95 / max）
+- 单客户端吞吐的最小值与最大值（一个客户端是否被其他客户端拖慢）
+
+模拟客户端分布在多个进程中（--client-procs），避免压测端自身成为瓶颈。
+
+用法：
+    python scripts/bench_ingest_server.py --clients 8 --segments 20 --size-mb 4 --workers 1 4
+    python scripts/bench_ingest_server.py --video recordings/<session>/<segment>.mp4 --workers 1 2 4 --uvloop
+"""
+
+import argparse
+import asyncio
+import base64
+import json
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import websockets
+
+# 添加项目根目录到路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from streaming_server.load_generator import free_port, percentile, start_server, stop_server
+
+
+async def run_client(url: str, client_index: int, segments: int, data_b64: str, size: int) -> Dict[str, Any]:
+    """一个模拟客户端：开始采集，逐个发送分段并等待确认，最后结束采集"""
+    base = datetime.now() + timedelta(hours=client_index)
+    latencies: List[float] = []
+    async with websockets.connect(url, max_size=None, ping_interval=None) as websocket:
+        await websocket.send(json.dumps({"status": "capture_started", "message": "bench"}))
+        started = time.time()
+        for k in range(segments):
+            segment_id = (base + timedelta(seconds=60 * k)).strftime('%Y%m%d_%H%M%S') + f"_{k % 100:02d}"
+            message = (
+                f'{{"type": "mp4_segment", "segment_id": "{segment_id}", "size": {size}, '
+                f'"qr_results": [], "data": "{data_b64}"}}'
+            )
+            send_start = time.perf_counter()
+            await websocket.send(message)
+            while True:
+                reply = json.loads(await websocket.recv())
+                if reply.get('type') == 'segment_ack' and reply.get('segment_id') == segment_id:
+                    break
+            latencies.append(time.perf_counter() - send_start)
+        finished = time.time()
+        await websocket.send(json.dumps({"status": "capture_stopped", "message": "bench"}))
+    return {'started': started, 'finished': finished, 'latencies': latencies, 'bytes': size * segments}
+
+
+def client_process(url: str, indices: List[int], segments: int, data_b64: str, size: int) -> List[Dict[str, Any]]:
+    """在一个进程中运行若干模拟客户端"""
+    async def run_all():
+        return await asyncio.gather(*[run_client(url, i, segments, data_b64, size) for i in indices])
+    return asyncio.run(run_all())
+
+
+def run_round(args, data_b64: str, size: int, workers: int) -> Dict[str, Any]:
+    """以给定进程数启动服务器并压测一轮"""
+    workdir = Path(tempfile.mkdtemp(prefix=f'bench_ingest_w{workers}_'))
+    port = free_port()
+    server = start_server(
+        workdir, port, workers, args.uvloop, size / (1024 * 1024),
+        env={'REALTIME_PROCESSING_ENABLED': 'false'}
+    )
+    url = f"ws://127.0.0.1:{port}"
+    procs = max(1, min(args.client_procs, args.clients))
+    groups = [list(range(args.clients))[i::procs] for i in range(procs)]
+    try:
+        with multiprocessing.get_context('spawn').Pool(procs) as pool:
+            results = pool.starmap(
+                client_process, [(url, group, args.segments, data_b64, size) for group in groups]
+            )
+    finally:
+        stop_server(server)
+        if args.keep:
+            print(f"  保留工作目录 {workdir}")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    clients = [client for group in results for client in group]
+    latencies = [latency for client in clients for latency in client['latencies']]
+    total_bytes = sum(client['bytes'] for client in clients)
+    elapsed = max(c['finished'] for c in clients) - min(c['started'] for c in clients)
+    per_client = [c['bytes'] / (1024 * 1024) / max(1e-6, c['finished'] - c['started']) for c in clients]
+    return {
+        'workers': workers,
+        'total_mb': total_bytes / (1024 * 1024),
+        'elapsed': elapsed,
+        'throughput': total_bytes / (1024 * 1024) / max(1e-6, elapsed),
+        'p50': percentile(latencies, 0.5),
+        'p95': percentile(latencies, 0.95),
+        'max': max(latencies) if latencies else 0.0,
+        'client_min': min(per_client),
+        'client_max': max(per_client),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="WebSocket 接收服务器压测（单进程 vs 多进程）")
+    parser.add_argument('--clients', type=int, default=8, help='模拟客户端数（默认 8）')
+    parser.add_argument('--segments', type=int, default=10, help='每个客户端发送的分段数（默认 10）')
+    parser.add_argument('--size-mb', type=float, default=4.0, help='合成分段大小（MB，默认 4；指定 --video 时忽略）')
+    parser.add_argument('--video', help='使用真实 MP4 分段作为负载')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 4], help='依次测试的服务器进程数（默认 1 4）')
+    parser.add_argument('--uvloop', action='store_true', help='服务器使用 uvloop')
+    parser.add_argument('--client-procs', type=int, default=max(1, (os.cpu_count() or 2) // 2),
+                        help='模拟客户端所在的进程数（默认 CPU 核数的一半）')
+    parser.add_argument('--keep', action='store_true', help='保留服务器工作目录（含 server.log 与收到的分段）')
+    args = parser.parse_args()
+
+    if args.video:
+        payload = Path(args.video).read_bytes()
+    else:
+        payload = os.urandom(int(args.size_mb * 1024 * 1024))
+    data_b64 = base64.b64encode(payload).decode('ascii')
+
+    print(
+        f"客户端={args.clients}（{args.client_procs} 个进程），每客户端 {args.segments} 段，"
+        f"分段 {len(payload) / (1024 * 1024):.2f} MB，uvloop={args.uvloop}"
+    )
+    rows: List[Dict[str, Any]] = []
+    for workers in args.workers:
+        print(f"\n测试 workers={workers} ...")
+        row = run_round(args, data_b64, len(payload), workers)
+        rows.append(row)
+        print(
+            f"  吞吐 {row['throughput']:.1f} MB/s，延迟 p50={row['p50'] * 1000:.0f}ms "
+            f"p95={row['p95'] * 1000:.0f}ms max={row['max'] * 1000:.0f}ms"
+        )
+
+    baseline: Optional[float] = rows[0]['throughput'] if rows else None
+    print(f"\n{'进程数':>6} {'总量MB':>9} {'耗时s':>8} {'吞吐MB/s':>9} {'加速':>6} "
+          f"{'p50 ms':>8} {'p95 ms':>8} {'max ms':>8} {'单客户端MB/s(min/max)':>22}")
+    for row in rows:
+        speedup = row['throughput'] / baseline if baseline else 0.0
+        print(
+            f"{row['workers']:>6} {row['total_mb']:>9.1f} {row['elapsed']:>8.1f} {row['throughput']:>9.1f} "
+            f"{speedup:>5.2f}x {row['p50'] * 1000:>8.0f} {row['p95'] * 1000:>8.0f} {row['max'] * 1000:>8.0f} "
+            f"{row['client_min']:>10.2f}/{row['client_max']:<10.2f}"
+        )
+
+
+if __name__ == '__main__':
+    main()
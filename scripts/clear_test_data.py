@@ -68,17 +68,29 @@ def clear_files(filenames):
         except Exception as e:
             print(f"  ✗ 清空文件 {filename} 失败: {e}")
 
+def clear_replay_state():
+    """删除重放断点与按日期分开的外貌缓存（scripts/process_recording_session.py 并行处理多个日期时生成）"""
+    log_dir = project_root / "logs_debug"
+    paths = sorted((log_dir / "replay_checkpoints").glob("*.json")) + sorted(log_dir.glob("appearances_*.json*"))
+    for path in paths:
+        try:
+            path.unlink()
+            print(f"  ✓ 文件 {path.relative_to(log_dir)} 已删除")
+        except Exception as e:
+            print(f"  ✗ 删除文件 {path.relative_to(log_dir)} 失败: {e}")
+
 def main():
     print("=" * 60)
     print("清理测试数据")
     print("=" * 60)
 
     # 第一次提问
-    ans1 = input("\n是否清空视频理解所生成的数据库表logs_raw、调试日志文件event_logs.jsonl、event_logs_thinking.jsonl、appearances.json？(y/N): ").strip().lower()
+    ans1 = input("\n是否清空视频理解所生成的数据库表logs_raw、调试日志文件event_logs.jsonl、event_logs_thinking.jsonl、appearances.json、appearances.oplog.jsonl 与重放断点？(y/N): ").strip().lower()
     if ans1 == 'y':
         print("\n正在清理视频理解数据...")
         clear_tables(['logs_raw'])
-        clear_files(['event_logs.jsonl', 'event_logs_thinking.jsonl', 'appearances.json'])
+        clear_files(['event_logs.jsonl', 'event_logs_thinking.jsonl', 'appearances.json', 'appearances.oplog.jsonl'])
+        clear_replay_state()
     else:
         print("\n已跳过视频理解数据清理。")
 
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""对比视频预处理前后的上传体积、模型耗时与识别结果
+
+对每个视频分别用原视频和预处理副本（降帧率/降分辨率）调用一次视频理解模型（旧版提示词，
+不使用动态上下文），打印上传字节数、调用耗时和识别出的事件，便于人工判断精度损失。
+模型与参数读取 .env（VIDEO_UNDERSTANDING_MODEL 等）。
+
+用法：
+    python scripts/compare_preprocess.py recordings/xxx/20251224_100000_01.mp4 [...] \\
+        [--fps 2] [--max-side 768] [--crf 30]
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+# 添加项目根目录到路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from dotenv import load_dotenv
+
+from storage.models import VideoSegment
+from video_processing.preprocess import VideoPreprocessor
+from video_processing.qwen3_vl_processor import create_qwen_processor
+
+
+def run_once(processor, video_path: str, segment_id: str):
+    """调用一次模型，返回 (耗时, 事件列表)"""
+    segment = VideoSegment(segment_id=segment_id, video_path=video_path, start_time=0.0, end_time=60.0)
+    start = time.time()
+    result = processor.process_segment(segment)
+    return time.time() - start, result.events
+
+
+def print_events(events) -> None:
+    for event in events:
+        print(f"      [{event.event_type}] {event.raw_text}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="对比视频预处理前后的上传体积、耗时与识别结果")
+    parser.add_argument('videos', nargs='+', help='视频文件')
+    parser.add_argument('--fps', type=float, default=None, help='副本帧率（默认 VLM_PREPROCESS_FPS 或 2）')
+    parser.add_argument('--max-side', type=int, default=None, help='副本长边上限（默认 VLM_PREPROCESS_MAX_SIDE 或 768）')
+    parser.add_argument('--crf', type=int, default=None, help='x264 CRF（默认 VLM_PREPROCESS_CRF 或 30）')
+    args = parser.parse_args()
+
+    load_dotenv(project_root / '.env')
+    preprocessor = VideoPreprocessor(fps=args.fps, max_side=args.max_side, crf=args.crf)
+    processor = create_qwen_processor()
+    print(f"模型: {processor.model}  副本参数: fps={preprocessor.fps} max_side={preprocessor.max_side} crf={preprocessor.crf}")
+
+    totals = {'original_bytes': 0, 'upload_bytes': 0, 'original_time': 0.0, 'reduced_time': 0.0}
+    for video in args.videos:
+        video_path = Path(video)
+        if not video_path.exists():
+            print(f"跳过不存在的文件: {video_path}")
+            continue
+
+        prepared = preprocessor.prepare(str(video_path))
+        print(f"\n{video_path.name}: 原视频 {prepared.original_bytes / 1e6:.2f} MB → "
+              f"副本 {prepared.upload_bytes / 1e6:.2f} MB（预处理 {prepared.elapsed:.1f}s）")
+        if not prepared.reduced:
+            print("  副本不比原视频小，跳过对比")
+            continue
+
+        original_time, original_events = run_once(processor, str(video_path), video_path.stem)
+        reduced_time, reduced_events = run_once(processor, prepared.path, video_path.stem)
+        print(f"  原视频: {original_time:.1f}s, {len(original_events)} 个事件")
+        print_events(original_events)
+        print(f"  副本:   {reduced_time:.1f}s, {len(reduced_events)} 个事件")
+        print_events(reduced_events)
+
+        totals['original_bytes'] += prepared.original_bytes
+        totals['upload_bytes'] += prepared.upload_bytes
+        totals['original_time'] += original_time
+        totals['reduced_time'] += reduced_time
+
+    if totals['original_bytes']:
+        print(f"\n合计：上传 {totals['original_bytes'] / 1e6:.2f} MB → {totals['upload_bytes'] / 1e6:.2f} MB "
+              f"({totals['upload_bytes'] / totals['original_bytes']:.0%})，"
+              f"模型耗时 {totals['original_time']:.1f}s → {totals['reduced_time']:.1f}s")
+
+
+if __name__ == '__main__':
+    main()
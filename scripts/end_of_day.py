@@ -25,13 +25,14 @@ project_root = Path(__file__).parent.parent
 sys.path.insert(0, str(project_root))
 
 from context.appearance_cache import AppearanceCache
+from context.appearance_store import AppearanceStore
 from storage.seekdb_client import SeekDBClient
 from log_writer.encryption_service import FieldEncryptionService
 
 
 def load_appearance_cache(date: datetime) -> AppearanceCache:
     """
-    加载外貌缓存 (appearances.json)
+    加载外貌缓存 (appearances.json 快照 + appearances.oplog.jsonl 操作日志)
     
     Args:
         date: 日期 (已废弃，现在统一读取 appearances.json)
@@ -41,9 +42,12 @@ def load_appearance_cache(date: datetime) -> AppearanceCache:
     """
     cache = AppearanceCache()
     cache_path = Path("logs_debug") / "appearances.json"
+    store = AppearanceStore(cache_path)
     
-    if cache_path.exists():
-        loaded = cache.load_from_file(str(cache_path))
+    if cache_path.exists() or store.oplog_path.exists():
+        # 只读：重放后立即解除记录，避免日终处理写入操作日志
+        loaded = store.load(cache)
+        cache.op_listener = None
         if loaded:
             print(f"[加载] 外貌缓存加载成功，名义日期: {cache.nominal_date}，共 {cache.get_record_count()} 条记录，"
                   f"{cache.get_root_count()} 个主编号")
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""测量视频理解请求体构建的峰值内存
+
+对比两种构建 OpenRouter /v1/responses 请求体的方式（tracemalloc 统计 Python 分配的峰值）：
+- inline：整个视频读入内存 → base64 字符串 → 嵌入 payload → json 序列化（原有做法）
+- streaming：StreamingJSONBody，按 http.client 的方式每次读取 8KB 发送
+
+用法：
+    python scripts/measure_request_memory.py [--video path/to/segment.mp4] [--size-mb 20]
+"""
+
+import argparse
+import base64
+import json
+import os
+import sys
+import tempfile
+import tracemalloc
+from pathlib import Path
+
+# 添加项目根目录到路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from video_processing.request_body import StreamingJSONBody, VideoFileRef
+
+
+SEND_BLOCK_SIZE = 8192  # http.client 的默认发送块大小
+
+
+def build_payload(video_value) -> dict:
+    """与 OpenRouterTransport 相同结构的请求体"""
+    return {
+        "model": "google/gemini-2.5-flash-preview-09-2025",
+        "input": [
+            {"type": "message", "role": "system", "content": [{"type": "input_text", "text": "系统指令" * 500}]},
+            {
+                "type": "message",
+                "role": "user",
+                "content": [
+                    {"type": "input_text", "text": "外貌表" * 200},
+                    {"type": "input_video", "video_url": video_value},
+                    {"type": "input_text", "text": "最近事件" * 200}
+                ]
+            }
+        ],
+        "stream": True
+    }
+
+
+def inline_body(video_path: str) -> int:
+    with open(video_path, "rb") as video_file:
+        data_url = f"data:video/mp4;base64,{base64.b64encode(video_file.read()).decode('utf-8')}"
+    body = json.dumps(build_payload(data_url)).encode('utf-8')
+    return len(body)
+
+
+def streaming_body(video_path: str) -> int:
+    body = StreamingJSONBody(build_payload(VideoFileRef(video_path)))
+    sent = 0
+    while True:
+        block = body.read(SEND_BLOCK_SIZE)
+        if not block:
+            break
+        sent += len(block)
+    assert sent == len(body), (sent, len(body))
+    return sent
+
+
+def measure(label: str, func, video_path: str, video_size: int) -> None:
+    tracemalloc.start()
+    body_size = func(video_path)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"  {label:<10} 请求体 {body_size / 1e6:8.2f} MB  峰值内存 {peak / 1e6:8.2f} MB  ({peak / video_size:5.2f}x 视频大小)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="测量视频理解请求体构建的峰值内存")
+    parser.add_argument('--video', help='视频文件（不指定则生成随机内容的临时文件）')
+    parser.add_argument('--size-mb', type=float, default=20.0, help='临时文件大小（MB，默认 20）')
+    args = parser.parse_args()
+
+    temp_path = None
+    video_path = args.video
+    if not video_path:
+        fd, temp_path = tempfile.mkstemp(suffix='.mp4')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(os.urandom(int(args.size_mb * 1e6)))
+        video_path = temp_path
+
+    try:
+        video_size = os.path.getsize(video_path)
+        print(f"视频: {video_path} ({video_size / 1e6:.2f} MB)")
+        measure("inline", inline_body, video_path, video_size)
+        measure("streaming", streaming_body, video_path, video_size)
+    finally:
+        if temp_path:
+            os.remove(temp_path)
+
+
+if __name__ == '__main__':
+    main()
@@ -15,6 +15,8 @@ from orchestration.pipeline import VideoLogPipeline
 def main():
     parser = argparse.ArgumentParser(description='处理视频并生成日志')
     parser.add_argument('video_path', type=str, help='视频文件路径')
+    parser.add_argument('--parallelism', type=int, default=None,
+                        help='视频理解阶段的并发数（默认读取 PIPELINE_VLM_PARALLELISM，为 2）')
     
     args = parser.parse_args()
     
@@ -47,7 +49,8 @@ def main():
             sys.exit(1)
     
     # 索引不再由视频处理触发，统一由独立脚本处理
-    with VideoLogPipeline(enable_indexing=False, nominal_date=nominal_date) as pipeline:
+    with VideoLogPipeline(enable_indexing=False, nominal_date=nominal_date,
+                          vlm_parallelism=args.parallelism) as pipeline:
         try:
             events = pipeline.process_video(str(video_path))
             print(f"\n处理完成！共生成 {len(events)} 个事件日志")
@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+"""按日期汇总实时处理统计（logs_debug/processing_stats.jsonl）
+
+输出每天的分段数、模型调用数、静止场景跳过的调用数与比例、上传字节数，以及每分钟视频的 token 数
+（合并调用时明显下降）。
+
+用法：
+    python scripts/report_processing_stats.py [--log logs_debug/processing_stats.jsonl]
+"""
+
+import argparse
+import sys
+from pathlib import Path
+
+# 添加项目根目录到路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from streaming_server.monitoring import MonitoringLogger
+
+
+def main():
+    parser = argparse.ArgumentParser(description="按日期汇总实时处理统计")
+    parser.add_argument('--log', default='logs_debug/processing_stats.jsonl', help='统计文件路径')
+    args = parser.parse_args()
+
+    log_file = Path(args.log)
+    if not log_file.exists():
+        print(f"统计文件不存在: {log_file}")
+        sys.exit(1)
+
+    summary = MonitoringLogger(log_file).summarize_by_date()
+    print(f"{'日期':<12}{'分段':>8}{'模型调用':>10}{'跳过':>8}{'跳过比例':>10}{'上传(MB)':>12}{'tokens/分钟':>14}")
+    for date in sorted(summary):
+        day = summary[date]
+        calls = day['vlm_calls'] + day['vlm_skipped']
+        ratio = day['vlm_skipped'] / calls if calls else 0.0
+        per_minute = day['tokens'] / (day['video_seconds'] / 60) if day['video_seconds'] else 0.0
+        print(f"{date:<12}{day['segments']:>8}{day['vlm_calls']:>10}{day['vlm_skipped']:>8}"
+              f"{ratio:>10.1%}{day['upload_bytes'] / 1e6:>12.2f}{per_minute:>14.0f}")
+
+
+if __name__ == '__main__':
+    main()
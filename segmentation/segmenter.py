@@ -4,7 +4,7 @@ import subprocess
 import json
 import uuid
 from pathlib import Path
-from typing import List
+from typing import Iterator, List
 
 from storage.models import VideoSegment
 
@@ -38,6 +38,18 @@ class VideoSegmenter:
         Returns:
             分段列表
         """
+        return list(self.iter_segments(video_path))
+    
+    def iter_segments(self, video_path: str) -> Iterator[VideoSegment]:
+        """
+        逐个产出分段：每切出一个分段就立即返回，供流水线在切分后续分段的同时处理已切出的分段
+        
+        Args:
+            video_path: 视频文件路径
+            
+        Yields:
+            按时间顺序的分段
+        """
         video_path = Path(video_path)
         if not video_path.exists():
             raise FileNotFoundError(f"视频文件不存在: {video_path}")
@@ -57,7 +69,8 @@ class VideoSegmenter:
         if not keyframes:
             # 如果没有找到关键帧，回退到原来的方法
             print("  警告：未找到关键帧，使用时间分段")
-            return self._segment_by_time(str(video_path), duration)
+            yield from self._iter_segments_by_time(str(video_path), duration)
+            return
         
         # 如果关键帧很少，给出提示但继续使用关键帧分段
         min_keyframes = max(2, int(duration / self.target_duration))
@@ -71,7 +84,6 @@ class VideoSegmenter:
             keyframes.append(duration)
         
         # 2. 迭代式分段：每提取一个分段后，检查实际结束时间，从那里开始下一个分段
-        segments = []
         segment_index = 0
         max_segment_duration = 300.0  # 最大分段时长：5分钟（300秒）
         
@@ -135,7 +147,7 @@ class VideoSegmenter:
                 end_time=actual_end_time,
                 qr_results=[]
             )
-            segments.append(segment)
+            yield segment
             
             # 从实际结束时间开始下一个分段
             # 重要：使用实际结束时间，即使不是关键帧，ffmpeg 也会自动对齐
@@ -146,8 +158,6 @@ class VideoSegmenter:
                 break
             
             segment_index += 1
-        
-        return segments
     
     def _get_video_info(self, video_path: str) -> dict:
         """获取视频信息"""
@@ -239,7 +249,10 @@ class VideoSegmenter:
         Returns:
             分段列表
         """
-        segments = []
+        return list(self._iter_segments_by_time(video_path, duration))
+    
+    def _iter_segments_by_time(self, video_path: str, duration: float) -> Iterator[VideoSegment]:
+        """按时间逐个产出分段（_segment_by_time 的生成器版本）"""
         current_time = 0.0
         segment_index = 0
         
@@ -262,12 +275,10 @@ class VideoSegmenter:
                 end_time=end_time,
                 qr_results=[]
             )
-            segments.append(segment)
+            yield segment
             
             current_time = end_time
             segment_index += 1
-        
-        return segments
     
     def _extract_segment(self, video_path: str, segment_id: str,
                         start_time: float, end_time: float) -> str:
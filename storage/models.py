@@ -1,6 +1,6 @@
 """数据模型定义"""
 
-from dataclasses import dataclass, field
+from dataclasses import asdict, dataclass, field
 from datetime import datetime
 from typing import Dict, Any, List, Optional
 
@@ -13,6 +13,7 @@ class VideoSegment:
     start_time: float  # seconds in video
     end_time: float
     qr_results: List[Dict[str, Any]] = field(default_factory=list)  # OCR/QR 识别结果，默认空列表
+    extra_video_paths: List[str] = field(default_factory=list)  # 多视频合并调用：video_path 之后按时间顺序的相邻分段
 
 
 @dataclass
@@ -76,3 +77,23 @@ class Emergency:
     created_at: Optional[datetime] = None
     resolved_at: Optional[datetime] = None
 
+
+_RECORD_DATETIME_FIELDS = ('start_time', 'end_time', 'created_at', 'resolved_at')
+
+
+def to_commit_record(item: Any) -> Dict[str, Any]:
+    """EventLog / Emergency 转为可 JSON 序列化的字典（时间转为 ISO 字符串），用于记录已提交的结果"""
+    record = asdict(item)
+    for key in _RECORD_DATETIME_FIELDS:
+        if isinstance(record.get(key), datetime):
+            record[key] = record[key].isoformat()
+    return record
+
+
+def from_commit_record(cls: Any, record: Dict[str, Any]) -> Any:
+    """to_commit_record 的逆操作"""
+    values = dict(record)
+    for key in _RECORD_DATETIME_FIELDS:
+        if isinstance(values.get(key), str):
+            values[key] = datetime.fromisoformat(values[key])
+    return cls(**values)
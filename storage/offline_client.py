@@ -0,0 +1,56 @@
+"""离线数据库客户端：不连接 SeekDB，只统计写入次数
+
+压测与离线演练（streaming_server/load_generator.py 配合 VIDEO_UNDERSTANDING_MODEL=mock）时
+实时处理链路仍需要一个数据库客户端写入事件与紧急情况。启用后服务器改用本客户端，
+事件照常写入 logs_debug/event_logs.jsonl（事件上下文依赖该文件），数据库写入被丢弃。
+
+环境变量：
+- SEEKDB_OFFLINE：是否使用离线客户端（默认 false）
+"""
+
+import os
+import threading
+from typing import Any
+
+from storage.models import EventLog
+
+
+def is_seekdb_offline() -> bool:
+    """读取 SEEKDB_OFFLINE 环境变量（默认关闭）"""
+    return os.getenv('SEEKDB_OFFLINE', 'false').lower() in ('true', '1', 'yes', 'on')
+
+
+class OfflineDBClient:
+    """与 SeekDBClient 写入接口一致的空实现"""
+
+    def __init__(self):
+        self.event_count = 0
+        self.emergency_count = 0
+        self._lock = threading.Lock()
+
+    def insert_event_log(self, event_log: EventLog) -> None:
+        with self._lock:
+            self.event_count += 1
+
+    def insert_emergency_log(self, emergency: Any) -> None:
+        with self._lock:
+            self.emergency_count += 1
+
+    def get_pending_emergency_count(self) -> int:
+        return 0
+
+    def get_user_public_key(self, user_id: str) -> str:
+        # 写入器捕获 ValueError 后跳过字段加密
+        raise ValueError(f"离线模式不提供用户 {user_id} 的公钥")
+
+    def insert_field_encryption_key(self, **kwargs) -> None:
+        pass
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
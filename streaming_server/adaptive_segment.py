@@ -0,0 +1,155 @@
+"""自适应分段时长：按画面活动与处理队列长度调整手机端的分段时长
+
+分段越长，模型调用越少（每次调用的固定开销——系统提示词、外貌表、思考——被更多视频分摊）；
+分段越短，事件与紧急情况的延迟越低。策略：
+
+- 队列积压（长度 ≥ queue_high）：延长分段，减少调用，让处理追上采集；
+- 连续 idle_streak 个分段无人（只有 none 事件或被静止场景跳过）：延长分段；
+- 有人员活动且队列空闲：缩短分段，降低延迟；
+- 其余情况保持不变。
+
+每次调整至少间隔 cooldown 个分段，且变化幅度小于 10% 时不下发，避免来回抖动。
+新的分段时长通过 WebSocket 控制通道以 reconfigure_capture 命令下发，手机端从当前分段起生效。
+
+环境变量：
+- ADAPTIVE_SEGMENT_DURATION：是否启用（默认 false）
+- ADAPTIVE_SEGMENT_MIN：分段时长下限（秒，默认 30）
+- ADAPTIVE_SEGMENT_MAX：分段时长上限（秒，默认 180）
+- ADAPTIVE_SEGMENT_QUEUE_HIGH：视为积压的队列长度（默认 3）
+"""
+
+import os
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+from storage.models import EventLog
+
+
+def is_adaptive_segment_enabled() -> bool:
+    """读取 ADAPTIVE_SEGMENT_DURATION 环境变量（默认关闭）"""
+    return os.getenv('ADAPTIVE_SEGMENT_DURATION', 'false').lower() in ('true', '1', 'yes', 'on')
+
+
+def _env_number(name: str, default, cast):
+    try:
+        return cast(os.getenv(name, str(default)))
+    except ValueError:
+        return default
+
+
+@dataclass
+class SegmentDurationPolicy:
+    """分段时长调整策略参数"""
+    min_duration: float = 30.0
+    max_duration: float = 180.0
+    grow_factor: float = 1.5        # 延长倍数
+    shrink_factor: float = 0.5      # 缩短倍数
+    queue_high: int = 3             # 队列长度达到该值视为积压
+    idle_streak: int = 2            # 连续多少个无人分段后延长
+    active_change: float = 0.05     # 画面变化占比达到该值视为有活动（需启用静止场景检测）
+    cooldown: int = 2               # 两次调整之间至少间隔的分段数
+    min_relative_change: float = 0.1
+
+    @classmethod
+    def from_env(cls) -> 'SegmentDurationPolicy':
+        return cls(
+            min_duration=_env_number('ADAPTIVE_SEGMENT_MIN', 30.0, float),
+            max_duration=_env_number('ADAPTIVE_SEGMENT_MAX', 180.0, float),
+            queue_high=_env_number('ADAPTIVE_SEGMENT_QUEUE_HIGH', 3, int),
+        )
+
+    def describe(self) -> Dict[str, Any]:
+        return {
+            'min_duration': self.min_duration,
+            'max_duration': self.max_duration,
+            'grow_factor': self.grow_factor,
+            'shrink_factor': self.shrink_factor,
+            'queue_high': self.queue_high,
+            'idle_streak': self.idle_streak,
+            'cooldown': self.cooldown,
+        }
+
+
+@dataclass
+class SegmentDurationDecision:
+    """一次调整"""
+    duration: float
+    previous: float
+    reason: str       # queue / idle / activity
+
+
+@dataclass
+class AdaptiveSegmentController:
+    """单个会话的分段时长控制器（在处理队列中按分段顺序调用）"""
+    duration: float
+    policy: SegmentDurationPolicy = field(default_factory=SegmentDurationPolicy.from_env)
+    idle_count: int = 0
+    segments_since_change: int = 0
+    changes: int = 0
+    last_reason: Optional[str] = None
+
+    def __post_init__(self):
+        self.duration = self._clamp(self.duration)
+        # 会话开始后允许立即调整
+        self.segments_since_change = self.policy.cooldown
+
+    def _clamp(self, value: float) -> float:
+        return max(self.policy.min_duration, min(self.policy.max_duration, value))
+
+    def observe(
+        self,
+        events: List[EventLog],
+        queue_length: int,
+        vlm_skipped: bool = False,
+        activity_change: Optional[float] = None
+    ) -> Optional[SegmentDurationDecision]:
+        """
+        根据刚处理完的分段更新状态
+
+        Args:
+            events: 分段的事件
+            queue_length: 当前处理队列长度
+            vlm_skipped: 是否被静止场景检测跳过
+            activity_change: 分段内相邻帧变化占比最大值（未启用静止场景检测时为 None）
+
+        Returns:
+            需要下发的新时长；不调整时返回 None
+        """
+        policy = self.policy
+        self.segments_since_change += 1
+
+        active = any(event.event_type == 'person' for event in events) or (
+            activity_change is not None and activity_change >= policy.active_change
+        )
+        idle = not active and (vlm_skipped or (bool(events) and all(event.event_type == 'none' for event in events)))
+        self.idle_count = self.idle_count + 1 if idle else 0
+
+        if queue_length >= policy.queue_high:
+            target, reason = self.duration * policy.grow_factor, 'queue'
+        elif self.idle_count >= policy.idle_streak:
+            target, reason = self.duration * policy.grow_factor, 'idle'
+        elif active and queue_length == 0:
+            target, reason = self.duration * policy.shrink_factor, 'activity'
+        else:
+            return None
+
+        target = float(round(self._clamp(target)))
+        if self.segments_since_change < policy.cooldown:
+            return None
+        if abs(target - self.duration) < self.duration * policy.min_relative_change:
+            return None
+
+        decision = SegmentDurationDecision(duration=target, previous=self.duration, reason=reason)
+        self.duration = target
+        self.segments_since_change = 0
+        self.changes += 1
+        self.last_reason = reason
+        return decision
+
+    def metrics(self) -> Dict[str, Any]:
+        """写入 processing_stats.jsonl 的统计"""
+        return {
+            'segment_duration_target': round(self.duration, 1),
+            'segment_duration_changes': self.changes,
+            'segment_duration_reason': self.last_reason,
+        }
@@ -0,0 +1,211 @@
+"""采集背压：服务器饱和时让手机端降低码率/帧率，恢复后逐级还原
+
+start_capture 命令下发码率与帧率后，采集参数在整个会话中不变；处理队列积压或磁盘写入变慢时，
+手机端仍按原参数源源不断地发送分段。启用后每收到一个分段，按该客户端的以下信号调整采集档位：
+
+- 处理队列长度 ≥ CAPTURE_BACKPRESSURE_QUEUE（积压）
+- 分段接收耗时（base64 解码 + 写盘）≥ CAPTURE_BACKPRESSURE_INGEST 秒（磁盘 I/O 饱和）
+
+任一信号饱和时降一档（每档码率、帧率各乘以 step_factor，不低于下限）；两个信号都降到阈值的
+restore_ratio 以下、并连续保持 recover_after 个分段后才升一档（滞回，避免抖动）。两次调整之间至少
+间隔 cooldown 个分段。新参数通过 WebSocket 控制通道以 reconfigure_capture 命令只下发给该客户端，
+手机端不重启编码器直接生效（码率通过 MediaCodec 动态参数，帧率通过发送端丢帧）。
+
+每次调整写入 logs_debug/capture_control.jsonl；每个分段的统计中记录当前档位（capture_*）。
+
+环境变量：
+- CAPTURE_BACKPRESSURE：是否启用（默认 false）
+- CAPTURE_BACKPRESSURE_QUEUE：视为积压的队列长度（默认 5）
+- CAPTURE_BACKPRESSURE_INGEST：视为磁盘饱和的分段接收耗时（秒，默认 5）
+- CAPTURE_MIN_BITRATE_MB：码率下限（MB，默认 0.25）
+- CAPTURE_MIN_FPS：帧率下限（默认 2）
+"""
+
+import os
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, Optional, Tuple
+
+
+def is_capture_backpressure_enabled() -> bool:
+    """读取 CAPTURE_BACKPRESSURE 环境变量（默认关闭）"""
+    return os.getenv('CAPTURE_BACKPRESSURE', 'false').lower() in ('true', '1', 'yes', 'on')
+
+
+def _env_number(name: str, default, cast):
+    try:
+        return cast(os.getenv(name, str(default)))
+    except ValueError:
+        return default
+
+
+@dataclass
+class CapturePolicy:
+    """采集档位调整策略参数"""
+    queue_high: int = 5
+    ingest_high: float = 5.0        # 秒
+    restore_ratio: float = 0.5      # 信号降到阈值的该比例以下才视为恢复
+    recover_after: int = 3          # 连续多少个恢复分段后升一档
+    cooldown: int = 2               # 两次调整之间至少间隔的分段数
+    step_factor: float = 0.5        # 每档码率、帧率的倍数
+    max_level: int = 3
+    min_bitrate_mb: float = 0.25
+    min_fps: int = 2
+    unlimited_fps: int = 15         # start_capture 不限帧率（fps=0）时按此帧率计算降档
+
+    @classmethod
+    def from_env(cls) -> 'CapturePolicy':
+        return cls(
+            queue_high=_env_number('CAPTURE_BACKPRESSURE_QUEUE', 5, int),
+            ingest_high=_env_number('CAPTURE_BACKPRESSURE_INGEST', 5.0, float),
+            min_bitrate_mb=_env_number('CAPTURE_MIN_BITRATE_MB', 0.25, float),
+            min_fps=_env_number('CAPTURE_MIN_FPS', 2, int),
+        )
+
+    def describe(self) -> Dict[str, Any]:
+        return {
+            'queue_high': self.queue_high,
+            'ingest_high': self.ingest_high,
+            'restore_ratio': self.restore_ratio,
+            'recover_after': self.recover_after,
+            'step_factor': self.step_factor,
+            'max_level': self.max_level,
+        }
+
+
+@dataclass
+class CaptureDecision:
+    """一次采集参数调整"""
+    level: int
+    previous: int
+    bitrate_mb: float
+    fps: int               # 0 表示不限帧率（恢复到 start_capture 的原参数时可能出现）
+    reason: str            # queue / ingest / recovered
+    queue_length: int
+    ingest_seconds: float
+
+    def payload(self) -> Dict[str, Any]:
+        """reconfigure_capture 命令的负载"""
+        return {'bitrate': self.bitrate_mb, 'fps': self.fps}
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'previous_level': self.previous,
+            'level': self.level,
+            'bitrate_mb': self.bitrate_mb,
+            'fps': self.fps,
+            'reason': self.reason,
+            'queue_length': self.queue_length,
+            'ingest_seconds': round(self.ingest_seconds, 3),
+        }
+
+
+@dataclass
+class CaptureController:
+    """单个客户端的采集档位控制器（每收到一个分段调用一次）"""
+    base_bitrate_mb: float
+    base_fps: int
+    policy: CapturePolicy = field(default_factory=CapturePolicy.from_env)
+    level: int = 0
+    calm_streak: int = 0
+    segments_since_change: int = 0
+    changes: int = 0
+    saturated_segments: int = 0
+    observed_segments: int = 0
+    last_reason: Optional[str] = None
+    entered_at: float = field(default_factory=time.time)
+    time_at_level: Dict[int, float] = field(default_factory=dict)
+
+    def __post_init__(self):
+        # 会话开始后允许立即调整
+        self.segments_since_change = self.policy.cooldown
+
+    def settings(self, level: Optional[int] = None) -> Tuple[float, int]:
+        """某一档位的 (码率 MB, 帧率)；L0 为 start_capture 的原参数"""
+        level = self.level if level is None else level
+        if level == 0:
+            return self.base_bitrate_mb, self.base_fps
+        factor = self.policy.step_factor ** level
+        bitrate = max(self.policy.min_bitrate_mb, round(self.base_bitrate_mb * factor, 3))
+        fps = max(self.policy.min_fps, int((self.base_fps or self.policy.unlimited_fps) * factor))
+        return bitrate, fps
+
+    def observe(self, queue_length: int, ingest_seconds: float) -> Optional[CaptureDecision]:
+        """
+        根据刚收到的分段更新状态
+
+        Args:
+            queue_length: 该客户端会话的处理队列长度
+            ingest_seconds: 分段接收耗时（base64 解码 + 写盘，秒）
+
+        Returns:
+            需要下发的新参数；不调整时返回 None
+        """
+        policy = self.policy
+        self.observed_segments += 1
+        self.segments_since_change += 1
+
+        reason = None
+        if queue_length >= policy.queue_high:
+            reason = 'queue'
+        elif ingest_seconds >= policy.ingest_high:
+            reason = 'ingest'
+        if reason:
+            self.saturated_segments += 1
+            self.calm_streak = 0
+        elif (
+            queue_length <= policy.queue_high * policy.restore_ratio
+            and ingest_seconds <= policy.ingest_high * policy.restore_ratio
+        ):
+            self.calm_streak += 1
+        else:
+            # 介于恢复阈值与饱和阈值之间：保持当前档位
+            self.calm_streak = 0
+
+        if self.segments_since_change < policy.cooldown:
+            return None
+        if reason and self.level < policy.max_level:
+            target = self.level + 1
+        elif not reason and self.level > 0 and self.calm_streak >= policy.recover_after:
+            target, reason = self.level - 1, 'recovered'
+        else:
+            return None
+
+        now = time.time()
+        self.time_at_level[self.level] = self.time_at_level.get(self.level, 0.0) + now - self.entered_at
+        bitrate, fps = self.settings(target)
+        decision = CaptureDecision(
+            level=target,
+            previous=self.level,
+            bitrate_mb=bitrate,
+            fps=fps,
+            reason=reason,
+            queue_length=queue_length,
+            ingest_seconds=ingest_seconds
+        )
+        self.level = target
+        self.entered_at = now
+        self.segments_since_change = 0
+        self.calm_streak = 0
+        self.changes += 1
+        self.last_reason = reason
+        return decision
+
+    def metrics(self) -> Dict[str, Any]:
+        """写入 processing_stats.jsonl 的统计"""
+        bitrate, fps = self.settings()
+        return {
+            'capture_level': self.level,
+            'capture_bitrate_mb': bitrate,
+            'capture_fps': fps,
+            'capture_changes': self.changes,
+            'capture_reason': self.last_reason,
+            'capture_saturated_ratio': round(self.saturated_segments / self.observed_segments, 4)
+            if self.observed_segments else 0.0,
+        }
+
+    def summary(self) -> Dict[str, float]:
+        """各档位累计停留时间（秒）"""
+        totals = dict(self.time_at_level)
+        totals[self.level] = totals.get(self.level, 0.0) + time.time() - self.entered_at
+        return {f"L{level}": round(seconds, 1) for level, seconds in sorted(totals.items())}
@@ -0,0 +1,216 @@
+"""积压降级：处理队列积压时逐级降低每个分段的处理成本，积压消除后逐级恢复
+
+队列长度超过 REALTIME_QUEUE_ALERT_THRESHOLD 时原先只打印告警，处理会越落越远。
+启用后按队列长度进入以下等级（逐级叠加）：
+
+    L0 normal         正常参数
+    L1 reduce         降低抽帧率（VIDEO_FPS → DEGRADE_FPS），缩小思考预算（DEGRADE_THINKING_BUDGET）
+    L2 coalesce       关闭思考，相邻 DEGRADE_COALESCE 个分段合并为一次调用（合并方式按 VLM_BATCH_MODE）
+    L3 fast_model     在 L2 基础上改用更快的模型（DEGRADE_FAST_MODEL）
+
+队列长度达到某一等级的阈值时立即升到该等级（可跨级）；降级后需在当前等级停留至少
+cooldown 个分段，且队列长度降到当前等级阈值的 restore_ratio 以下，才逐级恢复（滞回，避免抖动）。
+每次等级变化生成一条 DegradationTransition，服务器打印并写入 logs_debug/degradation_transitions.jsonl；
+每个分段的统计中记录当前等级（degradation_*）。
+
+环境变量：
+- DEGRADATION_MODE：是否启用（默认 false）
+- DEGRADE_QUEUE_LEVELS：L1/L2/L3 的队列长度阈值（逗号分隔，默认按 REALTIME_QUEUE_ALERT_THRESHOLD
+  的 0.5/1/2 倍，即 5,10,20）
+- DEGRADE_RESTORE_RATIO：恢复阈值比例（默认 0.5）
+- DEGRADE_FPS：L1 起的抽帧率上限（默认 0.5）
+- DEGRADE_THINKING_BUDGET：L1 的思考预算（默认 1024）
+- DEGRADE_COALESCE：L2 起每次调用合并的分段数（默认 2）
+- DEGRADE_FAST_MODEL：L3 使用的模型（默认 qwen3-vl-flash；VIDEO_UNDERSTANDING_MODEL 为 mock / cascade 时
+  默认沿用原模型，避免离线演练切到真实 API、级联被单一模型替换）
+"""
+
+import os
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+
+def is_degradation_enabled() -> bool:
+    """读取 DEGRADATION_MODE 环境变量（默认关闭）"""
+    return os.getenv('DEGRADATION_MODE', 'false').lower() in ('true', '1', 'yes', 'on')
+
+
+def _env_number(name: str, default, cast):
+    try:
+        return cast(os.getenv(name, str(default)))
+    except ValueError:
+        return default
+
+
+@dataclass
+class DegradationLevel:
+    """一个降级等级的处理参数（None 表示沿用正常参数）"""
+    level: int
+    name: str
+    min_queue: int                        # 进入该等级的队列长度
+    fps: Optional[float] = None           # 抽帧率上限
+    enable_thinking: Optional[bool] = None
+    thinking_budget: Optional[int] = None
+    coalesce: int = 1                     # 每次调用合并的分段数
+    model: Optional[str] = None
+
+    def describe(self) -> str:
+        parts = []
+        if self.fps is not None:
+            parts.append(f"fps≤{self.fps:g}")
+        if self.enable_thinking is False:
+            parts.append("关闭思考")
+        elif self.thinking_budget is not None:
+            parts.append(f"思考预算={self.thinking_budget}")
+        if self.coalesce > 1:
+            parts.append(f"合并{self.coalesce}段")
+        if self.model:
+            parts.append(f"模型={self.model}")
+        return "、".join(parts) or "正常参数"
+
+
+# 自带模型选择的处理器：未显式设置 DEGRADE_FAST_MODEL 时 L3 不切换模型
+KEEP_MODEL_PROCESSORS = ('mock', 'cascade')
+
+
+def fast_model_for(base_model: Optional[str]) -> Optional[str]:
+    """
+    L3 使用的模型
+
+    Args:
+        base_model: 会话配置的模型（VIDEO_UNDERSTANDING_MODEL）
+
+    Returns:
+        显式设置的 DEGRADE_FAST_MODEL；否则 mock / cascade 返回 None（沿用原模型），其余为 qwen3-vl-flash
+    """
+    explicit = os.getenv('DEGRADE_FAST_MODEL')
+    if explicit:
+        return explicit
+    if base_model and base_model.lower() in KEEP_MODEL_PROCESSORS:
+        return None
+    return 'qwen3-vl-flash'
+
+
+def build_levels(alert_threshold: int, base_model: Optional[str] = None) -> List[DegradationLevel]:
+    """
+    从环境变量构建等级表
+
+    Args:
+        alert_threshold: REALTIME_QUEUE_ALERT_THRESHOLD（未设置 DEGRADE_QUEUE_LEVELS 时据此推算阈值）
+        base_model: 会话配置的模型，None 则读取 VIDEO_UNDERSTANDING_MODEL
+
+    Returns:
+        L0~L3
+    """
+    if base_model is None:
+        base_model = os.getenv('VIDEO_UNDERSTANDING_MODEL')
+    thresholds = [max(1, alert_threshold // 2), max(2, alert_threshold), max(3, alert_threshold * 2)]
+    raw = os.getenv('DEGRADE_QUEUE_LEVELS')
+    if raw:
+        try:
+            values = [int(v) for v in raw.split(',') if v.strip()]
+            if len(values) == 3 and values == sorted(values) and values[0] > 0:
+                thresholds = values
+        except ValueError:
+            pass
+    fps = _env_number('DEGRADE_FPS', 0.5, float)
+    coalesce = max(1, _env_number('DEGRADE_COALESCE', 2, int))
+    return [
+        DegradationLevel(0, 'normal', 0),
+        DegradationLevel(1, 'reduce', thresholds[0], fps=fps,
+                         thinking_budget=_env_number('DEGRADE_THINKING_BUDGET', 1024, int)),
+        DegradationLevel(2, 'coalesce', thresholds[1], fps=fps, enable_thinking=False, coalesce=coalesce),
+        DegradationLevel(3, 'fast_model', thresholds[2], fps=fps, enable_thinking=False, coalesce=coalesce,
+                         model=fast_model_for(base_model)),
+    ]
+
+
+@dataclass
+class DegradationTransition:
+    """一次等级变化"""
+    previous: int
+    level: int
+    name: str
+    queue_length: int
+    at: float
+    settings: str
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'previous_level': self.previous,
+            'level': self.level,
+            'name': self.name,
+            'queue_length': self.queue_length,
+            'settings': self.settings,
+            'timestamp': self.at,
+        }
+
+
+@dataclass
+class DegradationController:
+    """单个会话的降级控制器（在处理队列中每次领取分段前调用）"""
+    levels: List[DegradationLevel]
+    restore_ratio: float = field(default_factory=lambda: _env_number('DEGRADE_RESTORE_RATIO', 0.5, float))
+    cooldown: int = 2
+    level: int = 0
+    segments_at_level: int = 0
+    transitions: int = 0
+    entered_at: float = field(default_factory=time.time)
+    time_at_level: Dict[int, float] = field(default_factory=dict)
+
+    @property
+    def current(self) -> DegradationLevel:
+        return self.levels[self.level]
+
+    def observe(self, queue_length: int) -> Optional[DegradationTransition]:
+        """
+        根据当前队列长度调整等级
+
+        Args:
+            queue_length: 排队中的分段数（不含本次领取的分段）
+
+        Returns:
+            等级变化；不变时返回 None
+        """
+        target = self.level
+        for candidate in self.levels[self.level + 1:]:
+            if queue_length >= candidate.min_queue:
+                target = candidate.level
+        if target == self.level and self.level > 0 and self.segments_at_level >= self.cooldown:
+            if queue_length <= self.current.min_queue * self.restore_ratio:
+                target = self.level - 1
+
+        if target == self.level:
+            self.segments_at_level += 1
+            return None
+
+        now = time.time()
+        self.time_at_level[self.level] = self.time_at_level.get(self.level, 0.0) + now - self.entered_at
+        transition = DegradationTransition(
+            previous=self.level,
+            level=target,
+            name=self.levels[target].name,
+            queue_length=queue_length,
+            at=now,
+            settings=self.levels[target].describe()
+        )
+        self.level = target
+        self.segments_at_level = 1
+        self.entered_at = now
+        self.transitions += 1
+        return transition
+
+    def metrics(self) -> Dict[str, Any]:
+        """写入 processing_stats.jsonl 的统计"""
+        return {
+            'degradation_level': self.level,
+            'degradation_name': self.current.name,
+            'degradation_transitions': self.transitions,
+        }
+
+    def summary(self) -> Dict[str, float]:
+        """各等级累计停留时间（秒）"""
+        totals = dict(self.time_at_level)
+        totals[self.level] = totals.get(self.level, 0.0) + time.time() - self.entered_at
+        return {self.levels[level].name: round(seconds, 1) for level, seconds in sorted(totals.items())}
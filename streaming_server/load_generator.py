@@ -0,0 +1,644 @@
+"""WebSocket 压测客户端：模拟 N 台 Android 摄像头，按采集节奏向服务器发送分段
+
+scripts/bench_ingest_server.py 收到确认就发下一个分段，测的是接收吞吐的上限；本工具按真实节奏开环发送：
+每台模拟摄像头每 segment_duration / speed 秒发送一个分段，服务器变慢时分段照常到达（与手机端一致），
+积压体现为确认延迟与队列长度的增长。消息与 Android 端完全一致：
+
+- 连接后发送 {"status": "capture_started"}，结束时发送 {"status": "capture_stopped"}
+- 分段为 {"type": "mp4_segment", "segment_id", "size", "qr_results", "data"}（base64），
+  segment_id 为 YYYYMMDD_HHMMSS_NN，时间按模拟时钟递增（每段加一个分段时长）
+- 处理服务器下发的命令：reconfigure_capture（分段时长 / 码率 / 帧率，回复 capture_reconfigured）、
+  stop_capture（停止发送）
+
+分段负载：
+- --replay：回放录制的会话目录或 MP4 文件，同名 _qr.json 中的二维码结果原样发送
+- 默认合成：有 ffmpeg 时生成测试图案 MP4（分段时长、码率、帧率与参数一致），否则使用 --size-mb 大小的
+  随机字节（服务器只需解码视频的功能如预处理、静止检测会失败）；按 --qr-rate 附带模拟二维码结果
+
+统计（需要服务器设置 SEGMENT_ACK=true，分段保存后回复 segment_ack）：
+- 确认延迟：发送分段到收到 segment_ack 的时间（p50 / p95 / p99 / max）
+- 吞吐：发送的分段字节数 / 运行时间
+- 失败：服务器回复失败的确认（按原因）、确认超时（--ack-timeout）、发送失败、断线
+- 发送滞后：实际发送时间晚于计划时间超过阈值的次数（压测端或网络跟不上节奏）
+- 服务器队列长度：segment_ack 中的 queue_length（最大值与平均值）
+
+--spawn-server 在临时目录中启动服务器并完全离线运行：VIDEO_UNDERSTANDING_MODEL=mock
+（video_processing/mock_processor.py）、SEEKDB_OFFLINE=true（storage/offline_client.py），发送结束后
+等待处理队列清空，并汇总服务器的 processing_stats.jsonl。模拟模型的耗时等参数见 mock_processor.py，
+可通过环境变量传给服务器（如 MOCK_VLM_LATENCY=0.5）。
+
+所有摄像头运行在同一个事件循环中；摄像头很多时可以启动多个实例分别压测同一个服务器。
+
+用法：
+    python -m streaming_server.load_generator --spawn-server --clients 10 --segments 20 --speed 10
+    python -m streaming_server.load_generator --spawn-server --workers 2 --clients 8 --duration 120 --speed 20
+    python -m streaming_server.load_generator --url ws://127.0.0.1:50002 --clients 4 --replay recordings/<session>
+"""
+
+import argparse
+import asyncio
+import base64
+import hashlib
+import json
+import os
+import random
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import websockets
+
+from streaming_server.segment_queue import STATE_DONE, STATE_FAILED, STATE_IN_FLIGHT, STATE_QUEUED, SegmentQueue
+
+
+project_root = Path(__file__).parent.parent
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def percentile(values: List[float], ratio: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(ratio * (len(ordered) - 1))))]
+
+
+def start_server(
+    workdir: Path,
+    port: int,
+    workers: int = 1,
+    use_uvloop: bool = False,
+    size_mb: float = 4.0,
+    env: Optional[Dict[str, str]] = None
+) -> subprocess.Popen:
+    """
+    在 workdir 中启动服务器子进程并等待所有工作进程开始监听
+
+    Args:
+        workdir: 服务器工作目录（recordings/ 与 logs_debug/ 写在其中，输出写入 server.log）
+        port: 监听端口
+        workers: 接收进程数
+        use_uvloop: 是否使用 uvloop
+        size_mb: 最大分段大小（MB），用于设置 WEBSOCKET_MAX_SIZE_MB
+        env: 额外的环境变量
+
+    Returns:
+        服务器进程，用 stop_server() 结束
+    """
+    full_env = dict(os.environ)
+    full_env['PYTHONPATH'] = os.pathsep.join(filter(None, [str(project_root.resolve()), full_env.get('PYTHONPATH')]))
+    full_env.update(
+        SEGMENT_ACK='true',
+        WEBSOCKET_MAX_SIZE_MB=str(max(10.0, size_mb * 1.5 + 1)),
+    )
+    full_env.update(env or {})
+    cmd = [
+        sys.executable, '-m', 'streaming_server.server',
+        '--host', '127.0.0.1', '--port', str(port), '--workers', str(workers)
+    ]
+    if use_uvloop:
+        cmd.append('--uvloop')
+    log_path = workdir / 'server.log'
+    process = subprocess.Popen(
+        cmd, cwd=workdir, env=full_env, stdin=subprocess.PIPE,
+        stdout=log_path.open('w'), stderr=subprocess.STDOUT
+    )
+    ready_marker = '已启动，监听' if workers > 1 else 'WebSocket server started'
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"服务器启动失败，见 {log_path}:\n{log_path.read_text()[-2000:]}")
+        if log_path.read_text(errors='ignore').count(ready_marker) >= workers:
+            return process
+        time.sleep(0.2)
+    process.kill()
+    raise RuntimeError(f"服务器 60 秒内未就绪，见 {log_path}")
+
+
+def stop_server(process: subprocess.Popen) -> None:
+    process.send_signal(signal.SIGINT)
+    try:
+        process.wait(timeout=15)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+
+def offline_server_env(workdir: Path, segment_seconds: float) -> Dict[str, str]:
+    """--spawn-server 的服务器环境变量：模拟模型后端、离线数据库，事件日志写在工作目录中"""
+    return {
+        'VIDEO_UNDERSTANDING_MODEL': 'mock',
+        'DEGRADE_FAST_MODEL': 'mock',
+        'SEEKDB_OFFLINE': 'true',
+        'EVENT_LOG_FILE': str(workdir / 'logs_debug' / 'event_logs.jsonl'),
+        'REALTIME_TARGET_SEGMENT_DURATION': str(segment_seconds),
+    }
+
+
+@dataclass
+class SegmentPayload:
+    """一个可发送的分段负载"""
+    data_b64: str
+    size: int
+    qr_results: Optional[List[Dict[str, Any]]] = None  # 回放时为录制的二维码结果；None 表示按 --qr-rate 合成
+    scalable: bool = False                              # 随机字节：可按下发的码率截短
+
+
+def load_replay_payloads(paths: List[str]) -> List[SegmentPayload]:
+    """读取会话目录或 MP4 文件（按文件名排序），同名 _qr.json 作为二维码结果"""
+    files: List[Path] = []
+    for path in map(Path, paths):
+        files.extend(sorted(path.glob('*.mp4')) if path.is_dir() else [path])
+    if not files:
+        raise SystemExit(f"未找到 MP4 分段: {' '.join(paths)}")
+    payloads = []
+    for file in files:
+        data = file.read_bytes()
+        qr_path = file.with_name(f"{file.stem}_qr.json")
+        qr_results = json.loads(qr_path.read_text(encoding='utf-8')) if qr_path.exists() else []
+        payloads.append(SegmentPayload(base64.b64encode(data).decode('ascii'), len(data), qr_results))
+    return payloads
+
+
+def synthetic_payload(segment_seconds: float, bitrate_mb: float, fps: int, size_mb: float,
+                      force_random: bool = False) -> SegmentPayload:
+    """合成分段：有 ffmpeg 时生成测试图案 MP4，否则使用随机字节"""
+    if not force_random and shutil.which('ffmpeg'):
+        with tempfile.TemporaryDirectory(prefix='loadgen_') as tmp:
+            output = Path(tmp) / 'segment.mp4'
+            subprocess.run([
+                'ffmpeg', '-y', '-loglevel', 'error',
+                '-f', 'lavfi', '-i', f"testsrc=size=1280x720:rate={fps}",
+                '-t', str(segment_seconds), '-c:v', 'libx264', '-b:v', f"{bitrate_mb}M", '-pix_fmt', 'yuv420p',
+                str(output)
+            ], check=True)
+            data = output.read_bytes()
+        return SegmentPayload(base64.b64encode(data).decode('ascii'), len(data))
+    if not force_random:
+        print("[Warning]: 未找到 ffmpeg，使用随机字节作为分段（服务器需要解码视频的功能会失败）")
+    data = os.urandom(int(size_mb * 1024 * 1024))
+    return SegmentPayload(base64.b64encode(data).decode('ascii'), len(data), scalable=True)
+
+
+@dataclass
+class LoadStats:
+    """所有模拟摄像头的累计统计"""
+    sent: int = 0
+    sent_bytes: int = 0
+    acked: int = 0
+    qr_segments: int = 0
+    failed_acks: Dict[str, int] = field(default_factory=dict)  # 失败原因 -> 次数
+    ack_timeouts: int = 0
+    send_errors: int = 0
+    lost: int = 0                 # 断线时尚未确认的分段
+    disconnects: int = 0
+    late_sends: int = 0
+    max_lag: float = 0.0
+    reconfigurations: int = 0
+    stopped_by_server: int = 0
+    latencies: List[float] = field(default_factory=list)
+    ingest_seconds: List[float] = field(default_factory=list)
+    queue_lengths: List[int] = field(default_factory=list)
+
+    @property
+    def failures(self) -> int:
+        return sum(self.failed_acks.values()) + self.ack_timeouts + self.send_errors + self.lost
+
+
+class SimulatedCamera:
+    """一台模拟摄像头（断线后自动重连，连续失败 --max-reconnects 次后放弃）"""
+
+    def __init__(self, index: int, url: str, payloads: List[SegmentPayload], args: argparse.Namespace,
+                 stats: LoadStats, rng: random.Random):
+        self.index = index
+        self.url = url
+        self.payloads = payloads
+        self.args = args
+        self.stats = stats
+        self.rng = rng
+        self.segment_duration = args.segment_seconds
+        self.bitrate = args.bitrate
+        self.fps = args.fps
+        self.stopped = False
+        self.pending: Dict[str, float] = {}
+        # 模拟时钟：各摄像头错开 index 秒（会话目录按秒命名，同一秒开始的客户端共用目录）
+        self.clock = datetime.now().replace(microsecond=0) + timedelta(seconds=index)
+        self.user_id = f"loadgen_user_{index:03d}"
+
+    def interval(self) -> float:
+        return self.segment_duration / self.args.speed
+
+    def _more(self, sent: int, started: float) -> bool:
+        if self.stopped:
+            return False
+        if self.args.duration:
+            return time.monotonic() - started < self.args.duration
+        return sent < self.args.segments
+
+    async def run(self) -> None:
+        sent = 0
+        started = time.monotonic()
+        next_at = started
+        failures = 0
+        while self._more(sent, started):
+            try:
+                async with websockets.connect(self.url, max_size=None, ping_interval=None) as websocket:
+                    failures = 0
+                    receiver = asyncio.create_task(self._receive(websocket))
+                    try:
+                        await websocket.send(json.dumps({
+                            "status": "capture_started", "message": f"load generator camera {self.index}"
+                        }))
+                        while self._more(sent, started):
+                            delay = next_at - time.monotonic()
+                            if delay > 0:
+                                await asyncio.sleep(delay)
+                            lag = time.monotonic() - next_at
+                            self.stats.max_lag = max(self.stats.max_lag, lag)
+                            if lag > min(1.0, self.interval() * 0.5):
+                                self.stats.late_sends += 1
+                            self._expire_pending()
+                            await self._send_segment(websocket, sent)
+                            sent += 1
+                            next_at += self.interval()
+                        await self._wait_for_acks()
+                        await websocket.send(json.dumps({
+                            "status": "capture_stopped", "message": f"load generator camera {self.index}"
+                        }))
+                    finally:
+                        receiver.cancel()
+                return
+            except (websockets.exceptions.WebSocketException, OSError) as e:
+                self.stats.disconnects += 1
+                self.stats.lost += len(self.pending)
+                self.pending.clear()
+                failures += 1
+                if failures > self.args.max_reconnects:
+                    print(f"[LoadGen] 摄像头 {self.index} 连续 {failures} 次连接失败，放弃: {type(e).__name__}: {e}")
+                    return
+                print(f"[LoadGen] 摄像头 {self.index} 连接断开（{type(e).__name__}: {e}），1 秒后重连")
+                await asyncio.sleep(1.0)
+
+    def _qr_results(self, payload: SegmentPayload) -> List[Dict[str, Any]]:
+        if payload.qr_results is not None:
+            return payload.qr_results
+        if self.rng.random() >= self.args.qr_rate:
+            return []
+        detected = (self.clock + timedelta(seconds=self.rng.uniform(0, self.segment_duration))).astimezone()
+        return [{
+            "confidence": round(self.rng.uniform(0.8, 1.0), 3),
+            "detected_at_ms": int(detected.timestamp() * 1000),
+            "detected_at": detected.isoformat(timespec='milliseconds'),
+            "user_id": self.user_id,
+            "public_key_fingerprint": hashlib.sha256(self.user_id.encode('utf-8')).hexdigest()[:16],
+        }]
+
+    async def _send_segment(self, websocket, sequence: int) -> None:
+        payload = self.payloads[(self.index + sequence) % len(self.payloads)]
+        data_b64, size = payload.data_b64, payload.size
+        if payload.scalable and self.bitrate < self.args.bitrate:
+            # 随机字节负载按下发的码率等比例截短（base64 按 4 字符对齐）
+            keep = int(len(data_b64) * self.bitrate / self.args.bitrate) // 4 * 4
+            data_b64, size = data_b64[:keep], keep // 4 * 3
+        segment_id = self.clock.strftime('%Y%m%d_%H%M%S') + f"_{sequence % 100:02d}"
+        qr_results = self._qr_results(payload)
+        header = json.dumps({
+            "type": "mp4_segment",
+            "segment_id": segment_id,
+            "size": size,
+            "qr_results": qr_results,
+        }, ensure_ascii=False)
+        # 负载直接拼接，避免对数 MB 的 base64 字符串再做一次 JSON 转义
+        message = header[:-1] + f', "data": "{data_b64}"}}'
+        self.clock += timedelta(seconds=self.segment_duration)
+        self.pending[segment_id] = time.monotonic()
+        try:
+            await websocket.send(message)
+        except websockets.exceptions.WebSocketException:
+            self.pending.pop(segment_id, None)
+            self.stats.send_errors += 1
+            raise
+        self.stats.sent += 1
+        self.stats.sent_bytes += size
+        if qr_results:
+            self.stats.qr_segments += 1
+
+    def _expire_pending(self) -> None:
+        """超过 --ack-timeout 仍未确认的分段记为确认超时"""
+        now = time.monotonic()
+        for segment_id, sent_at in list(self.pending.items()):
+            if now - sent_at > self.args.ack_timeout:
+                del self.pending[segment_id]
+                self.stats.ack_timeouts += 1
+
+    async def _wait_for_acks(self) -> None:
+        deadline = time.monotonic() + self.args.ack_timeout
+        while self.pending and time.monotonic() < deadline:
+            await asyncio.sleep(0.1)
+        self.stats.ack_timeouts += len(self.pending)
+        self.pending.clear()
+
+    async def _receive(self, websocket) -> None:
+        try:
+            async for raw in websocket:
+                if not isinstance(raw, str):
+                    continue
+                try:
+                    data = json.loads(raw)
+                except ValueError:
+                    continue
+                if data.get('type') == 'segment_ack':
+                    self._on_ack(data)
+                elif data.get('command'):
+                    await self._on_command(websocket, data)
+        except websockets.exceptions.ConnectionClosed:
+            pass
+
+    def _on_ack(self, ack: Dict[str, Any]) -> None:
+        sent_at = self.pending.pop(ack.get('segment_id'), None)
+        if sent_at is None:
+            return
+        if not ack.get('ok', True):
+            reason = ack.get('error') or 'unknown'
+            self.stats.failed_acks[reason] = self.stats.failed_acks.get(reason, 0) + 1
+            return
+        self.stats.acked += 1
+        self.stats.latencies.append(time.monotonic() - sent_at)
+        if 'ingest_seconds' in ack:
+            self.stats.ingest_seconds.append(float(ack['ingest_seconds']))
+        if 'queue_length' in ack:
+            self.stats.queue_lengths.append(int(ack['queue_length']))
+
+    async def _on_command(self, websocket, data: Dict[str, Any]) -> None:
+        command = data.get('command')
+        payload = data.get('payload') or {}
+        if command in ('start_capture', 'reconfigure_capture'):
+            if 'segmentDuration' in payload:
+                self.segment_duration = float(payload['segmentDuration'])
+            if 'bitrate' in payload:
+                self.bitrate = float(payload['bitrate'])
+            if 'fps' in payload:
+                self.fps = int(payload['fps'])
+        if command == 'reconfigure_capture':
+            self.stats.reconfigurations += 1
+            await websocket.send(json.dumps({
+                "status": "capture_reconfigured",
+                "message": f"bitrate={self.bitrate:g}MB, fps={self.fps}, segmentDuration={self.segment_duration:g}s",
+            }))
+        elif command == 'stop_capture':
+            self.stats.stopped_by_server += 1
+            self.stopped = True
+
+
+async def report_progress(stats: LoadStats, started: float, interval: float) -> None:
+    """定期打印进度"""
+    while True:
+        await asyncio.sleep(interval)
+        elapsed = time.monotonic() - started
+        recent = stats.latencies[-200:]
+        queue = f"，队列={stats.queue_lengths[-1]}" if stats.queue_lengths else ""
+        print(
+            f"[LoadGen] {elapsed:.0f}s 已发送 {stats.sent}，已确认 {stats.acked}，失败 {stats.failures}，"
+            f"{stats.sent_bytes / (1024 * 1024) / max(elapsed, 1e-6):.2f} MB/s，"
+            f"确认 p95={percentile(recent, 0.95) * 1000:.0f}ms{queue}"
+        )
+
+
+async def run_load(url: str, payloads: List[SegmentPayload], args: argparse.Namespace) -> Tuple[LoadStats, float]:
+    """
+    运行所有模拟摄像头
+
+    Returns:
+        (统计, 运行时间秒)
+    """
+    stats = LoadStats()
+    rng = random.Random(args.seed)
+    cameras = [
+        SimulatedCamera(index, url, payloads, args, stats, random.Random(rng.random()))
+        for index in range(args.clients)
+    ]
+
+    async def start(camera: SimulatedCamera) -> None:
+        await asyncio.sleep(camera.index * args.ramp)
+        await camera.run()
+
+    started = time.monotonic()
+    reporter = asyncio.create_task(report_progress(stats, started, args.report_interval))
+    try:
+        await asyncio.gather(*(start(camera) for camera in cameras))
+    finally:
+        reporter.cancel()
+    return stats, time.monotonic() - started
+
+
+def summarize_load(stats: LoadStats, elapsed: float) -> Dict[str, Any]:
+    """客户端统计汇总"""
+    return {
+        'elapsed': round(elapsed, 2),
+        'sent': stats.sent,
+        'acked': stats.acked,
+        'sent_mb': round(stats.sent_bytes / (1024 * 1024), 2),
+        'throughput_mb_s': round(stats.sent_bytes / (1024 * 1024) / max(elapsed, 1e-6), 3),
+        'segments_per_s': round(stats.sent / max(elapsed, 1e-6), 3),
+        'qr_segments': stats.qr_segments,
+        'ack_latency_ms': {
+            name: round(percentile(stats.latencies, ratio) * 1000, 1)
+            for name, ratio in (('p50', 0.5), ('p95', 0.95), ('p99', 0.99), ('max', 1.0))
+        },
+        'ingest_ms_p95': round(percentile(stats.ingest_seconds, 0.95) * 1000, 1),
+        'failures': {
+            'failed_acks': dict(stats.failed_acks),
+            'ack_timeouts': stats.ack_timeouts,
+            'send_errors': stats.send_errors,
+            'lost_on_disconnect': stats.lost,
+            'total': stats.failures,
+        },
+        'disconnects': stats.disconnects,
+        'late_sends': stats.late_sends,
+        'max_send_lag': round(stats.max_lag, 3),
+        'queue_length': {
+            'max': max(stats.queue_lengths, default=0),
+            'mean': round(sum(stats.queue_lengths) / len(stats.queue_lengths), 2) if stats.queue_lengths else 0.0,
+        },
+        'reconfigurations': stats.reconfigurations,
+        'stopped_by_server': stats.stopped_by_server,
+    }
+
+
+def queue_counts(workdir: Path) -> Dict[str, int]:
+    """服务器工作目录中所有处理队列数据库（含多进程分片）的各状态分段数"""
+    totals: Dict[str, int] = {}
+    for path in sorted((workdir / 'recordings').glob('segment_queue*.db')):
+        segment_queue = SegmentQueue(path)
+        try:
+            for state, count in segment_queue.counts().items():
+                totals[state] = totals.get(state, 0) + count
+        finally:
+            segment_queue.close()
+    return totals
+
+
+def wait_for_drain(workdir: Path, timeout: float) -> Dict[str, int]:
+    """等待服务器处理完积压（队列中没有 queued / in_flight 的分段）或超时"""
+    deadline = time.time() + timeout
+    last_report = 0.0
+    while True:
+        counts = queue_counts(workdir)
+        remaining = counts.get(STATE_QUEUED, 0) + counts.get(STATE_IN_FLIGHT, 0)
+        if not remaining or time.time() >= deadline:
+            return counts
+        if time.time() - last_report >= 5:
+            print(f"[LoadGen] 等待服务器处理积压：剩余 {remaining} 个分段")
+            last_report = time.time()
+        time.sleep(0.5)
+
+
+def summarize_server(workdir: Path, counts: Dict[str, int]) -> Dict[str, Any]:
+    """汇总服务器工作目录中的处理统计与事件日志"""
+    stats_path = workdir / 'logs_debug' / 'processing_stats.jsonl'
+    records = []
+    if stats_path.exists():
+        records = [json.loads(line) for line in stats_path.read_text(encoding='utf-8').splitlines() if line.strip()]
+    events_path = workdir / 'logs_debug' / 'event_logs.jsonl'
+    events = sum(1 for line in events_path.open(encoding='utf-8') if line.strip()) if events_path.exists() else 0
+    processing_times = [r['processing_time'] for r in records if 'processing_time' in r]
+    latencies = [r['end_to_end_latency'] for r in records if 'end_to_end_latency' in r]
+    return {
+        'queue_states': counts,
+        'processed_segments': sum(len(r.get('coalesced_segments') or [r]) for r in records),
+        'vlm_calls': sum(1 for r in records if not r.get('vlm_skipped')),
+        'events': events,
+        'processing_time_mean': round(sum(processing_times) / len(processing_times), 3) if processing_times else 0.0,
+        'end_to_end_latency_p50': round(percentile(latencies, 0.5), 3),
+        'end_to_end_latency_p95': round(percentile(latencies, 0.95), 3),
+        'max_queue_length': max((r.get('queue_length', 0) for r in records), default=0),
+    }
+
+
+def print_summary(args: argparse.Namespace, summary: Dict[str, Any]) -> None:
+    latency = summary['ack_latency_ms']
+    failures = summary['failures']
+    reasons = "，".join(f"{reason} {count}" for reason, count in failures['failed_acks'].items())
+    print(f"\n[LoadGen] {args.clients} 台摄像头，{args.speed:g} 倍速，运行 {summary['elapsed']:.1f}s")
+    print(f"  发送分段    {summary['sent']}（{summary['sent_mb']:.1f} MB，{summary['throughput_mb_s']:.2f} MB/s，"
+          f"{summary['segments_per_s']:.2f} 段/秒，含二维码 {summary['qr_segments']}）")
+    print(f"  确认延迟    p50={latency['p50']:.0f}ms p95={latency['p95']:.0f}ms "
+          f"p99={latency['p99']:.0f}ms max={latency['max']:.0f}ms（服务器接收 p95={summary['ingest_ms_p95']:.0f}ms）")
+    print(f"  失败        {failures['total']}：失败确认 {sum(failures['failed_acks'].values())}"
+          + (f"（{reasons}）" if reasons else "")
+          + f"，确认超时 {failures['ack_timeouts']}，发送失败 {failures['send_errors']}，"
+          f"断线丢失 {failures['lost_on_disconnect']}（断线 {summary['disconnects']} 次）")
+    print(f"  发送滞后    {summary['late_sends']} 次，最大 {summary['max_send_lag']:.2f}s")
+    print(f"  服务器队列  最大 {summary['queue_length']['max']}，平均 {summary['queue_length']['mean']:.1f}"
+          f"（来自 segment_ack）")
+    print(f"  采集调整    reconfigure_capture {summary['reconfigurations']} 次，stop_capture {summary['stopped_by_server']} 次")
+    if summary['sent'] and not summary['acked'] and not failures['failed_acks']:
+        print("[Warning]: 未收到任何 segment_ack，服务器需要设置 SEGMENT_ACK=true")
+    server = summary.get('server')
+    if server:
+        states = server['queue_states']
+        print(f"  服务器处理  {server['processed_segments']} 段（模型调用 {server['vlm_calls']} 次，"
+              f"事件 {server['events']} 条），完成 {states.get(STATE_DONE, 0)}，失败 {states.get(STATE_FAILED, 0)}，"
+              f"未完成 {states.get(STATE_QUEUED, 0) + states.get(STATE_IN_FLIGHT, 0)}")
+        print(f"              平均处理 {server['processing_time_mean']:.2f}s，端到端 "
+              f"p50={server['end_to_end_latency_p50']:.1f}s p95={server['end_to_end_latency_p95']:.1f}s，"
+              f"处理时最大队列 {server['max_queue_length']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="模拟 N 台 Android 摄像头压测 WebSocket 服务器")
+    target = parser.add_mutually_exclusive_group()
+    target.add_argument('--url', default='ws://127.0.0.1:50002', help='服务器地址（默认 ws://127.0.0.1:50002）')
+    target.add_argument('--spawn-server', action='store_true',
+                        help='在临时目录中启动离线服务器（模拟模型后端 + 离线数据库）')
+    parser.add_argument('--workers', type=int, default=1, help='--spawn-server 的接收进程数（默认 1）')
+    parser.add_argument('--uvloop', action='store_true', help='--spawn-server 的服务器使用 uvloop')
+    parser.add_argument('--keep', action='store_true', help='保留 --spawn-server 的工作目录')
+    parser.add_argument('--drain-timeout', type=float, default=300.0,
+                        help='--spawn-server 发送结束后等待处理完积压的最长时间（秒，默认 300）')
+    parser.add_argument('--clients', type=int, default=4, help='模拟摄像头数（默认 4）')
+    length = parser.add_mutually_exclusive_group()
+    length.add_argument('--segments', type=int, default=10, help='每台摄像头发送的分段数（默认 10）')
+    length.add_argument('--duration', type=float, help='按运行时间（秒）代替分段数')
+    parser.add_argument('--segment-seconds', type=float,
+                        default=float(os.getenv('REALTIME_TARGET_SEGMENT_DURATION', '60')),
+                        help='分段时长（秒，默认 REALTIME_TARGET_SEGMENT_DURATION 或 60）')
+    parser.add_argument('--speed', type=float, default=1.0, help='发送节奏倍速（默认 1，即每个分段时长发送一次）')
+    parser.add_argument('--ramp', type=float, default=0.0, help='相邻摄像头开始发送的间隔（秒，默认 0）')
+    parser.add_argument('--replay', nargs='+', help='回放的会话目录或 MP4 文件')
+    parser.add_argument('--size-mb', type=float, default=2.0, help='随机字节负载的大小（MB，默认 2）')
+    parser.add_argument('--random-payload', action='store_true', help='有 ffmpeg 时也使用随机字节负载')
+    parser.add_argument('--bitrate', type=float, default=1.0, help='合成 MP4 的码率（Mbps，默认 1）')
+    parser.add_argument('--fps', type=int, default=10, help='合成 MP4 的帧率（默认 10）')
+    parser.add_argument('--qr-rate', type=float, default=0.2, help='合成分段附带二维码结果的比例（默认 0.2）')
+    parser.add_argument('--ack-timeout', type=float, default=60.0, help='确认超时（秒，默认 60）')
+    parser.add_argument('--max-reconnects', type=int, default=5, help='连续重连失败多少次后放弃（默认 5）')
+    parser.add_argument('--report-interval', type=float, default=5.0, help='进度输出间隔（秒，默认 5）')
+    parser.add_argument('--seed', type=int, default=0, help='随机数种子（默认 0）')
+    parser.add_argument('--json', help='把汇总写入 JSON 文件')
+    args = parser.parse_args()
+    if args.speed <= 0:
+        parser.error('--speed 必须大于 0')
+
+    if args.replay:
+        payloads = load_replay_payloads(args.replay)
+    else:
+        payloads = [synthetic_payload(args.segment_seconds, args.bitrate, args.fps, args.size_mb, args.random_payload)]
+    max_size_mb = max(payload.size for payload in payloads) / (1024 * 1024)
+    print(
+        f"[LoadGen] {args.clients} 台摄像头，"
+        + (f"运行 {args.duration:g}s" if args.duration else f"每台 {args.segments} 段")
+        + f"，分段 {args.segment_seconds:g}s / {args.speed:g} 倍速（每 {args.segment_seconds / args.speed:.2f}s 一段），"
+        f"负载 {len(payloads)} 个（最大 {max_size_mb:.2f} MB）"
+    )
+
+    workdir: Optional[Path] = None
+    server: Optional[subprocess.Popen] = None
+    url = args.url
+    if args.spawn_server:
+        workdir = Path(tempfile.mkdtemp(prefix='loadgen_server_'))
+        port = free_port()
+        server = start_server(
+            workdir, port, args.workers, args.uvloop, max_size_mb,
+            env=offline_server_env(workdir, args.segment_seconds)
+        )
+        url = f"ws://127.0.0.1:{port}"
+        print(f"[LoadGen] 离线服务器已启动：{url}（{args.workers} 个接收进程，工作目录 {workdir}）")
+
+    try:
+        stats, elapsed = asyncio.run(run_load(url, payloads, args))
+        summary = summarize_load(stats, elapsed)
+        if workdir is not None:
+            counts = wait_for_drain(workdir, args.drain_timeout)
+            summary['server'] = summarize_server(workdir, counts)
+    except KeyboardInterrupt:
+        print("\n[LoadGen] 已中断")
+        return
+    finally:
+        if server is not None:
+            stop_server(server)
+            if args.keep:
+                print(f"[LoadGen] 保留工作目录 {workdir}（server.log、recordings/、logs_debug/）")
+            else:
+                shutil.rmtree(workdir, ignore_errors=True)
+
+    print_summary(args, summary)
+    if args.json:
+        Path(args.json).write_text(json.dumps(summary, ensure_ascii=False, indent=2), encoding='utf-8')
+        print(f"[LoadGen] 汇总已写入 {args.json}")
+
+
+if __name__ == '__main__':
+    main()
@@ -38,6 +38,24 @@ class MonitoringLogger:
                 - timestamp: 处理完成时间戳
                 - h264_size_mb: H264文件大小（MB）
                 - mp4_size_mb: MP4文件大小（MB）
+                - api_latency / input_tokens / cached_tokens / cached_ratio / output_tokens:
+                  模型调用统计（可选）
+                - streamed / time_to_first_event / time_to_first_emergency:
+                  流式输出统计（可选，秒，相对请求发出时刻）
+                - upload_bytes / original_bytes / upload_ratio / preprocess_time:
+                  上传字节数与预处理统计（可选）
+                - end_to_end_latency: 收到分段到处理完成的耗时（秒，可选）
+                - vlm_skipped / activity_max_change / activity_boundary_change / activity_time:
+                  静止场景检测统计（可选）
+                - segment_duration_target / segment_duration_changes / segment_duration_reason:
+                  自适应分段时长（可选）
+                - source: 分段来源（live / watch）
+                - degradation_level / degradation_name / degradation_transitions:
+                  积压降级（可选）
+                - coalesced_segments / batch_mode: 合并调用的原分段与合并方式（可选）
+                - capture_level / capture_bitrate_mb / capture_fps / capture_changes / capture_reason /
+                  capture_saturated_ratio: 采集背压（可选）
+                - tokens_per_video_minute: 每分钟视频的输入 + 输出 token 数（可选）
         """
         # 添加时间戳（如果未提供）
         if 'timestamp' not in stats:
@@ -51,6 +69,72 @@ class MonitoringLogger:
         except Exception as e:
             print(f"[Warning]: 写入监控日志失败: {e}")
     
+    def log_degradation_transition(self, transition: Dict[str, Any]) -> None:
+        """
+        记录积压降级的等级变化（写入同目录下的 degradation_transitions.jsonl）
+        
+        Args:
+            transition: 等级变化（previous_level / level / name / queue_length / settings / time_at_level）
+        """
+        path = self.log_file.parent / "degradation_transitions.jsonl"
+        try:
+            with path.open("a", encoding="utf-8") as f:
+                json.dump(transition, f, ensure_ascii=False)
+                f.write("\n")
+        except Exception as e:
+            print(f"[Warning]: 写入降级日志失败: {e}")
+    
+    def log_capture_control(self, record: Dict[str, Any]) -> None:
+        """
+        记录采集背压的参数调整（写入同目录下的 capture_control.jsonl）
+        
+        Args:
+            record: 调整记录（client_id / level / bitrate_mb / fps / reason / queue_length / ingest_seconds 等）
+        """
+        path = self.log_file.parent / "capture_control.jsonl"
+        try:
+            with path.open("a", encoding="utf-8") as f:
+                json.dump(record, f, ensure_ascii=False)
+                f.write("\n")
+        except Exception as e:
+            print(f"[Warning]: 写入采集背压日志失败: {e}")
+    
+    def summarize_by_date(self) -> Dict[str, Dict[str, Any]]:
+        """
+        按日期汇总处理统计（日期取自记录的 timestamp）
+        
+        Returns:
+            {日期: {'segments': 分段数, 'vlm_calls': 模型调用数, 'vlm_skipped': 跳过数,
+                    'upload_bytes': 上传字节数, 'tokens': 输入 + 输出 token 数,
+                    'video_seconds': 有 token 统计的调用覆盖的视频时长}}
+        """
+        summary: Dict[str, Dict[str, Any]] = {}
+        if not self.log_file.exists():
+            return summary
+        with self.log_file.open("r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    stats = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                date = str(stats.get('timestamp', ''))[:10] or 'unknown'
+                day = summary.setdefault(date, {
+                    'segments': 0, 'vlm_calls': 0, 'vlm_skipped': 0, 'upload_bytes': 0,
+                    'tokens': 0, 'video_seconds': 0.0
+                })
+                # 合并调用的一条记录覆盖多个分段
+                day['segments'] += len(stats.get('coalesced_segments') or []) or 1
+                if stats.get('vlm_skipped'):
+                    day['vlm_skipped'] += 1
+                else:
+                    day['vlm_calls'] += 1
+                    day['upload_bytes'] += stats.get('upload_bytes') or 0
+                    tokens = (stats.get('input_tokens') or 0) + (stats.get('output_tokens') or 0)
+                    if tokens:
+                        day['tokens'] += tokens
+                        day['video_seconds'] += stats.get('segment_duration') or 0.0
+        return summary
+    
     def print_segment_stats(self, stats: Dict[str, Any]) -> None:
         """
         打印分段处理统计到控制台
@@ -0,0 +1,306 @@
+"""持久化分段处理队列：SQLite（WAL）记录每个分段的处理状态，服务器重启后继续处理
+
+原先的处理队列是内存中的 asyncio.Queue：客户端断开或服务器重启时仍在排队的分段不会再被处理，
+尽管 MP4 已保存在磁盘上。这里每个分段在保存后立即登记为 queued，处理队列按以下状态流转：
+
+    queued ──claim──▶ in_flight ──complete──▶ done
+                          │
+                          └──fail──▶ queued（延迟重试）/ failed（超过重试次数）
+
+- claim 时写入租约到期时间；租约过期仍未完成的分段可被重新领取（处理卡死时兜底）
+- 上下文提交（事件编号重排、外貌更新写入操作日志）后立即把提交结果记录到分段上（committed）；
+  之后写日志、缩略图等步骤失败或服务器崩溃时，重试只重做这些写入，不再调用模型、不再重复提交
+- 服务器启动时把上一次运行遗留的 in_flight 分段放回 queued，并恢复所有会话中未完成的分段
+- 同一会话的分段按登记顺序处理（事件编号依赖处理顺序）；失败重试的分段未到重试时间时，会话等待它，
+  不越过它处理后面的分段
+
+数据库默认位于 recordings/segment_queue.db，所有会话共用，便于启动时统一恢复。
+同一个数据库只应由一个服务器进程使用；多进程接收时每个工作进程使用各自的数据库（见 sharded.py）。
+
+环境变量：
+- SEGMENT_QUEUE_DB：数据库路径（默认 recordings/segment_queue.db）
+- SEGMENT_QUEUE_LEASE：租约时长（秒，默认 600）
+- SEGMENT_QUEUE_MAX_ATTEMPTS：最多处理次数，超过后标记为 failed（默认 3）
+- SEGMENT_QUEUE_RETRY_DELAY：失败后重试的基础延迟（秒，按次数递增，默认 30）
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+
+STATE_QUEUED = 'queued'
+STATE_IN_FLIGHT = 'in_flight'
+STATE_DONE = 'done'
+STATE_FAILED = 'failed'
+
+
+def _env_number(name: str, default, cast):
+    try:
+        return cast(os.getenv(name, str(default)))
+    except ValueError:
+        return default
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS segments (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    session_dir TEXT NOT NULL,
+    segment_id TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    state TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    available_at REAL NOT NULL DEFAULT 0,
+    lease_until REAL,
+    last_error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    committed TEXT,
+    UNIQUE (session_dir, segment_id)
+);
+CREATE INDEX IF NOT EXISTS idx_segments_session_state ON segments (session_dir, state, id);
+"""
+
+
+@dataclass
+class SegmentJob:
+    """领取到的一个分段"""
+    session_dir: str
+    segment_id: str
+    payload: Dict[str, Any]   # 与原先放入内存队列的 segment_info 相同
+    attempts: int             # 含本次在内的处理次数
+    committed: Optional[Dict[str, Any]] = None  # 已提交的结果（mark_committed 记录），重试时只重做写入
+
+
+class SegmentQueue:
+    """持久化分段队列（线程安全，可在事件循环与线程池中调用）"""
+
+    def __init__(
+        self,
+        db_path: Optional[Path] = None,
+        lease_seconds: Optional[float] = None,
+        max_attempts: Optional[int] = None,
+        retry_delay: Optional[float] = None
+    ):
+        """
+        Args:
+            db_path: 数据库路径，None 则读取 SEGMENT_QUEUE_DB（默认 recordings/segment_queue.db）
+            lease_seconds: 租约时长，None 则读取 SEGMENT_QUEUE_LEASE（默认 600）
+            max_attempts: 最多处理次数，None 则读取 SEGMENT_QUEUE_MAX_ATTEMPTS（默认 3）
+            retry_delay: 重试基础延迟，None 则读取 SEGMENT_QUEUE_RETRY_DELAY（默认 30）
+        """
+        self.db_path = Path(db_path or os.getenv('SEGMENT_QUEUE_DB', 'recordings/segment_queue.db'))
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.lease_seconds = lease_seconds if lease_seconds is not None else _env_number('SEGMENT_QUEUE_LEASE', 600.0, float)
+        self.max_attempts = max_attempts if max_attempts is not None else _env_number('SEGMENT_QUEUE_MAX_ATTEMPTS', 3, int)
+        self.retry_delay = retry_delay if retry_delay is not None else _env_number('SEGMENT_QUEUE_RETRY_DELAY', 30.0, float)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(segments)")}
+        if 'committed' not in columns:
+            # 旧版数据库没有 committed 列
+            self._conn.execute("ALTER TABLE segments ADD COLUMN committed TEXT")
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def enqueue(self, session_dir: str, segment_id: str, payload: Dict[str, Any], replace: bool = True) -> bool:
+        """
+        登记分段
+
+        Args:
+            session_dir: 会话目录
+            segment_id: 分段ID
+            payload: 处理所需信息（需可 JSON 序列化）
+            replace: 分段已登记过时是否重置为 queued（False 时保持原状态不变）
+
+        Returns:
+            是否写入（replace=False 且分段已登记过时为 False）
+        """
+        now = time.time()
+        on_conflict = (
+            """DO UPDATE SET
+                payload = excluded.payload, state = excluded.state, attempts = 0,
+                available_at = 0, lease_until = NULL, last_error = NULL, committed = NULL,
+                updated_at = excluded.updated_at"""
+            if replace else "DO NOTHING"
+        )
+        with self._lock:
+            cursor = self._conn.execute(
+                f"""
+                INSERT INTO segments (session_dir, segment_id, payload, state, created_at, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT (session_dir, segment_id) {on_conflict}
+                """,
+                (session_dir, segment_id, json.dumps(payload, ensure_ascii=False), STATE_QUEUED, now, now)
+            )
+        return cursor.rowcount > 0
+
+    def claim(self, session_dir: str) -> Optional[SegmentJob]:
+        """
+        领取会话中下一个待处理的分段（queued，或租约已过期的 in_flight）
+
+        按登记顺序只看最早的一个待处理分段：它是尚未到重试时间的 queued 分段时返回 None，
+        会话等待它重试，不越过它处理后面的分段（事件编号与上下文依赖处理顺序，合并调用也只合并相邻分段）。
+
+        Args:
+            session_dir: 会话目录
+
+        Returns:
+            SegmentJob；没有可处理的分段时返回 None
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    """
+                    SELECT id, segment_id, payload, attempts, state, available_at, committed FROM segments
+                    WHERE session_dir = ? AND (state = ? OR (state = ? AND lease_until < ?))
+                    ORDER BY id LIMIT 1
+                    """,
+                    (session_dir, STATE_QUEUED, STATE_IN_FLIGHT, now)
+                ).fetchone()
+                if row is None or (row[4] == STATE_QUEUED and row[5] > now):
+                    self._conn.execute("COMMIT")
+                    return None
+                row_id, segment_id, payload, attempts = row[:4]
+                self._conn.execute(
+                    "UPDATE segments SET state = ?, attempts = ?, lease_until = ?, updated_at = ? WHERE id = ?",
+                    (STATE_IN_FLIGHT, attempts + 1, now + self.lease_seconds, now, row_id)
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        committed = json.loads(row[6]) if row[6] else None
+        return SegmentJob(session_dir, segment_id, json.loads(payload), attempts + 1, committed)
+
+    def mark_committed(self, job: SegmentJob, result: Dict[str, Any]) -> None:
+        """
+        记录分段已提交到上下文（状态不变，仍为 in_flight）
+
+        Args:
+            job: 领取到的分段
+            result: 提交结果与写入进度（需可 JSON 序列化）；之后失败重试时由 claim 返回在 job.committed 中
+        """
+        job.committed = result
+        with self._lock:
+            self._conn.execute(
+                "UPDATE segments SET committed = ?, updated_at = ? WHERE session_dir = ? AND segment_id = ?",
+                (json.dumps(result, ensure_ascii=False), time.time(), job.session_dir, job.segment_id)
+            )
+
+    def complete(self, job: SegmentJob) -> None:
+        """标记分段处理完成"""
+        self._set_state(job, STATE_DONE, None, 0)
+
+    def fail(self, job: SegmentJob, error: str, permanent: bool = False) -> str:
+        """
+        记录处理失败：未超过重试次数时延迟后重新排队，否则标记为 failed
+
+        Args:
+            job: 领取到的分段
+            error: 错误信息
+            permanent: 是否不再重试（如视频文件已不存在）
+
+        Returns:
+            新状态（queued / failed）
+        """
+        if permanent or job.attempts >= self.max_attempts:
+            self._set_state(job, STATE_FAILED, error, 0)
+            return STATE_FAILED
+        self._set_state(job, STATE_QUEUED, error, time.time() + self.retry_delay * job.attempts)
+        return STATE_QUEUED
+
+    def _set_state(self, job: SegmentJob, state: str, error: Optional[str], available_at: float) -> None:
+        with self._lock:
+            self._conn.execute(
+                """
+                UPDATE segments SET state = ?, last_error = ?, available_at = ?, lease_until = NULL, updated_at = ?
+                WHERE session_dir = ? AND segment_id = ?
+                """,
+                (state, error, available_at, time.time(), job.session_dir, job.segment_id)
+            )
+
+    def contains(self, session_dir: str, segment_id: str) -> bool:
+        """分段是否已登记（任意状态）"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT 1 FROM segments WHERE session_dir = ? AND segment_id = ?",
+                (session_dir, segment_id)
+            ).fetchone()
+        return row is not None
+
+    def pending_count(self, session_dir: str) -> int:
+        """会话中排队中的分段数（不含正在处理的分段）"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT COUNT(*) FROM segments WHERE session_dir = ? AND state = ?",
+                (session_dir, STATE_QUEUED)
+            ).fetchone()
+        return row[0]
+
+    def unfinished_count(self, session_dir: str) -> int:
+        """会话中尚未完成（queued 或 in_flight）的分段数"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT COUNT(*) FROM segments WHERE session_dir = ? AND state IN (?, ?)",
+                (session_dir, STATE_QUEUED, STATE_IN_FLIGHT)
+            ).fetchone()
+        return row[0]
+
+    def requeue_in_flight(self) -> int:
+        """
+        把上一次运行遗留的 in_flight 分段放回 queued（仅在服务器启动时调用）
+
+        Returns:
+            放回的分段数
+        """
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE segments SET state = ?, lease_until = NULL, available_at = 0, updated_at = ? WHERE state = ?",
+                (STATE_QUEUED, time.time(), STATE_IN_FLIGHT)
+            )
+        return cursor.rowcount
+
+    def unfinished_sessions(self) -> List[str]:
+        """有未完成分段的会话目录（按最早登记顺序）"""
+        with self._lock:
+            rows = self._conn.execute(
+                """
+                SELECT session_dir FROM segments WHERE state IN (?, ?)
+                GROUP BY session_dir ORDER BY MIN(id)
+                """,
+                (STATE_QUEUED, STATE_IN_FLIGHT)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def counts(self) -> Dict[str, int]:
+        """各状态的分段数"""
+        with self._lock:
+            rows = self._conn.execute("SELECT state, COUNT(*) FROM segments GROUP BY state").fetchall()
+        return {state: count for state, count in rows}
+
+
+_shared_queue: Optional[SegmentQueue] = None
+_shared_queue_lock = threading.Lock()
+
+
+def get_segment_queue() -> SegmentQueue:
+    """进程内共享的持久化队列"""
+    global _shared_queue
+    with _shared_queue_lock:
+        if _shared_queue is None:
+            _shared_queue = SegmentQueue()
+        return _shared_queue
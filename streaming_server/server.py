@@ -9,20 +9,56 @@ import subprocess
 import time
 from datetime import datetime
 from pathlib import Path
-from typing import Dict, Optional, List
+from typing import Any, Dict, Optional, List
 
 import websockets
 
 # 导入实时处理相关模块
 from streaming_server.monitoring import MonitoringLogger
-from storage.models import VideoSegment
+from streaming_server.adaptive_segment import (
+    AdaptiveSegmentController,
+    SegmentDurationDecision,
+    is_adaptive_segment_enabled,
+)
+from streaming_server.capture_control import (
+    CaptureController,
+    CaptureDecision,
+    is_capture_backpressure_enabled,
+)
+from streaming_server.degradation import (
+    DegradationController,
+    DegradationTransition,
+    build_levels,
+    is_degradation_enabled,
+)
+from streaming_server.segment_queue import STATE_QUEUED, SegmentJob, SegmentQueue, get_segment_queue
+from streaming_server.sharded import read_command, run_event_loop, run_sharded, shard_queue_path, supports_reuse_port
+from streaming_server.watcher import CompletedSegment, RecordingsWatcher, WatchThroughput, is_watch_enabled
+from storage.models import Emergency, EventLog, VideoSegment, from_commit_record, to_commit_record
 from storage.seekdb_client import SeekDBClient
+from storage.offline_client import OfflineDBClient, is_seekdb_offline
 from utils.segment_time_parser import parse_segment_times, extract_date_from_segment_id
 
 # 动态上下文相关模块
 from context.appearance_cache import AppearanceCache
+from context.context_coordinator import RemoteContextService
+from context.context_service import DateContextService, acquire_context_service, release_context_service
 from context.event_context import EventContext
-from video_processing.qwen3_vl_processor import Qwen3VLProcessor
+from video_processing.qwen3_vl_processor import Qwen3VLProcessor, create_qwen_processor
+from video_processing.batching import (
+    BATCH_MODE_MULTI,
+    SegmentPart,
+    attribute_items,
+    concat_segments,
+    get_batch_mode,
+    get_batch_segments,
+    tokens_per_video_minute,
+)
+from video_processing.async_client import close_http_clients
+from video_processing.emergency_detector import EmergencyGate, FlameDetector, is_fast_detection_enabled
+from video_processing.preprocess import VideoPreprocessor, is_preprocess_enabled
+from video_processing.activity_gate import ActivityGate, build_idle_event, is_activity_gate_enabled
+from video_processing.response_parser import ProcessingResult
 from log_writer.writer import SimpleLogWriter
 
 RECORDINGS_ROOT = Path("recordings")
@@ -35,6 +71,11 @@ DEBUG_LOG_DIR.mkdir(parents=True, exist_ok=True)
 # 跟踪当前已连接的客户端及其录制会话
 CONNECTED_CLIENTS = set()
 RECORDING_SESSIONS: Dict[websockets.WebSocketServerProtocol, "RecordingSession"] = {}
+# 正在后台处理分段的会话（客户端结束采集后仍保留引用，直到队列处理完）
+PROCESSING_SESSIONS: set = set()
+# 目录监视导入的会话（按会话目录）与吞吐统计
+WATCHED_SESSIONS: Dict[str, "RecordingSession"] = {}
+WATCH_THROUGHPUT: Optional[WatchThroughput] = None
 
 # 环境变量配置
 def get_config(key: str, default, type_func: type = str):
@@ -53,6 +94,9 @@ REALTIME_CLEANUP_H264 = get_config('REALTIME_CLEANUP_H264', True, bool)
 DYNAMIC_CONTEXT_ENABLED = get_config('DYNAMIC_CONTEXT_ENABLED', True, bool)
 MAX_RECENT_EVENTS = get_config('MAX_RECENT_EVENTS', 20, int)
 APPEARANCE_DUMP_INTERVAL = get_config('APPEARANCE_DUMP_INTERVAL', 5, int)  # 每 N 个分段 dump 一次
+# 积压时每次调用最多合并的相邻分段数与合并方式（见 video_processing/batching.py）
+VLM_BATCH_SEGMENTS = get_batch_segments()
+VLM_BATCH_MODE = get_batch_mode()
 
 # start 命令的默认参数（可通过环境变量覆盖）
 DEFAULT_ASPECT_RATIO_WIDTH = get_config('DEFAULT_ASPECT_RATIO_WIDTH', 4, int)
@@ -64,6 +108,15 @@ DEFAULT_INCLUDE_ASPECT_RATIO = get_config('DEFAULT_INCLUDE_ASPECT_RATIO', False,
 # WebSocket 单消息大小上限（MB），用于容纳更长分段
 WEBSOCKET_MAX_SIZE_MB = get_config('WEBSOCKET_MAX_SIZE_MB', 10.0, float)
 WEBSOCKET_VERBOSE = get_config('WEBSOCKET_VERBOSE', False, bool)
+# 最近一次 start 命令下发的码率（MB）与帧率，作为采集背压的原参数（L0）
+CAPTURE_SETTINGS: Dict[str, Any] = {'bitrate': DEFAULT_BITRATE_MB, 'fps': DEFAULT_FPS}
+# 分段保存后向客户端回复 segment_ack（含接收耗时与队列长度，供压测客户端统计延迟）
+SEGMENT_ACK = get_config('SEGMENT_ACK', False, bool)
+
+# 多进程接收（streaming_server/sharded.py）时由工作进程设置：分片编号与上下文协调器代理
+SHARD_INDEX: Optional[int] = None
+SHARD_COUNT: Optional[int] = None
+CONTEXT_COORDINATOR = None
 
 
 def log_debug(msg: str):
@@ -76,13 +129,23 @@ class RecordingSession:
     针对单个客户端的一次录制会话：
     - 在 recordings/ 下为每个会话创建独立目录
     - 接收Android端封装的MP4分段
-    - 如果启用实时处理，将MP4分段加入处理队列
+    - 如果启用实时处理，将MP4分段登记到持久化处理队列
     - 支持动态上下文（人物外貌缓存、事件上下文）
     """
-    def __init__(self, client_id: str, enable_realtime_processing: bool = False):
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    def __init__(self, client_id: str, enable_realtime_processing: bool = False, session_dir: Optional[Path] = None):
+        """
+        Args:
+            client_id: 客户端标识
+            enable_realtime_processing: 是否实时处理
+            session_dir: 已有的会话目录（服务器重启后恢复未完成分段时使用），None 则按当前时间新建
+        """
+        if session_dir is None:
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            self.session_dir = RECORDINGS_ROOT / timestamp
+        else:
+            self.session_dir = Path(session_dir)
+            timestamp = self.session_dir.name
         self.client_id = client_id
-        self.session_dir = RECORDINGS_ROOT / timestamp
         self.session_dir.mkdir(parents=True, exist_ok=True)
         
         # 提取名义日期 (YYYY-MM-DD)
@@ -91,22 +154,58 @@ class RecordingSession:
         # 实时处理相关
         self.enable_realtime_processing = enable_realtime_processing and REALTIME_PROCESSING_ENABLED
         
-        # 处理队列（异步处理）
-        self.processing_queue: Optional[asyncio.Queue] = None
+        # 处理队列（持久化，重启后可恢复）与后台处理任务
+        self.segment_queue: Optional[SegmentQueue] = None
+        self.queue_event: Optional[asyncio.Event] = None
         self.processing_task: Optional[asyncio.Task] = None
+        # 客户端已结束采集：队列处理完后关闭会话
+        self.closing = False
+        # 处理任务已确认队列为空并退出循环（之后登记的分段需要新的会话处理）
+        self.drained = False
         
         # 动态上下文相关
         self.appearance_cache: Optional[AppearanceCache] = None
+        # 同一名义日期的会话共享；多进程接收时为协调器代理 RemoteContextService
+        self.context_service: Optional[DateContextService] = None
         self.event_context: Optional[EventContext] = None
         self.db_client: Optional[SeekDBClient] = None
         self.log_writer: Optional[SimpleLogWriter] = None
         self.video_processor: Optional[Qwen3VLProcessor] = None
         
+        # 紧急情况：快速检测与视频理解模型的输出经同一个去重闸门写入
+        self.emergency_gate: Optional[EmergencyGate] = None
+        self.flame_detector: Optional[FlameDetector] = None
+        self.emergency_tasks: set = set()
+        
+        # 上传前预处理（降帧率/降分辨率副本，可选）
+        self.video_preprocessor = VideoPreprocessor() if is_preprocess_enabled() else None
+        
+        # 静止场景跳过（实验室无人且画面不变时不调用模型）
+        self.activity_gate = ActivityGate() if is_activity_gate_enabled() else None
+        
         # 统计字段
         self.processed_segments_count = 0
         self.total_temp_size_mb = 0.0
         self.processing_stats: List[Dict] = []
         
+        # 当前分段时长（自适应分段时由服务器调整并下发给客户端）
+        self.websocket = None
+        self.segment_duration = REALTIME_TARGET_SEGMENT_DURATION
+        self.segment_controller = (
+            AdaptiveSegmentController(REALTIME_TARGET_SEGMENT_DURATION)
+            if self.enable_realtime_processing and is_adaptive_segment_enabled() else None
+        )
+        
+        # 积压降级：队列积压时降低抽帧率/思考、合并分段、换用更快的模型
+        self.degradation = (
+            DegradationController(build_levels(REALTIME_QUEUE_ALERT_THRESHOLD))
+            if self.enable_realtime_processing and is_degradation_enabled() else None
+        )
+        self._degraded_processors: Dict[int, Any] = {}
+        
+        # 采集背压：服务器饱和时让该客户端降低码率/帧率（仅实时采集的会话，由 start_recording 创建）
+        self.capture_controller: Optional[CaptureController] = None
+        
         # 监控日志记录器
         self.monitor = MonitoringLogger() if self.enable_realtime_processing else None
         
@@ -116,28 +215,51 @@ class RecordingSession:
         # 外貌缓存文件路径
         self.appearance_cache_path = DEBUG_LOG_DIR / "appearances.json"
     
+    def current_processor(self):
+        """当前降级等级使用的视频处理器（L0 即 video_processor；各等级的处理器按需创建并复用）"""
+        if not self.degradation or self.degradation.level == 0 or not self.video_processor:
+            return self.video_processor
+        level = self.degradation.current
+        processor = self._degraded_processors.get(level.level)
+        if processor is None:
+            base_fps = getattr(self.video_processor, 'fps', None)
+            fps = level.fps if level.fps is None or base_fps is None else min(base_fps, level.fps)
+            processor = create_qwen_processor(
+                model=level.model,
+                fps=fps,
+                enable_thinking=level.enable_thinking,
+                thinking_budget=level.thinking_budget,
+                appearance_cache=self.appearance_cache,
+                event_context=self.event_context,
+                max_recent_events=MAX_RECENT_EVENTS
+            )
+            self._degraded_processors[level.level] = processor
+        return processor
+    
     def init_dynamic_context(self):
         """初始化动态上下文组件"""
         if not DYNAMIC_CONTEXT_ENABLED:
             return
         
         try:
-            # 创建数据库客户端
-            self.db_client = SeekDBClient()
+            # 创建数据库客户端（离线演练时不连接 SeekDB）
+            self.db_client = OfflineDBClient() if is_seekdb_offline() else SeekDBClient()
             
-            # 创建人物外貌缓存（尝试从文件加载）
-            self.appearance_cache = AppearanceCache()
-            self.appearance_cache.nominal_date = self.nominal_date
-            if self.appearance_cache_path.exists():
-                loaded = self.appearance_cache.load_from_file(str(self.appearance_cache_path))
-                if loaded:
-                    print(f"[Context]: 加载外貌缓存成功，共 {self.appearance_cache.get_record_count()} 条记录")
-            
-            # 创建事件上下文（从 JSONL 文件读取）
-            self.event_context = EventContext()
+            # 获取共享上下文服务（同一名义日期的多个会话共用外貌缓存与事件编号；多进程时经协调器共享）
+            if CONTEXT_COORDINATOR is not None:
+                self.context_service = RemoteContextService(
+                    CONTEXT_COORDINATOR, self.nominal_date, self.appearance_cache_path
+                )
+            else:
+                self.context_service = acquire_context_service(self.nominal_date, self.appearance_cache_path)
+            self.appearance_cache = self.context_service.appearance_cache
+            self.event_context = self.context_service.event_context
             
             # 创建日志写入器（不加密）
             self.log_writer = SimpleLogWriter(self.db_client)
+            self.emergency_gate = EmergencyGate(self.log_writer.write_emergency_log)
+            if is_fast_detection_enabled():
+                self.flame_detector = FlameDetector()
             
             # 创建视频处理器（使用动态上下文）
             self.video_processor = Qwen3VLProcessor(
@@ -156,31 +278,55 @@ class RecordingSession:
     
     def _cleanup_context(self):
         """清理动态上下文资源"""
-        if self.event_context:
-            self.event_context.close()
-            self.event_context = None
         if self.db_client:
             self.db_client.close()
             self.db_client = None
+        if self.context_service:
+            # 外貌缓存与事件上下文由共享服务持有，最后一个会话释放时关闭
+            if isinstance(self.context_service, RemoteContextService):
+                self.context_service.release()
+            else:
+                release_context_service(self.context_service)
+            self.context_service = None
+        self.event_context = None
         self.appearance_cache = None
         self.log_writer = None
+        self.emergency_gate = None
+        self.flame_detector = None
         self.video_processor = None
     
-    def dump_appearance_cache(self):
-        """保存外貌缓存到文件"""
-        if self.appearance_cache:
+    def dump_appearance_cache(self, force: bool = True):
+        """
+        保存外貌缓存快照（变更已实时追加到操作日志，快照只用于压缩）
+        
+        Args:
+            force: True 时立即写快照；False 时仅在累计操作数达到阈值时写
+        """
+        if self.context_service:
             try:
-                self.appearance_cache.dump_to_file(str(self.appearance_cache_path))
-                print(f"[Context]: 外貌缓存已保存，共 {self.appearance_cache.get_record_count()} 条记录")
+                if force:
+                    self.context_service.compact()
+                elif not self.context_service.maybe_compact():
+                    return
+                print(f"[Context]: 外貌缓存已保存，共 {self.context_service.appearance_cache.get_record_count()} 条记录")
             except Exception as e:
                 print(f"[Context]: 保存外貌缓存失败: {e}")
     
-    def handle_mp4_segment(self, segment_id: str, mp4_data: bytes, qr_results: Optional[List] = None):
+    def queue_length(self) -> int:
+        """排队中的分段数（不含正在处理的分段）"""
+        if not self.segment_queue:
+            return 0
+        return self.segment_queue.pending_count(str(self.session_dir))
+    
+    def handle_mp4_segment(self, segment_id: str, mp4_data: bytes, qr_results: Optional[List] = None) -> Optional[Dict]:
         """
-        处理接收到的MP4分段：
+        处理接收到的MP4分段（阻塞，在线程池中调用）：
         - 保存MP4文件到会话目录
         - 生成时间戳
-        - 加入处理队列（如果启用实时处理）
+        - 登记到持久化处理队列（如果启用实时处理）
+        
+        Returns:
+            登记的分段信息；未启用实时处理时返回 None
         """
         qr_results = qr_results or []
         # 保存MP4文件（使用segment_id作为文件名，已包含时间戳和序号）
@@ -195,22 +341,40 @@ class RecordingSession:
         
         # 生成时间戳（从segment_id中提取，格式：YYYYMMDD_HHMMSS_XX）
         # 如果无法解析，使用当前时间
-        start_time, end_time = parse_segment_times(segment_id, REALTIME_TARGET_SEGMENT_DURATION)
+        start_time, end_time = parse_segment_times(segment_id, self.segment_duration)
         
         self.segment_count += 1
         print(f"[Info]: Saved MP4 segment {segment_id} ({len(mp4_data)} bytes) to {segment_path}")
         
-        # 如果启用实时处理，加入处理队列
-        if self.enable_realtime_processing and self.processing_queue:
+        # 如果启用实时处理，登记到处理队列（先于通知处理任务落盘，重启后可恢复）
+        if self.enable_realtime_processing and self.segment_queue:
             segment_info = {
                 'segment_id': segment_id,
                 'segment_path': str(segment_path),
                 'start_time': start_time,
                 'end_time': end_time,
                 'mp4_size_mb': len(mp4_data) / (1024 * 1024),
-                'qr_results': qr_results
+                'qr_results': qr_results,
+                'received_at': time.time()
             }
-            self.processing_queue.put_nowait(segment_info)
+            self.segment_queue.enqueue(str(self.session_dir), segment_id, segment_info)
+            return segment_info
+        return None
+    
+    def notify_segment(self, segment_info: Dict):
+        """分段登记后在事件循环中调用：唤醒处理任务，并启动紧急情况快速检测"""
+        if self.queue_event:
+            self.queue_event.set()
+        # 紧急情况快速检测与队列处理并行，不等待排队和完整的视频理解调用
+        self.start_fast_emergency_check(segment_info)
+    
+    def start_fast_emergency_check(self, segment_info: Dict):
+        """为分段启动紧急情况快速检测任务"""
+        if not (self.flame_detector and self.emergency_gate):
+            return
+        task = asyncio.get_running_loop().create_task(run_fast_emergency_check(self, segment_info))
+        self.emergency_tasks.add(task)
+        task.add_done_callback(self.emergency_tasks.discard)
     
     def close(self):
         """关闭会话"""
@@ -221,24 +385,20 @@ class RecordingSession:
 
     async def finalize(self) -> Optional[Path]:
         """
-        结束会话：
-        - 如果启用实时处理，等待处理队列完成
+        结束会话（实时处理时在处理队列清空后由后台处理任务调用）：
+        - 等待进行中的紧急情况快速检测
         - 保存外貌缓存
         """
-        # 如果启用实时处理，等待处理队列完成
-        if self.enable_realtime_processing and self.processing_task:
-            print(f"[Info]: Waiting for processing queue to complete...")
-            try:
-                # 等待处理任务完成，最多等待30秒
-                await asyncio.wait_for(self.processing_task, timeout=30.0)
-            except asyncio.TimeoutError:
-                print(f"[Warning]: Processing task timeout after 30 seconds")
-            except Exception as e:
-                print(f"[Error]: Error waiting for processing task: {e}")
+        # 等待进行中的紧急情况快速检测
+        if self.emergency_tasks:
+            await asyncio.gather(*self.emergency_tasks, return_exceptions=True)
         
         # 保存外貌缓存
         self.dump_appearance_cache()
         
+        if self.activity_gate and self.activity_gate.checked:
+            print(f"[Info]: 静止场景跳过 {self.activity_gate.skipped}/{self.activity_gate.checked} 次模型调用")
+        
         print(f"[Info]: Recording session finalized. Processed {self.segment_count} segments.")
         return None
 
@@ -270,74 +430,423 @@ def extract_first_frame_from_mp4(mp4_path: Path, output_path: Path) -> Optional[
     return output_path
 
 
+def make_emergency_writer(session: RecordingSession, parts: Optional[List[SegmentPart]] = None):
+    """
+    构造紧急情况回调：识别到即经去重闸门写入数据库与调试日志
+
+    回调可能在事件循环或线程池中被调用，写入失败只打印警告，不中断模型调用。
+    合并调用（parts 多于一个）时先按水印时间把紧急情况归还到所属分段。
+    source 为去重闸门的来源标记（级联处理器的 flash 阶段传入 "flash"）。
+    """
+    gate = session.emergency_gate
+    if not gate:
+        return None
+
+    def write_emergency(emergency, source: str = "vlm") -> None:
+        try:
+            if parts and len(parts) > 1:
+                attribute_items([emergency], parts)
+            gate.submit(emergency, source)
+        except Exception as e:
+            print(f"[Warning]: 写入紧急情况失败: {e}")
+
+    return write_emergency
+
+
+async def run_fast_emergency_check(session: RecordingSession, segment_info: Dict):
+    """对单个分段运行紧急情况快速检测（本地抽帧 + 颜色/闪烁规则），检测到即写入"""
+    detector = session.flame_detector
+    gate = session.emergency_gate
+    if not (detector and gate):
+        return
+    received_at = time.time()
+    try:
+        emergency = await asyncio.get_running_loop().run_in_executor(
+            None,
+            detector.detect,
+            segment_info['segment_path'],
+            segment_info['segment_id'],
+            datetime.fromtimestamp(segment_info['start_time'])
+        )
+        if emergency:
+            gate.submit(emergency, "fast")
+            print(f"[Realtime] 分段 {segment_info['segment_id']} 快速检测到疑似明火（收到分段后 {time.time() - received_at:.1f}s）")
+    except Exception as e:
+        print(f"[Warning]: 紧急情况快速检测失败 ({segment_info['segment_id']}): {e}")
+
+
+async def send_segment_duration(session: RecordingSession, decision: SegmentDurationDecision):
+    """通过 WebSocket 控制通道下发新的分段时长（reconfigure_capture）"""
+    session.segment_duration = decision.duration
+    if not session.websocket or session.closing:
+        return
+    message = json.dumps({
+        "command": "reconfigure_capture",
+        "payload": {"segmentDuration": decision.duration},
+    })
+    try:
+        await session.websocket.send(message)
+        print(f"[Realtime] 分段时长 {decision.previous:.0f}s → {decision.duration:.0f}s（原因: {decision.reason}）")
+    except Exception as e:
+        print(f"[Warning]: 下发分段时长失败: {e}")
+
+
+async def send_capture_settings(session: RecordingSession, decision: CaptureDecision):
+    """通过 WebSocket 控制通道向该客户端下发新的码率与帧率（reconfigure_capture）"""
+    direction = "降档" if decision.level > decision.previous else "升档"
+    fps_info = f"{decision.fps}fps" if decision.fps else "不限帧率"
+    print(
+        f"[Realtime] 采集{direction} L{decision.previous} → L{decision.level}（原因: {decision.reason}，"
+        f"队列={decision.queue_length}，接收={decision.ingest_seconds:.1f}s）: "
+        f"码率={decision.bitrate_mb:g}MB, {fps_info}"
+    )
+    if session.monitor:
+        session.monitor.log_capture_control({
+            'session': session.session_dir.name,
+            'client_id': session.client_id,
+            **decision.to_dict(),
+            'time_at_level': session.capture_controller.summary(),
+        })
+    if not session.websocket or session.closing:
+        return
+    message = json.dumps({"command": "reconfigure_capture", "payload": decision.payload()})
+    try:
+        await session.websocket.send(message)
+    except Exception as e:
+        print(f"[Warning]: 下发采集参数失败: {e}")
+
+
+async def send_segment_ack(websocket, segment_id: Optional[str], error: Optional[str] = None, **fields):
+    """
+    回复分段接收确认（SEGMENT_ACK 启用时；Android 端忽略没有 command 字段的消息）
+
+    Args:
+        websocket: 客户端连接
+        segment_id: 分段ID（消息无效时可能为 None）
+        error: 失败原因，None 表示分段已保存并登记
+        **fields: 附加字段（ingest_seconds、queue_length 等）
+    """
+    if not SEGMENT_ACK:
+        return
+    ack = {"type": "segment_ack", "segment_id": segment_id, "ok": error is None, **fields, "shard": SHARD_INDEX}
+    if error is not None:
+        ack["error"] = error
+    try:
+        await websocket.send(json.dumps(ack))
+    except websockets.exceptions.ConnectionClosed:
+        pass
+
+
+def log_degradation_transition(session: RecordingSession, transition: DegradationTransition):
+    """打印降级等级变化并写入 logs_debug/degradation_transitions.jsonl"""
+    direction = "降级" if transition.level > transition.previous else "恢复"
+    print(
+        f"[Realtime] {direction} L{transition.previous} → L{transition.level} {transition.name}"
+        f"（队列={transition.queue_length}）: {transition.settings}"
+    )
+    if session.monitor:
+        session.monitor.log_degradation_transition({
+            'session': session.session_dir.name,
+            **transition.to_dict(),
+            'time_at_level': session.degradation.summary(),
+        })
+
+
+def claim_coalesced_jobs(session: RecordingSession, job: SegmentJob, count: int) -> List[SegmentJob]:
+    """在已领取的分段之后再领取最多 count - 1 个相邻分段（视频缺失的直接标记失败）"""
+    queue = session.segment_queue
+    session_key = str(session.session_dir)
+    jobs = [job]
+    while len(jobs) < count:
+        next_job = queue.claim(session_key)
+        if next_job is None:
+            break
+        if not Path(next_job.payload['segment_path']).exists():
+            queue.fail(next_job, "video file missing", permanent=True)
+            print(f"[Warning]: 分段视频不存在，不再处理: {next_job.payload['segment_path']}")
+            continue
+        jobs.append(next_job)
+    return jobs
+
+
+def build_commit_records(jobs: List[SegmentJob], events: List[Any], emergencies: List[Any]) -> Dict[str, Dict]:
+    """
+    按分段整理已提交的事件与待写入的紧急情况（合并调用时按已归还的 segment_id 分组）
+
+    Returns:
+        {segment_id: {'events', 'emergencies', 'events_written', 'emergencies_written'}}
+    """
+    records = {
+        j.segment_id: {'events': [], 'emergencies': [], 'events_written': 0, 'emergencies_written': 0}
+        for j in jobs
+    }
+    first = jobs[0].segment_id
+    for key, items in (('events', events), ('emergencies', emergencies)):
+        for item in items:
+            segment_id = item.segment_id if len(jobs) > 1 and item.segment_id in records else first
+            records[segment_id][key].append(to_commit_record(item))
+    return records
+
+
+def write_committed(session: RecordingSession, job: SegmentJob) -> None:
+    """
+    按已提交的结果写入事件与紧急情况（阻塞，在线程池中调用）
+
+    从记录的写入进度继续，每写完一条更新进度，重试时不重复写入已写的记录。
+    """
+    record = job.committed
+    if not record or not session.log_writer:
+        return
+    queue = session.segment_queue
+    events = record['events']
+    while record['events_written'] < len(events):
+        session.log_writer.write_event_log(from_commit_record(EventLog, events[record['events_written']]))
+        record['events_written'] += 1
+        queue.mark_committed(job, record)
+    emergencies = record['emergencies']
+    while record['emergencies_written'] < len(emergencies):
+        emergency = from_commit_record(Emergency, emergencies[record['emergencies_written']])
+        if session.emergency_gate:
+            session.emergency_gate.submit(emergency, "vlm")
+        else:
+            session.log_writer.write_emergency_log(emergency)
+        record['emergencies_written'] += 1
+        queue.mark_committed(job, record)
+
+
+async def save_thumbnail(segment_path: Path, segment_id: str) -> None:
+    """提取分段缩略图（尽力而为：失败只打印警告，不影响已提交分段的完成）"""
+    try:
+        await asyncio.get_event_loop().run_in_executor(
+            None,
+            extract_first_frame_from_mp4,
+            segment_path,
+            segment_path.parent / f"{segment_id}_thumbnail.jpg"
+        )
+    except Exception as e:
+        print(f"[Warning]: 提取缩略图失败 ({segment_id}): {type(e).__name__}: {e}")
+
+
+async def finish_committed_job(session: RecordingSession, job: SegmentJob):
+    """已提交分段的重试：只重做事件 / 紧急情况写入与缩略图，不再调用模型、不再提交"""
+    queue = session.segment_queue
+    loop = asyncio.get_event_loop()
+    try:
+        await loop.run_in_executor(None, write_committed, session, job)
+        segment_path = Path(job.payload['segment_path'])
+        if segment_path.exists():
+            await save_thumbnail(segment_path, job.segment_id)
+        session.processed_segments_count += 1
+        queue.complete(job)
+        print(f"[Realtime] 分段 {job.segment_id} 已提交，重试写入完成（事件数={len(job.committed['events'])}）")
+    except Exception as e:
+        state = queue.fail(job, f"{type(e).__name__}: {e}")
+        retry_info = "稍后重试" if state == STATE_QUEUED else "已达重试上限，标记为失败"
+        print(f"[Realtime] 分段 {job.segment_id} 已提交但写入失败（第 {job.attempts} 次，{retry_info}）: {e}")
+
+
+def coalesced_video_path(session: RecordingSession, jobs: List[SegmentJob]) -> Path:
+    """合并调用的临时视频路径（不在会话目录顶层，避免被当作分段）"""
+    return session.session_dir / "coalesced" / f"{jobs[0].segment_id}_x{len(jobs)}.mp4"
+
+
+def build_coalesced_segment_info(session: RecordingSession, jobs: List[SegmentJob], mode: str) -> Dict:
+    """
+    合并多个相邻分段（阻塞，在线程池中调用），返回合并后的 segment_info（parts 保留原分段）
+
+    concat 模式拼接为一个视频；multi 模式不拼接，segment_path 为第一段，
+    其余分段放在 extra_segment_paths，作为同一请求中的多个视频内容项。
+    """
+    infos = [j.payload for j in jobs]
+    first, last = infos[0], infos[-1]
+    extra_paths: List[str] = []
+    if mode == BATCH_MODE_MULTI:
+        segment_path = first['segment_path']
+        extra_paths = [info['segment_path'] for info in infos[1:]]
+    else:
+        segment_path = str(coalesced_video_path(session, jobs))
+        concat_segments([info['segment_path'] for info in infos], Path(segment_path))
+    merged = {
+        'segment_id': first['segment_id'],
+        'segment_path': segment_path,
+        'extra_segment_paths': extra_paths,
+        'start_time': first['start_time'],
+        'end_time': last['end_time'],
+        'mp4_size_mb': sum(info['mp4_size_mb'] for info in infos),
+        'qr_results': [qr for info in infos for qr in info.get('qr_results', [])],
+        'source': first.get('source', 'live'),
+        'parts': infos,
+    }
+    if 'received_at' in first:
+        merged['received_at'] = first['received_at']
+    return merged
+
+
 async def process_segment_queue_dynamic(session: RecordingSession):
     """
     后台串行处理分段队列（动态上下文版本）
     
-    使用动态上下文进行视频理解，维护人物外貌缓存
+    使用动态上下文进行视频理解，维护人物外貌缓存。分段从持久化队列中领取，
+    处理成功标记为 done，失败按重试次数重新排队或标记为 failed。
+    会话结束采集（closing）且队列中没有未完成分段时返回。
     """
+    queue = session.segment_queue
+    session_key = str(session.session_dir)
     while True:
         try:
-            # 从队列中获取分段（串行，一次只处理一个）
-            segment_info = await asyncio.wait_for(
-                session.processing_queue.get(), 
-                timeout=1.0
-            )
+            # 领取下一个分段（串行，一次只处理一个）
+            session.queue_event.clear()
+            job = queue.claim(session_key)
+            if job is None:
+                if session.closing and queue.unfinished_count(session_key) == 0:
+                    session.drained = True
+                    break
+                # 等待新分段登记或重试时间到达
+                try:
+                    await asyncio.wait_for(session.queue_event.wait(), timeout=1.0)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            if job.committed is not None:
+                # 已提交（上次在写入阶段失败或崩溃）：只重做写入
+                await finish_committed_job(session, job)
+                continue
+            segment_info = job.payload
             
             # 记录处理开始时间
             processing_start_time = time.time()
-            queue_length = session.processing_queue.qsize()
+            queue_length = session.queue_length()
+            
+            if not Path(segment_info['segment_path']).exists():
+                queue.fail(job, "video file missing", permanent=True)
+                print(f"[Warning]: 分段视频不存在，不再处理: {segment_info['segment_path']}")
+                continue
+            
+            # 积压降级：按队列长度调整处理参数
+            batch_size = VLM_BATCH_SEGMENTS
+            if session.degradation:
+                transition = session.degradation.observe(queue_length)
+                if transition:
+                    log_degradation_transition(session, transition)
+                batch_size = max(batch_size, session.degradation.current.coalesce)
+            
+            # 合并调用：只合并已在排队的相邻分段，不为凑满而等待（队列为空时仍逐段处理）
+            jobs = [job]
+            if batch_size > 1:
+                jobs = claim_coalesced_jobs(session, job, batch_size)
             
             # 处理分段
             try:
+                loop = asyncio.get_event_loop()
+                
+                parts = [
+                    SegmentPart(j.payload['segment_id'], j.payload['segment_path'],
+                                j.payload['start_time'], j.payload['end_time'])
+                    for j in jobs
+                ]
+                if len(jobs) > 1:
+                    segment_info = await loop.run_in_executor(
+                        None,
+                        build_coalesced_segment_info,
+                        session,
+                        jobs,
+                        VLM_BATCH_MODE
+                    )
+                extra_paths = segment_info.get('extra_segment_paths', [])
+                
+                # 静止场景检测：无人且画面不变的分段不调用模型（多视频合并时只有第一段可测，不做检测）
+                activity = None
+                skip_vlm = False
+                if session.activity_gate and session.video_processor and session.context_service and not extra_paths:
+                    try:
+                        activity = await loop.run_in_executor(
+                            None,
+                            session.activity_gate.measure,
+                            segment_info['segment_path']
+                        )
+                        skip_vlm = session.activity_gate.should_skip(
+                            activity, bool(segment_info.get('qr_results'))
+                        )
+                    except Exception as e:
+                        print(f"[Warning]: 活动检测失败，照常调用模型 ({segment_info['segment_id']}): {e}")
+                
+                # 上传前预处理：模型使用降帧率/降分辨率副本，原视频保留用于归档和缩略图
+                prepared = None
+                upload_path = segment_info['segment_path']
+                extra_upload_paths = list(extra_paths)
+                if session.video_preprocessor and not skip_vlm:
+                    prepared = await loop.run_in_executor(
+                        None,
+                        session.video_preprocessor.prepare,
+                        upload_path
+                    )
+                    upload_path = prepared.path
+                    extra_upload_paths = [
+                        (await loop.run_in_executor(None, session.video_preprocessor.prepare, path)).path
+                        for path in extra_paths
+                    ]
+                
                 segment = VideoSegment(
                     segment_id=segment_info['segment_id'],
-                    video_path=segment_info['segment_path'],
+                    video_path=upload_path,
                     start_time=segment_info['start_time'],
                     end_time=segment_info['end_time'],
-                    qr_results=segment_info.get('qr_results', [])
+                    qr_results=segment_info.get('qr_results', []),
+                    extra_video_paths=extra_upload_paths
                 )
                 
-                loop = asyncio.get_event_loop()
-                
                 # 从 segment_id 提取视频日期
                 segment_date = extract_date_from_segment_id(segment.segment_id)
                 
-                # 获取最近事件和最大事件编号（使用视频日期而非今天）
-                recent_events = []
-                max_event_id = 0
-                if session.event_context:
-                    if segment_date:
-                        recent_events = session.event_context.get_recent_events(MAX_RECENT_EVENTS, date=segment_date)
-                        max_event_id = session.event_context.get_max_event_id_number(date=segment_date)
-                    else:
-                        # 如果无法解析日期，回退到使用今天
-                        recent_events = session.event_context.get_recent_events(MAX_RECENT_EVENTS)
-                        max_event_id = session.event_context.get_max_event_id_number()
-                
                 # 视频理解（使用动态上下文）
                 video_process_start = time.time()
                 
-                if session.video_processor and session.appearance_cache:
-                    # 使用动态上下文处理
-                    result = await loop.run_in_executor(
+                if session.video_processor and session.context_service:
+                    # 获取上下文快照（最近事件与最大事件编号使用视频日期而非今天）
+                    snapshot = await loop.run_in_executor(
                         None,
-                        session.video_processor.process_segment_with_context,
-                        segment,
-                        session.appearance_cache,
-                        recent_events,
-                        max_event_id
+                        session.context_service.snapshot,
+                        segment_date,
+                        MAX_RECENT_EVENTS
                     )
                     
-                    # 应用外貌更新
-                    await loop.run_in_executor(
+                    if skip_vlm:
+                        # 静止场景：本地生成 none 事件，编号同样经 commit 排序
+                        result = ProcessingResult(
+                            events=[build_idle_event(
+                                segment.segment_id,
+                                datetime.fromtimestamp(segment.start_time),
+                                segment.end_time - segment.start_time,
+                                snapshot.max_event_id
+                            )],
+                            appearance_updates=[],
+                            raw_response='',
+                            metrics={'vlm_skipped': True}
+                        )
+                    else:
+                        # 使用动态上下文处理（不持锁，多个会话可并行调用模型；异步 HTTP 不占用线程池）
+                        # 流式输出时紧急情况一闭合就立即写入，不等待整个响应
+                        result = await session.current_processor().process_segment_with_context_async(
+                            segment,
+                            snapshot.appearance_cache,
+                            snapshot.recent_events,
+                            snapshot.max_event_id,
+                            on_emergency=make_emergency_writer(session, parts)
+                        )
+                        if session.activity_gate:
+                            session.activity_gate.record_result(result.events)
+                    
+                    # 提交外貌更新与事件（快照后若有其他会话提交，会重排冲突的编号）
+                    commit = await loop.run_in_executor(
                         None,
-                        session.video_processor._apply_appearance_updates,
-                        result.appearance_updates
+                        session.context_service.commit,
+                        snapshot,
+                        result.appearance_updates,
+                        result.events
                     )
                     
-                    events = result.events
-                    appearance_update_count = len(result.appearance_updates)
+                    events = commit.events
+                    appearance_update_count = len(commit.appearance_updates)
                 else:
                     # 回退到旧模式
                     from orchestration.pipeline import VideoLogPipeline
@@ -352,27 +861,30 @@ async def process_segment_queue_dynamic(session: RecordingSession):
                 
                 video_process_time = time.time() - video_process_start
                 
-                # 写入日志
-                if session.log_writer:
-                    for event in events:
-                        session.log_writer.write_event_log(event)
-                    
-                    # 写入紧急情况
-                    if hasattr(result, 'emergencies') and result.emergencies:
-                        for emg in result.emergencies:
-                            session.log_writer.write_emergency_log(emg)
-                        print(f"[Realtime] 检测到 {len(result.emergencies)} 个紧急情况！")
+                # 流式阶段已写入的紧急情况不再重复写
+                emergencies = getattr(result, 'emergencies', None) or []
+                pending_emergencies = [] if getattr(result, 'emergencies_dispatched', False) else emergencies
+                
+                # 合并调用：按水印时间把事件与紧急情况归还到各自的分段
+                if len(parts) > 1:
+                    attribute_items(events, parts)
+                    attribute_items(pending_emergencies, parts)
                 
-                # 提取缩略图（从MP4的第一帧）
-                segment_mp4_path = Path(segment_info['segment_path'])
-                thumbnail_path = segment_mp4_path.parent / f"{segment_info['segment_id']}_thumbnail.jpg"
+                # 记录提交结果：之后的写入失败或崩溃时，重试只重做写入，不再调用模型与重复提交
+                commit_records = build_commit_records(jobs, events, pending_emergencies)
+                for j in jobs:
+                    await loop.run_in_executor(None, queue.mark_committed, j, commit_records[j.segment_id])
+                
+                # 写入日志（紧急情况经闸门与快速检测结果去重）
+                for j in jobs:
+                    await loop.run_in_executor(None, write_committed, session, j)
+                if emergencies:
+                    print(f"[Realtime] 检测到 {len(emergencies)} 个紧急情况！")
+                
+                # 提取缩略图（从MP4的第一帧；合并调用时每个原分段各一张）
                 thumbnail_start = time.time()
-                await loop.run_in_executor(
-                    None,
-                    extract_first_frame_from_mp4,
-                    segment_mp4_path,
-                    thumbnail_path
-                )
+                for part in parts:
+                    await save_thumbnail(Path(part.video_path), part.segment_id)
                 thumbnail_time = time.time() - thumbnail_start
                 
                 # 计算处理用时
@@ -383,7 +895,7 @@ async def process_segment_queue_dynamic(session: RecordingSession):
                 mp4_size_mb = segment_info['mp4_size_mb']
                 
                 # 更新统计
-                session.processed_segments_count += 1
+                session.processed_segments_count += len(parts)
                 session.total_temp_size_mb += mp4_size_mb
                 
                 # 计算总临时文件大小
@@ -402,27 +914,89 @@ async def process_segment_queue_dynamic(session: RecordingSession):
                     'appearance_updates': appearance_update_count,
                     'mp4_size_mb': mp4_size_mb,
                     'total_temp_size_mb': total_size_mb,
-                    'processed_segments_count': session.processed_segments_count
+                    'processed_segments_count': session.processed_segments_count,
+                    'source': segment_info.get('source', 'live')
                 }
+                if SHARD_INDEX is not None:
+                    stats['shard'] = SHARD_INDEX
+                if len(parts) > 1:
+                    stats['coalesced_segments'] = [part.segment_id for part in parts]
+                    stats['batch_mode'] = VLM_BATCH_MODE
+                if session.degradation:
+                    stats.update(session.degradation.metrics())
+                if session.capture_controller:
+                    stats.update(session.capture_controller.metrics())
+                # 上传字节数与端到端延迟（收到分段到处理完成）
+                if prepared:
+                    stats.update(prepared.metrics())
+                else:
+                    stats['upload_bytes'] = Path(upload_path).stat().st_size
+                if extra_upload_paths and not skip_vlm:
+                    stats['upload_bytes'] += sum(Path(path).stat().st_size for path in extra_upload_paths)
+                if 'received_at' in segment_info:
+                    stats['end_to_end_latency'] = round(time.time() - segment_info['received_at'], 3)
+                if activity:
+                    stats.update(activity.metrics())
+                    stats.setdefault('vlm_skipped', False)
+                
+                # 自适应分段时长：无人或积压时延长，有活动时缩短
+                if session.segment_controller:
+                    decision = session.segment_controller.observe(
+                        events,
+                        session.queue_length(),
+                        vlm_skipped=skip_vlm,
+                        activity_change=activity.max_change if activity else None
+                    )
+                    if decision:
+                        await send_segment_duration(session, decision)
+                    stats.update(session.segment_controller.metrics())
+                # 合并模型调用统计（耗时、token 用量、前缀缓存命中），以及每分钟视频的 token 数
+                stats.update(getattr(result, 'metrics', None) or {})
+                per_minute = tokens_per_video_minute(stats, segment_duration)
+                if per_minute is not None:
+                    stats['tokens_per_video_minute'] = per_minute
                 session.processing_stats.append(stats)
                 
                 # 监控记录（仅写入文件，不打印）
                 if session.monitor:
                     session.monitor.log_segment_processing(stats)
+                if WATCH_THROUGHPUT and stats['source'] == 'watch':
+                    for j in jobs:
+                        WATCH_THROUGHPUT.record_processed(int(j.payload['mp4_size_mb'] * 1024 * 1024))
 
                 # 精简单行日志
                 appearance_info = ""
-                if session.appearance_cache:
-                    appearance_info = f", 外貌更新={appearance_update_count}, 外貌总数={session.appearance_cache.get_record_count()}"
+                if session.context_service:
+                    appearance_info = (
+                        f", 外貌更新={appearance_update_count}, "
+                        f"外貌总数={session.context_service.appearance_cache.get_record_count()}"
+                    )
+                
+                cache_info = ""
+                if 'cached_ratio' in stats:
+                    cache_info = f", 缓存命中={stats['cached_ratio']:.0%}"
+                if 'tokens_per_video_minute' in stats:
+                    cache_info += f", tokens/分钟={stats['tokens_per_video_minute']:.0f}"
+                if skip_vlm:
+                    cache_info += ", 静止场景已跳过模型调用"
+                if prepared and prepared.reduced:
+                    cache_info += f", 上传={prepared.upload_bytes / (1024 * 1024):.2f}MB"
+                if stats.get('time_to_first_emergency') is not None:
+                    cache_info += f", 首个紧急情况={stats['time_to_first_emergency']:.1f}s"
+                if len(parts) > 1:
+                    cache_info += f", 合并{len(parts)}段"
+                if session.degradation and session.degradation.level > 0:
+                    cache_info += f", 降级=L{session.degradation.level}"
                 
                 print(
-                    "[Realtime] 分段 {sid}: 事件数={ev}{app}, 时长={dur:.1f}s, 处理={proc:.2f}s, "
+                    "[Realtime] 分段 {sid}: 事件数={ev}{app}, 时长={dur:.1f}s, 处理={proc:.2f}s{cache}, "
                     "MP4={size:.2f}MB, 已处理={cnt}, 队列={q}".format(
                         sid=segment_info['segment_id'],
                         ev=len(events),
                         app=appearance_info,
                         dur=segment_duration,
                         proc=processing_time,
+                        cache=cache_info,
                         size=mp4_size_mb,
                         cnt=session.processed_segments_count,
                         q=queue_length,
@@ -431,19 +1005,28 @@ async def process_segment_queue_dynamic(session: RecordingSession):
                 
                 # 周期性保存外貌缓存
                 if session.processed_segments_count % APPEARANCE_DUMP_INTERVAL == 0:
-                    session.dump_appearance_cache()
+                    session.dump_appearance_cache(force=False)
+                
+                for j in jobs:
+                    queue.complete(j)
                 
             except Exception as e:
-                print(f"[Realtime] 处理分段失败: {e}")
+                for j in jobs:
+                    state = queue.fail(j, f"{type(e).__name__}: {e}")
+                retry_info = "稍后重试" if state == STATE_QUEUED else "已达重试上限，标记为失败"
+                if job.committed is not None:
+                    retry_info += "；已提交，重试时只重做写入"
+                print(f"[Realtime] 处理分段失败（第 {job.attempts} 次，{retry_info}）: {e}")
+                if session.activity_gate:
+                    session.activity_gate.reset()
                 import traceback
                 traceback.print_exc()
+            finally:
+                if len(jobs) > 1 and VLM_BATCH_MODE != BATCH_MODE_MULTI:
+                    coalesced_video_path(session, jobs).unlink(missing_ok=True)
             
-            session.processing_queue.task_done()
-            
-        except asyncio.TimeoutError:
-            # 继续等待，可能还有分段会加入队列
-            continue
         except asyncio.CancelledError:
+            # 正在处理的分段保持 in_flight，下次启动时重新排队
             break
         except Exception as e:
             print(f"[Realtime] 处理队列异常: {e}")
@@ -452,6 +1035,47 @@ async def process_segment_queue_dynamic(session: RecordingSession):
             await asyncio.sleep(1)
 
 
+async def run_session_processing(session: RecordingSession, limiter: Optional[asyncio.Semaphore] = None):
+    """后台处理任务：处理完会话的所有分段后结束并关闭会话"""
+    try:
+        if limiter is None:
+            await process_segment_queue_dynamic(session)
+        else:
+            # 受并发上限约束的会话（目录监视）获得名额后才初始化上下文
+            async with limiter:
+                if DYNAMIC_CONTEXT_ENABLED:
+                    session.init_dynamic_context()
+                await process_segment_queue_dynamic(session)
+    finally:
+        try:
+            mp4_path = await session.finalize()
+            if mp4_path:
+                print(f"[Info]: MP4 saved to {mp4_path}")
+        finally:
+            session.close()
+            PROCESSING_SESSIONS.discard(session)
+
+
+def start_session_processing(session: RecordingSession, limiter: Optional[asyncio.Semaphore] = None):
+    """
+    为会话接入持久化处理队列、初始化动态上下文并启动后台处理任务
+    
+    Args:
+        session: 录制会话
+        limiter: 并发上限（目录监视导入的会话共用），None 表示立即开始处理
+    """
+    session.segment_queue = get_segment_queue()
+    session.queue_event = asyncio.Event()
+    
+    # 初始化动态上下文
+    if DYNAMIC_CONTEXT_ENABLED and limiter is None:
+        session.init_dynamic_context()
+    
+    # 启动后台处理任务（客户端结束采集后继续运行，直到队列处理完）
+    PROCESSING_SESSIONS.add(session)
+    session.processing_task = asyncio.create_task(run_session_processing(session, limiter))
+
+
 async def start_recording(websocket, client_id: str):
     """
     开始一个新的录制会话。
@@ -462,20 +1086,16 @@ async def start_recording(websocket, client_id: str):
     
     # 启用实时处理
     session = RecordingSession(client_id, enable_realtime_processing=True)
+    session.websocket = websocket
+    if is_capture_backpressure_enabled():
+        session.capture_controller = CaptureController(
+            float(CAPTURE_SETTINGS['bitrate']), int(CAPTURE_SETTINGS['fps'])
+        )
     RECORDING_SESSIONS[websocket] = session
     
-    # 如果启用实时处理，创建处理队列和任务
+    # 如果启用实时处理，接入处理队列并启动处理任务
     if session.enable_realtime_processing:
-        session.processing_queue = asyncio.Queue()
-        
-        # 初始化动态上下文
-        if DYNAMIC_CONTEXT_ENABLED:
-            session.init_dynamic_context()
-        
-        # 启动后台处理任务
-        session.processing_task = asyncio.create_task(
-            process_segment_queue_dynamic(session)
-        )
+        start_session_processing(session)
         
         context_info = "（动态上下文）" if session.appearance_cache else ""
         print(f"[Info]: Started recording session with realtime processing{context_info} at {session.session_dir}")
@@ -484,44 +1104,24 @@ async def start_recording(websocket, client_id: str):
 
 
 async def finalize_recording(websocket, client_id: str):
+    """
+    结束客户端的录制会话（立即返回）：
+    实时处理时剩余分段由后台处理任务继续处理，处理完后再结束并关闭会话。
+    """
     log_debug(f"[Debug]: finalize_recording called for {client_id}")
     session = RECORDING_SESSIONS.pop(websocket, None)
     if not session:
         log_debug(f"[Debug]: No active session found for {client_id}")
         return
     
-    # 如果启用实时处理，等待处理队列完成
-    if session.enable_realtime_processing and session.processing_queue:
-        # 等待队列处理完成
-        try:
-            # 等待队列为空（最多等待30秒，避免无限等待）
-            max_wait_time = 30.0
-            wait_start = time.time()
-            while not session.processing_queue.empty():
-                if time.time() - wait_start > max_wait_time:
-                    print(f"[Warning]: 等待处理队列超时（{max_wait_time}秒），强制继续")
-                    break
-                await asyncio.sleep(0.1)
-            
-            # 等待所有任务完成（最多等待30秒）
-            wait_start = time.time()
-            while session.processing_queue.qsize() > 0 or (session.processing_task and not session.processing_task.done()):
-                if time.time() - wait_start > max_wait_time:
-                    print(f"[Warning]: 等待处理任务完成超时（{max_wait_time}秒），强制继续")
-                    break
-                await asyncio.sleep(0.1)
-        except Exception as e:
-            print(f"[Warning]: 等待处理队列完成时出错: {e}")
-            import traceback
-            traceback.print_exc()
-        
-        # 取消处理任务
-        if session.processing_task and not session.processing_task.done():
-            session.processing_task.cancel()
-            try:
-                await asyncio.wait_for(session.processing_task, timeout=5.0)
-            except (asyncio.CancelledError, asyncio.TimeoutError):
-                pass
+    session.websocket = None
+    if session.processing_task and not session.processing_task.done():
+        session.closing = True
+        session.queue_event.set()
+        remaining = session.segment_queue.unfinished_count(str(session.session_dir))
+        if remaining:
+            print(f"[Info]: 会话 {session.session_dir} 已结束采集，剩余 {remaining} 个分段在后台继续处理")
+        return
     
     mp4_path = await session.finalize()
     if mp4_path:
@@ -533,6 +1133,113 @@ async def finalize_recording(websocket, client_id: str):
     session.close()
 
 
+def resume_unfinished_sessions():
+    """
+    服务器启动时恢复所有会话中未完成的分段（上一次运行中断时仍在排队或正在处理的分段）
+    
+    每个会话以已有的会话目录重建，处理完后自动关闭。
+    """
+    queue = get_segment_queue()
+    requeued = queue.requeue_in_flight()
+    if requeued:
+        print(f"[Info]: 上次运行中断时有 {requeued} 个分段正在处理，已重新排队")
+    for session_dir in queue.unfinished_sessions():
+        session = RecordingSession("resumed", enable_realtime_processing=True, session_dir=Path(session_dir))
+        session.closing = True
+        start_session_processing(session)
+        print(f"[Info]: 恢复会话 {session_dir}，{queue.unfinished_count(session_dir)} 个分段待处理")
+
+
+async def ingest_watched_segment(
+    segment: CompletedSegment,
+    limiter: asyncio.Semaphore,
+    other_shards: List[SegmentQueue] = ()
+):
+    """
+    把目录监视发现的分段登记到持久化处理队列，并按需为其会话目录启动处理任务
+    
+    正在实时采集的会话目录跳过（分段已由 handle_mp4_segment 登记）；已登记过的分段不重复登记。
+    多进程接收时其他工作进程的实时会话也保存在 recordings/ 下，已登记在其队列数据库中的分段同样跳过。
+    """
+    session_key = str(segment.session_dir)
+    if any(str(s.session_dir) == session_key for s in RECORDING_SESSIONS.values()):
+        WATCH_THROUGHPUT.skipped_live += 1
+        return
+    if any(q.contains(session_key, segment.segment_id) for q in other_shards):
+        WATCH_THROUGHPUT.duplicates += 1
+        return
+    
+    qr_results = []
+    if segment.qr_path:
+        try:
+            qr_results = json.loads(segment.qr_path.read_text(encoding='utf-8'))
+        except Exception as e:
+            print(f"[Warning]: Failed to read QR results {segment.qr_path}: {e}")
+    start_time, end_time = parse_segment_times(segment.segment_id, REALTIME_TARGET_SEGMENT_DURATION)
+    segment_info = {
+        'segment_id': segment.segment_id,
+        'segment_path': str(segment.mp4_path),
+        'start_time': start_time,
+        'end_time': end_time,
+        'mp4_size_mb': segment.size / (1024 * 1024),
+        'qr_results': qr_results,
+        'received_at': segment.completed_at,
+        'source': 'watch'
+    }
+    if not get_segment_queue().enqueue(session_key, segment.segment_id, segment_info, replace=False):
+        WATCH_THROUGHPUT.duplicates += 1
+        return
+    WATCH_THROUGHPUT.record_enqueued(segment)
+    
+    # 同一目录已有处理任务（含启动时恢复的会话）且尚未退出时，唤醒它即可
+    for session in PROCESSING_SESSIONS:
+        if str(session.session_dir) == session_key and not session.drained:
+            session.queue_event.set()
+            return
+    
+    session = RecordingSession("watch", enable_realtime_processing=True, session_dir=segment.session_dir)
+    session.closing = True
+    WATCHED_SESSIONS[session_key] = session
+    start_session_processing(session, limiter)
+    session.processing_task.add_done_callback(
+        lambda _task: WATCHED_SESSIONS.pop(session_key, None) if WATCHED_SESSIONS.get(session_key) is session else None
+    )
+    print(f"[Watch] 开始处理会话目录 {session_key}")
+
+
+async def report_watch_throughput(interval: float = 60.0):
+    """周期性打印目录监视的吞吐统计（有新分段时）"""
+    last_enqueued = last_processed = -1
+    while True:
+        await asyncio.sleep(interval)
+        if (WATCH_THROUGHPUT.enqueued, WATCH_THROUGHPUT.processed) == (last_enqueued, last_processed):
+            continue
+        last_enqueued, last_processed = WATCH_THROUGHPUT.enqueued, WATCH_THROUGHPUT.processed
+        queue = get_segment_queue()
+        backlog = sum(queue.unfinished_count(key) for key in list(WATCHED_SESSIONS))
+        print(f"[Watch] 吞吐: {WATCH_THROUGHPUT.snapshot(backlog)}")
+
+
+async def run_recordings_watcher():
+    """目录监视：离线拷贝到 recordings/ 的分段进入与实时会话相同的处理队列"""
+    global WATCH_THROUGHPUT
+    WATCH_THROUGHPUT = WatchThroughput()
+    limiter = asyncio.Semaphore(max(get_config('RECORDINGS_WATCH_MAX_SESSIONS', 2, int), 1))
+    watcher = RecordingsWatcher(RECORDINGS_ROOT)
+    # 多进程接收时其他工作进程的处理队列（只读查询是否已登记）
+    other_shards = [
+        SegmentQueue(shard_queue_path(shard))
+        for shard in range(SHARD_COUNT or 1) if shard != (SHARD_INDEX or 0)
+    ]
+    reporter = asyncio.create_task(report_watch_throughput())
+    try:
+        await watcher.run(lambda segment: ingest_watched_segment(segment, limiter, other_shards))
+    finally:
+        reporter.cancel()
+        for queue in other_shards:
+            queue.close()
+
+
 # This handler manages receiving messages from a client
 async def consumer_handler(websocket):
     """
@@ -568,6 +1275,7 @@ async def consumer_handler(websocket):
                         session = RECORDING_SESSIONS.get(websocket)
                         if not session:
                             print(f"[Warning]: Received MP4 segment from {client_id} without active session.")
+                            await send_segment_ack(websocket, data.get("segment_id"), "no_active_session")
                             continue
                         
                         segment_id = data.get("segment_id")
@@ -577,6 +1285,7 @@ async def consumer_handler(websocket):
                         
                         if not segment_id or not base64_data:
                             print(f"[Error]: Invalid MP4 segment message from {client_id}: segment_id={segment_id}, has_base64={bool(base64_data)}")
+                            await send_segment_ack(websocket, segment_id, "invalid_message")
                             continue
                         
                         # Base64解码MP4数据（在后台线程执行，避免阻塞消息接收）
@@ -597,8 +1306,8 @@ async def consumer_handler(websocket):
                             decoded_size_mb = len(mp4_data) / (1024 * 1024)
                             log_debug(f"[Debug]: Base64 decode completed in {decode_time:.2f}s, decoded_size={decoded_size_mb:.2f} MB")
                             
-                            # 保存分段（也在后台线程执行）
-                            await asyncio.wait_for(
+                            # 保存分段并登记到处理队列（也在后台线程执行）
+                            segment_info = await asyncio.wait_for(
                                 loop.run_in_executor(
                                     None,
                                     session.handle_mp4_segment,
@@ -609,22 +1318,41 @@ async def consumer_handler(websocket):
                                 timeout=10.0  # 10秒超时
                             )
                             log_debug(f"[Debug]: MP4 segment {segment_id} saved successfully")
+                            if segment_info:
+                                session.notify_segment(segment_info)
                         except asyncio.TimeoutError:
                             print(f"[Error]: Timeout while processing MP4 segment {segment_id} from {client_id}")
                             import traceback
                             traceback.print_exc()
+                            await send_segment_ack(websocket, segment_id, "timeout")
                             continue
                         except Exception as e:
                             print(f"[Error]: Failed to decode/handle MP4 segment {segment_id} from {client_id}: {type(e).__name__}: {e}")
                             import traceback
                             traceback.print_exc()
+                            await send_segment_ack(websocket, segment_id, f"{type(e).__name__}: {e}")
                             continue
                         
                         # 监控队列长度
-                        if session.enable_realtime_processing and session.processing_queue:
-                            queue_length = session.processing_queue.qsize()
+                        queue_length = 0
+                        if session.enable_realtime_processing and session.segment_queue:
+                            queue_length = session.queue_length()
                             if queue_length >= REALTIME_QUEUE_ALERT_THRESHOLD and session.monitor:
                                 session.monitor.print_queue_warning(queue_length, REALTIME_QUEUE_ALERT_THRESHOLD)
+                        
+                        # 采集背压：队列积压或接收（解码 + 写盘）变慢时让该客户端降低码率/帧率
+                        if session.capture_controller:
+                            decision = session.capture_controller.observe(queue_length, time.time() - decode_start)
+                            if decision:
+                                await send_capture_settings(session, decision)
+                        
+                        # 回复接收确认
+                        await send_segment_ack(
+                            websocket,
+                            segment_id,
+                            ingest_seconds=round(time.time() - receive_time, 4),
+                            queue_length=queue_length
+                        )
                     else:
                         # 状态消息
                         status = data.get("status")
@@ -638,6 +1366,8 @@ async def consumer_handler(websocket):
                             received_capture_stopped = True
                             await finalize_recording(websocket, client_id)
                             log_debug(f"[Debug]: Recording finalized for {client_id}")
+                        elif status == "capture_reconfigured":
+                            print(f"[Info]: Client {client_id} applied new capture settings: {message_text}")
                         else:
                             log_debug(f"[Debug]: Unknown status: {status}")
                 except (json.JSONDecodeError, TypeError) as e:
@@ -663,10 +1393,10 @@ async def consumer_handler(websocket):
         if e.code == 1006:
             print(f"[Warning]: 连接异常关闭 (1006)，可能是网络中断或超时")
             session = RECORDING_SESSIONS.get(websocket)
-            if session and session.enable_realtime_processing and session.processing_queue:
-                queue_size = session.processing_queue.qsize()
+            if session and session.enable_realtime_processing and session.segment_queue:
+                queue_size = session.queue_length()
                 if queue_size > 0:
-                    print(f"[Warning]: 连接断开时，处理队列中还有 {queue_size} 个分段未处理")
+                    print(f"[Warning]: 连接断开时，处理队列中还有 {queue_size} 个分段未处理（将在后台继续处理）")
         elif e.code == 1000:
             print(f"[Info]: 连接正常关闭 (1000)")
         else:
@@ -729,6 +1459,103 @@ async def broadcast(message):
         print("[Broadcast]: No clients connected to send message.")
 
 
+def terminal_prompt() -> str:
+    """终端命令提示"""
+    return (
+        f"\nEnter command ('start [w]:[h] [bitrate_mb] [fps]' or 'stop'): \n"
+        f"  Example: 'start 4:3 4 10' for 4:3 aspect ratio, 4 MB bitrate, 10 fps\n"
+        f"  Defaults (from env): aspect={DEFAULT_ASPECT_RATIO_WIDTH}:{DEFAULT_ASPECT_RATIO_HEIGHT}, "
+        f"bitrate={DEFAULT_BITRATE_MB}MB, fps={DEFAULT_FPS}, include_aspect={DEFAULT_INCLUDE_ASPECT_RATIO}\n> "
+    )
+
+
+def build_control_message(command_str: str) -> Optional[str]:
+    """
+    将终端命令转换为下发给客户端的 JSON 控制消息
+    
+    Args:
+        command_str: 终端输入（'start [w]:[h] [bitrate_mb] [fps]' 或 'stop'）
+    
+    Returns:
+        JSON 消息；空行或无法识别的命令返回 None
+    """
+    parts = command_str.lower().split()
+    if not parts:
+        return None
+    command = parts[0]
+
+    if command == "start":
+        # 使用环境变量中的默认值
+        aspect_width, aspect_height = DEFAULT_ASPECT_RATIO_WIDTH, DEFAULT_ASPECT_RATIO_HEIGHT
+        bitrate_mb = DEFAULT_BITRATE_MB
+        fps = DEFAULT_FPS
+        # 如果命令行提供了宽高比参数，则包含 aspectRatio；否则根据环境变量决定
+        include_aspect_ratio = DEFAULT_INCLUDE_ASPECT_RATIO
+
+        if len(parts) > 1:
+            # 命令行提供了宽高比参数
+            try:
+                aspect_width, aspect_height = map(int, parts[1].split(":"))
+                if aspect_width <= 0 or aspect_height <= 0:
+                    raise ValueError("Aspect ratio must be positive")
+                include_aspect_ratio = True
+            except (ValueError, IndexError):
+                print(f"[Error]: Invalid aspect ratio format. Using default {DEFAULT_ASPECT_RATIO_WIDTH}:{DEFAULT_ASPECT_RATIO_HEIGHT}.")
+                aspect_width, aspect_height = DEFAULT_ASPECT_RATIO_WIDTH, DEFAULT_ASPECT_RATIO_HEIGHT
+
+        if len(parts) > 2:
+            # 命令行提供了码率参数
+            try:
+                bitrate_mb = float(parts[2])
+                if bitrate_mb <= 0:
+                    raise ValueError("Bitrate must be positive")
+            except ValueError:
+                print(f"[Error]: Invalid bitrate. Using default {DEFAULT_BITRATE_MB} MB.")
+                bitrate_mb = DEFAULT_BITRATE_MB
+
+        if len(parts) > 3:
+            # 命令行提供了帧率参数
+            try:
+                fps = int(parts[3])
+                if fps < 0:
+                    fps = DEFAULT_FPS
+            except ValueError:
+                print(f"[Error]: Invalid fps. Using default {DEFAULT_FPS} FPS.")
+                fps = DEFAULT_FPS
+
+        payload = {
+            "format": "h264",
+            "bitrate": int(bitrate_mb) if isinstance(bitrate_mb, float) and bitrate_mb.is_integer() else bitrate_mb,
+            "fps": fps,
+            "segmentDuration": REALTIME_TARGET_SEGMENT_DURATION,
+        }
+        if include_aspect_ratio:
+            payload["aspectRatio"] = {
+                "width": aspect_width,
+                "height": aspect_height,
+            }
+
+        return json.dumps({
+            "command": "start_capture",
+            "payload": payload,
+        })
+
+    if command == "stop":
+        return json.dumps({"command": "stop_capture"})
+
+    print(f"[Error]: Unknown command '{command}'. Use 'start' or 'stop'.")
+    return None
+
+
+async def dispatch_control_message(message: str):
+    """记录 start 命令的码率与帧率（采集背压的原参数），并广播给所有已连接客户端"""
+    data = json.loads(message)
+    if data.get("command") == "start_capture":
+        payload = data["payload"]
+        CAPTURE_SETTINGS.update(bitrate=float(payload["bitrate"]), fps=int(payload["fps"]))
+    await broadcast(message)
+
+
 # This function reads commands from the server's terminal
 async def terminal_input_handler():
     """
@@ -739,82 +1566,10 @@ async def terminal_input_handler():
     loop = asyncio.get_running_loop()
     while True:
         try:
-            command_str = await loop.run_in_executor(
-                None,
-                lambda: input(
-                    f"\nEnter command ('start [w]:[h] [bitrate_mb] [fps]' or 'stop'): \n"
-                    f"  Example: 'start 4:3 4 10' for 4:3 aspect ratio, 4 MB bitrate, 10 fps\n"
-                    f"  Defaults (from env): aspect={DEFAULT_ASPECT_RATIO_WIDTH}:{DEFAULT_ASPECT_RATIO_HEIGHT}, "
-                    f"bitrate={DEFAULT_BITRATE_MB}MB, fps={DEFAULT_FPS}, include_aspect={DEFAULT_INCLUDE_ASPECT_RATIO}\n> "
-                ),
-            )
-            parts = command_str.lower().split()
-            if not parts:
-                continue
-            command = parts[0]
-
-            if command == "start":
-                # 使用环境变量中的默认值
-                aspect_width, aspect_height = DEFAULT_ASPECT_RATIO_WIDTH, DEFAULT_ASPECT_RATIO_HEIGHT
-                bitrate_mb = DEFAULT_BITRATE_MB
-                fps = DEFAULT_FPS
-                # 如果命令行提供了宽高比参数，则包含 aspectRatio；否则根据环境变量决定
-                include_aspect_ratio = DEFAULT_INCLUDE_ASPECT_RATIO
-
-                if len(parts) > 1:
-                    # 命令行提供了宽高比参数
-                    try:
-                        aspect_width, aspect_height = map(int, parts[1].split(":"))
-                        if aspect_width <= 0 or aspect_height <= 0:
-                            raise ValueError("Aspect ratio must be positive")
-                        include_aspect_ratio = True
-                    except (ValueError, IndexError):
-                        print(f"[Error]: Invalid aspect ratio format. Using default {DEFAULT_ASPECT_RATIO_WIDTH}:{DEFAULT_ASPECT_RATIO_HEIGHT}.")
-                        aspect_width, aspect_height = DEFAULT_ASPECT_RATIO_WIDTH, DEFAULT_ASPECT_RATIO_HEIGHT
-
-                if len(parts) > 2:
-                    # 命令行提供了码率参数
-                    try:
-                        bitrate_mb = float(parts[2])
-                        if bitrate_mb <= 0:
-                            raise ValueError("Bitrate must be positive")
-                    except ValueError:
-                        print(f"[Error]: Invalid bitrate. Using default {DEFAULT_BITRATE_MB} MB.")
-                        bitrate_mb = DEFAULT_BITRATE_MB
-
-                if len(parts) > 3:
-                    # 命令行提供了帧率参数
-                    try:
-                        fps = int(parts[3])
-                        if fps < 0:
-                            fps = DEFAULT_FPS
-                    except ValueError:
-                        print(f"[Error]: Invalid fps. Using default {DEFAULT_FPS} FPS.")
-                        fps = DEFAULT_FPS
-
-                payload = {
-                    "format": "h264",
-                    "bitrate": int(bitrate_mb) if isinstance(bitrate_mb, float) and bitrate_mb.is_integer() else bitrate_mb,
-                    "fps": fps,
-                    "segmentDuration": REALTIME_TARGET_SEGMENT_DURATION,
-                }
-                if include_aspect_ratio:
-                    payload["aspectRatio"] = {
-                        "width": aspect_width,
-                        "height": aspect_height,
-                    }
-
-                message = json.dumps({
-                    "command": "start_capture",
-                    "payload": payload,
-                })
-                await broadcast(message)
-
-            elif command == "stop":
-                message = json.dumps({"command": "stop_capture"})
-                await broadcast(message)
-            else:
-                print(f"[Error]: Unknown command '{command}'. Use 'start' or 'stop'.")
+            command_str = await loop.run_in_executor(None, lambda: input(terminal_prompt()))
+            message = build_control_message(command_str)
+            if message:
+                await dispatch_control_message(message)
 
         except (KeyboardInterrupt, asyncio.CancelledError):
             break
@@ -823,8 +1578,42 @@ async def terminal_input_handler():
             continue
 
 
+async def command_queue_handler(commands):
+    """
+    多进程接收时的工作进程：主进程读取终端命令后经队列转发，这里广播给本进程的客户端
+    
+    Args:
+        commands: multiprocessing 队列（收到 None 时退出）
+    """
+    loop = asyncio.get_running_loop()
+    while True:
+        message = await loop.run_in_executor(None, read_command, commands)
+        if message is None:
+            break
+        if not message:
+            continue
+        try:
+            await dispatch_control_message(message)
+        except Exception as e:
+            print(f"[Error] in command handler: {e}")
+
+
 # The main function to start the server and the terminal handler
-async def main(host: str = "0.0.0.0", port: int = 50002):
+async def main(
+    host: str = "0.0.0.0",
+    port: int = 50002,
+    watch: bool = False,
+    reuse_port: bool = False,
+    commands=None
+):
+    """
+    Args:
+        host: 监听地址
+        port: 监听端口
+        watch: 是否监视 recordings/ 目录
+        reuse_port: 以 SO_REUSEPORT 监听（多进程接收的工作进程）
+        commands: 多进程接收时主进程转发控制消息的队列，None 则从终端读取命令
+    """
     server_task = websockets.serve(
         connection_handler, 
         host, 
@@ -832,27 +1621,74 @@ async def main(host: str = "0.0.0.0", port: int = 50002):
         ping_interval=20,
         ping_timeout=10,
         close_timeout=10,
-        max_size=int(WEBSOCKET_MAX_SIZE_MB * 1024 * 1024)
+        max_size=int(WEBSOCKET_MAX_SIZE_MB * 1024 * 1024),
+        reuse_port=reuse_port
     )
     async with server_task:
-        print(f"WebSocket server started at ws://{host}:{port}")
-        print("You can now connect your Android Camera App.")
+        if SHARD_INDEX is not None:
+            print(f"[Info]: 工作进程 {SHARD_INDEX}（pid={os.getpid()}）已启动，监听 ws://{host}:{port}")
+        else:
+            print(f"WebSocket server started at ws://{host}:{port}")
+            print("You can now connect your Android Camera App.")
+        # 多进程时配置信息只由 0 号进程打印
+        if SHARD_INDEX in (None, 0):
+            if REALTIME_PROCESSING_ENABLED:
+                print(f"[Info]: Realtime processing enabled (target segment duration: {REALTIME_TARGET_SEGMENT_DURATION}s)")
+                if is_adaptive_segment_enabled():
+                    policy = AdaptiveSegmentController(REALTIME_TARGET_SEGMENT_DURATION).policy
+                    print(f"[Info]: Adaptive segment duration enabled: {policy.describe()}")
+            if is_capture_backpressure_enabled():
+                policy = CaptureController(DEFAULT_BITRATE_MB, DEFAULT_FPS).policy
+                print(f"[Info]: Capture backpressure enabled: {policy.describe()}")
+            if DYNAMIC_CONTEXT_ENABLED:
+                print(f"[Info]: Dynamic context enabled (max recent events: {MAX_RECENT_EVENTS})")
+            print(f"[Info]: WebSocket max message size = {WEBSOCKET_MAX_SIZE_MB} MB")
         if REALTIME_PROCESSING_ENABLED:
-            print(f"[Info]: Realtime processing enabled (target segment duration: {REALTIME_TARGET_SEGMENT_DURATION}s)")
-        if DYNAMIC_CONTEXT_ENABLED:
-            print(f"[Info]: Dynamic context enabled (max recent events: {MAX_RECENT_EVENTS})")
-        print(f"[Info]: WebSocket max message size = {WEBSOCKET_MAX_SIZE_MB} MB")
-        terminal_task = asyncio.create_task(terminal_input_handler())
-        await asyncio.gather(terminal_task)
+            print(f"[Info]: Segment queue: {get_segment_queue().db_path} {get_segment_queue().counts()}")
+            resume_unfinished_sessions()
+        watcher_task = None
+        if watch:
+            if REALTIME_PROCESSING_ENABLED:
+                watcher_task = asyncio.create_task(run_recordings_watcher())
+            else:
+                print("[Warning]: 目录监视需要启用实时处理（REALTIME_PROCESSING_ENABLED），已忽略")
+        if commands is not None:
+            terminal_task = asyncio.create_task(command_queue_handler(commands))
+        else:
+            terminal_task = asyncio.create_task(terminal_input_handler())
+        try:
+            await asyncio.gather(terminal_task)
+        finally:
+            if watcher_task:
+                watcher_task.cancel()
+            await close_http_clients()
 
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("--host", default="0.0.0.0")
     parser.add_argument("--port", type=int, default=50002)
+    parser.add_argument("--watch", action="store_true", help="监视 recordings/ 目录，处理离线拷贝进来的分段")
+    parser.add_argument(
+        "--workers", type=int, default=get_config('SERVER_WORKERS', 1, int),
+        help="接收进程数，>1 时多进程共同监听同一端口（见 streaming_server/sharded.py）"
+    )
+    parser.add_argument(
+        "--uvloop", action="store_true", default=get_config('SERVER_UVLOOP', False, bool),
+        help="使用 uvloop 事件循环（需安装 uvloop）"
+    )
     args = parser.parse_args()
+    watch = args.watch or is_watch_enabled()
 
-    try:
-        asyncio.run(main(args.host, args.port))
-    except KeyboardInterrupt:
-        print("\nServer shutting down.")
+    workers = args.workers
+    if workers > 1 and not supports_reuse_port():
+        print("[Warning]: 当前系统不支持 SO_REUSEPORT，回退到单进程接收")
+        workers = 1
+
+    if workers > 1:
+        run_sharded(args.host, args.port, workers, watch=watch, use_uvloop=args.uvloop)
+    else:
+        try:
+            run_event_loop(main(args.host, args.port, watch=watch), use_uvloop=args.uvloop)
+        except KeyboardInterrupt:
+            print("\nServer shutting down.")
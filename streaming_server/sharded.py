@@ -0,0 +1,222 @@
+"""多进程接收：N 个工作进程共同监听同一端口，各自持有所连接客户端的会话
+
+单进程服务器中所有客户端的 JSON 解析、base64 解码与写盘都挤在同一个进程里（事件循环与解析受 GIL 限制），
+摄像头较多时接收吞吐受限于单核，一个客户端的大分段也会拖慢其他客户端。启用后：
+
+- 主进程启动上下文协调器（context/context_coordinator.py）与 N 个工作进程，之后只读取终端命令并转发
+- 各工作进程以 SO_REUSEPORT 监听同一端口，由内核把新连接分配给各进程；连接的会话、处理队列与
+  处理任务都留在接受它的进程内
+- 各工作进程使用独立的处理队列数据库：0 号沿用 SEGMENT_QUEUE_DB（默认 recordings/segment_queue.db，
+  与单进程模式相同），i 号为 segment_queue.shard<i>.db，重启后各自恢复未完成的分段
+- 同一名义日期的外貌缓存与事件编号由协调器统一持有，各进程按快照 / 提交共享
+- 目录监视（--watch）只在 0 号进程运行；登记前检查其他工作进程的队列数据库，其他进程的实时会话
+  已登记的分段不再重复登记（否则同一分段会被调用两次模型、写入两份事件）
+- 可选 uvloop 事件循环（未安装时回退到 asyncio 默认循环）
+
+需要操作系统支持 SO_REUSEPORT（Linux / macOS），不支持时回退到单进程。减少进程数后，编号超出范围的
+分片数据库中仍有未完成的分段时启动会打印告警，需要以原进程数启动一次处理完。
+
+环境变量：
+- SERVER_WORKERS：接收进程数（默认 1，即单进程）
+- SERVER_UVLOOP：是否使用 uvloop（默认 false）
+"""
+
+import asyncio
+import multiprocessing
+import os
+import queue
+import secrets
+import socket
+import sys
+from pathlib import Path
+from typing import Any, Coroutine, List, Optional
+
+from context.context_coordinator import connect_coordinator, start_coordinator
+
+
+DEFAULT_QUEUE_DB = 'recordings/segment_queue.db'
+
+
+def supports_reuse_port() -> bool:
+    """当前系统是否支持 SO_REUSEPORT"""
+    if not hasattr(socket, 'SO_REUSEPORT'):
+        return False
+    try:
+        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        return True
+    except OSError:
+        return False
+
+
+def shard_queue_path(shard: int, base: str = None) -> Path:
+    """
+    工作进程的处理队列数据库路径
+
+    Args:
+        shard: 分片编号
+        base: 基础路径，None 则读取 SEGMENT_QUEUE_DB
+
+    Returns:
+        0 号为基础路径本身，其余为 <stem>.shard<i><suffix>
+    """
+    base_path = Path(base or os.getenv('SEGMENT_QUEUE_DB', DEFAULT_QUEUE_DB))
+    if shard == 0:
+        return base_path
+    return base_path.with_name(f"{base_path.stem}.shard{shard}{base_path.suffix}")
+
+
+def run_event_loop(main: Coroutine, use_uvloop: bool = False) -> Any:
+    """
+    运行协程（可选 uvloop）
+
+    Args:
+        main: 入口协程
+        use_uvloop: 是否使用 uvloop（未安装时打印告警并使用默认事件循环）
+
+    Returns:
+        协程返回值
+    """
+    if use_uvloop:
+        try:
+            import uvloop
+        except ImportError:
+            print("[Warning]: 未安装 uvloop（pip install uvloop），使用 asyncio 默认事件循环")
+        else:
+            if sys.version_info >= (3, 11):
+                with asyncio.Runner(loop_factory=uvloop.new_event_loop) as runner:
+                    return runner.run(main)
+            asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    return asyncio.run(main)
+
+
+def read_command(commands: Any, timeout: float = 1.0) -> Optional[str]:
+    """
+    工作进程从主进程的命令队列读取一条控制消息（在线程池中调用）
+
+    Returns:
+        控制消息；超时返回空字符串，None 表示主进程要求退出
+    """
+    try:
+        return commands.get(timeout=timeout)
+    except queue.Empty:
+        return ''
+
+
+def _warn_orphan_shards(workers: int) -> None:
+    """检查编号超出范围的分片数据库中是否还有未完成的分段"""
+    from streaming_server.segment_queue import SegmentQueue
+
+    base = shard_queue_path(0)
+    for path in sorted(base.parent.glob(f"{base.stem}.shard*{base.suffix}")):
+        try:
+            shard = int(path.stem.rsplit('.shard', 1)[1])
+        except (IndexError, ValueError):
+            continue
+        if shard < workers:
+            continue
+        orphan = SegmentQueue(path)
+        try:
+            counts = orphan.counts()
+        finally:
+            orphan.close()
+        unfinished = counts.get('queued', 0) + counts.get('in_flight', 0)
+        if unfinished:
+            print(
+                f"[Warning]: 分片数据库 {path} 中有 {unfinished} 个未完成的分段，"
+                f"当前只启动 {workers} 个工作进程，需要以 --workers {shard + 1} 以上启动一次处理完"
+            )
+
+
+def _run_worker(
+    shard: int,
+    workers: int,
+    host: str,
+    port: int,
+    watch: bool,
+    use_uvloop: bool,
+    coordinator_address: Any,
+    authkey: bytes,
+    commands: Any
+) -> None:
+    """工作进程入口：连接协调器后以 SO_REUSEPORT 运行服务器主循环"""
+    os.environ['SEGMENT_QUEUE_DB'] = str(shard_queue_path(shard))
+    from streaming_server import server
+
+    server.SHARD_INDEX = shard
+    server.SHARD_COUNT = workers
+    server.CONTEXT_COORDINATOR = connect_coordinator(coordinator_address, authkey)
+    try:
+        run_event_loop(
+            server.main(host, port, watch=watch, reuse_port=True, commands=commands),
+            use_uvloop=use_uvloop
+        )
+    except KeyboardInterrupt:
+        pass
+
+
+def _forward_terminal_commands(commands: List[Any]) -> None:
+    """读取终端命令，转换为控制消息后转发给所有工作进程（由各进程广播给自己的客户端）"""
+    from streaming_server.server import build_control_message, terminal_prompt
+
+    while True:
+        message = build_control_message(input(terminal_prompt()))
+        if message:
+            for command_queue in commands:
+                command_queue.put(message)
+
+
+def run_sharded(host: str, port: int, workers: int, watch: bool = False, use_uvloop: bool = False) -> None:
+    """
+    以多进程方式运行接收服务器（阻塞直到 Ctrl+C 或所有工作进程退出）
+
+    Args:
+        host: 监听地址
+        port: 监听端口
+        workers: 工作进程数
+        watch: 是否监视 recordings/ 目录（只在 0 号进程运行）
+        use_uvloop: 工作进程是否使用 uvloop
+    """
+    ctx = multiprocessing.get_context('spawn')
+    authkey = secrets.token_bytes(16)
+    manager, address = start_coordinator(authkey)
+    commands = [ctx.Queue() for _ in range(workers)]
+    processes = [
+        ctx.Process(
+            target=_run_worker,
+            args=(shard, workers, host, port, watch and shard == 0, use_uvloop, address, authkey, commands[shard]),
+            name=f"ingest-shard{shard}"
+        )
+        for shard in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    print(
+        f"[Info]: 多进程接收：{workers} 个工作进程共同监听 ws://{host}:{port}（SO_REUSEPORT），"
+        f"上下文协调器 {address[0]}:{address[1]}"
+        + ("，uvloop" if use_uvloop else "")
+    )
+    _warn_orphan_shards(workers)
+
+    try:
+        try:
+            _forward_terminal_commands(commands)
+        except EOFError:
+            # 无终端（后台运行）时不再读取命令，直到工作进程退出或 Ctrl+C
+            print("[Info]: 终端输入已关闭，不再接收 start/stop 命令")
+            for process in processes:
+                process.join()
+    except KeyboardInterrupt:
+        print("\nServer shutting down.")
+    finally:
+        for command_queue in commands:
+            command_queue.put(None)
+        for process in processes:
+            process.join(timeout=30)
+            if process.is_alive():
+                print(f"[Warning]: 工作进程 {process.name} 未按时退出，强制结束")
+                process.terminate()
+        try:
+            manager.coordinator().close_all()
+        finally:
+            manager.shutdown()
@@ -0,0 +1,324 @@
+"""录制目录监视：离线拷贝到 recordings/ 的分段自动进入处理队列
+
+除 WebSocket 实时采集外，也会有整批 MP4 分段直接拷贝到 recordings/<会话>/ 下。RecordingsWatcher
+监视 recordings/ 的会话子目录，发现新的 <segment_id>.mp4（及 <segment_id>_qr.json）并确认写入完成后回调：
+
+- 写入完成的判定：文件经 rename 移入（IN_MOVED_TO），或大小与修改时间连续 stable_seconds 秒不变
+- 二维码结果文件最多等待 qr_grace 秒，仍未出现时按无二维码结果处理
+- 启动时已存在的分段视为已处理（backfill=True 时也一并处理）
+- 安装了 inotify_simple 时用 inotify 及时发现变化，否则每 poll_interval 秒轮询一次
+
+只扫描会话目录的第一层，preprocessed/ 等子目录与以 . 开头的临时文件不会被当作分段。
+
+环境变量：
+- RECORDINGS_WATCH：是否启用（默认 false，也可用 server.py --watch 启用）
+- RECORDINGS_WATCH_STABLE_SECONDS：文件大小不变多久视为写入完成（秒，默认 5）
+- RECORDINGS_WATCH_POLL_INTERVAL：轮询间隔（秒，默认 2）
+- RECORDINGS_WATCH_QR_GRACE：等待二维码结果文件的时长（秒，默认 60）
+- RECORDINGS_WATCH_BACKFILL：启动时是否处理已存在的分段（默认 false）
+- RECORDINGS_WATCH_MAX_SESSIONS：同时处理的监视会话数上限（默认 2）
+"""
+
+import asyncio
+import os
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Set, Tuple
+
+try:
+    from inotify_simple import INotify, flags as inotify_flags
+except ImportError:  # 非 Linux 或未安装时退化为轮询
+    INotify = None
+    inotify_flags = None
+
+
+def is_watch_enabled() -> bool:
+    """读取 RECORDINGS_WATCH 环境变量（默认关闭）"""
+    return os.getenv('RECORDINGS_WATCH', 'false').lower() in ('true', '1', 'yes', 'on')
+
+
+def _env_number(name: str, default, cast):
+    try:
+        return cast(os.getenv(name, str(default)))
+    except ValueError:
+        return default
+
+
+@dataclass
+class CompletedSegment:
+    """写入完成的分段"""
+    session_dir: Path
+    segment_id: str
+    mp4_path: Path
+    qr_path: Optional[Path]     # 二维码结果文件（超时未出现时为 None）
+    size: int
+    detected_at: float          # 首次发现的时间
+    completed_at: float         # 判定写入完成的时间
+
+
+# 吞吐统计的滑动窗口（秒）
+THROUGHPUT_WINDOW = 300.0
+
+
+@dataclass
+class WatchThroughput:
+    """目录监视导入的吞吐统计"""
+    started_at: float = field(default_factory=time.time)
+    enqueued: int = 0
+    duplicates: int = 0          # 已登记过（如实时会话自己保存的分段）
+    skipped_live: int = 0        # 属于正在采集的实时会话
+    processed: int = 0
+    processed_bytes: int = 0
+    ingest_latency_total: float = 0.0   # 首次发现到判定写入完成的累计耗时
+    _recent: Deque[Tuple[float, int]] = field(default_factory=deque)  # (处理完成时间, 字节数)
+
+    def record_enqueued(self, segment: 'CompletedSegment') -> None:
+        self.enqueued += 1
+        self.ingest_latency_total += segment.completed_at - segment.detected_at
+
+    def record_processed(self, size_bytes: int) -> None:
+        now = time.time()
+        self.processed += 1
+        self.processed_bytes += size_bytes
+        self._recent.append((now, size_bytes))
+        while self._recent and now - self._recent[0][0] > THROUGHPUT_WINDOW:
+            self._recent.popleft()
+
+    def snapshot(self, backlog: int) -> Dict[str, Any]:
+        """
+        当前统计
+
+        Args:
+            backlog: 监视会话中尚未完成的分段数
+
+        Returns:
+            统计字典（segments_per_minute / mb_per_minute 按最近 5 分钟计算）
+        """
+        now = time.time()
+        while self._recent and now - self._recent[0][0] > THROUGHPUT_WINDOW:
+            self._recent.popleft()
+        window = min(THROUGHPUT_WINDOW, max(now - self.started_at, 1.0))
+        recent_bytes = sum(size for _, size in self._recent)
+        return {
+            'enqueued': self.enqueued,
+            'processed': self.processed,
+            'backlog': backlog,
+            'duplicates': self.duplicates,
+            'skipped_live': self.skipped_live,
+            'segments_per_minute': round(len(self._recent) * 60.0 / window, 2),
+            'mb_per_minute': round(recent_bytes / (1024 * 1024) * 60.0 / window, 2),
+            'avg_ingest_latency': round(self.ingest_latency_total / self.enqueued, 2) if self.enqueued else None,
+        }
+
+
+@dataclass
+class _Candidate:
+    size: int
+    mtime: float
+    first_seen: float
+    stable_since: float
+    renamed: bool = False
+
+
+class RecordingsWatcher:
+    """监视 recordings/ 下的新分段"""
+
+    def __init__(
+        self,
+        root: Path,
+        stable_seconds: Optional[float] = None,
+        poll_interval: Optional[float] = None,
+        qr_grace: Optional[float] = None,
+        backfill: Optional[bool] = None
+    ):
+        """
+        Args:
+            root: 录制根目录（recordings/）
+            stable_seconds: 大小不变多久视为写入完成，None 则读取 RECORDINGS_WATCH_STABLE_SECONDS（默认 5）
+            poll_interval: 轮询间隔，None 则读取 RECORDINGS_WATCH_POLL_INTERVAL（默认 2）
+            qr_grace: 等待二维码结果文件的时长，None 则读取 RECORDINGS_WATCH_QR_GRACE（默认 60）
+            backfill: 是否处理启动时已存在的分段，None 则读取 RECORDINGS_WATCH_BACKFILL（默认 false）
+        """
+        self.root = Path(root)
+        self.stable_seconds = stable_seconds if stable_seconds is not None else _env_number('RECORDINGS_WATCH_STABLE_SECONDS', 5.0, float)
+        self.poll_interval = poll_interval if poll_interval is not None else _env_number('RECORDINGS_WATCH_POLL_INTERVAL', 2.0, float)
+        self.qr_grace = qr_grace if qr_grace is not None else _env_number('RECORDINGS_WATCH_QR_GRACE', 60.0, float)
+        if backfill is None:
+            backfill = os.getenv('RECORDINGS_WATCH_BACKFILL', 'false').lower() in ('true', '1', 'yes', 'on')
+        self.backfill = backfill
+
+        self._pending: Dict[Path, _Candidate] = {}
+        self._seen: Set[Path] = set()
+        self._dirty: Set[Path] = set()
+        self._renamed: Set[Path] = set()
+        self._wakeup = asyncio.Event()
+        self._inotify = None
+        self._watch_dirs: Dict[int, Path] = {}
+
+        # 统计
+        self.detected = 0
+        self.completed = 0
+
+    @property
+    def mode(self) -> str:
+        return 'inotify' if self._inotify else 'polling'
+
+    def _session_dirs(self) -> List[Path]:
+        return sorted(p for p in self.root.iterdir() if p.is_dir() and not p.name.startswith('.'))
+
+    @staticmethod
+    def _segment_files(session_dir: Path) -> List[Path]:
+        try:
+            return [p for p in session_dir.glob("*.mp4") if not p.name.startswith('.')]
+        except OSError:
+            return []
+
+    def _start_inotify(self) -> None:
+        if INotify is None:
+            return
+        try:
+            self._inotify = INotify()
+            self._add_watch(self.root, inotify_flags.CREATE | inotify_flags.MOVED_TO)
+            for session_dir in self._session_dirs():
+                self._watch_session(session_dir)
+            asyncio.get_running_loop().add_reader(self._inotify.fileno(), self._on_inotify)
+        except OSError as e:
+            print(f"[Watch] inotify 不可用，改为轮询: {e}")
+            self._inotify = None
+
+    def _add_watch(self, path: Path, mask) -> None:
+        wd = self._inotify.add_watch(str(path), mask)
+        self._watch_dirs[wd] = path
+
+    def _watch_session(self, session_dir: Path) -> None:
+        self._add_watch(
+            session_dir,
+            inotify_flags.CLOSE_WRITE | inotify_flags.MOVED_TO | inotify_flags.CREATE | inotify_flags.MODIFY
+        )
+
+    def _on_inotify(self) -> None:
+        """inotify 事件（在事件循环中回调）：记录有变化的目录并唤醒扫描"""
+        for event in self._inotify.read(timeout=0):
+            parent = self._watch_dirs.get(event.wd)
+            if parent is None or not event.name:
+                continue
+            path = parent / event.name
+            if parent == self.root:
+                if event.mask & inotify_flags.ISDIR:
+                    try:
+                        self._watch_session(path)
+                    except OSError:
+                        continue
+                    self._dirty.add(path)
+                continue
+            if event.mask & inotify_flags.MOVED_TO and path.suffix == '.mp4':
+                self._renamed.add(path)
+            self._dirty.add(parent)
+        self._wakeup.set()
+
+    def _scan(self, dirs: List[Path]) -> None:
+        """把目录中新出现的分段加入待定列表"""
+        now = time.time()
+        for session_dir in dirs:
+            for mp4_path in self._segment_files(session_dir):
+                if mp4_path in self._seen or mp4_path in self._pending:
+                    continue
+                try:
+                    stat = mp4_path.stat()
+                except FileNotFoundError:
+                    continue
+                self._pending[mp4_path] = _Candidate(stat.st_size, stat.st_mtime, now, now)
+                self.detected += 1
+
+    def _collect_completed(self, renamed: Set[Path]) -> List[CompletedSegment]:
+        """
+        检查待定分段，返回已写入完成的分段（按路径排序，保证同一会话内的顺序）
+
+        Args:
+            renamed: 本轮 inotify 报告经 rename 移入的文件
+        """
+        now = time.time()
+        completed = []
+        for mp4_path in sorted(self._pending):
+            candidate = self._pending[mp4_path]
+            try:
+                stat = mp4_path.stat()
+            except FileNotFoundError:
+                # 被删除或改名（改名后的新文件会被重新发现）
+                del self._pending[mp4_path]
+                continue
+            if mp4_path in renamed:
+                candidate.renamed = True
+            if stat.st_size != candidate.size or stat.st_mtime != candidate.mtime:
+                candidate.size, candidate.mtime = stat.st_size, stat.st_mtime
+                candidate.stable_since = now
+                continue
+            if stat.st_size == 0:
+                continue
+            if not candidate.renamed and now - candidate.stable_since < self.stable_seconds:
+                continue
+
+            qr_path = mp4_path.with_name(f"{mp4_path.stem}_qr.json")
+            if not qr_path.exists():
+                if now - candidate.first_seen < self.qr_grace:
+                    continue
+                qr_path = None
+            del self._pending[mp4_path]
+            self._seen.add(mp4_path)
+            self.completed += 1
+            completed.append(CompletedSegment(
+                session_dir=mp4_path.parent,
+                segment_id=mp4_path.stem,
+                mp4_path=mp4_path,
+                qr_path=qr_path,
+                size=stat.st_size,
+                detected_at=candidate.first_seen,
+                completed_at=now
+            ))
+        return completed
+
+    async def run(self, on_segment: Callable[[CompletedSegment], Awaitable[None]]) -> None:
+        """
+        持续监视并回调写入完成的分段（直到任务被取消）
+
+        Args:
+            on_segment: 分段回调（按会话目录、segment_id 顺序调用）
+        """
+        self.root.mkdir(parents=True, exist_ok=True)
+        if not self.backfill:
+            for session_dir in self._session_dirs():
+                self._seen.update(self._segment_files(session_dir))
+        self._start_inotify()
+        print(
+            f"[Watch] 监视 {self.root}（{self.mode}），已有分段 {len(self._seen)} 个"
+            f"{'，将一并处理' if self.backfill else '，跳过'}"
+        )
+        if self.backfill:
+            self._scan(self._session_dirs())
+
+        try:
+            while True:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+
+                if self._inotify:
+                    dirs, self._dirty = sorted(self._dirty), set()
+                else:
+                    dirs = self._session_dirs()
+                renamed, self._renamed = self._renamed, set()
+                await asyncio.to_thread(self._scan, dirs)
+                for segment in await asyncio.to_thread(self._collect_completed, renamed):
+                    try:
+                        await on_segment(segment)
+                    except Exception as e:
+                        print(f"[Watch] 分段入队失败 ({segment.mp4_path}): {e}")
+        finally:
+            if self._inotify:
+                asyncio.get_running_loop().remove_reader(self._inotify.fileno())
+                self._inotify.close()
+                self._inotify = None
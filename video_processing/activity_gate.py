@@ -0,0 +1,216 @@
+"""静止场景跳过：本地活动检测，实验室无人且画面不变时不调用视频理解模型
+
+实验室长时间无人时，每个 60 秒分段仍要做一次带思考的模型调用，结果大多只是一个 none 事件。
+ActivityGate 用 ffmpeg 以 1 fps 抽取 64x48 灰度帧，统计相邻帧变化像素的占比：
+
+- 分段内任意相邻两帧的变化占比都低于阈值，且首帧与上一个分段末帧相比也几乎不变，视为静止；
+- 只有上一个经模型处理的分段结果为“无人”（只有 none 事件）时才跳过，避免有人静坐时被误判；
+- 有二维码识别结果的分段从不跳过；连续跳过 ACTIVITY_GATE_MAX_SKIP 个分段后强制调用一次模型。
+
+被跳过的分段在本地生成一个 none 事件，编号规则与模型输出相同。
+
+环境变量：
+- ACTIVITY_GATE：是否启用（默认 false）
+- ACTIVITY_GATE_THRESHOLD：相邻帧变化像素占比阈值（默认 0.01）
+- ACTIVITY_GATE_PIXEL_DELTA：灰度差超过多少算变化像素（默认 25）
+- ACTIVITY_GATE_MAX_SKIP：最多连续跳过的分段数（默认 10）
+"""
+
+import os
+import subprocess
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import List, Optional
+
+from storage.models import EventLog
+
+
+FRAME_WIDTH = 64
+FRAME_HEIGHT = 48
+SAMPLE_FPS = 1
+
+IDLE_EVENT_DESCRIPTION = "画面无明显变化，无人员活动（本地活动检测判定为静止场景，未调用视频理解模型）"
+
+
+def is_activity_gate_enabled() -> bool:
+    """读取 ACTIVITY_GATE 环境变量（默认关闭）"""
+    return os.getenv('ACTIVITY_GATE', 'false').lower() in ('true', '1', 'yes', 'on')
+
+
+def _env_number(name: str, default, cast):
+    try:
+        return cast(os.getenv(name, str(default)))
+    except ValueError:
+        return default
+
+
+@dataclass
+class ActivityStats:
+    """分段活动统计"""
+    frames: int
+    max_change: float          # 分段内相邻帧变化像素占比的最大值
+    mean_change: float         # 分段内相邻帧变化像素占比的均值
+    boundary_change: Optional[float]  # 首帧与上一分段末帧的变化占比（无上一分段时为 None）
+    elapsed: float = 0.0
+
+    def metrics(self) -> dict:
+        return {
+            'activity_max_change': round(self.max_change, 4),
+            'activity_boundary_change': (
+                round(self.boundary_change, 4) if self.boundary_change is not None else None
+            ),
+            'activity_time': round(self.elapsed, 3),
+        }
+
+
+def changed_ratio(previous: bytes, current: bytes, pixel_delta: int) -> float:
+    """两帧灰度图中差值超过 pixel_delta 的像素占比"""
+    if not previous:
+        return 0.0
+    changed = sum(1 for a, b in zip(previous, current) if abs(a - b) > pixel_delta)
+    return changed / len(current)
+
+
+class ActivityGate:
+    """单个会话的静止场景判定（按分段顺序调用，不是线程安全的）"""
+
+    def __init__(
+        self,
+        threshold: Optional[float] = None,
+        pixel_delta: Optional[int] = None,
+        max_skip: Optional[int] = None,
+        ffmpeg_bin: Optional[str] = None
+    ):
+        """
+        Args:
+            threshold: 变化像素占比阈值，None 则读取 ACTIVITY_GATE_THRESHOLD（默认 0.01）
+            pixel_delta: 变化像素的灰度差下限，None 则读取 ACTIVITY_GATE_PIXEL_DELTA（默认 25）
+            max_skip: 最多连续跳过的分段数，None 则读取 ACTIVITY_GATE_MAX_SKIP（默认 10）
+            ffmpeg_bin: ffmpeg 可执行文件，None 则读取 FFMPEG_BIN（默认 ffmpeg）
+        """
+        self.threshold = threshold if threshold is not None else _env_number('ACTIVITY_GATE_THRESHOLD', 0.01, float)
+        self.pixel_delta = pixel_delta if pixel_delta is not None else _env_number('ACTIVITY_GATE_PIXEL_DELTA', 25, int)
+        self.max_skip = max_skip if max_skip is not None else _env_number('ACTIVITY_GATE_MAX_SKIP', 10, int)
+        self.ffmpeg_bin = ffmpeg_bin or os.environ.get("FFMPEG_BIN", "ffmpeg")
+
+        self._last_frame: bytes = b""      # 上一个分段的末帧
+        self._idle_baseline = False        # 上一个经模型处理的分段是否“无人”
+        self._consecutive_skips = 0
+
+        # 统计
+        self.checked = 0
+        self.skipped = 0
+
+    def _read_frames(self, video_path: str) -> List[bytes]:
+        """用 ffmpeg 抽取低分辨率灰度帧"""
+        cmd = [
+            self.ffmpeg_bin,
+            "-v", "error",
+            "-i", video_path,
+            "-vf", f"fps={SAMPLE_FPS},scale={FRAME_WIDTH}:{FRAME_HEIGHT}",
+            "-f", "rawvideo",
+            "-pix_fmt", "gray",
+            "-",
+        ]
+        result = subprocess.run(cmd, capture_output=True)
+        if result.returncode != 0:
+            raise RuntimeError(result.stderr.decode('utf-8', errors='replace').strip())
+
+        frame_size = FRAME_WIDTH * FRAME_HEIGHT
+        data = result.stdout
+        return [data[i:i + frame_size] for i in range(0, len(data) - frame_size + 1, frame_size)]
+
+    def measure(self, video_path: str) -> ActivityStats:
+        """
+        统计分段的画面变化，并记住末帧供下一个分段比较（阻塞）
+
+        Args:
+            video_path: 视频路径
+
+        Returns:
+            ActivityStats
+        """
+        start = time.time()
+        frames = self._read_frames(video_path)
+        changes = [
+            changed_ratio(frames[i - 1], frames[i], self.pixel_delta)
+            for i in range(1, len(frames))
+        ]
+        boundary = None
+        if frames and self._last_frame:
+            boundary = changed_ratio(self._last_frame, frames[0], self.pixel_delta)
+        if frames:
+            self._last_frame = frames[-1]
+        return ActivityStats(
+            frames=len(frames),
+            max_change=max(changes, default=0.0),
+            mean_change=sum(changes) / len(changes) if changes else 0.0,
+            boundary_change=boundary,
+            elapsed=time.time() - start
+        )
+
+    def should_skip(self, stats: ActivityStats, has_qr_results: bool = False) -> bool:
+        """
+        判断分段是否可以跳过模型调用（返回 True 时计为一次跳过）
+
+        Args:
+            stats: measure 的结果
+            has_qr_results: 分段是否有二维码识别结果
+
+        Returns:
+            是否跳过
+        """
+        self.checked += 1
+        idle = (
+            stats.frames > 1
+            and stats.max_change < self.threshold
+            and stats.boundary_change is not None
+            and stats.boundary_change < self.threshold
+        )
+        if (not idle or has_qr_results or not self._idle_baseline
+                or self._consecutive_skips >= self.max_skip):
+            self._consecutive_skips = 0
+            return False
+        self._consecutive_skips += 1
+        self.skipped += 1
+        return True
+
+    def record_result(self, events: List[EventLog]) -> None:
+        """记录经模型处理的分段结果：只有 none 事件时作为“无人”基线（没有事件可能是解析失败，不作为基线）"""
+        self._idle_baseline = bool(events) and all(event.event_type == 'none' for event in events)
+
+    def reset(self) -> None:
+        """画面来源中断（如处理失败）后清除基线，下一个分段必定调用模型"""
+        self._last_frame = b""
+        self._idle_baseline = False
+        self._consecutive_skips = 0
+
+
+def build_idle_event(
+    segment_id: str,
+    start_time: datetime,
+    duration: float,
+    max_event_id: int
+) -> EventLog:
+    """
+    为跳过的分段生成 none 事件
+
+    Args:
+        segment_id: 分段ID
+        start_time: 分段开始时间
+        duration: 分段时长（秒）
+        max_event_id: 当前最大事件编号数字（新事件编号为其后一个）
+
+    Returns:
+        EventLog
+    """
+    return EventLog(
+        event_id=f"evt_{max_event_id + 1:05d}",
+        segment_id=segment_id,
+        start_time=start_time,
+        end_time=start_time + timedelta(seconds=duration),
+        event_type='none',
+        structured={'person_ids': [], 'equipment': ''},
+        raw_text=IDLE_EVENT_DESCRIPTION
+    )
@@ -0,0 +1,349 @@
+"""异步 VLM 客户端：基于 httpx.AsyncClient 的连接池、超时、带抖动重试与取消
+
+- 每个 (事件循环, 主机) 复用一个 AsyncClient（keep-alive 连接池），避免每次请求重新握手
+- 连接错误、超时、429/5xx 按指数退避 + 全抖动重试，优先遵循 Retry-After
+- asyncio 取消（CancelledError）不会被重试逻辑吞掉，会中断正在进行的请求
+- OpenRouterAsyncClient：/v1/responses（非流式或 SSE 流式）
+- DashScopeCompatibleAsyncClient：OpenAI 兼容模式 /chat/completions（流式 SSE，汇总正文、思考与用量）
+- 流式调用可传入 on_delta 回调，正文增量到达时立即回调；已回调过正文后中途断流不再重试
+  （重发会让下游解析器收到重复正文），直接抛出异常交给上层重试整个分段
+- 请求体以 StreamingJSONBody 发送，payload 中的 VideoFileRef 从文件分块编码，不在内存中拼出整个视频
+
+环境变量：
+- VLM_HTTP_TIMEOUT：单次请求读超时（秒，默认 180）
+- VLM_HTTP_CONNECT_TIMEOUT：连接超时（秒，默认 10）
+- VLM_HTTP_MAX_RETRIES：最大重试次数（默认 3）
+- VLM_HTTP_MAX_CONNECTIONS：每个主机的最大连接数（默认 20）
+- VLM_ASYNC_HTTP：处理器的异步接口是否使用本模块（默认 true；false 时回退到线程池调用同步 SDK）
+"""
+
+import asyncio
+import json
+import os
+import random
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+import httpx
+
+from video_processing.request_body import StreamingJSONBody
+
+
+RETRY_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+RETRY_BASE_DELAY = 1.0   # 秒
+RETRY_MAX_DELAY = 30.0   # 秒
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, str(default)))
+    except ValueError:
+        return default
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, str(default)))
+    except ValueError:
+        return default
+
+
+def is_async_http_enabled() -> bool:
+    """读取 VLM_ASYNC_HTTP 环境变量（默认开启）"""
+    return os.getenv('VLM_ASYNC_HTTP', 'true').lower() in ('true', '1', 'yes', 'on')
+
+
+# (事件循环 id, scheme://host) -> AsyncClient
+_clients: Dict[Tuple[int, str], httpx.AsyncClient] = {}
+
+
+def get_http_client(url: str) -> httpx.AsyncClient:
+    """
+    获取目标主机的共享 AsyncClient（按事件循环隔离）
+
+    Args:
+        url: 请求地址
+
+    Returns:
+        httpx.AsyncClient
+    """
+    parts = urlsplit(url)
+    key = (id(asyncio.get_running_loop()), f"{parts.scheme}://{parts.netloc}")
+    client = _clients.get(key)
+    if client is None or client.is_closed:
+        max_connections = _env_int('VLM_HTTP_MAX_CONNECTIONS', 20)
+        client = httpx.AsyncClient(
+            timeout=httpx.Timeout(
+                _env_float('VLM_HTTP_TIMEOUT', 180.0),
+                connect=_env_float('VLM_HTTP_CONNECT_TIMEOUT', 10.0)
+            ),
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_connections,
+                keepalive_expiry=60.0
+            )
+        )
+        _clients[key] = client
+    return client
+
+
+async def close_http_clients() -> None:
+    """关闭当前事件循环创建的全部 AsyncClient（服务器退出时调用）"""
+    loop_id = id(asyncio.get_running_loop())
+    for key in [k for k in _clients if k[0] == loop_id]:
+        client = _clients.pop(key)
+        await client.aclose()
+
+
+def _retry_delay(attempt: int, response: Optional[httpx.Response] = None) -> float:
+    """计算重试等待：Retry-After 优先，否则指数退避 + 全抖动"""
+    if response is not None:
+        retry_after = response.headers.get('Retry-After')
+        if retry_after:
+            try:
+                return min(float(retry_after), RETRY_MAX_DELAY)
+            except ValueError:
+                pass
+    cap = min(RETRY_BASE_DELAY * (2 ** attempt), RETRY_MAX_DELAY)
+    return random.uniform(0, cap)
+
+
+class ResponsesStreamAccumulator:
+    """汇总 OpenRouter /v1/responses 的 SSE 事件（同步与异步客户端共用）"""
+
+    def __init__(self, on_delta: Optional[Callable[[str], None]] = None):
+        self.on_delta = on_delta
+        self.text_parts: List[str] = []
+        self.final: Optional[Dict[str, Any]] = None
+
+    def feed_line(self, line: str) -> bool:
+        """
+        处理一行 SSE
+
+        Returns:
+            是否已收到结束事件
+        """
+        if not line.startswith('data:'):
+            return False
+        data = line[5:].strip()
+        if data == '[DONE]':
+            return True
+        try:
+            event = json.loads(data)
+        except json.JSONDecodeError:
+            return False
+
+        event_type = event.get('type')
+        if event_type == 'response.output_text.delta':
+            delta = event.get('delta') or ''
+            if delta:
+                self.text_parts.append(delta)
+                if self.on_delta:
+                    self.on_delta(delta)
+        elif event_type in ('response.completed', 'response.incomplete'):
+            self.final = event.get('response') or {}
+            return True
+        elif event_type in ('response.failed', 'error'):
+            error = event.get('error') or (event.get('response') or {}).get('error') or event
+            raise RuntimeError(f"流式响应失败: {error}")
+        return False
+
+    def result(self) -> Dict[str, Any]:
+        """完整响应（未收到结束事件时由已收到的正文拼出）"""
+        if self.final and self.final.get('output'):
+            return self.final
+        return {
+            'output': [{
+                'type': 'message',
+                'content': [{'type': 'output_text', 'text': ''.join(self.text_parts)}]
+            }],
+            'usage': (self.final or {}).get('usage') or {}
+        }
+
+
+class DeltaTracker:
+    """包装 on_delta，记录是否已回调过正文（已回调后请求不可重试）"""
+
+    def __init__(self, on_delta: Optional[Callable[[str], None]] = None):
+        self.on_delta = on_delta
+        self.delivered = False
+
+    def __call__(self, text: str) -> None:
+        if text:
+            self.delivered = True
+        if self.on_delta:
+            self.on_delta(text)
+
+
+class AsyncVLMClient:
+    """异步 VLM HTTP 客户端基类"""
+
+    def __init__(self, api_key: str, base_url: str, max_retries: Optional[int] = None):
+        """
+        Args:
+            api_key: API Key（Bearer）
+            base_url: 接口基础地址
+            max_retries: 最大重试次数，None 则读取 VLM_HTTP_MAX_RETRIES
+        """
+        self.api_key = api_key
+        self.base_url = base_url.rstrip('/')
+        self.max_retries = max_retries if max_retries is not None else _env_int('VLM_HTTP_MAX_RETRIES', 3)
+
+    def _headers(self) -> Dict[str, str]:
+        return {
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/json"
+        }
+
+    async def _request_with_retry(
+        self,
+        url: str,
+        payload: Dict[str, Any],
+        handler,
+        tracker: Optional[DeltaTracker] = None
+    ):
+        """
+        发送 POST 请求并按需重试
+
+        Args:
+            url: 请求地址
+            payload: JSON 请求体（视频可用 VideoFileRef 占位，发送时流式编码）
+            handler: async (httpx.Response) -> Any，在响应流打开期间处理响应
+            tracker: 流式调用的正文回调记录；已回调过正文时不再重试
+
+        Returns:
+            handler 的返回值
+        """
+        client = get_http_client(url)
+        body = StreamingJSONBody(payload)
+        headers = {**self._headers(), **body.headers}
+        attempt = 0
+        while True:
+            try:
+                # 每次尝试重新从文件读取视频
+                async with client.stream('POST', url, content=body.aiter_bytes(), headers=headers) as response:
+                    if response.status_code in RETRY_STATUS_CODES and attempt < self.max_retries:
+                        await response.aread()
+                        delay = _retry_delay(attempt, response)
+                        print(f"[Warning]: VLM 请求返回 {response.status_code}，{delay:.1f}s 后重试 ({attempt + 1}/{self.max_retries})")
+                    else:
+                        if response.status_code >= 400:
+                            await response.aread()
+                            response.raise_for_status()
+                        return await handler(response)
+            except (httpx.TransportError, httpx.TimeoutException) as e:
+                if attempt >= self.max_retries:
+                    raise
+                if tracker is not None and tracker.delivered:
+                    print(f"[Warning]: VLM 流式响应中途失败 ({type(e).__name__}: {e})，已回调部分正文，不再重试")
+                    raise
+                delay = _retry_delay(attempt)
+                print(f"[Warning]: VLM 请求失败 ({type(e).__name__}: {e})，{delay:.1f}s 后重试 ({attempt + 1}/{self.max_retries})")
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    async def post_json(self, path: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """POST JSON 并返回解析后的响应"""
+        async def handler(response: httpx.Response) -> Dict[str, Any]:
+            await response.aread()
+            return response.json()
+
+        return await self._request_with_retry(f"{self.base_url}{path}", payload, handler)
+
+
+class OpenRouterAsyncClient(AsyncVLMClient):
+    """OpenRouter /v1/responses 异步客户端"""
+
+    def __init__(self, api_key: str, base_url: str = "https://openrouter.ai/api/v1", **kwargs):
+        super().__init__(api_key, base_url, **kwargs)
+
+    async def create_response(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """调用 /responses，返回原始响应 JSON"""
+        return await self.post_json("/responses", payload)
+
+    async def stream_response(
+        self,
+        payload: Dict[str, Any],
+        on_delta: Optional[Callable[[str], None]] = None
+    ) -> Dict[str, Any]:
+        """以 SSE 流式调用 /responses，正文增量回调 on_delta，返回完整响应 JSON"""
+        payload = dict(payload)
+        payload['stream'] = True
+        tracker = DeltaTracker(on_delta)
+
+        async def handler(response: httpx.Response) -> Dict[str, Any]:
+            accumulator = ResponsesStreamAccumulator(tracker)
+            async for line in response.aiter_lines():
+                if accumulator.feed_line(line):
+                    break
+            return accumulator.result()
+
+        return await self._request_with_retry(f"{self.base_url}/responses", payload, handler, tracker)
+
+
+class DashScopeCompatibleAsyncClient(AsyncVLMClient):
+    """DashScope OpenAI 兼容模式 /chat/completions 异步客户端（流式）"""
+
+    def __init__(
+        self,
+        api_key: str,
+        base_url: Optional[str] = None,
+        **kwargs
+    ):
+        base_url = base_url or os.getenv(
+            'DASHSCOPE_COMPATIBLE_BASE_URL', 'https://dashscope.aliyuncs.com/compatible-mode/v1'
+        )
+        super().__init__(api_key, base_url, **kwargs)
+
+    async def chat_completion(
+        self,
+        payload: Dict[str, Any],
+        on_delta: Optional[Callable[[str], None]] = None
+    ) -> Dict[str, Any]:
+        """
+        以流式方式调用 /chat/completions 并汇总结果
+
+        思考模式在兼容接口下需要流式输出，因此统一使用 SSE。
+
+        Args:
+            payload: 请求体
+            on_delta: 正文增量回调（可选）
+
+        Returns:
+            {"content": 正文, "reasoning_content": 思考内容, "usage": 用量字典}
+        """
+        payload = dict(payload)
+        payload['stream'] = True
+        payload['stream_options'] = {'include_usage': True}
+        tracker = DeltaTracker(on_delta)
+
+        async def handler(response: httpx.Response) -> Dict[str, Any]:
+            content_parts = []
+            reasoning_parts = []
+            usage: Dict[str, Any] = {}
+            async for line in response.aiter_lines():
+                if not line.startswith('data:'):
+                    continue
+                data = line[5:].strip()
+                if data == '[DONE]':
+                    break
+                try:
+                    chunk = json.loads(data)
+                except json.JSONDecodeError:
+                    continue
+                if chunk.get('usage'):
+                    usage = chunk['usage']
+                for choice in chunk.get('choices') or []:
+                    delta = choice.get('delta') or {}
+                    if delta.get('content'):
+                        content_parts.append(delta['content'])
+                        tracker(delta['content'])
+                    if delta.get('reasoning_content'):
+                        reasoning_parts.append(delta['reasoning_content'])
+            return {
+                'content': ''.join(content_parts),
+                'reasoning_content': ''.join(reasoning_parts) or None,
+                'usage': usage
+            }
+
+        return await self._request_with_retry(f"{self.base_url}/chat/completions", payload, handler, tracker)
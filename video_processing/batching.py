@@ -0,0 +1,155 @@
+"""分段合并：把相邻的多个分段拼接成一个视频，一次模型调用处理，再把事件归还到各自的分段
+
+每次模型调用都要支付固定开销（系统指令、任务规则、外貌表、最近事件、连接与思考），
+积压时把 K 个相邻分段合成一次调用可以明显减少总开销。拼接使用 ffmpeg concat 分离器直接拷贝
+码流（同一会话的分段编码参数相同，不重编码）。
+
+模型根据画面左上角的时间戳水印给出事件时间，因此合并后按事件的 start_time 落在哪个分段的
+时间范围内把事件（及紧急情况）归还到对应的 segment_id；落在所有分段之外时归到时间最近的分段。
+
+两种合并方式：
+- concat：拼接为一个视频（默认；要求各分段编码参数一致）
+- multi：不拼接，一次请求中按时间顺序放入多个视频内容项（VideoSegment.extra_video_paths）
+
+除积压降级的 L2 外，实时处理与会话重放也可以直接开启合并（VLM_BATCH_SEGMENTS > 1）：
+实时处理只合并已在队列中排队的分段，不会为凑满 K 段而等待，因此只在积压时生效。
+
+环境变量：
+- VLM_BATCH_SEGMENTS：每次调用最多合并的相邻分段数（默认 1，即不合并）
+- VLM_BATCH_MODE：合并方式 concat / multi（默认 concat）
+"""
+
+import os
+import subprocess
+import tempfile
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence
+
+
+BATCH_MODE_CONCAT = 'concat'
+BATCH_MODE_MULTI = 'multi'
+
+
+def get_batch_segments() -> int:
+    """读取 VLM_BATCH_SEGMENTS 环境变量（默认 1，不合并）"""
+    try:
+        return max(1, int(os.getenv('VLM_BATCH_SEGMENTS', '1')))
+    except ValueError:
+        return 1
+
+
+def get_batch_mode() -> str:
+    """读取 VLM_BATCH_MODE 环境变量（默认 concat，无法识别时同样按 concat）"""
+    mode = os.getenv('VLM_BATCH_MODE', BATCH_MODE_CONCAT).lower()
+    return mode if mode in (BATCH_MODE_CONCAT, BATCH_MODE_MULTI) else BATCH_MODE_CONCAT
+
+
+@dataclass
+class SegmentPart:
+    """合并前的一个分段"""
+    segment_id: str
+    video_path: str
+    start_time: float   # Unix 时间戳（秒）
+    end_time: float
+
+
+def concat_segments(video_paths: Sequence[str], output_path: Path, ffmpeg_bin: str = 'ffmpeg') -> Path:
+    """
+    拼接视频（码流拷贝，不重编码）
+
+    Args:
+        video_paths: 按时间顺序的分段视频路径
+        output_path: 输出路径
+        ffmpeg_bin: ffmpeg 可执行文件
+
+    Returns:
+        输出路径
+    """
+    output_path = Path(output_path)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    with tempfile.NamedTemporaryFile('w', suffix='.txt', delete=False, encoding='utf-8') as f:
+        for path in video_paths:
+            escaped = str(Path(path).resolve()).replace("'", "'\\''")
+            f.write(f"file '{escaped}'\n")
+        list_path = Path(f.name)
+    cmd = [
+        ffmpeg_bin, '-y', '-loglevel', 'error',
+        '-f', 'concat', '-safe', '0', '-i', str(list_path),
+        '-c', 'copy', '-movflags', '+faststart',
+        str(output_path)
+    ]
+    try:
+        result = subprocess.run(cmd, capture_output=True)
+        if result.returncode != 0 or not output_path.exists():
+            raise RuntimeError(
+                f"拼接分段失败: {result.stderr.decode('utf-8', errors='ignore')[-500:]}"
+            )
+    finally:
+        list_path.unlink(missing_ok=True)
+    return output_path
+
+
+def _naive(value: datetime) -> datetime:
+    """转换为本地时间并去掉时区信息（模型输出的时间可能带 Z 后缀）"""
+    return value.astimezone().replace(tzinfo=None) if value.tzinfo else value
+
+
+def attribute_segment_id(moment: datetime, parts: Sequence[SegmentPart]) -> str:
+    """
+    按水印时间确定所属分段
+
+    Args:
+        moment: 事件开始时间（模型按水印给出）
+        parts: 按时间顺序的分段
+
+    Returns:
+        segment_id
+    """
+    timestamp = _naive(moment).timestamp()
+    for part in parts:
+        if part.start_time <= timestamp < part.end_time:
+            return part.segment_id
+
+    def distance(part: SegmentPart) -> float:
+        if timestamp < part.start_time:
+            return part.start_time - timestamp
+        return timestamp - part.end_time
+
+    return min(parts, key=distance).segment_id
+
+
+def attribute_items(items: List[Any], parts: Sequence[SegmentPart]) -> Dict[str, int]:
+    """
+    把合并调用输出的事件或紧急情况（带 start_time 与 segment_id 属性）归还到各自的分段
+
+    Args:
+        items: EventLog / Emergency 列表（原地修改 segment_id）
+        parts: 按时间顺序的分段
+
+    Returns:
+        {segment_id: 数量}（包含数量为 0 的分段）
+    """
+    counts = {part.segment_id: 0 for part in parts}
+    for item in items:
+        item.segment_id = attribute_segment_id(item.start_time, parts)
+        counts[item.segment_id] += 1
+    return counts
+
+
+def tokens_per_video_minute(metrics: Dict[str, Any], video_seconds: float) -> Optional[float]:
+    """
+    每分钟视频消耗的 token 数（输入 + 输出），用于比较合并前后的成本
+
+    Args:
+        metrics: 模型调用统计（input_tokens / output_tokens）
+        video_seconds: 本次调用覆盖的视频时长（秒）
+
+    Returns:
+        token 数；没有 token 统计或时长为 0 时返回 None
+    """
+    tokens = int(metrics.get('input_tokens') or 0) + int(metrics.get('output_tokens') or 0)
+    if not tokens or video_seconds <= 0:
+        return None
+    return round(tokens / (video_seconds / 60.0), 1)
@@ -0,0 +1,359 @@
+"""级联处理器：先用便宜的 flash 模型（关闭思考）处理，必要时再升级到 plus 模型（思考）
+
+大部分分段内容简单（无人、熟悉的人做常规操作），flash 的输出已经足够；只有 flash 的输出
+显示出不确定信号时才把同一个分段交给更强的模型重新理解，并以其结果为准。升级信号：
+
+- parse_failed：flash 的响应无法解析为 JSON
+- new_person / merged_person：外貌更新中有新增或合并人物（人物身份判断出错代价高）
+- qr：分段中有二维码识别结果（需要把人物与用户 ID 关联）
+- emergency：flash 报告了紧急情况（由强模型确认）
+- many_events：事件数达到阈值（场景复杂）
+
+flash 阶段识别到的紧急情况立即经 on_emergency 以 "flash" 来源分发（PENDING，不等待升级；非流式模式下
+flash 调用返回后、升级前补发；没有 on_emergency 时并入升级后的结果），
+升级后强模型报告的紧急情况以默认来源分发，与 flash 的结果时间相交时由调用方的去重闸门
+（EmergencyGate）只写入一次；升级只用于确认，不延迟告警。每个分段的升级信号、是否升级、两阶段耗时以及相对“全部使用强模型”估算的
+节省记录在 ProcessingResult.metrics（cascade_* 字段），实时处理会写入 processing_stats.jsonl。
+
+使用方法：VIDEO_UNDERSTANDING_MODEL=cascade
+
+环境变量：
+- VLM_CASCADE_FAST_MODEL：第一阶段模型（默认 qwen3-vl-flash，始终关闭思考）
+- VLM_CASCADE_STRONG_MODEL：升级模型（默认 qwen3-vl-plus，思考按 ENABLE_THINKING）
+- VLM_CASCADE_ESCALATE_ON：启用的升级信号（逗号分隔，默认全部）
+- VLM_CASCADE_MANY_EVENTS：many_events 的事件数阈值（默认 4）
+- VLM_CASCADE_COST_RATIO：强模型相对 flash 的每 token 价格倍数，用于估算节省（默认 5）
+"""
+
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+
+from context.appearance_cache import AppearanceCache
+from context.context_service import apply_appearance_updates
+from storage.models import Emergency, VideoSegment, VideoUnderstandingResult
+from video_processing.engine import DynamicContextVideoEngine
+from video_processing.interface import VideoProcessor
+from video_processing.response_parser import ProcessingResult, load_json_object
+
+
+ESCALATION_SIGNALS = ('parse_failed', 'new_person', 'merged_person', 'qr', 'emergency', 'many_events')
+
+# flash 阶段分发紧急情况时的来源标记（on_emergency 的 source 关键字参数）
+FLASH_EMERGENCY_SOURCE = 'flash'
+
+
+def _env_number(name: str, default, cast):
+    try:
+        return cast(os.getenv(name, str(default)))
+    except ValueError:
+        return default
+
+
+@dataclass
+class EscalationPolicy:
+    """升级策略"""
+    signals: List[str] = field(default_factory=lambda: list(ESCALATION_SIGNALS))
+    many_events: int = 4
+    cost_ratio: float = 5.0    # 强模型每 token 价格 / flash 每 token 价格
+
+    @classmethod
+    def from_env(cls) -> 'EscalationPolicy':
+        raw = os.getenv('VLM_CASCADE_ESCALATE_ON')
+        signals = list(ESCALATION_SIGNALS)
+        if raw is not None:
+            signals = [s.strip() for s in raw.split(',') if s.strip() in ESCALATION_SIGNALS]
+        return cls(
+            signals=signals,
+            many_events=_env_number('VLM_CASCADE_MANY_EVENTS', 4, int),
+            cost_ratio=_env_number('VLM_CASCADE_COST_RATIO', 5.0, float),
+        )
+
+    def evaluate(self, segment: VideoSegment, result: ProcessingResult) -> List[str]:
+        """
+        检查 flash 结果中的不确定信号
+
+        Args:
+            segment: 视频分段
+            result: flash 阶段的处理结果
+
+        Returns:
+            命中且已启用的信号列表（为空表示不升级）
+        """
+        try:
+            parsed = isinstance(load_json_object(result.raw_response), dict)
+        except ValueError:
+            parsed = False
+        ops = {update.op for update in result.appearance_updates}
+        hits = {
+            'parse_failed': not parsed,
+            'new_person': 'add' in ops,
+            'merged_person': 'merge' in ops,
+            'qr': bool(segment.qr_results),
+            'emergency': bool(result.emergencies),
+            'many_events': len(result.events) >= self.many_events,
+        }
+        return [name for name in self.signals if hits[name]]
+
+
+def flash_emergency_callback(
+    on_emergency: Optional[Callable[..., None]]
+) -> Optional[Callable[[Emergency], None]]:
+    """flash 阶段的紧急情况回调：以 FLASH_EMERGENCY_SOURCE 来源调用 on_emergency"""
+    if on_emergency is None:
+        return None
+
+    def dispatch(emergency: Emergency) -> None:
+        on_emergency(emergency, source=FLASH_EMERGENCY_SOURCE)
+
+    return dispatch
+
+
+def _call_tokens(metrics: Dict[str, Any]) -> int:
+    return int(metrics.get('input_tokens') or 0) + int(metrics.get('output_tokens') or 0)
+
+
+@dataclass
+class CascadeStats:
+    """级联统计（处理器生命周期内累计）"""
+    segments: int = 0
+    escalated: int = 0
+    signal_counts: Dict[str, int] = field(default_factory=dict)
+    fast_latency: float = 0.0
+    strong_latency: float = 0.0
+    fast_tokens: int = 0
+    strong_tokens: int = 0
+    saved_latency: float = 0.0
+    saved_cost: float = 0.0    # 以 flash 每 token 价格为 1 的相对成本
+
+    def average_strong_latency(self) -> Optional[float]:
+        return self.strong_latency / self.escalated if self.escalated else None
+
+
+class CascadeProcessor(VideoProcessor):
+    """flash → plus 级联处理器（两个阶段共用外貌缓存与事件上下文）"""
+
+    def __init__(
+        self,
+        fast: DynamicContextVideoEngine,
+        strong: DynamicContextVideoEngine,
+        policy: Optional[EscalationPolicy] = None
+    ):
+        """
+        Args:
+            fast: 第一阶段处理器（应关闭思考）
+            strong: 升级处理器
+            policy: 升级策略，None 则读取环境变量
+        """
+        self.fast = fast
+        self.strong = strong
+        self.policy = policy or EscalationPolicy.from_env()
+        self.stats = CascadeStats()
+        self._stats_lock = threading.Lock()
+
+    @property
+    def appearance_cache(self) -> AppearanceCache:
+        return self.fast.appearance_cache
+
+    @property
+    def event_context(self):
+        return self.fast.event_context
+
+    @property
+    def model(self) -> str:
+        return f"{self.fast.model}>{self.strong.model}"
+
+    @property
+    def fps(self) -> float:
+        return self.fast.fps
+
+    @property
+    def _use_dynamic_context(self) -> bool:
+        return self.fast._use_dynamic_context
+
+    def _record(
+        self,
+        segment: VideoSegment,
+        fast_result: ProcessingResult,
+        fast_latency: float,
+        signals: List[str],
+        strong_result: Optional[ProcessingResult],
+        strong_latency: Optional[float]
+    ) -> Dict[str, Any]:
+        """累计统计并生成该分段的 cascade_* 指标"""
+        fast_tokens = _call_tokens(fast_result.metrics)
+        ratio = self.policy.cost_ratio
+        with self._stats_lock:
+            stats = self.stats
+            stats.segments += 1
+            stats.fast_latency += fast_latency
+            stats.fast_tokens += fast_tokens
+            for name in signals:
+                stats.signal_counts[name] = stats.signal_counts.get(name, 0) + 1
+
+            if strong_result is not None:
+                strong_tokens = _call_tokens(strong_result.metrics)
+                stats.escalated += 1
+                stats.strong_latency += strong_latency
+                stats.strong_tokens += strong_tokens
+                # 升级时多付出了 flash 的一次调用
+                saved_latency = -fast_latency
+                saved_cost = -float(fast_tokens)
+            else:
+                # 估算：若直接使用强模型，耗时取已观测的平均值，token 数按 flash 的用量
+                average = stats.average_strong_latency()
+                saved_latency = (average - fast_latency) if average is not None else 0.0
+                saved_cost = fast_tokens * (ratio - 1)
+            stats.saved_latency += saved_latency
+            stats.saved_cost += saved_cost
+
+            return {
+                'cascade_escalated': strong_result is not None,
+                'cascade_signals': signals,
+                'cascade_fast_model': self.fast.model,
+                'cascade_fast_latency': round(fast_latency, 3),
+                'cascade_strong_latency': round(strong_latency, 3) if strong_latency is not None else None,
+                'cascade_escalation_rate': round(stats.escalated / stats.segments, 4),
+                'cascade_saved_latency': round(saved_latency, 3),
+                'cascade_saved_latency_total': round(stats.saved_latency, 1),
+                'cascade_saved_cost': round(saved_cost, 1),
+                'cascade_saved_cost_total': round(stats.saved_cost, 1),
+            }
+
+    @staticmethod
+    def _dispatch_flash_emergencies(
+        fast_result: ProcessingResult,
+        on_emergency: Optional[Callable[..., None]]
+    ) -> None:
+        """非流式模式下 flash 阶段没有分发紧急情况：flash 调用返回后立即补发（不等待升级）"""
+        if on_emergency is None or fast_result.emergencies_dispatched or not fast_result.emergencies:
+            return
+        dispatch = flash_emergency_callback(on_emergency)
+        for emergency in fast_result.emergencies:
+            dispatch(emergency)
+        fast_result.emergencies_dispatched = True
+
+    @staticmethod
+    def _carry_flash_emergencies(fast_result: ProcessingResult, strong_result: ProcessingResult) -> None:
+        """未分发的 flash 紧急情况并入升级后的结果（与强模型报告的时间相交的不重复加入）"""
+        if fast_result.emergencies_dispatched:
+            return
+        for emergency in fast_result.emergencies:
+            if not any(
+                emergency.start_time <= other.end_time and other.start_time <= emergency.end_time
+                for other in strong_result.emergencies
+            ):
+                strong_result.emergencies.append(emergency)
+
+    def _merge(
+        self,
+        segment: VideoSegment,
+        fast_result: ProcessingResult,
+        fast_latency: float,
+        strong_result: Optional[ProcessingResult] = None,
+        strong_latency: Optional[float] = None,
+        signals: Optional[List[str]] = None
+    ) -> ProcessingResult:
+        signals = signals or []
+        cascade_metrics = self._record(segment, fast_result, fast_latency, signals, strong_result, strong_latency)
+        result = strong_result or fast_result
+        result.metrics = {**result.metrics, **cascade_metrics}
+        if strong_result is not None:
+            self._carry_flash_emergencies(fast_result, strong_result)
+        if strong_result is not None:
+            print(
+                f"[Cascade] {segment.segment_id} 升级到 {self.strong.model}（{', '.join(signals)}），"
+                f"升级率 {cascade_metrics['cascade_escalation_rate']:.0%}"
+            )
+        return result
+
+    def process_segment_with_context(
+        self,
+        segment: VideoSegment,
+        appearance_cache: AppearanceCache,
+        recent_events: List[Dict[str, Any]],
+        max_event_id: int,
+        on_emergency: Optional[Callable[..., None]] = None
+    ) -> ProcessingResult:
+        """
+        使用动态上下文处理视频分段（flash 不确定时升级，参数同 DynamicContextVideoEngine）
+
+        on_emergency 需接受 source 关键字参数（flash 阶段以 FLASH_EMERGENCY_SOURCE 调用）。
+        """
+        start = time.time()
+        fast_result = self.fast.process_segment_with_context(
+            segment, appearance_cache, recent_events, max_event_id,
+            on_emergency=flash_emergency_callback(on_emergency)
+        )
+        fast_latency = time.time() - start
+        self._dispatch_flash_emergencies(fast_result, on_emergency)
+        signals = self.policy.evaluate(segment, fast_result)
+        if not signals:
+            return self._merge(segment, fast_result, fast_latency)
+
+        start = time.time()
+        strong_result = self.strong.process_segment_with_context(
+            segment, appearance_cache, recent_events, max_event_id, on_emergency=on_emergency
+        )
+        return self._merge(segment, fast_result, fast_latency, strong_result, time.time() - start, signals)
+
+    async def process_segment_with_context_async(
+        self,
+        segment: VideoSegment,
+        appearance_cache: AppearanceCache,
+        recent_events: List[Dict[str, Any]],
+        max_event_id: int,
+        on_emergency: Optional[Callable[..., None]] = None
+    ) -> ProcessingResult:
+        """使用动态上下文处理视频分段（异步）"""
+        start = time.time()
+        fast_result = await self.fast.process_segment_with_context_async(
+            segment, appearance_cache, recent_events, max_event_id,
+            on_emergency=flash_emergency_callback(on_emergency)
+        )
+        fast_latency = time.time() - start
+        self._dispatch_flash_emergencies(fast_result, on_emergency)
+        signals = self.policy.evaluate(segment, fast_result)
+        if not signals:
+            return self._merge(segment, fast_result, fast_latency)
+
+        start = time.time()
+        strong_result = await self.strong.process_segment_with_context_async(
+            segment, appearance_cache, recent_events, max_event_id, on_emergency=on_emergency
+        )
+        return self._merge(segment, fast_result, fast_latency, strong_result, time.time() - start, signals)
+
+    def process_segment(self, segment: VideoSegment) -> VideoUnderstandingResult:
+        """
+        处理视频分段（使用处理器自带的外貌缓存与事件上下文）
+
+        未使用动态上下文时按旧版提示词处理，只检查 qr / many_events / parse_failed（无事件）信号。
+        """
+        if not self._use_dynamic_context:
+            start = time.time()
+            fast = self.fast.process_segment(segment)
+            fast_result = ProcessingResult(events=fast.events, appearance_updates=[], raw_response=fast.remark)
+            fast_latency = time.time() - start
+            # 旧版响应格式不同，解析失败以“没有事件”判断
+            signals = [name for name in self.policy.evaluate(segment, fast_result) if name != 'parse_failed']
+            if not fast.events and 'parse_failed' in self.policy.signals:
+                signals.insert(0, 'parse_failed')
+            if not signals:
+                self._merge(segment, fast_result, fast_latency)
+                return fast
+            start = time.time()
+            strong = self.strong.process_segment(segment)
+            strong_result = ProcessingResult(events=strong.events, appearance_updates=[], raw_response=strong.remark)
+            self._merge(segment, fast_result, fast_latency, strong_result, time.time() - start, signals)
+            return strong
+
+        recent_events, max_event_id = self.fast.own_context(segment)
+        result = self.process_segment_with_context(segment, self.appearance_cache, recent_events, max_event_id)
+        apply_appearance_updates(self.appearance_cache, result.appearance_updates)
+        return VideoUnderstandingResult(
+            segment_id=segment.segment_id,
+            remark=result.raw_response,
+            events=result.events
+        )
@@ -0,0 +1,266 @@
+"""紧急情况快速检测：在完整的视频理解调用之外，本地检测疑似明火
+
+完整的视频理解调用通常需要一分钟以上，紧急情况的告警延迟等于整段处理延迟。
+FlameDetector 用 ffmpeg 以低帧率、低分辨率抽帧（rgb24 原始像素），按火焰颜色规则
+（R 通道高、R ≥ G > B、饱和度随亮度变化）统计火焰色像素，再要求火焰色区域在相邻帧间
+有足够的形状变化（闪烁），以排除红色灯、红色物体等静止目标。整段检测通常在一两秒内完成，
+与视频理解调用并行运行。
+
+EmergencyGate 只在不同来源之间去重：快速检测的结果与模型输出的紧急情况时间范围相交
+（允许 EMERGENCY_DEDUP_WINDOW 秒的误差）时只写入一次。同一来源的紧急情况互不去重，
+模型在同一分段或相近时间报告的多个紧急情况都会写入。
+
+环境变量：
+- FAST_EMERGENCY_DETECTION：是否启用快速检测（默认 true）
+- FAST_EMERGENCY_SAMPLE_FPS：抽帧率（默认 2）
+- EMERGENCY_DEDUP_WINDOW：不同来源去重时允许的时间误差（秒，默认 10）
+"""
+
+import os
+import subprocess
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Callable, List, Optional, Tuple
+
+from storage.models import Emergency
+
+
+# 抽帧分辨率（像素数越少越快；明火在 64x48 下仍占若干像素）
+FRAME_WIDTH = 64
+FRAME_HEIGHT = 48
+
+# 火焰颜色规则阈值（Chen et al. 2004 的 RGB/饱和度规则）
+RED_THRESHOLD = 180          # R 通道下限
+SATURATION_THRESHOLD = 0.2   # 饱和度阈值（在 R = RED_THRESHOLD 处）
+MIN_RED_BLUE_GAP = 60        # R - B 下限，排除偏白的高光
+
+# 判定阈值
+MIN_FIRE_RATIO = 0.003       # 单帧火焰色像素占比下限（64x48 下约 9 个像素）
+MIN_FIRE_FRAMES = 3          # 至少多少帧出现火焰色区域
+MIN_FLICKER = 0.15           # 相邻火焰帧之间区域变化比例（XOR / 并集）的均值下限
+
+
+def is_fast_detection_enabled() -> bool:
+    """读取 FAST_EMERGENCY_DETECTION 环境变量（默认开启）"""
+    return os.getenv('FAST_EMERGENCY_DETECTION', 'true').lower() in ('true', '1', 'yes', 'on')
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, str(default)))
+    except ValueError:
+        return default
+
+
+@dataclass
+class FlameDetection:
+    """快速检测结果"""
+    detected: bool
+    frames: int                   # 抽取的帧数
+    fire_frames: int              # 出现火焰色区域的帧数
+    max_fire_ratio: float         # 单帧火焰色像素占比最大值
+    flicker: float                # 相邻火焰帧区域变化比例均值
+    first_offset: float = 0.0     # 首个火焰帧相对分段开始的秒数
+    last_offset: float = 0.0      # 最后一个火焰帧相对分段开始的秒数
+    elapsed: float = 0.0          # 检测耗时（秒）
+
+
+def fire_mask(frame: bytes) -> bytearray:
+    """
+    计算单帧的火焰色像素掩码
+
+    Args:
+        frame: rgb24 原始像素
+
+    Returns:
+        每像素一个字节（1 表示火焰色）
+    """
+    mask = bytearray(len(frame) // 3)
+    # 饱和度规则 S >= (255 - R) * S_T / R_T，其中 S = (R - B) / R（R ≥ G > B 时 R 为最大值、B 为最小值）
+    # 两边同乘 R * R_T 化为整数比较
+    scale = SATURATION_THRESHOLD / RED_THRESHOLD
+    for i, (r, g, b) in enumerate(zip(frame[0::3], frame[1::3], frame[2::3])):
+        if r > RED_THRESHOLD and r >= g > b and r - b > MIN_RED_BLUE_GAP:
+            if (r - b) >= (255 - r) * scale * r:
+                mask[i] = 1
+    return mask
+
+
+def _mask_change(previous: bytearray, current: bytearray) -> float:
+    """相邻两帧火焰区域变化比例：XOR / 并集"""
+    changed = 0
+    union = 0
+    for a, b in zip(previous, current):
+        if a or b:
+            union += 1
+            if a != b:
+                changed += 1
+    return changed / union if union else 0.0
+
+
+class FlameDetector:
+    """基于颜色与闪烁的明火快速检测器"""
+
+    def __init__(self, sample_fps: Optional[float] = None, ffmpeg_bin: Optional[str] = None):
+        """
+        Args:
+            sample_fps: 抽帧率，None 则读取 FAST_EMERGENCY_SAMPLE_FPS（默认 2）
+            ffmpeg_bin: ffmpeg 可执行文件，None 则读取 FFMPEG_BIN（默认 ffmpeg）
+        """
+        self.sample_fps = sample_fps or _env_float('FAST_EMERGENCY_SAMPLE_FPS', 2.0)
+        self.ffmpeg_bin = ffmpeg_bin or os.environ.get("FFMPEG_BIN", "ffmpeg")
+
+    def _read_frames(self, video_path: str) -> List[bytes]:
+        """用 ffmpeg 抽取低分辨率 rgb24 帧"""
+        cmd = [
+            self.ffmpeg_bin,
+            "-v", "error",
+            "-i", video_path,
+            "-vf", f"fps={self.sample_fps},scale={FRAME_WIDTH}:{FRAME_HEIGHT}",
+            "-f", "rawvideo",
+            "-pix_fmt", "rgb24",
+            "-",
+        ]
+        result = subprocess.run(cmd, capture_output=True)
+        if result.returncode != 0:
+            raise RuntimeError(result.stderr.decode('utf-8', errors='replace').strip())
+
+        frame_size = FRAME_WIDTH * FRAME_HEIGHT * 3
+        data = result.stdout
+        return [data[i:i + frame_size] for i in range(0, len(data) - frame_size + 1, frame_size)]
+
+    def analyze(self, video_path: str) -> FlameDetection:
+        """
+        分析视频是否存在疑似明火
+
+        Args:
+            video_path: 视频路径
+
+        Returns:
+            FlameDetection
+        """
+        start = time.time()
+        frames = self._read_frames(video_path)
+        pixel_count = FRAME_WIDTH * FRAME_HEIGHT
+
+        fire_frames: List[Tuple[int, bytearray]] = []
+        max_ratio = 0.0
+        for index, frame in enumerate(frames):
+            mask = fire_mask(frame)
+            ratio = sum(mask) / pixel_count
+            max_ratio = max(max_ratio, ratio)
+            if ratio >= MIN_FIRE_RATIO:
+                fire_frames.append((index, mask))
+
+        changes = [
+            _mask_change(fire_frames[i - 1][1], fire_frames[i][1])
+            for i in range(1, len(fire_frames))
+        ]
+        flicker = sum(changes) / len(changes) if changes else 0.0
+
+        detection = FlameDetection(
+            detected=len(fire_frames) >= MIN_FIRE_FRAMES and flicker >= MIN_FLICKER,
+            frames=len(frames),
+            fire_frames=len(fire_frames),
+            max_fire_ratio=max_ratio,
+            flicker=flicker,
+            elapsed=time.time() - start
+        )
+        if fire_frames:
+            detection.first_offset = fire_frames[0][0] / self.sample_fps
+            detection.last_offset = (fire_frames[-1][0] + 1) / self.sample_fps
+        return detection
+
+    def detect(self, video_path: str, segment_id: str, base_time: datetime) -> Optional[Emergency]:
+        """
+        检测分段中的疑似明火
+
+        Args:
+            video_path: 视频路径
+            segment_id: 分段ID
+            base_time: 分段开始时间
+
+        Returns:
+            Emergency（未检测到则返回 None）
+        """
+        detection = self.analyze(video_path)
+        if not detection.detected:
+            return None
+
+        return Emergency(
+            emergency_id=f"emg_{uuid.uuid4().hex[:8]}",
+            description=(
+                f"快速检测：疑似明火（火焰色像素占比 {detection.max_fire_ratio:.1%}，"
+                f"闪烁度 {detection.flicker:.2f}），请尽快确认"
+            ),
+            start_time=base_time + timedelta(seconds=detection.first_offset),
+            end_time=base_time + timedelta(seconds=detection.last_offset),
+            segment_id=segment_id,
+            status="PENDING"
+        )
+
+
+def _naive(value: datetime) -> datetime:
+    """去掉时区信息（模型输出的时间可能带 Z 后缀）"""
+    return value.replace(tzinfo=None) if value.tzinfo else value
+
+
+class EmergencyGate:
+    """紧急情况写入去重（线程安全，快速检测与视频理解模型共用）"""
+
+    def __init__(self, writer: Callable[[Emergency], None], window_seconds: Optional[float] = None):
+        """
+        Args:
+            writer: 实际写入函数（如 SimpleLogWriter.write_emergency_log）
+            window_seconds: 时间相交判定的误差，None 则读取 EMERGENCY_DEDUP_WINDOW（默认 10）
+        """
+        self.writer = writer
+        self.window = timedelta(seconds=(
+            window_seconds if window_seconds is not None else _env_float('EMERGENCY_DEDUP_WINDOW', 10.0)
+        ))
+        self._lock = threading.Lock()
+        self._written: List[Tuple[Emergency, str]] = []
+
+    def _duplicate_of(self, emergency: Emergency, source: str) -> Optional[Emergency]:
+        for existing, existing_source in self._written:
+            # 同一来源的紧急情况是各自独立的报告，不去重
+            if existing_source == source:
+                continue
+            if (_naive(emergency.start_time) <= _naive(existing.end_time) + self.window
+                    and _naive(existing.start_time) <= _naive(emergency.end_time) + self.window):
+                return existing
+        return None
+
+    def submit(self, emergency: Emergency, source: str) -> bool:
+        """
+        写入紧急情况（与其他来源已写入的重复时跳过）
+
+        Args:
+            emergency: 紧急情况
+            source: 来源标记（如 "fast" / "vlm"），只在不同来源之间去重
+
+        Returns:
+            是否实际写入
+        """
+        with self._lock:
+            duplicate = self._duplicate_of(emergency, source)
+            if duplicate is None:
+                self._written.append((emergency, source))
+                # 只保留最近的记录，时间窗口外的不会再命中
+                if len(self._written) > 100:
+                    self._written = self._written[-100:]
+        if duplicate is not None:
+            print(f"[Realtime] 紧急情况（{source}）与已写入的 {duplicate.emergency_id} 重复，已跳过")
+            return False
+
+        try:
+            self.writer(emergency)
+        except Exception:
+            with self._lock:
+                self._written.remove((emergency, source))
+            raise
+        print(f"[Realtime] 紧急情况已写入（{source}）: {emergency.emergency_id} {emergency.description}")
+        return True
@@ -0,0 +1,381 @@
+"""视频理解处理引擎：各模型共用的动态上下文处理流程
+
+DynamicContextVideoEngine 负责提示词构建、思考日志、响应解析与外貌更新，
+模型调用委托给 VLMTransport（见 transports.py），响应解析见 response_parser.py。
+动态上下文调用默认流式输出（VLM_STREAMING），紧急情况在响应生成过程中即通过
+on_emergency 回调分发（见 stream_parser.py）。
+设置 VLM_RESPONSE_CACHE=true 时传输层外包一层磁盘响应缓存（见 response_cache.py）。
+各模型的处理器（Qwen3VLFlashProcessor 等）只是指定传输层与默认参数的子类。
+"""
+
+import json
+import os
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple, Type
+
+from dotenv import load_dotenv
+
+from context.appearance_cache import AppearanceCache
+from context.context_service import apply_appearance_updates
+from context.event_context import EventContext
+from context.prompt_builder import PromptBuilder, PromptLayout
+from storage.models import VideoSegment, VideoUnderstandingResult, Emergency
+from utils.segment_time_parser import extract_date_from_segment_id
+from video_processing.interface import VideoProcessor
+from video_processing.response_parser import (
+    AppearanceUpdate,
+    ProcessingResult,
+    parse_dynamic_response,
+    parse_legacy_response,
+)
+from video_processing.response_cache import CachingTransport, get_shared_response_cache, is_response_cache_enabled
+from video_processing.stream_parser import SegmentStreamDispatcher
+from video_processing.transports import (
+    DashScopeTransport,
+    GenerationConfig,
+    TransportResponse,
+    VLMRequest,
+    VLMTransport,
+)
+
+# 加载环境变量
+load_dotenv()
+
+
+THINKING_LOG_PATH = Path("logs_debug/event_logs_thinking.jsonl")
+# 多个分段并发处理时避免思考日志的行交错
+_thinking_log_lock = threading.Lock()
+
+
+def build_legacy_prompt(segment: VideoSegment) -> str:
+    """构建旧版提示词（兼容模式）"""
+    duration = segment.end_time - segment.start_time
+    return f"""请分析这段实验室视频（时长约 {duration:.1f} 秒），并记录所有观察到的事件。
+
+**任务要求**：
+1. 识别视频中的人物动作（使用了什么设备或工具或化学品）、设备运转状态，和相应的时间范围，记录为事件。
+2. 关于时间
+    - 根据视频画面左上角的时间戳水印 "yyyy-MM-dd Time: HH:MM:SS" 来判断时间。
+    - 如果时间戳水印缺少日期，则使用2025-12-22作为日期。
+3. 关于事件划分
+    - 如果有多个人同时出现，将每个人的动作分开记录为事件。
+    - 一个设备，如果有显示数值且似乎与人物动作无关，要单独记录为一个事件。
+    - 没有显示数值且不被操作的设备，不记录为事件。
+    - 不同人物或设备的事件的时间可以交叠，但同一人物或设备的事件时间不能交叠。
+    - 同一个人的一些连续的人物事件，如果涉及同一个设备或没有涉及设备，要合并为一个事件。
+4. 关于内容描述
+    - 如果无法判断是什么设备或工具或化学品，就描述它的外观特征，如颜色、形状、大小等。
+    - 描述设备仪表或设备显示屏上的数值及其变化，如果不清晰，则不描述具体数值。
+    - 不描述手机和笔记本电脑显示屏上的内容。
+
+**输出格式**：必须以 JSON 格式输出，包含以下字段：
+- event_id: 唯一事件 ID（格式：evt_001, evt_002...）
+- start_time: 事件开始时间（ISO 格式，如 "2025-12-17T10:00:00"）
+- end_time: 事件结束时间（ISO 格式）
+- event_type: 事件类型（字符串，如"person"、"equipment-only"）
+- structured: 结构化数据对象
+  - person: "person"事件中的对象人物
+    - upper_clothing_color: 上衣颜色（字符串，可选，如"白色"、"蓝色"等，敏感信息，不可在其他字段中提及）
+    - hair_color: 头发颜色（字符串，可选，敏感信息，不可在其他字段中提及）
+    - action: 人物动作的简短描述（字符串，如"走进画面"、"操作设备"、"坐下"、"看手机"等）
+  - equipment: "person"事件中对象人物使用的设备，或"equipment-only"事件中对象设备（字符串，可选，如"离心机"、"笔记本电脑"等）
+  - tool: 对象人物使用的工具（字符串，可选，如"钳子"、"螺丝刀"、"镊子"等）
+  - chemicals: 对象人物使用的化学品（字符串，可选，如"氧化铅"、"白色粉末"、"无水乙醇"、"无色液体"等）
+- raw_text: 事件的自然语言描述，不提及具体时间和人物上衣颜色、头发颜色（字符串）
+
+**输出示例**：
+{{
+  "events": [
+    {{
+      "event_id": "evt_001",
+      "start_time": "2025-12-17T10:00:00",
+      "end_time": "2025-12-17T10:00:20",
+      "event_type": "person",
+      "structured": {{
+        "person": {{
+          "upper_clothing_color": "白色",
+          "hair_color": "黑色",
+          "action": "看手机"
+        }},
+        "equipment": "手机"
+      }},
+      "raw_text": "对象人物坐在一张黑色椅子上，面向离心机，正在看手机屏幕。"
+    }}
+  ]
+}}
+
+**数据安全要求**：
+- `structured.person.upper_clothing_color`（上衣颜色）和 `structured.person.hair_color`（头发颜色）字段在后续流程中会被加密存储
+- **严禁**将这些敏感信息（上衣颜色、头发颜色）写入非加密字段，尤其是`raw_text`字段，否则会导致敏感信息泄露。
+"""
+
+
+class DynamicContextVideoEngine(VideoProcessor):
+    """视频理解处理引擎（动态上下文版本）"""
+    
+    # 子类覆盖：传输层、默认模型名、VL_HIGH_RESOLUTION_IMAGES 的默认值
+    transport_class: Type[VLMTransport] = DashScopeTransport
+    default_model = 'qwen3-vl-flash'
+    default_high_resolution = False
+    
+    def __init__(
+        self,
+        api_key: str = None,
+        model: str = None,
+        fps: Optional[float] = None,
+        enable_thinking: bool = None,
+        thinking_budget: int = None,
+        appearance_cache: Optional[AppearanceCache] = None,
+        event_context: Optional[EventContext] = None,
+        max_recent_events: int = 20,
+        transport: Optional[VLMTransport] = None
+    ):
+        """
+        初始化处理器
+        
+        Args:
+            api_key: API Key，如果为 None 则从传输层对应的环境变量读取（DASHSCOPE_API_KEY / OPENROUTER_API_KEY）
+            model: 模型名称，如果为 None 则从环境变量 VIDEO_UNDERSTANDING_MODEL 读取，默认 default_model
+            fps: 视频抽帧率，表示每隔 1/fps 秒抽取一帧，如果为 None 则从环境变量 VIDEO_FPS 读取，默认 1.0
+            enable_thinking: 是否启用思考，如果为 None 则从环境变量 ENABLE_THINKING 读取，默认 True
+            thinking_budget: 思考预算，如果为 None 则从环境变量 THINKING_BUDGET 读取，默认 8192 tokens
+            appearance_cache: 人物外貌缓存，如果为 None 则创建默认实例
+            event_context: 事件上下文，如果为 None 则不使用动态上下文
+            max_recent_events: 最大最近事件数，默认 20
+            transport: 自定义传输层，提供时忽略 api_key/model/fps/思考参数
+        """
+        if transport is None:
+            api_key_env = self.transport_class.api_key_env
+            api_key = api_key or os.getenv(api_key_env)
+            if not api_key:
+                raise ValueError(f"未提供 {api_key_env}，请在环境变量或参数中设置")
+            
+            # 从环境变量读取模型配置，如果没有则使用默认值
+            model = model or os.getenv('VIDEO_UNDERSTANDING_MODEL', self.default_model)
+            config = GenerationConfig.from_env(
+                fps=fps,
+                enable_thinking=enable_thinking,
+                thinking_budget=thinking_budget,
+                default_high_resolution=self.default_high_resolution
+            )
+            transport = self.transport_class(api_key, model, config)
+        if is_response_cache_enabled() and not isinstance(transport, CachingTransport):
+            transport = CachingTransport(transport, get_shared_response_cache())
+        self.transport = transport
+        
+        # 动态上下文相关
+        self.appearance_cache = appearance_cache or AppearanceCache()
+        self.event_context = event_context
+        self.max_recent_events = max_recent_events
+        self.prompt_builder = PromptBuilder(max_recent_events)
+        
+        # 是否使用动态上下文（通过检查是否有 event_context 来判断）
+        self._use_dynamic_context = event_context is not None
+    
+    @property
+    def model(self) -> str:
+        return self.transport.model
+    
+    @property
+    def config(self) -> GenerationConfig:
+        return self.transport.config
+    
+    @property
+    def fps(self) -> float:
+        return self.transport.config.fps
+    
+    def _write_thinking_log(self, segment_id: str, thinking: Optional[str]) -> None:
+        """将模型思考内容写入日志文件"""
+        THINKING_LOG_PATH.parent.mkdir(parents=True, exist_ok=True)
+        
+        log_entry = {
+            "segment_id": segment_id,
+            "thinking": thinking or "未获取到思考内容",
+            "timestamp": datetime.now().isoformat()
+        }
+        
+        line = json.dumps(log_entry, ensure_ascii=False) + "\n"
+        with _thinking_log_lock:
+            with open(THINKING_LOG_PATH, "a", encoding="utf-8") as f:
+                f.write(line)
+    
+    def process_segment(self, segment: VideoSegment) -> VideoUnderstandingResult:
+        """
+        处理视频分段（使用处理器自带的外貌缓存与事件上下文）
+        
+        Args:
+            segment: 视频分段
+        
+        Returns:
+            视频理解结果
+        """
+        if self._use_dynamic_context:
+            request = VLMRequest(
+                video_path=segment.video_path,
+                prompt=self._build_dynamic_prompt(segment),
+                system_instruction=self.prompt_builder.build_system_instruction(),
+                extra_video_paths=segment.extra_video_paths
+            )
+        else:
+            request = VLMRequest(
+                video_path=segment.video_path,
+                prompt=build_legacy_prompt(segment),
+                extra_video_paths=segment.extra_video_paths
+            )
+        
+        try:
+            response = self.transport.call(request)
+            self._write_thinking_log(segment.segment_id, response.thinking)
+            
+            if self._use_dynamic_context:
+                processing_result = parse_dynamic_response(response.text, segment)
+                self._apply_appearance_updates(processing_result.appearance_updates)
+                events = processing_result.events
+            else:
+                events = parse_legacy_response(response.text, segment)
+            
+            return VideoUnderstandingResult(
+                segment_id=segment.segment_id,
+                remark=response.text,
+                events=events
+            )
+        except Exception as e:
+            raise RuntimeError(f"视频理解 API 调用失败: {e}")
+    
+    def process_segment_with_context(
+        self,
+        segment: VideoSegment,
+        appearance_cache: AppearanceCache,
+        recent_events: List[Dict[str, Any]],
+        max_event_id: int,
+        on_emergency: Optional[Callable[[Emergency], None]] = None
+    ) -> ProcessingResult:
+        """
+        使用动态上下文处理视频分段
+        
+        Args:
+            segment: 视频分段
+            appearance_cache: 人物外貌缓存
+            recent_events: 最近事件列表
+            max_event_id: 当前最大事件编号数字
+            on_emergency: 紧急情况回调（流式模式下在识别到时立即调用，每个紧急情况只调用一次）
+        
+        Returns:
+            处理结果（包含事件、外貌更新和紧急情况）
+        """
+        layout = self._build_layout(segment, appearance_cache, recent_events, max_event_id)
+        request, dispatcher = self._build_request(segment, layout, on_emergency)
+        try:
+            response = self.transport.call(request)
+            return self._finish(segment, layout, response, dispatcher)
+        except Exception as e:
+            raise RuntimeError(f"视频理解 API 调用失败: {e}")
+    
+    async def process_segment_with_context_async(
+        self,
+        segment: VideoSegment,
+        appearance_cache: AppearanceCache,
+        recent_events: List[Dict[str, Any]],
+        max_event_id: int,
+        on_emergency: Optional[Callable[[Emergency], None]] = None
+    ) -> ProcessingResult:
+        """使用动态上下文处理视频分段（异步，由传输层决定是否走异步 HTTP）"""
+        layout = self._build_layout(segment, appearance_cache, recent_events, max_event_id)
+        request, dispatcher = self._build_request(segment, layout, on_emergency)
+        try:
+            response = await self.transport.acall(request)
+            return self._finish(segment, layout, response, dispatcher)
+        except Exception as e:
+            raise RuntimeError(f"视频理解 API 调用失败: {e}")
+    
+    def _build_layout(
+        self,
+        segment: VideoSegment,
+        appearance_cache: AppearanceCache,
+        recent_events: List[Dict[str, Any]],
+        max_event_id: int
+    ) -> PromptLayout:
+        """构建分层提示词（静态前缀 → 外貌表 → 视频 → 易变尾部）"""
+        return self.prompt_builder.build_prompt_layout(
+            segment=segment,
+            qr_results=segment.qr_results,
+            recent_events=recent_events,
+            appearance_cache=appearance_cache,
+            max_event_id=max_event_id,
+            max_person_id=appearance_cache.get_max_person_id_number()
+        )
+    
+    def _build_request(
+        self,
+        segment: VideoSegment,
+        layout: PromptLayout,
+        on_emergency: Optional[Callable[[Emergency], None]]
+    ):
+        """构建调用请求；流式模式下附带增量解析分发器"""
+        dispatcher = None
+        if self.config.streaming:
+            dispatcher = SegmentStreamDispatcher(segment, on_emergency)
+        request = VLMRequest(
+            video_path=segment.video_path,
+            layout=layout,
+            on_text=dispatcher.feed if dispatcher else None,
+            extra_video_paths=segment.extra_video_paths
+        )
+        return request, dispatcher
+    
+    def _finish(
+        self,
+        segment: VideoSegment,
+        layout: PromptLayout,
+        response: TransportResponse,
+        dispatcher: Optional[SegmentStreamDispatcher] = None
+    ) -> ProcessingResult:
+        """记录思考过程、解析响应并附加调用统计"""
+        self._write_thinking_log(segment.segment_id, response.thinking)
+        processing_result = parse_dynamic_response(response.text, segment)
+        processing_result.metrics = {**response.metrics, 'prompt_budget': layout.budget}
+        if dispatcher is not None:
+            dispatcher.finalize(processing_result)
+            processing_result.metrics.update(dispatcher.metrics())
+        return processing_result
+    
+    def _build_dynamic_prompt(self, segment: VideoSegment) -> str:
+        """使用处理器自带的上下文构建提示词"""
+        recent_events, max_event_id = self.own_context(segment)
+        return self.prompt_builder.build_dynamic_prompt(
+            segment=segment,
+            qr_results=segment.qr_results,
+            recent_events=recent_events,
+            appearance_cache=self.appearance_cache,
+            max_event_id=max_event_id,
+            max_person_id=self.appearance_cache.get_max_person_id_number()
+        )
+    
+    def own_context(self, segment: VideoSegment) -> Tuple[List[Dict[str, Any]], int]:
+        """
+        处理器自带事件上下文中的最近事件与最大事件编号（按分段的视频日期）
+        
+        Returns:
+            (最近事件列表, 最大事件编号数字)；未使用动态上下文时为 ([], 0)
+        """
+        # 从 segment_id 提取视频日期
+        segment_date = extract_date_from_segment_id(segment.segment_id)
+        
+        # 获取最近事件（使用视频日期而非今天）
+        recent_events = []
+        max_event_id = 0
+        if self.event_context:
+            if segment_date:
+                recent_events = self.event_context.get_recent_events(self.max_recent_events, date=segment_date)
+                max_event_id = self.event_context.get_max_event_id_number(date=segment_date)
+            else:
+                # 如果无法解析日期，回退到使用今天
+                recent_events = self.event_context.get_recent_events(self.max_recent_events)
+                max_event_id = self.event_context.get_max_event_id_number()
+        return recent_events, max_event_id
+    
+    def _apply_appearance_updates(self, updates: List[AppearanceUpdate]) -> None:
+        """应用外貌更新到处理器自带的缓存"""
+        apply_appearance_updates(self.appearance_cache, updates)
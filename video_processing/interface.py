@@ -1,6 +1,9 @@
 """视频处理接口定义"""
 
+import asyncio
+import functools
 from abc import ABC, abstractmethod
+from typing import Any, Callable, Dict, List, Optional
 
 from storage.models import VideoSegment, VideoUnderstandingResult
 
@@ -20,4 +23,40 @@ class VideoProcessor(ABC):
             视频理解结果
         """
         pass
-
+    
+    async def process_segment_with_context_async(
+        self,
+        segment: VideoSegment,
+        appearance_cache: Any,
+        recent_events: List[Dict[str, Any]],
+        max_event_id: int,
+        on_emergency: Optional[Callable[[Any], None]] = None
+    ) -> Any:
+        """
+        使用动态上下文处理视频分段（异步）
+        
+        默认实现在线程池中调用同步的 process_segment_with_context；
+        支持异步 HTTP 的处理器会覆盖此方法，直接在事件循环中发起请求。
+        
+        Args:
+            segment: 视频分段
+            appearance_cache: 人物外貌缓存
+            recent_events: 最近事件列表
+            max_event_id: 当前最大事件编号数字
+            on_emergency: 紧急情况回调（支持流式输出的处理器会在识别到时立即调用）
+        
+        Returns:
+            处理结果（包含事件和外貌更新）
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            None,
+            functools.partial(
+                self.process_segment_with_context,
+                segment,
+                appearance_cache,
+                recent_events,
+                max_event_id,
+                on_emergency=on_emergency
+            )
+        )
@@ -0,0 +1,196 @@
+"""离线模拟处理器：不调用任何模型服务，按提示词生成合法的动态上下文响应
+
+配合 streaming_server/load_generator.py，在没有手机、没有 API Key 的环境中压测完整的实时处理链路
+（处理队列、上下文快照与提交、编号重排、事件写入、统计）。模拟传输层像模型一样只读取请求内容：
+
+- 分段时间：从视频文件名（segment_id，YYYYMMDD_HHMMSS_XX）解析
+- 编号起始值：从提示词的“编号起始值”一节读取
+- 二维码：人物外貌表中已关联该用户ID的人物直接引用，否则新建带 user_id 的人物，并记为 person 事件
+- 每个视频生成一个事件（无二维码时按 MOCK_VLM_PERSON_RATE 随机生成 person 或 equipment-only 事件）
+
+同一视频路径的输出内容是确定的（随机数以路径为种子）。调用耗时与 token 用量按环境变量模拟，
+可按比例注入调用失败（抛出异常，与真实 API 错误走同一条重试路径）。
+
+使用方法：VIDEO_UNDERSTANDING_MODEL=mock
+
+环境变量：
+- MOCK_VLM_LATENCY：每次调用的平均耗时（秒，默认 2.0）
+- MOCK_VLM_JITTER：耗时的随机抖动比例（默认 0.3）
+- MOCK_VLM_FAILURE_RATE：调用失败的比例（默认 0）
+- MOCK_VLM_PERSON_RATE：无二维码时生成 person 事件的比例（默认 0.5）
+- MOCK_VLM_EMERGENCY_RATE：报告紧急情况的比例（默认 0）
+"""
+
+import asyncio
+import json
+import os
+import random
+import re
+import time
+import zlib
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+from context.token_budget import estimate_tokens
+from utils.segment_time_parser import parse_segment_times
+from video_processing.engine import DynamicContextVideoEngine
+from video_processing.prompt_cache import build_call_metrics
+from video_processing.transports import GenerationConfig, TransportResponse, VLMRequest, VLMTransport
+
+
+_NEXT_EVENT_RE = re.compile(r'新事件编号从 evt_(\d+) 开始')
+_NEXT_PERSON_RE = re.compile(r'新人物编号从 p(\d+) 开始')
+_QR_USER_RE = re.compile(r'- 用户ID: (\S+?), 识别时间')
+_KNOWN_USER_RE = re.compile(r'^- (p\d+)\S*: .*, 用户ID: (\S+)$', re.MULTILINE)
+
+# 每帧视频折算的输入 token 数（估算模拟用量）
+_VIDEO_TOKENS_PER_FRAME = 280
+# 文件名无法解析时间时假定的分段时长（秒）
+_DEFAULT_SEGMENT_SECONDS = 60.0
+
+
+def _env_number(name: str, default, cast):
+    try:
+        return cast(os.getenv(name, str(default)))
+    except ValueError:
+        return default
+
+
+class MockTransport(VLMTransport):
+    """离线模拟传输层"""
+
+    name = "mock"
+    api_key_env = "MOCK_VLM_API_KEY"
+
+    def __init__(self, api_key: str, model: str, config: GenerationConfig):
+        super().__init__(api_key, model, config)
+        self.latency = _env_number('MOCK_VLM_LATENCY', 2.0, float)
+        self.jitter = _env_number('MOCK_VLM_JITTER', 0.3, float)
+        self.failure_rate = _env_number('MOCK_VLM_FAILURE_RATE', 0.0, float)
+        self.person_rate = _env_number('MOCK_VLM_PERSON_RATE', 0.5, float)
+        self.emergency_rate = _env_number('MOCK_VLM_EMERGENCY_RATE', 0.0, float)
+        self._warm = False
+
+    def _prompt(self, request: VLMRequest) -> Tuple[str, str]:
+        """(静态前缀, 全部提示词文本)"""
+        if request.layout is not None:
+            return request.layout.static_prefix, request.layout.to_text()
+        return '', '\n\n'.join(filter(None, [request.system_instruction, request.prompt]))
+
+    def _plan(self, request: VLMRequest) -> Tuple[random.Random, float]:
+        """以视频路径为种子的随机数与本次模拟耗时"""
+        rng = random.Random(zlib.crc32(request.video_path.encode('utf-8')))
+        delay = max(0.0, self.latency * (1 + self.jitter * (2 * rng.random() - 1)))
+        return rng, delay
+
+    def _respond(self, request: VLMRequest, rng: random.Random, elapsed: float) -> TransportResponse:
+        """生成响应正文与调用统计"""
+        # 失败与路径无关，重试时可能成功
+        if random.random() < self.failure_rate:
+            raise RuntimeError("模拟调用失败（MOCK_VLM_FAILURE_RATE）")
+
+        static_prefix, prompt = self._prompt(request)
+        match = _NEXT_EVENT_RE.search(prompt)
+        next_event = int(match.group(1)) if match else 1
+        match = _NEXT_PERSON_RE.search(prompt)
+        next_person = int(match.group(1)) if match else 1
+        qr_users = list(dict.fromkeys(_QR_USER_RE.findall(prompt)))
+        known_users = {user_id: person_id for person_id, user_id in _KNOWN_USER_RE.findall(prompt)}
+
+        events: List[Dict[str, Any]] = []
+        updates: List[Dict[str, Any]] = []
+        emergencies: List[Dict[str, Any]] = []
+        video_seconds = 0.0
+        for index, path in enumerate([request.video_path, *request.extra_video_paths]):
+            start, end = parse_segment_times(Path(path).stem, _DEFAULT_SEGMENT_SECONDS)
+            video_seconds += max(0.0, end - start)
+            event_start = datetime.fromtimestamp(start + min(1.0, (end - start) / 4))
+            event_end = datetime.fromtimestamp(start + (end - start) * 0.8)
+
+            person_ids: List[str] = []
+            if index == 0 and qr_users:
+                for user_id in qr_users:
+                    if user_id in known_users:
+                        person_ids.append(known_users[user_id])
+                        continue
+                    person_id = f"p{next_person}"
+                    next_person += 1
+                    updates.append({
+                        'op': 'add',
+                        'target_person_id': person_id,
+                        'appearance': f"模拟人物，扫码用户 {user_id}",
+                        'user_id': user_id,
+                    })
+                    person_ids.append(person_id)
+            elif rng.random() < self.person_rate:
+                if next_person > 1 and rng.random() < 0.7:
+                    person_ids.append(f"p{rng.randint(1, next_person - 1)}")
+                else:
+                    person_id = f"p{next_person}"
+                    next_person += 1
+                    updates.append({
+                        'op': 'add',
+                        'target_person_id': person_id,
+                        'appearance': f"模拟人物 {person_id}，白色实验服",
+                    })
+                    person_ids.append(person_id)
+
+            events.append({
+                'event_id': f"evt_{next_event:05d}",
+                'start_time': event_start.strftime('%Y-%m-%dT%H:%M:%S'),
+                'end_time': event_end.strftime('%Y-%m-%dT%H:%M:%S'),
+                'event_type': 'person' if person_ids else 'equipment-only',
+                'person_ids': person_ids,
+                'equipment': '离心机',
+                'description': f"模拟事件（{Path(path).stem}）",
+            })
+            next_event += 1
+            if rng.random() < self.emergency_rate:
+                emergencies.append({
+                    'description': "模拟紧急情况：台面起火",
+                    'start_time': event_start.strftime('%Y-%m-%dT%H:%M:%S'),
+                    'end_time': event_end.strftime('%Y-%m-%dT%H:%M:%S'),
+                })
+
+        text = "```json\n" + json.dumps({
+            'events_to_append': events,
+            'appearance_updates': updates,
+            'emergency_events': emergencies,
+        }, ensure_ascii=False, indent=2) + "\n```"
+        if request.on_text:
+            # 分几次回调，模拟流式增量
+            step = max(1, len(text) // 4)
+            for offset in range(0, len(text), step):
+                request.on_text(text[offset:offset + step])
+
+        input_tokens = estimate_tokens(prompt) + int(video_seconds * self.config.fps * _VIDEO_TOKENS_PER_FRAME)
+        cached_tokens = estimate_tokens(static_prefix) if self._warm else 0
+        self._warm = True
+        return TransportResponse(
+            text=text,
+            metrics=build_call_metrics(elapsed, input_tokens, cached_tokens, estimate_tokens(text))
+        )
+
+    def call(self, request: VLMRequest) -> TransportResponse:
+        start = time.time()
+        rng, delay = self._plan(request)
+        time.sleep(delay)
+        return self._respond(request, rng, time.time() - start)
+
+    async def acall(self, request: VLMRequest) -> TransportResponse:
+        start = time.time()
+        rng, delay = self._plan(request)
+        await asyncio.sleep(delay)
+        return self._respond(request, rng, time.time() - start)
+
+
+class MockProcessor(DynamicContextVideoEngine):
+    """离线模拟处理器（不需要 API Key）"""
+
+    transport_class = MockTransport
+    default_model = 'mock'
+    default_high_resolution = False
+
+    def __init__(self, api_key: str = None, **kwargs):
+        super().__init__(api_key=api_key or os.getenv(MockTransport.api_key_env) or 'offline', **kwargs)
@@ -0,0 +1,144 @@
+"""上传前的视频预处理：用 ffmpeg 生成降帧率、降分辨率的副本供视频理解模型使用
+
+手机端按 DEFAULT_BITRATE_MB 编码上传，而模型只按 VIDEO_FPS（1~2 fps）抽帧，且通常会再缩小
+分辨率。预处理副本缓存在原视频所在目录的 preprocessed/ 子目录下（与原视频同名），原视频
+保持不变用于归档、缩略图和快速检测。副本不比原视频小时仍上传原视频。
+
+环境变量：
+- VLM_PREPROCESS：是否启用预处理（默认 false）
+- VLM_PREPROCESS_FPS：副本帧率（默认 2，不应低于 VIDEO_FPS）
+- VLM_PREPROCESS_MAX_SIDE：副本长边上限（像素，默认 768；不放大）
+- VLM_PREPROCESS_CRF：x264 CRF（默认 30，越大体积越小、画质越差）
+"""
+
+import os
+import subprocess
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+
+
+PREPROCESSED_DIR_NAME = "preprocessed"
+
+
+def is_preprocess_enabled() -> bool:
+    """读取 VLM_PREPROCESS 环境变量（默认关闭）"""
+    return os.getenv('VLM_PREPROCESS', 'false').lower() in ('true', '1', 'yes', 'on')
+
+
+def _env_number(name: str, default, cast):
+    try:
+        return cast(os.getenv(name, str(default)))
+    except ValueError:
+        return default
+
+
+@dataclass
+class PreparedVideo:
+    """预处理结果"""
+    path: str                 # 实际上传的视频路径
+    original_bytes: int       # 原视频大小
+    upload_bytes: int         # 实际上传的视频大小
+    reduced: bool             # 是否使用了预处理副本
+    cached: bool = False      # 副本是否来自缓存
+    elapsed: float = 0.0      # 预处理耗时（秒，命中缓存时接近 0）
+
+    def metrics(self) -> dict:
+        """写入 processing_stats.jsonl 的统计"""
+        return {
+            'upload_bytes': self.upload_bytes,
+            'original_bytes': self.original_bytes,
+            'upload_ratio': round(self.upload_bytes / self.original_bytes, 4) if self.original_bytes else 1.0,
+            'preprocess_time': round(self.elapsed, 3),
+        }
+
+
+class VideoPreprocessor:
+    """ffmpeg 降帧率/降分辨率转码（带文件缓存）"""
+
+    def __init__(
+        self,
+        fps: Optional[float] = None,
+        max_side: Optional[int] = None,
+        crf: Optional[int] = None,
+        ffmpeg_bin: Optional[str] = None
+    ):
+        """
+        Args:
+            fps: 副本帧率，None 则读取 VLM_PREPROCESS_FPS（默认 2）
+            max_side: 长边上限，None 则读取 VLM_PREPROCESS_MAX_SIDE（默认 768）
+            crf: x264 CRF，None 则读取 VLM_PREPROCESS_CRF（默认 30）
+            ffmpeg_bin: ffmpeg 可执行文件，None 则读取 FFMPEG_BIN（默认 ffmpeg）
+        """
+        self.fps = fps or _env_number('VLM_PREPROCESS_FPS', 2.0, float)
+        self.max_side = max_side or _env_number('VLM_PREPROCESS_MAX_SIDE', 768, int)
+        self.crf = crf if crf is not None else _env_number('VLM_PREPROCESS_CRF', 30, int)
+        self.ffmpeg_bin = ffmpeg_bin or os.environ.get("FFMPEG_BIN", "ffmpeg")
+
+    @staticmethod
+    def cache_path(video_path: Path) -> Path:
+        """预处理副本路径：<原目录>/preprocessed/<原文件名>"""
+        return video_path.parent / PREPROCESSED_DIR_NAME / video_path.name
+
+    def _transcode(self, source: Path, target: Path) -> None:
+        """转码到临时文件后原子替换，避免中断时留下不完整的缓存"""
+        target.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = target.with_name(f".{target.stem}.tmp{target.suffix}")
+        side = self.max_side
+        # 长边缩放到不超过 max_side（不放大），短边按比例取偶数
+        scale = (
+            f"scale='if(gte(iw,ih),min(iw,{side}),-2)':'if(gte(iw,ih),-2,min(ih,{side}))'"
+        )
+        cmd = [
+            self.ffmpeg_bin,
+            "-y",
+            "-v", "error",
+            "-i", str(source),
+            "-vf", f"fps={self.fps},{scale}",
+            "-c:v", "libx264",
+            "-preset", "veryfast",
+            "-crf", str(self.crf),
+            "-pix_fmt", "yuv420p",
+            "-an",
+            "-movflags", "+faststart",
+            str(temp_path),
+        ]
+        result = subprocess.run(cmd, capture_output=True, text=True)
+        if result.returncode != 0:
+            temp_path.unlink(missing_ok=True)
+            raise RuntimeError(result.stderr.strip())
+        os.replace(temp_path, target)
+
+    def prepare(self, video_path: str) -> PreparedVideo:
+        """
+        获取用于上传的视频（阻塞，异步代码中应在线程池中调用）
+
+        转码失败时回退到原视频并打印警告。
+
+        Args:
+            video_path: 原视频路径
+
+        Returns:
+            PreparedVideo
+        """
+        source = Path(video_path)
+        original_bytes = source.stat().st_size
+        target = self.cache_path(source)
+
+        start = time.time()
+        cached = target.exists() and target.stat().st_mtime >= source.stat().st_mtime
+        if not cached:
+            try:
+                self._transcode(source, target)
+            except Exception as e:
+                print(f"[Warning]: 视频预处理失败，上传原视频 ({source.name}): {e}")
+                return PreparedVideo(str(source), original_bytes, original_bytes, reduced=False)
+        elapsed = time.time() - start
+
+        reduced_bytes = target.stat().st_size
+        if reduced_bytes >= original_bytes:
+            return PreparedVideo(str(source), original_bytes, original_bytes, reduced=False,
+                                 cached=cached, elapsed=elapsed)
+        return PreparedVideo(str(target), original_bytes, reduced_bytes, reduced=True,
+                             cached=cached, elapsed=elapsed)
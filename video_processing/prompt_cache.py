@@ -0,0 +1,205 @@
+"""提示词前缀缓存：按“静态前缀 → 外貌表 → 视频 → 易变尾部”组装请求消息，并提取缓存命中统计
+
+- DashScope：系统消息的文本块附带 cache_control（显式缓存），命中后 usage 中返回 cached_tokens
+- OpenRouter：系统消息的 input_text 附带 cache_control，由上游提供商决定是否生效
+
+环境变量 VL_EXPLICIT_CACHE（默认 true）控制是否添加 cache_control 标记；
+关闭后消息顺序保持不变，仍可利用服务端的隐式前缀缓存。
+"""
+
+import os
+from typing import Any, Dict, List, Optional, Sequence
+
+from context.prompt_builder import PromptLayout
+
+
+# 显式缓存标记
+CACHE_CONTROL = {'type': 'ephemeral'}
+
+
+def is_explicit_cache_enabled() -> bool:
+    """读取 VL_EXPLICIT_CACHE 环境变量（默认开启）"""
+    return os.getenv('VL_EXPLICIT_CACHE', 'true').lower() in ('true', '1', 'yes', 'on')
+
+
+def build_dashscope_messages(
+    layout: PromptLayout,
+    video_url: str,
+    fps: float,
+    explicit_cache: bool = True,
+    extra_videos: Sequence[str] = ()
+) -> List[Dict[str, Any]]:
+    """
+    构建 DashScope MultiModalConversation 消息
+
+    Args:
+        layout: 分层提示词
+        video_url: 视频地址（file:// 或 http(s)://）
+        fps: 视频抽帧率
+        explicit_cache: 是否为静态前缀添加 cache_control
+        extra_videos: 多视频合并调用时按时间顺序的后续视频地址
+
+    Returns:
+        messages 列表
+    """
+    system_item: Dict[str, Any] = {'text': layout.static_prefix}
+    if explicit_cache:
+        system_item['cache_control'] = dict(CACHE_CONTROL)
+
+    return [
+        {
+            'role': 'system',
+            'content': [system_item]
+        },
+        {
+            'role': 'user',
+            'content': [
+                {'text': layout.appearance_section},
+                *({'video': url, 'fps': fps} for url in [video_url, *extra_videos]),
+                {'text': layout.volatile_tail}
+            ]
+        }
+    ]
+
+
+def build_openrouter_input(
+    layout: PromptLayout,
+    video_data_url: Any,
+    explicit_cache: bool = True,
+    extra_videos: Sequence[Any] = ()
+) -> List[Dict[str, Any]]:
+    """
+    构建 OpenRouter /v1/responses 的 input 列表
+
+    Args:
+        layout: 分层提示词
+        video_data_url: 视频 URL，或 VideoFileRef（发送时流式编码为 data URL）
+        explicit_cache: 是否为静态前缀添加 cache_control
+        extra_videos: 多视频合并调用时按时间顺序的后续视频
+
+    Returns:
+        input 列表
+    """
+    system_item: Dict[str, Any] = {'type': 'input_text', 'text': layout.static_prefix}
+    if explicit_cache:
+        system_item['cache_control'] = dict(CACHE_CONTROL)
+
+    return [
+        {
+            'type': 'message',
+            'role': 'system',
+            'content': [system_item]
+        },
+        {
+            'type': 'message',
+            'role': 'user',
+            'content': [
+                {'type': 'input_text', 'text': layout.appearance_section},
+                *({'type': 'input_video', 'video_url': url} for url in [video_data_url, *extra_videos]),
+                {'type': 'input_text', 'text': layout.volatile_tail}
+            ]
+        }
+    ]
+
+
+def build_compatible_messages(
+    layout: PromptLayout,
+    video_data_url: Any,
+    fps: float,
+    explicit_cache: bool = True,
+    extra_videos: Sequence[Any] = ()
+) -> List[Dict[str, Any]]:
+    """
+    构建 DashScope OpenAI 兼容模式（/chat/completions）消息
+
+    Args:
+        layout: 分层提示词
+        video_data_url: 视频公网 URL，或 VideoFileRef（发送时流式编码为 data URL）
+        fps: 视频抽帧率
+        explicit_cache: 是否为静态前缀添加 cache_control
+        extra_videos: 多视频合并调用时按时间顺序的后续视频
+
+    Returns:
+        messages 列表
+    """
+    system_item: Dict[str, Any] = {'type': 'text', 'text': layout.static_prefix}
+    if explicit_cache:
+        system_item['cache_control'] = dict(CACHE_CONTROL)
+
+    return [
+        {
+            'role': 'system',
+            'content': [system_item]
+        },
+        {
+            'role': 'user',
+            'content': [
+                {'type': 'text', 'text': layout.appearance_section},
+                *(
+                    {'type': 'video_url', 'video_url': {'url': url}, 'fps': fps}
+                    for url in [video_data_url, *extra_videos]
+                ),
+                {'type': 'text', 'text': layout.volatile_tail}
+            ]
+        }
+    ]
+
+
+def _get(obj: Any, key: str) -> Any:
+    """兼容 dict 与属性对象的取值"""
+    if obj is None:
+        return None
+    if isinstance(obj, dict):
+        return obj.get(key)
+    try:
+        return obj[key]
+    except (KeyError, TypeError, IndexError):
+        return getattr(obj, key, None)
+
+
+def _to_int(value: Any) -> int:
+    try:
+        return int(value or 0)
+    except (TypeError, ValueError):
+        return 0
+
+
+def build_call_metrics(
+    api_latency: float,
+    input_tokens: int,
+    cached_tokens: int,
+    output_tokens: int
+) -> Dict[str, Any]:
+    """
+    组装单次调用统计
+
+    Returns:
+        包含 api_latency、input_tokens、cached_tokens、cached_ratio、output_tokens 的字典
+    """
+    return {
+        'api_latency': round(api_latency, 3),
+        'input_tokens': input_tokens,
+        'cached_tokens': cached_tokens,
+        'cached_ratio': round(cached_tokens / input_tokens, 4) if input_tokens > 0 else 0.0,
+        'output_tokens': output_tokens,
+    }
+
+
+def dashscope_call_metrics(response: Any, api_latency: float) -> Dict[str, Any]:
+    """从 DashScope 响应中提取 token 用量与缓存命中"""
+    usage = _get(response, 'usage')
+    input_tokens = _to_int(_get(usage, 'input_tokens') or _get(usage, 'prompt_tokens'))
+    output_tokens = _to_int(_get(usage, 'output_tokens') or _get(usage, 'completion_tokens'))
+    details: Optional[Any] = _get(usage, 'prompt_tokens_details') or _get(usage, 'input_tokens_details')
+    cached_tokens = _to_int(_get(details, 'cached_tokens'))
+    return build_call_metrics(api_latency, input_tokens, cached_tokens, output_tokens)
+
+
+def openrouter_call_metrics(data: Dict[str, Any], api_latency: float) -> Dict[str, Any]:
+    """从 OpenRouter /v1/responses 响应中提取 token 用量与缓存命中"""
+    usage = data.get('usage') or {}
+    input_tokens = _to_int(usage.get('input_tokens') or usage.get('prompt_tokens'))
+    output_tokens = _to_int(usage.get('output_tokens') or usage.get('completion_tokens'))
+    details = usage.get('input_tokens_details') or usage.get('prompt_tokens_details') or {}
+    cached_tokens = _to_int(details.get('cached_tokens'))
+    return build_call_metrics(api_latency, input_tokens, cached_tokens, output_tokens)
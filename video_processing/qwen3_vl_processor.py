@@ -1,22 +1,95 @@
-"""Qwen3-VL 视频理解处理器工厂（根据环境变量选择 Flash 或 Plus）"""
+"""视频理解处理器工厂（根据模型名称从注册表中选择处理器）"""
 
 import os
-from typing import Optional
+from typing import Callable, List, Optional, Tuple, Type
 
 from dotenv import load_dotenv
 from video_processing.interface import VideoProcessor
+from video_processing.engine import DynamicContextVideoEngine
 from context.appearance_cache import AppearanceCache
 from context.event_context import EventContext
 
 # 加载环境变量
 load_dotenv()
 
-# 延迟导入，避免循环依赖
 from video_processing.qwen3_vl_flash_processor import Qwen3VLFlashProcessor
 from video_processing.qwen3_vl_plus_processor import Qwen3VLPlusProcessor
 from video_processing.qwen35_flash_processor import Qwen35FlashProcessor
 from video_processing.qwen35_plus_processor import Qwen35PlusProcessor
 from video_processing.openrouter_processor import OpenRouterProcessor
+from video_processing.cascade_processor import CascadeProcessor
+from video_processing.mock_processor import MockProcessor
+
+
+# 处理器注册表：(模型名匹配函数, 处理器类或同参数的工厂函数)，按注册顺序匹配，第一个命中的生效
+_PROCESSOR_REGISTRY: List[Tuple[Callable[[str], bool], Callable[..., VideoProcessor]]] = []
+
+# 未命中任何注册项时使用的处理器
+DEFAULT_PROCESSOR: Type[DynamicContextVideoEngine] = Qwen3VLFlashProcessor
+
+
+def register_processor(
+    matcher: Callable[[str], bool],
+    processor_class: Callable[..., VideoProcessor]
+) -> None:
+    """
+    注册处理器
+    
+    Args:
+        matcher: 接收小写模型名、返回是否匹配的函数
+        processor_class: 处理器类（DynamicContextVideoEngine 子类），或接受相同参数的工厂函数
+    """
+    _PROCESSOR_REGISTRY.append((matcher, processor_class))
+
+
+def resolve_processor_class(model: str) -> Callable[..., VideoProcessor]:
+    """根据模型名称选择处理器类"""
+    name = model.lower()
+    for matcher, processor_class in _PROCESSOR_REGISTRY:
+        if matcher(name):
+            return processor_class
+    return DEFAULT_PROCESSOR
+
+
+def create_cascade_processor(
+    api_key: str = None,
+    model: str = None,
+    fps: Optional[float] = None,
+    enable_thinking: bool = None,
+    thinking_budget: int = None,
+    appearance_cache: Optional[AppearanceCache] = None,
+    event_context: Optional[EventContext] = None,
+    max_recent_events: int = 20
+) -> CascadeProcessor:
+    """
+    创建级联处理器（VIDEO_UNDERSTANDING_MODEL=cascade）：flash 关闭思考，升级模型按 enable_thinking
+    
+    两个阶段的模型分别由 VLM_CASCADE_FAST_MODEL / VLM_CASCADE_STRONG_MODEL 指定，参数含义同 create_qwen_processor
+    """
+    appearance_cache = appearance_cache or AppearanceCache()
+    fast_model = os.getenv('VLM_CASCADE_FAST_MODEL', Qwen3VLFlashProcessor.default_model)
+    strong_model = os.getenv('VLM_CASCADE_STRONG_MODEL', Qwen3VLPlusProcessor.default_model)
+    stages = []
+    for stage_model, stage_thinking in ((fast_model, False), (strong_model, enable_thinking)):
+        stages.append(resolve_processor_class(stage_model)(
+            api_key=api_key,
+            model=stage_model,
+            fps=fps,
+            enable_thinking=stage_thinking,
+            thinking_budget=thinking_budget,
+            appearance_cache=appearance_cache,
+            event_context=event_context,
+            max_recent_events=max_recent_events
+        ))
+    return CascadeProcessor(*stages)
+
+
+register_processor(lambda name: name == 'cascade', create_cascade_processor)
+register_processor(lambda name: name == 'mock', MockProcessor)
+register_processor(lambda name: 'google/' in name or 'gemini' in name, OpenRouterProcessor)
+register_processor(lambda name: 'qwen3.5' in name and 'plus' in name, Qwen35PlusProcessor)
+register_processor(lambda name: 'qwen3.5' in name and 'flash' in name, Qwen35FlashProcessor)
+register_processor(lambda name: 'plus' in name, Qwen3VLPlusProcessor)
 
 
 def create_qwen_processor(
@@ -30,93 +103,36 @@ def create_qwen_processor(
     max_recent_events: int = 20
 ) -> VideoProcessor:
     """
-    创建 Qwen3-VL 视频处理器（根据环境变量或参数选择 Flash 或 Plus）
+    创建视频处理器（根据参数或环境变量中的模型名称选择）
     
     Args:
-        api_key: DashScope API Key，如果为 None 则从环境变量读取
+        api_key: API Key，如果为 None 则由处理器从对应的环境变量读取
         model: 模型名称，如果为 None 则从环境变量 VIDEO_UNDERSTANDING_MODEL 读取
-        fps: 视频抽帧率，表示每隔 1/fps 秒抽取一帧，如果为 None 则从环境变量 VIDEO_FPS 读取，默认 1.0，如果为默认值 1.0 则从环境变量 VIDEO_FPS 读取
+        fps: 视频抽帧率，表示每隔 1/fps 秒抽取一帧，如果为 None 则从环境变量 VIDEO_FPS 读取，默认 1.0
         enable_thinking: 是否启用思考，如果为 None 则从环境变量 ENABLE_THINKING 读取
         thinking_budget: 思考预算，如果为 None 则从环境变量 THINKING_BUDGET 读取
         appearance_cache: 人物外貌缓存，如果为 None 则创建默认实例
-        event_context: 事件上下文，如果为 None 则创建默认实例
+        event_context: 事件上下文，如果为 None 则不使用动态上下文
         max_recent_events: 最大最近事件数，默认 20
     
     Returns:
-        VideoProcessor 实例（Qwen3VLFlashProcessor 或 Qwen3VLPlusProcessor）
+        处理器实例（具体类型由注册表决定，通常为 DynamicContextVideoEngine 子类）
     """
     # 确定使用的模型
     if model is None:
-        model = os.getenv('VIDEO_UNDERSTANDING_MODEL', 'qwen3-vl-flash')
-    
-    # 从环境变量读取 fps 配置，如果没有则使用参数或默认值
-    if fps is None:
-        fps_str = os.getenv('VIDEO_FPS', '1.0')
-        try:
-            fps = float(fps_str)
-        except ValueError:
-            fps = 1.0
+        model = os.getenv('VIDEO_UNDERSTANDING_MODEL', DEFAULT_PROCESSOR.default_model)
     
-    # 根据模型名称选择处理器
-    if 'google/' in model.lower() or 'gemini' in model.lower():
-        return OpenRouterProcessor(
-            api_key=api_key, # 这里由 OpenRouterProcessor 自己决定使用哪个环境变量
-            model=model,
-            fps=fps,
-            enable_thinking=enable_thinking,
-            thinking_budget=thinking_budget,
-            appearance_cache=appearance_cache,
-            event_context=event_context,
-            max_recent_events=max_recent_events
-        )
-    elif 'qwen3.5' in model.lower() and 'plus' in model.lower():
-        # qwen3.5-plus
-        return Qwen35PlusProcessor(
-            api_key=api_key,
-            model=model,
-            fps=fps,
-            enable_thinking=enable_thinking,
-            thinking_budget=thinking_budget,
-            appearance_cache=appearance_cache,
-            event_context=event_context,
-            max_recent_events=max_recent_events
-        )
-    elif 'qwen3.5' in model.lower() and 'flash' in model.lower():
-        # qwen3.5-flash
-        return Qwen35FlashProcessor(
-            api_key=api_key,
-            model=model,
-            fps=fps,
-            enable_thinking=enable_thinking,
-            thinking_budget=thinking_budget,
-            appearance_cache=appearance_cache,
-            event_context=event_context,
-            max_recent_events=max_recent_events
-        )
-    elif 'plus' in model.lower() or model == 'qwen3-vl-plus':
-        # qwen3-vl-plus
-        return Qwen3VLPlusProcessor(
-            api_key=api_key,
-            model=model,
-            fps=fps,
-            enable_thinking=enable_thinking,
-            thinking_budget=thinking_budget,
-            appearance_cache=appearance_cache,
-            event_context=event_context,
-            max_recent_events=max_recent_events
-        )
-    else:
-        # 默认使用 qwen3-vl-flash
-        return Qwen3VLFlashProcessor(
-            api_key=api_key,
-            model=model,
-            fps=fps,
-            enable_thinking=enable_thinking,
-            thinking_budget=thinking_budget,
-            appearance_cache=appearance_cache,
-            event_context=event_context,
-            max_recent_events=max_recent_events
-        )
+    processor_class = resolve_processor_class(model)
+    return processor_class(
+        api_key=api_key,
+        model=model,
+        fps=fps,
+        enable_thinking=enable_thinking,
+        thinking_budget=thinking_budget,
+        appearance_cache=appearance_cache,
+        event_context=event_context,
+        max_recent_events=max_recent_events
+    )
 
 
 # 为了向后兼容，提供一个默认的类名
@@ -129,6 +145,8 @@ class Qwen3VLProcessor:
     - qwen3-vl-flash / qwen3-vl-plus：Qwen3-VL 系列
     - qwen3.5-flash / qwen3.5-plus：Qwen3.5 系列
     - google/gemini-*：Gemini 系列（通过 OpenRouter）
+    - cascade：flash 先处理，不确定时升级到 plus（见 cascade_processor.py）
+    - mock：离线模拟，不调用模型服务（见 mock_processor.py，用于压测）
     
     默认使用 qwen3-vl-flash 处理器
     """
@@ -0,0 +1,159 @@
+"""流式 JSON 请求体：视频以 base64 分块从文件写入请求体，不在内存中拼出完整的 data URL
+
+原先的做法是先把整个 MP4 读入内存、编码成 base64 字符串，再嵌入 payload 由 requests/httpx
+序列化一次，每次调用同时持有视频的约 4 份拷贝（原始字节、base64 字节、str、序列化后的请求体）。
+
+这里 payload 中的视频用 VideoFileRef 占位：序列化时占位符被替换成一个唯一标记，请求体按标记
+拆成 JSON 前缀与后缀，发送时依次输出“前缀 → data URL 头 → base64 分块 → 后缀”。base64 字符
+不需要 JSON 转义，长度可预先算出，因此仍以 Content-Length（而非 chunked）发送，重试时可重新读取。
+
+若模型服务商可以直接拉取 URL，可设置 VLM_VIDEO_URL_BASE，视频改为以 URL 引用，请求体中不再
+包含视频内容（需要另行把视频目录通过 HTTP 暴露出去，如 nginx 的 alias）：
+- VLM_VIDEO_URL_BASE：视频目录对外的 URL 前缀（如 https://example.com/segments）
+- VLM_VIDEO_URL_ROOT：与该前缀对应的本地目录（默认当前工作目录）
+"""
+
+import asyncio
+import base64
+import json
+import os
+import uuid
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Union
+from urllib.parse import quote
+
+
+# 每次读取的原始字节数（3 的倍数，保证分块编码后可直接拼接）
+READ_CHUNK_SIZE = 3 * 256 * 1024
+
+
+@dataclass(frozen=True)
+class VideoFileRef:
+    """payload 中的视频占位（序列化时以 base64 data URL 流式写入）"""
+    path: str
+    mime_type: str = "video/mp4"
+
+    @property
+    def header(self) -> bytes:
+        return f"data:{self.mime_type};base64,".encode('ascii')
+
+    def encoded_size(self) -> int:
+        """data URL 的字节数"""
+        size = os.path.getsize(self.path)
+        return len(self.header) + 4 * ((size + 2) // 3)
+
+    def iter_base64(self) -> Iterator[bytes]:
+        """逐块输出 data URL（阻塞 IO）"""
+        yield self.header
+        with open(self.path, "rb") as video_file:
+            while True:
+                chunk = video_file.read(READ_CHUNK_SIZE)
+                if not chunk:
+                    break
+                yield base64.b64encode(chunk)
+
+
+def video_url_for(video_path: str) -> Optional[str]:
+    """
+    按 VLM_VIDEO_URL_BASE 把本地视频路径映射为公网 URL
+
+    Args:
+        video_path: 本地视频路径
+
+    Returns:
+        URL；未配置或视频不在 VLM_VIDEO_URL_ROOT 下时返回 None
+    """
+    base = os.getenv('VLM_VIDEO_URL_BASE', '').strip()
+    if not base:
+        return None
+    root = Path(os.getenv('VLM_VIDEO_URL_ROOT', '.')).resolve()
+    try:
+        relative = Path(video_path).resolve().relative_to(root)
+    except ValueError:
+        return None
+    return f"{base.rstrip('/')}/{quote(relative.as_posix())}"
+
+
+def video_reference(video_path: str) -> Union[str, VideoFileRef]:
+    """视频在 payload 中的取值：配置了 VLM_VIDEO_URL_BASE 时为 URL，否则为流式 data URL 占位"""
+    return video_url_for(video_path) or VideoFileRef(video_path)
+
+
+class StreamingJSONBody:
+    """
+    JSON 请求体，其中的 VideoFileRef 在发送时从文件流式编码
+
+    同时支持 requests（read / __len__）与 httpx（content=body.aiter_bytes()）。
+    每次迭代都重新打开文件，可用于重试。
+    """
+
+    def __init__(self, payload: Dict[str, Any]):
+        """
+        Args:
+            payload: 请求体，视频位置为 VideoFileRef
+        """
+        marker = f"__video_{uuid.uuid4().hex}__"
+        refs: List[VideoFileRef] = []
+
+        def default(obj: Any) -> Any:
+            if isinstance(obj, VideoFileRef):
+                refs.append(obj)
+                return marker
+            raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+        text = json.dumps(payload, ensure_ascii=False, default=default)
+        parts = text.split(json.dumps(marker))
+        # 片段与视频交替：part0, video0, part1, video1, ..., partN
+        self._parts: List[bytes] = [p.encode('utf-8') for p in parts]
+        self._refs = refs
+        self._length = (
+            sum(len(p) for p in self._parts)
+            + sum(ref.encoded_size() + 2 for ref in refs)   # 两侧引号
+        )
+        self._reader: Optional[Iterator[bytes]] = None
+        self._pending = b""
+        self._offset = 0
+
+    def __len__(self) -> int:
+        return self._length
+
+    @property
+    def headers(self) -> Dict[str, str]:
+        return {"Content-Type": "application/json", "Content-Length": str(self._length)}
+
+    def __iter__(self) -> Iterator[bytes]:
+        for index, part in enumerate(self._parts):
+            if index > 0:
+                yield b'"'
+                yield from self._refs[index - 1].iter_base64()
+                yield b'"'
+            if part:
+                yield part
+
+    async def aiter_bytes(self) -> AsyncIterator[bytes]:
+        """异步迭代（文件读取与编码在线程池中执行，不阻塞事件循环）"""
+        iterator = iter(self)
+        sentinel = object()
+        while True:
+            chunk = await asyncio.to_thread(next, iterator, sentinel)
+            if chunk is sentinel:
+                break
+            yield chunk
+
+    def read(self, size: int = -1) -> bytes:
+        """类文件接口（requests / http.client 按块读取）"""
+        if self._reader is None:
+            self._reader = iter(self)
+        if self._offset >= len(self._pending):
+            self._pending = next(self._reader, b"")
+            self._offset = 0
+        if size < 0:
+            # 一次读完（只在调用方不分块时使用）
+            rest = [self._pending[self._offset:]]
+            rest.extend(self._reader)
+            self._pending, self._offset = b"", 0
+            return b"".join(rest)
+        data = self._pending[self._offset:self._offset + size]
+        self._offset += len(data)
+        return data
@@ -0,0 +1,250 @@
+"""视频理解响应缓存：视频与提示词都不变时复用上一次的模型输出（本地磁盘，默认关闭）
+
+用于重放与评估：清空测试数据后重新运行 scripts/process_recording_session.py，或调整解析、
+入库逻辑时，不必为相同的输入再次付费调用模型。缓存键为
+(传输层, 模型, 调用参数, 视频内容 sha256, 提示词 sha256)，每个条目一个 JSON 文件。
+
+- 条目超过 TTL 视为未命中并删除
+- 目录总大小超过上限时按最近访问时间淘汰（命中会刷新文件的 mtime）
+- 命中时若请求为流式（on_text），把完整正文一次性回调，紧急情况仍按原流程分发
+
+环境变量：
+- VLM_RESPONSE_CACHE：是否启用（默认 false）
+- VLM_RESPONSE_CACHE_DIR：缓存目录（默认 logs_debug/vlm_response_cache）
+- VLM_RESPONSE_CACHE_TTL：条目有效期（秒，默认 604800 即 7 天）
+- VLM_RESPONSE_CACHE_MAX_MB：缓存目录大小上限（MB，默认 200）
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+from dataclasses import asdict
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+from video_processing.transports import TransportResponse, VLMRequest, VLMTransport
+
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+# 不影响模型输出的调用参数
+_IGNORED_CONFIG_FIELDS = ('streaming',)
+
+
+def is_response_cache_enabled() -> bool:
+    """读取 VLM_RESPONSE_CACHE 环境变量（默认关闭）"""
+    return os.getenv('VLM_RESPONSE_CACHE', 'false').lower() in ('true', '1', 'yes', 'on')
+
+
+def _env_number(name: str, default, cast):
+    try:
+        return cast(os.getenv(name, str(default)))
+    except ValueError:
+        return default
+
+
+# (路径, 大小, mtime) -> sha256，避免同一文件重复计算
+_file_hashes: Dict[Tuple[str, int, float], str] = {}
+_file_hashes_lock = threading.Lock()
+
+
+def file_sha256(path: str) -> str:
+    """计算文件内容的 sha256（阻塞 IO）"""
+    stat = os.stat(path)
+    memo_key = (os.path.abspath(path), stat.st_size, stat.st_mtime)
+    with _file_hashes_lock:
+        cached = _file_hashes.get(memo_key)
+    if cached:
+        return cached
+
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(HASH_CHUNK_SIZE)
+            if not chunk:
+                break
+            digest.update(chunk)
+    value = digest.hexdigest()
+    with _file_hashes_lock:
+        _file_hashes[memo_key] = value
+    return value
+
+
+def prompt_sha256(request: VLMRequest) -> str:
+    """提示词的 sha256（分层提示词按各层拼接）"""
+    if request.layout is not None:
+        parts = [
+            request.layout.static_prefix,
+            request.layout.appearance_section,
+            request.layout.volatile_tail,
+        ]
+    else:
+        parts = [request.system_instruction or '', request.prompt or '']
+    return hashlib.sha256('\x1e'.join(parts).encode('utf-8')).hexdigest()
+
+
+class ResponseCache:
+    """磁盘响应缓存（线程安全）"""
+
+    def __init__(self, cache_dir: Path, ttl_seconds: float, max_bytes: int):
+        """
+        Args:
+            cache_dir: 缓存目录
+            ttl_seconds: 条目有效期（秒）
+            max_bytes: 目录总大小上限（字节）
+        """
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def from_env(cls) -> 'ResponseCache':
+        return cls(
+            cache_dir=Path(os.getenv('VLM_RESPONSE_CACHE_DIR', 'logs_debug/vlm_response_cache')),
+            ttl_seconds=_env_number('VLM_RESPONSE_CACHE_TTL', 7 * 24 * 3600, float),
+            max_bytes=int(_env_number('VLM_RESPONSE_CACHE_MAX_MB', 200, float) * 1024 * 1024),
+        )
+
+    @staticmethod
+    def make_key(transport: VLMTransport, request: VLMRequest) -> str:
+        """缓存键（阻塞：需要读取视频计算哈希）"""
+        config = {k: v for k, v in asdict(transport.config).items() if k not in _IGNORED_CONFIG_FIELDS}
+        material = {
+            'transport': transport.name,
+            'model': transport.model,
+            'config': config,
+            'video': file_sha256(request.video_path),
+            'prompt': prompt_sha256(request),
+        }
+        if request.extra_video_paths:
+            material['extra_videos'] = [file_sha256(path) for path in request.extra_video_paths]
+        material = json.dumps(material, sort_keys=True)
+        return hashlib.sha256(material.encode('utf-8')).hexdigest()
+
+    def _path(self, key: str) -> Path:
+        return self.cache_dir / f"{key}.json"
+
+    def get(self, key: str) -> Optional[TransportResponse]:
+        """读取条目；过期或损坏时删除并返回 None"""
+        path = self._path(key)
+        with self._lock:
+            try:
+                entry = json.loads(path.read_text(encoding='utf-8'))
+            except FileNotFoundError:
+                self.misses += 1
+                return None
+            except (OSError, json.JSONDecodeError):
+                path.unlink(missing_ok=True)
+                self.misses += 1
+                return None
+
+            if time.time() - entry.get('created_at', 0) > self.ttl_seconds:
+                path.unlink(missing_ok=True)
+                self.misses += 1
+                return None
+
+            # 刷新访问时间，按 LRU 淘汰
+            os.utime(path)
+            self.hits += 1
+        return TransportResponse(
+            text=entry['text'],
+            thinking=entry.get('thinking'),
+            metrics={**(entry.get('metrics') or {}), 'response_cache': 'hit'}
+        )
+
+    def put(self, key: str, response: TransportResponse) -> None:
+        """写入条目（原子替换）并按需淘汰"""
+        entry = {
+            'created_at': time.time(),
+            'text': response.text,
+            'thinking': response.thinking,
+            'metrics': response.metrics,
+        }
+        path = self._path(key)
+        temp_path = path.with_suffix('.tmp')
+        with self._lock:
+            temp_path.write_text(json.dumps(entry, ensure_ascii=False), encoding='utf-8')
+            os.replace(temp_path, path)
+            self._evict()
+
+    def _evict(self) -> None:
+        """目录超过大小上限时，删除最久未访问的条目"""
+        files = []
+        total = 0
+        for path in self.cache_dir.glob("*.json"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+            total += stat.st_size
+        if total <= self.max_bytes:
+            return
+        for _, size, path in sorted(files):
+            path.unlink(missing_ok=True)
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+    def stats(self) -> Dict[str, Any]:
+        return {'hits': self.hits, 'misses': self.misses}
+
+
+_shared_cache: Optional[ResponseCache] = None
+_shared_cache_lock = threading.Lock()
+
+
+def get_shared_response_cache() -> ResponseCache:
+    """进程内共享的响应缓存（所有处理器共用，命中统计合并）"""
+    global _shared_cache
+    with _shared_cache_lock:
+        if _shared_cache is None:
+            _shared_cache = ResponseCache.from_env()
+        return _shared_cache
+
+
+class CachingTransport(VLMTransport):
+    """为任意传输层加上响应缓存"""
+
+    def __init__(self, inner: VLMTransport, cache: ResponseCache):
+        super().__init__(inner.api_key, inner.model, inner.config)
+        self.inner = inner
+        self.cache = cache
+        self.name = inner.name
+
+    @staticmethod
+    def _replay(request: VLMRequest, response: TransportResponse) -> TransportResponse:
+        if request.on_text is not None and response.text:
+            request.on_text(response.text)
+        return response
+
+    def _store(self, key: str, response: TransportResponse) -> TransportResponse:
+        if response.text:
+            try:
+                self.cache.put(key, response)
+            except OSError as e:
+                print(f"[Warning]: 写入响应缓存失败: {e}")
+        response.metrics = {**response.metrics, 'response_cache': 'miss'}
+        return response
+
+    def call(self, request: VLMRequest) -> TransportResponse:
+        key = self.cache.make_key(self.inner, request)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return self._replay(request, cached)
+        return self._store(key, self.inner.call(request))
+
+    async def acall(self, request: VLMRequest) -> TransportResponse:
+        key = await asyncio.to_thread(self.cache.make_key, self.inner, request)
+        cached = await asyncio.to_thread(self.cache.get, key)
+        if cached is not None:
+            return self._replay(request, cached)
+        response = await self.inner.acall(request)
+        return await asyncio.to_thread(self._store, key, response)
@@ -0,0 +1,290 @@
+"""视频理解模型响应解析（各模型共用）
+
+- extract_json / load_json_object：从模型输出中提取 JSON 对象。优先匹配 ```json 代码块，
+  否则从第一个 "{" 起用 JSONDecoder.raw_decode 解析，只扫描一遍文本，且不受 JSON 之后的
+  附加说明文字影响
+- parse_dynamic_response：解析动态上下文响应（events_to_append、appearance_updates、emergency_events）
+- parse_legacy_response：解析旧版响应（events）
+"""
+
+import json
+import re
+import uuid
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from storage.models import VideoSegment, EventLog, Emergency
+
+
+_CODE_BLOCK_RE = re.compile(r'```(?:json)?\s*(\{[\s\S]*?\})\s*```')
+_DECODER = json.JSONDecoder()
+
+VALID_EVENT_TYPES = ('person', 'equipment-only', 'none')
+
+
+@dataclass
+class AppearanceUpdate:
+    """外貌更新操作"""
+    op: str  # add, update, merge
+    target_person_id: str
+    merge_from: Optional[str] = None
+    appearance: Optional[str] = None
+    user_id: Optional[str] = None
+
+
+@dataclass
+class ProcessingResult:
+    """处理结果（包含事件、外貌更新和紧急情况）"""
+    events: List[EventLog]
+    appearance_updates: List[AppearanceUpdate]
+    raw_response: str
+    emergencies: List[Emergency] = field(default_factory=list)
+    metrics: Dict[str, Any] = field(default_factory=dict)  # 调用耗时与 token/缓存命中统计
+    emergencies_dispatched: bool = False  # 紧急情况是否已在流式阶段通过 on_emergency 分发
+
+
+def extract_json(text: str) -> Optional[str]:
+    """
+    从文本中提取 JSON 字符串
+
+    Args:
+        text: 模型输出文本
+
+    Returns:
+        JSON 字符串，未找到则返回 None
+    """
+    if not text:
+        return None
+
+    # 尝试找到 JSON 代码块
+    if '```' in text:
+        code_block_match = _CODE_BLOCK_RE.search(text)
+        if code_block_match:
+            return code_block_match.group(1)
+
+    # 尝试直接找到 JSON 对象
+    json_start = text.find('{')
+    if json_start == -1:
+        return None
+    try:
+        _, json_end = _DECODER.raw_decode(text, json_start)
+        return text[json_start:json_end]
+    except json.JSONDecodeError:
+        json_end = text.rfind('}') + 1
+        if json_end > json_start:
+            return text[json_start:json_end]
+    return None
+
+
+def load_json_object(text: str) -> Optional[Any]:
+    """
+    提取并解析 JSON
+
+    Args:
+        text: 模型输出文本
+
+    Returns:
+        解析结果，未找到 JSON 时返回 None
+
+    Raises:
+        json.JSONDecodeError: 找到了 JSON 片段但无法解析
+    """
+    json_str = extract_json(text)
+    if not json_str:
+        return None
+    return json.loads(json_str)
+
+
+def _parse_iso(value: Any) -> datetime:
+    """解析 ISO 时间（兼容末尾的 Z）"""
+    return datetime.fromisoformat(value.replace('Z', '+00:00'))
+
+
+def _segment_time_range(segment: VideoSegment):
+    """以今天零点加分段偏移作为回退时间"""
+    base_date = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    return base_date + timedelta(seconds=segment.start_time), base_date + timedelta(seconds=segment.end_time)
+
+
+def parse_event(event_data: Dict[str, Any], segment: VideoSegment) -> Optional[EventLog]:
+    """解析单个事件"""
+    try:
+        # 解析时间
+        try:
+            start_time = _parse_iso(event_data.get('start_time', ''))
+            end_time = _parse_iso(event_data.get('end_time', ''))
+        except (ValueError, AttributeError):
+            # 如果解析失败，使用当前时间
+            start_time = datetime.now()
+            end_time = datetime.now()
+
+        # 获取事件 ID
+        event_id = event_data.get('event_id', '')
+        if not event_id:
+            return None
+
+        # 验证 event_type
+        event_type = event_data.get('event_type', '')
+        if event_type not in VALID_EVENT_TYPES:
+            print(f"警告：无效的 event_type '{event_type}'，必须是 'person'、'equipment-only' 或 'none'，已跳过事件 {event_id}")
+            return None
+
+        # 获取 person_ids（支持多人）
+        person_ids = event_data.get('person_ids', [])
+        if not isinstance(person_ids, list):
+            print(f"警告：person_ids 必须是数组，已跳过事件 {event_id}")
+            return None
+
+        # 验证 equipment-only 和 none 事件的 person_ids 应为空
+        if event_type != 'person' and person_ids:
+            print(f"警告：{event_type} 事件的 person_ids 应为空数组，已自动修正事件 {event_id}")
+            person_ids = []
+
+        return EventLog(
+            event_id=event_id,
+            segment_id=segment.segment_id,
+            start_time=start_time,
+            end_time=end_time,
+            event_type=event_type,
+            structured={
+                'person_ids': person_ids,
+                'equipment': event_data.get('equipment', ''),
+            },
+            raw_text=event_data.get('description', '')
+        )
+    except Exception as e:
+        print(f"解析事件异常: {e}")
+        return None
+
+
+def parse_appearance_update(update_data: Dict[str, Any]) -> Optional[AppearanceUpdate]:
+    """解析单个外貌更新"""
+    op = update_data.get('op')
+    target_person_id = update_data.get('target_person_id')
+
+    if not op or not target_person_id:
+        return None
+
+    return AppearanceUpdate(
+        op=op,
+        target_person_id=target_person_id,
+        merge_from=update_data.get('merge_from'),
+        appearance=update_data.get('appearance'),
+        user_id=update_data.get('user_id')
+    )
+
+
+def parse_emergency(emg_data: Dict[str, Any], segment: VideoSegment) -> Optional[Emergency]:
+    """解析单个紧急情况"""
+    try:
+        description = emg_data.get('description', '')
+        if not description:
+            return None
+
+        try:
+            start_time = _parse_iso(emg_data.get('start_time', ''))
+            end_time = _parse_iso(emg_data.get('end_time', ''))
+        except (ValueError, AttributeError):
+            # 如果解析失败，回退到分段起止时间
+            start_time, end_time = _segment_time_range(segment)
+
+        return Emergency(
+            # 临时 ID（存入数据库时可能会重新分配或使用此 ID）
+            emergency_id=f"emg_{uuid.uuid4().hex[:8]}",
+            description=description,
+            start_time=start_time,
+            end_time=end_time,
+            segment_id=segment.segment_id,
+            status="PENDING"
+        )
+    except Exception as e:
+        print(f"解析紧急情况异常: {e}")
+        return None
+
+
+def _parse_items(items: Any, parser, label: str) -> list:
+    """逐项解析，单项失败不影响其他项"""
+    results = []
+    if not isinstance(items, list):
+        return results
+    for item in items:
+        try:
+            parsed = parser(item)
+            if parsed:
+                results.append(parsed)
+        except Exception as e:
+            print(f"警告：解析{label}失败: {e}")
+    return results
+
+
+def parse_dynamic_response(response_text: str, segment: VideoSegment) -> ProcessingResult:
+    """
+    解析动态上下文响应
+
+    Args:
+        response_text: API 返回的文本
+        segment: 视频分段
+
+    Returns:
+        处理结果
+    """
+    try:
+        data = load_json_object(response_text)
+    except json.JSONDecodeError as e:
+        print(f"警告：无法解析 JSON 响应: {e}")
+        print(f"响应文本: {response_text[:500]}")
+        data = None
+
+    if not isinstance(data, dict):
+        return ProcessingResult(events=[], appearance_updates=[], raw_response=response_text)
+
+    return ProcessingResult(
+        events=_parse_items(
+            data.get('events_to_append', []), lambda d: parse_event(d, segment), "事件"
+        ),
+        appearance_updates=_parse_items(
+            data.get('appearance_updates', []), parse_appearance_update, "外貌更新"
+        ),
+        emergencies=_parse_items(
+            data.get('emergency_events', []), lambda d: parse_emergency(d, segment), "紧急情况"
+        ),
+        raw_response=response_text
+    )
+
+
+def parse_legacy_response(response_text: str, segment: VideoSegment) -> List[EventLog]:
+    """解析旧版响应（兼容模式）"""
+    try:
+        data = load_json_object(response_text)
+    except json.JSONDecodeError as e:
+        print(f"警告：无法解析 JSON 响应: {e}")
+        print(f"响应文本: {response_text[:500]}")
+        return []
+
+    if isinstance(data, list):
+        events_data = data
+    elif isinstance(data, dict):
+        events_data = data.get('events', [])
+    else:
+        return []
+
+    def parse_legacy_event(event_data: Dict[str, Any]) -> EventLog:
+        try:
+            start_time = _parse_iso(event_data.get('start_time'))
+            end_time = _parse_iso(event_data.get('end_time'))
+        except (ValueError, AttributeError, TypeError):
+            start_time, end_time = _segment_time_range(segment)
+
+        original_event_id = event_data.get('event_id', f"evt_{hash(str(event_data)) % 100000:05d}")
+        return EventLog(
+            event_id=f"{segment.segment_id}_{original_event_id}",
+            segment_id=segment.segment_id,
+            start_time=start_time,
+            end_time=end_time,
+            event_type=event_data.get('event_type'),
+            structured=event_data.get('structured', {}),
+            raw_text=event_data.get('raw_text', '')
+        )
+
+    return _parse_items(events_data, parse_legacy_event, "事件")
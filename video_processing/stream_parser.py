@@ -0,0 +1,191 @@
+"""流式响应的增量 JSON 解析：模型输出尚未结束时，逐个取出已闭合的数组元素
+
+模型按 {"events_to_append": [...], "appearance_updates": [...], "emergency_events": [...]}
+输出。IncrementalJSONParser 逐字符跟踪顶层对象的键和嵌套层级，顶层某个键对应数组中的
+对象一闭合就立即回调，不等待整个响应（包括后续字段）生成完毕。
+
+SegmentStreamDispatcher 在此基础上把紧急情况立即交给 on_emergency（如写入紧急情况日志），
+并记录首个事件、首个紧急情况的到达时间。流式结果只用于提前分发，最终结果仍以完整响应的
+解析为准；提前分发过的紧急情况不会重复分发。
+"""
+
+import json
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from storage.models import VideoSegment, Emergency
+from video_processing.response_parser import ProcessingResult, parse_emergency, parse_event
+
+
+STREAMED_KEYS = ('events_to_append', 'emergency_events')
+
+
+class IncrementalJSONParser:
+    """增量 JSON 解析器（只解析第一个顶层对象，其之前的文字如 ```json 会被忽略）"""
+
+    def __init__(self, on_item: Callable[[str, Any], None], keys: Iterable[str] = STREAMED_KEYS):
+        """
+        Args:
+            on_item: 回调 (顶层键, 已闭合的数组元素)
+            keys: 需要增量输出的顶层数组键
+        """
+        self.on_item = on_item
+        self.keys = set(keys)
+        self.done = False
+        self._stack: List[str] = []            # '{' / '['
+        self._in_string = False
+        self._escape = False
+        self._string_chars: Optional[List[str]] = None   # 顶层对象中的字符串（候选键）
+        self._last_string: Optional[str] = None
+        self._current_key: Optional[str] = None          # 正在解析其值的顶层键
+        self._item_key: Optional[str] = None
+        self._item_chars: Optional[List[str]] = None     # 正在收集的数组元素
+
+    def feed(self, chunk: str) -> None:
+        """输入一段新文本"""
+        for ch in chunk:
+            if self.done:
+                return
+            self._consume(ch)
+
+    def _consume(self, ch: str) -> None:
+        stack = self._stack
+        if not stack:
+            # 顶层对象开始之前的文字全部忽略
+            if ch == '{':
+                stack.append('{')
+            return
+
+        if self._item_chars is not None:
+            self._item_chars.append(ch)
+
+        if self._in_string:
+            if self._escape:
+                self._escape = False
+            elif ch == '\\':
+                self._escape = True
+            elif ch == '"':
+                self._in_string = False
+                if self._string_chars is not None:
+                    self._last_string = ''.join(self._string_chars)
+                    self._string_chars = None
+                return
+            if self._string_chars is not None:
+                self._string_chars.append(ch)
+            return
+
+        depth = len(stack)
+        if ch == '"':
+            self._in_string = True
+            self._string_chars = [] if depth == 1 else None
+        elif depth == 1 and ch == ':':
+            self._current_key = self._last_string
+        elif depth == 1 and ch == ',':
+            self._current_key = None
+        elif ch == '{' or ch == '[':
+            stack.append(ch)
+            if ch == '{' and stack == ['{', '[', '{'] and self._current_key in self.keys:
+                self._item_key = self._current_key
+                self._item_chars = ['{']
+        elif ch == '}' or ch == ']':
+            stack.pop()
+            if ch == '}' and self._item_chars is not None and stack == ['{', '[']:
+                self._emit()
+            if not stack:
+                self.done = True
+
+    def _emit(self) -> None:
+        text = ''.join(self._item_chars)
+        key = self._item_key
+        self._item_chars = None
+        self._item_key = None
+        try:
+            item = json.loads(text)
+        except json.JSONDecodeError:
+            return
+        self.on_item(key, item)
+
+
+def _emergency_key(emergency: Emergency) -> Tuple[str, str]:
+    return emergency.description, emergency.start_time.isoformat()
+
+
+class SegmentStreamDispatcher:
+    """单个分段的流式分发（紧急情况立即回调）"""
+
+    def __init__(
+        self,
+        segment: VideoSegment,
+        on_emergency: Optional[Callable[[Emergency], None]] = None
+    ):
+        """
+        Args:
+            segment: 视频分段
+            on_emergency: 紧急情况回调，每个紧急情况保证只调用一次
+        """
+        self.segment = segment
+        self.on_emergency = on_emergency
+        self.started_at = time.time()
+        self.emergencies: List[Emergency] = []
+        self.events_streamed = 0
+        self.first_event_latency: Optional[float] = None
+        self.first_emergency_latency: Optional[float] = None
+        self._parser = IncrementalJSONParser(self._on_item)
+
+    def feed(self, text: str) -> None:
+        """输入模型正文增量"""
+        self._parser.feed(text)
+
+    def _on_item(self, key: str, item: Any) -> None:
+        if not isinstance(item, dict):
+            return
+        latency = time.time() - self.started_at
+        if key == 'emergency_events':
+            emergency = parse_emergency(item, self.segment)
+            if emergency is None:
+                return
+            if self.first_emergency_latency is None:
+                self.first_emergency_latency = latency
+                print(f"[Realtime] 分段 {self.segment.segment_id} 流式识别到紧急情况（请求后 {latency:.1f}s）: {emergency.description}")
+            self._dispatch(emergency)
+        elif key == 'events_to_append':
+            if parse_event(item, self.segment) is None:
+                return
+            self.events_streamed += 1
+            if self.first_event_latency is None:
+                self.first_event_latency = latency
+
+    def _dispatch(self, emergency: Emergency) -> None:
+        self.emergencies.append(emergency)
+        if self.on_emergency is None:
+            return
+        try:
+            self.on_emergency(emergency)
+        except Exception as e:
+            print(f"[Warning]: 紧急情况回调失败: {e}")
+
+    def finalize(self, result: ProcessingResult) -> None:
+        """
+        用完整解析结果收尾：补发流式阶段漏掉的紧急情况，并复用已分发的对象（保持同一 ID）
+
+        Args:
+            result: 完整响应的解析结果（会被原地修改）
+        """
+        streamed = {_emergency_key(e) for e in self.emergencies}
+        for emergency in result.emergencies:
+            if _emergency_key(emergency) not in streamed:
+                self._dispatch(emergency)
+        result.emergencies = list(self.emergencies)
+        result.emergencies_dispatched = self.on_emergency is not None
+
+    def metrics(self) -> Dict[str, Any]:
+        """流式统计（秒，相对请求发出时刻）"""
+        return {
+            'streamed': True,
+            'time_to_first_event': (
+                round(self.first_event_latency, 3) if self.first_event_latency is not None else None
+            ),
+            'time_to_first_emergency': (
+                round(self.first_emergency_latency, 3) if self.first_emergency_latency is not None else None
+            ),
+        }
@@ -0,0 +1,378 @@
+"""视频理解模型传输层：屏蔽各模型服务商的请求格式差异
+
+- VLMRequest：一次调用的输入（视频 + 分层提示词或旧版单段提示词；设置 on_text 时流式调用）
+- TransportResponse：一次调用的输出（正文、思考内容、耗时与 token 统计）
+- DashScopeTransport：同步走 MultiModalConversation SDK，异步走 OpenAI 兼容接口
+- OpenRouterTransport：/v1/responses（同步 requests，异步 httpx）
+
+处理引擎只依赖 VLMTransport 接口，批处理、流式、缓存等可以在传输层按服务商扩展。
+"""
+
+import asyncio
+import os
+import time
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import requests
+from dashscope import MultiModalConversation
+
+from context.prompt_builder import PromptLayout
+from video_processing.async_client import (
+    DashScopeCompatibleAsyncClient,
+    OpenRouterAsyncClient,
+    ResponsesStreamAccumulator,
+    is_async_http_enabled,
+)
+from video_processing.prompt_cache import (
+    build_compatible_messages,
+    build_dashscope_messages,
+    build_openrouter_input,
+    dashscope_call_metrics,
+    openrouter_call_metrics,
+)
+from video_processing.request_body import StreamingJSONBody, video_reference
+
+
+def _env_bool(name: str, default: str) -> bool:
+    return os.getenv(name, default).lower() in ('true', '1', 'yes', 'on')
+
+
+def _env_number(name: str, default, cast):
+    try:
+        return cast(os.getenv(name, str(default)))
+    except ValueError:
+        return default
+
+
+@dataclass
+class GenerationConfig:
+    """模型调用参数"""
+    fps: float = 1.0                          # 视频抽帧率
+    enable_thinking: bool = True              # 是否启用思考
+    thinking_budget: int = 8192               # 思考预算（tokens）
+    temperature: Optional[float] = 0.1
+    top_p: Optional[float] = 0.7
+    vl_high_resolution_images: bool = False   # 高分辨率图像处理（DashScope）
+    explicit_cache: bool = True               # 静态前缀是否添加 cache_control
+    streaming: bool = True                    # 动态上下文调用是否使用流式输出（增量解析、提前分发紧急情况）
+
+    @classmethod
+    def from_env(
+        cls,
+        fps: Optional[float] = None,
+        enable_thinking: Optional[bool] = None,
+        thinking_budget: Optional[int] = None,
+        default_high_resolution: bool = False
+    ) -> 'GenerationConfig':
+        """
+        从参数与环境变量构建调用参数（参数为 None 时读取环境变量）
+
+        Args:
+            fps: 视频抽帧率，None 则读取 VIDEO_FPS（默认 1.0）
+            enable_thinking: 是否启用思考，None 则读取 ENABLE_THINKING（默认 true）
+            thinking_budget: 思考预算，None 则读取 THINKING_BUDGET（默认 8192）
+            default_high_resolution: VL_HIGH_RESOLUTION_IMAGES 未设置时的默认值（因模型而异）
+
+        Returns:
+            GenerationConfig
+        """
+        return cls(
+            fps=fps if fps is not None else _env_number('VIDEO_FPS', 1.0, float),
+            enable_thinking=(
+                enable_thinking if enable_thinking is not None else _env_bool('ENABLE_THINKING', 'true')
+            ),
+            thinking_budget=(
+                thinking_budget if thinking_budget is not None else _env_number('THINKING_BUDGET', 8192, int)
+            ),
+            temperature=_env_number('VL_TEMPERATURE', 0.1, float),
+            top_p=_env_number('VL_TOP_P', 0.7, float),
+            vl_high_resolution_images=_env_bool(
+                'VL_HIGH_RESOLUTION_IMAGES', 'true' if default_high_resolution else 'false'
+            ),
+            explicit_cache=_env_bool('VL_EXPLICIT_CACHE', 'true'),
+            streaming=_env_bool('VLM_STREAMING', 'true'),
+        )
+
+
+@dataclass
+class VLMRequest:
+    """一次模型调用的输入"""
+    video_path: str
+    layout: Optional[PromptLayout] = None      # 动态上下文：分层提示词
+    prompt: Optional[str] = None               # 旧版：单段提示词
+    system_instruction: Optional[str] = None   # 旧版：系统指令（可选）
+    on_text: Optional[Callable[[str], None]] = None  # 正文增量回调；设置后以流式方式调用
+    extra_video_paths: List[str] = field(default_factory=list)  # 多视频合并调用：按时间顺序的后续视频
+
+
+@dataclass
+class TransportResponse:
+    """一次模型调用的输出"""
+    text: str
+    thinking: Optional[str] = None
+    metrics: Dict[str, Any] = field(default_factory=dict)  # api_latency 与 token/缓存命中统计
+
+
+class VLMTransport(ABC):
+    """模型服务商传输接口"""
+
+    name = "base"
+
+    def __init__(self, api_key: str, model: str, config: GenerationConfig):
+        self.api_key = api_key
+        self.model = model
+        self.config = config
+
+    @abstractmethod
+    def call(self, request: VLMRequest) -> TransportResponse:
+        """同步调用"""
+
+    async def acall(self, request: VLMRequest) -> TransportResponse:
+        """异步调用（默认在线程池中执行同步调用）"""
+        return await asyncio.to_thread(self.call, request)
+
+
+class DashScopeTransport(VLMTransport):
+    """阿里云 DashScope（Qwen 系列）"""
+
+    name = "dashscope"
+    api_key_env = "DASHSCOPE_API_KEY"
+
+    def __init__(self, api_key: str, model: str, config: GenerationConfig):
+        super().__init__(api_key, model, config)
+        self.async_http = is_async_http_enabled()
+        self.async_client = DashScopeCompatibleAsyncClient(api_key)
+
+    def _sampling_params(self) -> Dict[str, Any]:
+        """思考与采样参数（SDK 与兼容接口通用）"""
+        params: Dict[str, Any] = {
+            'enable_thinking': self.config.enable_thinking,
+            'thinking_budget': self.config.thinking_budget
+        }
+        if self.config.vl_high_resolution_images:
+            params['vl_high_resolution_images'] = True
+        if self.config.temperature is not None:
+            params['temperature'] = self.config.temperature
+        if self.config.top_p is not None:
+            params['top_p'] = self.config.top_p
+        return params
+
+    @staticmethod
+    def _file_url(video_path: str) -> str:
+        if Path(video_path).is_absolute():
+            return f"file://{video_path}"
+        return f"file://{os.path.abspath(video_path)}"
+
+    def _build_messages(self, request: VLMRequest) -> List[Dict[str, Any]]:
+        """构建 MultiModalConversation 消息"""
+        video_url = self._file_url(request.video_path)
+        extra_urls = [self._file_url(path) for path in request.extra_video_paths]
+
+        if request.layout is not None:
+            # 静态前缀放在系统消息中，以命中前缀缓存
+            return build_dashscope_messages(
+                request.layout, video_url, self.config.fps, self.config.explicit_cache, extra_urls
+            )
+
+        messages: List[Dict[str, Any]] = [
+            {
+                'role': 'user',
+                'content': [
+                    *({'video': url, 'fps': self.config.fps} for url in [video_url, *extra_urls]),
+                    {'text': request.prompt}
+                ]
+            }
+        ]
+        if request.system_instruction:
+            messages.insert(0, {'role': 'system', 'content': request.system_instruction})
+        return messages
+
+    def call(self, request: VLMRequest) -> TransportResponse:
+        if request.on_text is not None:
+            return self._call_stream(request)
+
+        call_start = time.time()
+        response = MultiModalConversation.call(
+            api_key=self.api_key,
+            model=self.model,
+            messages=self._build_messages(request),
+            stream=False,
+            **self._sampling_params()
+        )
+        metrics = dashscope_call_metrics(response, time.time() - call_start)
+
+        message = response["output"]["choices"][0]["message"]
+        return TransportResponse(
+            text=message.content[0]["text"],
+            thinking=message.get("reasoning_content") or message.get("thought"),
+            metrics=metrics
+        )
+
+    def _call_stream(self, request: VLMRequest) -> TransportResponse:
+        """流式调用（incremental_output，每个分片只含增量）"""
+        call_start = time.time()
+        responses = MultiModalConversation.call(
+            api_key=self.api_key,
+            model=self.model,
+            messages=self._build_messages(request),
+            stream=True,
+            incremental_output=True,
+            **self._sampling_params()
+        )
+
+        text_parts: List[str] = []
+        thinking_parts: List[str] = []
+        last_response = None
+        for chunk in responses:
+            status_code = getattr(chunk, 'status_code', 200)
+            if status_code != 200:
+                raise RuntimeError(f"{status_code} {getattr(chunk, 'code', '')}: {getattr(chunk, 'message', '')}")
+            last_response = chunk
+            message = chunk["output"]["choices"][0]["message"]
+            delta = ''.join(
+                item.get("text", "") for item in (message.get("content") or []) if isinstance(item, dict)
+            )
+            if delta:
+                text_parts.append(delta)
+                request.on_text(delta)
+            thinking = message.get("reasoning_content")
+            if thinking:
+                thinking_parts.append(thinking)
+
+        return TransportResponse(
+            text=''.join(text_parts),
+            thinking=''.join(thinking_parts) or None,
+            metrics=dashscope_call_metrics(last_response, time.time() - call_start)
+        )
+
+    async def acall(self, request: VLMRequest) -> TransportResponse:
+        if not self.async_http or request.layout is None:
+            return await super().acall(request)
+
+        payload = {
+            'model': self.model,
+            'messages': build_compatible_messages(
+                request.layout, video_reference(request.video_path), self.config.fps, self.config.explicit_cache,
+                [video_reference(path) for path in request.extra_video_paths]
+            ),
+            **self._sampling_params()
+        }
+
+        call_start = time.time()
+        response = await self.async_client.chat_completion(payload, on_delta=request.on_text)
+        return TransportResponse(
+            text=response['content'],
+            thinking=response['reasoning_content'],
+            metrics=dashscope_call_metrics(response, time.time() - call_start)
+        )
+
+
+class OpenRouterTransport(VLMTransport):
+    """OpenRouter /v1/responses（Gemini 等）"""
+
+    name = "openrouter"
+    api_key_env = "OPENROUTER_API_KEY"
+
+    def __init__(self, api_key: str, model: str, config: GenerationConfig):
+        super().__init__(api_key, model, config)
+        self.base_url = "https://openrouter.ai/api/v1/responses"
+        self.async_http = is_async_http_enabled()
+        self.async_client = OpenRouterAsyncClient(api_key)
+
+    def _build_input(self, request: VLMRequest, video_data_url: Any) -> List[Dict[str, Any]]:
+        """构建 input 列表（video_data_url 为 URL 或 VideoFileRef；多视频时后续视频同样流式编码）"""
+        extra_videos = [video_reference(path) for path in request.extra_video_paths]
+        if request.layout is not None:
+            return build_openrouter_input(request.layout, video_data_url, self.config.explicit_cache, extra_videos)
+
+        input_items: List[Dict[str, Any]] = []
+        if request.system_instruction:
+            input_items.append({
+                "type": "message",
+                "role": "system",
+                "content": request.system_instruction
+            })
+        input_items.append({
+            "type": "message",
+            "role": "user",
+            "content": [
+                {"type": "input_text", "text": request.prompt},
+                *({"type": "input_video", "video_url": url} for url in [video_data_url, *extra_videos])
+            ]
+        })
+        return input_items
+
+    def _build_payload(self, input_items: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """构造 /v1/responses 请求体"""
+        return {
+            "model": self.model,
+            "input": input_items,
+            "temperature": self.config.temperature,
+            "top_p": self.config.top_p,
+            "reasoning": {
+                "enabled": self.config.enable_thinking,
+                "max_tokens": self.config.thinking_budget
+            },
+            "provider": {
+                "order": ["Google (Vertex)", "Google"]
+            }
+        }
+
+    @staticmethod
+    def _parse_output(data: Dict[str, Any]) -> Tuple[Optional[str], str]:
+        """从 /v1/responses 响应中提取 (思考内容, 结果文本)"""
+        thinking = None
+        result_text = ""
+        for item in data.get("output", []):
+            item_type = item.get("type")
+            content_list = item.get("content", [])
+            if item_type == "reasoning":
+                thinking = "\n".join(c.get("text", "") for c in content_list if c.get("type") == "reasoning_text")
+            elif item_type == "message":
+                result_text = "\n".join(c.get("text", "") for c in content_list if c.get("type") == "output_text")
+        return thinking, result_text
+
+    def call(self, request: VLMRequest) -> TransportResponse:
+        payload = self._build_payload(self._build_input(request, video_reference(request.video_path)))
+        if request.on_text is not None:
+            payload['stream'] = True
+        # 视频从文件分块编码写入请求体，不在内存中拼出完整的 data URL
+        body = StreamingJSONBody(payload)
+        headers = {"Authorization": f"Bearer {self.api_key}", **body.headers}
+
+        call_start = time.time()
+        if request.on_text is not None:
+            accumulator = ResponsesStreamAccumulator(request.on_text)
+            with requests.post(self.base_url, data=body, headers=headers, timeout=180, stream=True) as response:
+                response.raise_for_status()
+                for line in response.iter_lines(decode_unicode=True):
+                    if line and accumulator.feed_line(line):
+                        break
+            data = accumulator.result()
+        else:
+            response = requests.post(self.base_url, data=body, headers=headers, timeout=180)
+            response.raise_for_status()
+            data = response.json()
+        metrics = openrouter_call_metrics(data, time.time() - call_start)
+
+        thinking, result_text = self._parse_output(data)
+        return TransportResponse(text=result_text, thinking=thinking, metrics=metrics)
+
+    async def acall(self, request: VLMRequest) -> TransportResponse:
+        if not self.async_http:
+            return await super().acall(request)
+
+        payload = self._build_payload(self._build_input(request, video_reference(request.video_path)))
+
+        call_start = time.time()
+        if request.on_text is not None:
+            data = await self.async_client.stream_response(payload, on_delta=request.on_text)
+        else:
+            data = await self.async_client.create_response(payload)
+        metrics = openrouter_call_metrics(data, time.time() - call_start)
+
+        thinking, result_text = self._parse_output(data)
+        return TransportResponse(text=result_text, thinking=thinking, metrics=metrics)